@@ -1,10 +1,7 @@
 # ESG
 import streamlit as st
-import torch
-import types
 import os
-# torch.classes 패치 (Streamlit 에러 우회용)
-torch.classes = types.SimpleNamespace()
+from warmup import start_background_warmup
 st.set_page_config(
     page_title="ESG 전문가 AI",
     page_icon="🌱",
@@ -64,6 +61,9 @@ st.markdown("""
     </style>
 """, unsafe_allow_html=True)
 
+# 챗봇에 필요한 모델/벡터 인덱스를 백그라운드에서 미리 로드 (torch는 워밍업 스레드에서만 임포트)
+start_background_warmup()
+
 st.title("🌱 ESG 전문가 AI")
 st.markdown("""
 ### <b>파인튜닝된 GPT 모델을 활용한 ESG 전문가 AI 시스템</b>
@@ -0,0 +1,59 @@
+"""api_server.py의 HTTP 클라이언트 (Streamlit 페이지를 씬 클라이언트로 사용할 때)
+
+RAG_API_URL이 설정되어 있으면 챗봇 페이지는 모델을 직접 로드하지 않고 이 클라이언트로 API 서버를 호출합니다.
+"""
+import json
+from typing import Dict, Iterator, List, Optional
+
+import httpx
+
+class RagApiClient:
+    def __init__(self, base_url: str, timeout: float = 120.0):
+        self.base_url = base_url.rstrip("/")
+        self._client = httpx.Client(base_url=self.base_url, timeout=timeout)
+
+    def _post(self, path: str, payload: Dict) -> Dict:
+        response = self._client.post(path, json=payload)
+        if path == "/answer" and response.status_code == 503:
+            # 과부하로 거절된 질문도 안내 문구가 담긴 결과 형식으로 반환됨
+            return response.json()
+        response.raise_for_status()
+        return response.json()
+
+    def health(self) -> Dict:
+        response = self._client.get("/health")
+        response.raise_for_status()
+        return response.json()
+
+    def retrieve(self, query: str, **options) -> Dict:
+        return self._post("/retrieve", {"query": query, **options})
+
+    @staticmethod
+    def _answer_payload(query: str, model: Optional[str], history: Optional[List[Dict]], context: Optional[str],
+                        metadata_summary: Optional[Dict]) -> Dict:
+        payload = {"query": query, "history": history or None}
+        if model:
+            payload["model"] = model
+        if context is not None:
+            payload["context"] = context
+            payload["metadata_summary"] = {k: sorted(v) for k, v in (metadata_summary or {}).items()}
+        return payload
+
+    def answer(self, query: str, model: Optional[str] = None, history: Optional[List[Dict]] = None,
+               context: Optional[str] = None, metadata_summary: Optional[Dict] = None) -> Dict:
+        return self._post("/answer", self._answer_payload(query, model, history, context, metadata_summary))
+
+    def answer_stream(self, query: str, model: Optional[str] = None, history: Optional[List[Dict]] = None,
+                      context: Optional[str] = None, metadata_summary: Optional[Dict] = None) -> Iterator[Dict]:
+        """context → token… → done 이벤트를 순서대로 반환"""
+        payload = self._answer_payload(query, model, history, context, metadata_summary)
+        with self._client.stream("POST", "/answer/stream", json=payload) as response:
+            response.raise_for_status()
+            for line in response.iter_lines():
+                if line.startswith("data: "):
+                    yield json.loads(line[len("data: "):])
+
+    def summarize(self, summary: str, turns: List) -> str:
+        """ConversationMemory의 summarizer로 사용 (conversation_memory.Turn 목록)"""
+        payload = {"summary": summary, "turns": [{"user": t.user, "assistant": t.assistant} for t in turns]}
+        return self._post("/summarize", payload)["summary"]
@@ -0,0 +1,220 @@
+"""Streamlit과 분리된 검색/응답 HTTP API
+
+rag_chatbot의 expand_query → extract_metadata_filters → get_relevant_context → generate_response 흐름을
+비동기 HTTP 서비스로 제공합니다. 블로킹 작업은 설정 가능한 스레드 풀에서 실행되며,
+모델(임베딩, Cross-encoder)과 컬렉션은 프로세스 안에서 모든 요청이 공유합니다.
+
+엔드포인트:
+    POST /retrieve        관련 문서 검색
+    POST /answer          검색 + 응답 생성
+    POST /answer/stream   검색 + 응답 생성 (Server-Sent Events 스트리밍)
+    POST /summarize       대화 요약 (Streamlit 씬 클라이언트의 대화 메모리용)
+    GET  /health          워밍업(준비) 상태
+
+요청 마감 시간(RAG_REQUEST_TIMEOUT)은 요청이 도착한 시점부터 계산하므로 스레드 풀에서 기다린 시간도 포함됩니다.
+부하가 높으면 단계별로 품질을 낮추고(load_shedding.py), 한도를 넘으면 /retrieve, /answer, /summarize는 503과 안내 문구를 반환합니다.
+
+실행 예시 (저장소 루트에서):
+    python code/api_server.py --port 8000 --workers 16
+    RAG_API_URL=http://127.0.0.1:8000 streamlit run code/ESG.py
+"""
+import argparse
+import asyncio
+import contextvars
+import json
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from typing import Dict, List, Optional
+
+from fastapi import FastAPI
+from fastapi.responses import JSONResponse, StreamingResponse
+from pydantic import BaseModel
+
+import rag_chatbot
+from conversation_memory import Turn
+from load_shedding import BUSY_MESSAGE, Deadline, Overloaded
+from tracing import trace_request
+from warmup import get_warmup_state, start_background_warmup
+
+executor = ThreadPoolExecutor(max_workers=int(os.getenv("RAG_API_WORKERS", "8")), thread_name_prefix="rag-api")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # 모델/인덱스를 백그라운드에서 미리 로드
+    start_background_warmup()
+    yield
+
+app = FastAPI(title="ESG RAG API", lifespan=lifespan)
+
+class RetrieveRequest(BaseModel):
+    query: str
+    initial_k: int = 20
+    final_k: int = 5
+    expand: bool = True
+    metadata_filters: Optional[Dict[str, str]] = None  # 없으면 질문에서 추출
+
+class AnswerRequest(BaseModel):
+    query: str
+    model: str = rag_chatbot.FINETUNED_MODEL_ID
+    history: Optional[List[Dict[str, str]]] = None
+    # 후속 질문처럼 이미 검색한 문서를 재사용할 때 전달 (검색 단계 생략)
+    context: Optional[str] = None
+    metadata_summary: Optional[Dict[str, List[str]]] = None
+    coalesce: bool = True
+
+class SummarizeRequest(BaseModel):
+    summary: str = ""
+    turns: List[Dict[str, str]]
+
+def to_jsonable(value):
+    """metadata_summary의 set 등을 JSON으로 보낼 수 있는 형태로 변환"""
+    if isinstance(value, dict):
+        return {k: to_jsonable(v) for k, v in value.items()}
+    if isinstance(value, (set, frozenset)):
+        return sorted(to_jsonable(v) for v in value)
+    if isinstance(value, (list, tuple)):
+        return [to_jsonable(v) for v in value]
+    return value
+
+async def run_in_pool(fn, *args):
+    return await asyncio.get_running_loop().run_in_executor(executor, fn, *args)
+
+@app.get("/health")
+async def health():
+    state = get_warmup_state()
+    return {"ready": state.ready, "finished": state.finished, "steps": state.summary()}
+
+def _retrieve(request: RetrieveRequest, deadline: Deadline) -> Dict:
+    with trace_request("api_retrieve"), rag_chatbot.admit_request(deadline) as budget:
+        expanded_query = rag_chatbot.expand_query(request.query) if request.expand else request.query
+        metadata_filters = request.metadata_filters
+        if metadata_filters is None:
+            metadata_filters = rag_chatbot.extract_metadata_filters(request.query)
+        context, metadata_summary = rag_chatbot.get_relevant_context(
+            expanded_query,
+            rag_chatbot.get_collection(),
+            initial_k=request.initial_k,
+            final_k=request.final_k,
+            metadata_filters=metadata_filters
+        )
+        return {
+            "query": request.query,
+            "expanded_query": expanded_query,
+            "metadata_filters": metadata_filters,
+            "context": context,
+            "metadata_summary": metadata_summary,
+            "degradation": budget.metadata(),
+        }
+
+def _answer(request: AnswerRequest, deadline: Deadline) -> Dict:
+    with trace_request("api_answer", model=request.model) as trace:
+        if request.context is not None:
+            # 전달받은 검색 결과 재사용
+            result = rag_chatbot.answer_with_context(request.query, request.context, request.metadata_summary or {},
+                                                     model=request.model, history=request.history, deadline=deadline)
+            return {**result, "coalesced": False}
+
+        collection = rag_chatbot.get_collection()
+        if request.history or not request.coalesce:
+            result = rag_chatbot.answer_query(request.query, collection, model=request.model, history=request.history,
+                                              deadline=deadline)
+            shared = False
+        else:
+            result, shared = rag_chatbot.coalesced_answer(request.query, collection, model=request.model,
+                                                          deadline=deadline)
+        trace.attrs["coalesced"] = shared
+    return {**result, "coalesced": shared}
+
+def _summarize(request: SummarizeRequest, deadline: Deadline) -> Dict:
+    turns = [Turn(t.get("user", ""), t.get("assistant", "")) for t in request.turns]
+    return {"summary": rag_chatbot.summarize_conversation(request.summary, turns, deadline=deadline)}
+
+@app.post("/retrieve")
+async def retrieve(request: RetrieveRequest):
+    try:
+        return to_jsonable(await run_in_pool(_retrieve, request, Deadline()))
+    except Overloaded as e:
+        return JSONResponse({"detail": BUSY_MESSAGE, "degradation": e.metadata}, status_code=503)
+
+@app.post("/answer")
+async def answer(request: AnswerRequest):
+    result = to_jsonable(await run_in_pool(_answer, request, Deadline()))
+    if result["degradation"].get("rejected"):
+        # 과부하로 거절: 본문은 안내 문구가 담긴 같은 형식의 결과
+        return JSONResponse(result, status_code=503)
+    return result
+
+@app.post("/summarize")
+async def summarize(request: SummarizeRequest):
+    try:
+        return await run_in_pool(_summarize, request, Deadline())
+    except Overloaded as e:
+        return JSONResponse({"detail": BUSY_MESSAGE, "degradation": e.metadata}, status_code=503)
+
+@app.post("/answer/stream")
+async def answer_stream(request: AnswerRequest):
+    """이벤트 스트림: context(검색 결과) → token(응답 조각)… → done"""
+    deadline = Deadline()
+    if request.context is not None:
+        # 전달받은 검색 결과 재사용 (/answer와 같은 분기)
+        events = rag_chatbot.answer_with_context_stream(request.query, request.context, request.metadata_summary or {},
+                                                        model=request.model, history=request.history,
+                                                        deadline=deadline)
+    else:
+        collection = await run_in_pool(rag_chatbot.get_collection)
+        if request.history or not request.coalesce:
+            events = rag_chatbot.answer_query_stream(request.query, collection, model=request.model,
+                                                     history=request.history, deadline=deadline)
+        else:
+            events, _ = rag_chatbot.coalesced_answer_stream(request.query, collection, model=request.model,
+                                                            deadline=deadline)
+
+    # 제너레이터 안의 추적 컨텍스트(contextvars)가 여러 워커 스레드에서 같은 Context로 실행되도록 고정
+    context = contextvars.copy_context()
+    # 같은 Context에 두 스레드가 동시에 들어갈 수 없으므로 next와 close를 직렬화
+    lock = threading.Lock()
+    done = object()
+
+    def step():
+        with lock:
+            return context.run(next, events, done)
+
+    def close():
+        with lock:
+            context.run(events.close)
+
+    async def event_source():
+        try:
+            while True:
+                # 동기 이터레이터의 다음 항목을 워커 풀에서 가져옴 (이벤트 루프를 막지 않음)
+                event = await run_in_pool(step)
+                if event is done:
+                    break
+                yield f"data: {json.dumps(to_jsonable(event), ensure_ascii=False)}\n\n"
+        finally:
+            # 클라이언트가 끊으면 취소된 상태라 await할 수 없으므로 제출만 함 (입장 슬롯·추적 정리,
+            # 병합된 스트림이면 구독 해제 → 마지막 구독자였으면 single-flight가 생산을 멈춤)
+            executor.submit(close)
+
+    return StreamingResponse(event_source(), media_type="text/event-stream")
+
+def main():
+    global executor
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description="ESG RAG HTTP API 서버")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--workers", type=int, default=None,
+                        help="블로킹 파이프라인 작업을 실행할 스레드 수 (기본: RAG_API_WORKERS 또는 8)")
+    args = parser.parse_args()
+
+    if args.workers:
+        executor = ThreadPoolExecutor(max_workers=args.workers, thread_name_prefix="rag-api")
+
+    uvicorn.run(app, host=args.host, port=args.port)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,191 @@
+"""질문 목록(JSONL) 일괄 응답 생성
+
+ESG 설문처럼 수백 개 질문에 답해야 할 때 rag_chatbot의 대화형 루프 대신 사용합니다.
+    - 입력: 한 줄에 {"id": ..., "question": ...} (id가 없으면 줄 번호)
+    - batch_size개씩 묶어 필터 추출 → 질문 확장(별도의 작은 스레드 풀에서 동시 실행) → 일괄 검색(retrieve_documents_batch)
+    - 응답 생성은 최대 concurrency개까지 동시에 실행하고, 끝나는 대로 출력 JSONL에 한 줄씩 추가
+    - 출력: {"id", "question", "answer", "sources", "timings", ...} (실패한 질문은 "error" 포함)
+    - 다시 실행하면 출력 파일에서 성공한 id를 읽어 건너뜀 (중단 후 이어서 실행, 실패한 질문만 재시도)
+      같은 id가 여러 줄이면 마지막 줄이 최신 결과입니다.
+
+실행 예시 (저장소 루트에서):
+    python code/rag_chatbot.py --batch data/questions.jsonl --output outputs/answers.jsonl --concurrency 8
+"""
+import json
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Set
+
+from tracing import trace_request
+
+def read_questions(path: str) -> Iterator[Dict]:
+    """입력 JSONL에서 {"id", "question"} 읽기 ("query" 키도 허용, 빈 줄 무시)"""
+    with open(path, encoding="utf-8") as f:
+        for line_number, line in enumerate(f, 1):
+            line = line.strip()
+            if not line:
+                continue
+            record = json.loads(line)
+            question = record.get("question") or record.get("query")
+            if not question:
+                raise ValueError(f"{path}:{line_number} 질문(question)이 없습니다.")
+            yield {"id": str(record.get("id", line_number)), "question": question}
+
+def completed_ids(path: str) -> Set[str]:
+    """출력 JSONL에서 오류 없이 끝난 id (중단 중 잘린 마지막 줄은 무시)"""
+    done: Set[str] = set()
+    if not Path(path).exists():
+        return done
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            if "error" in record:
+                done.discard(str(record.get("id")))
+            else:
+                done.add(str(record.get("id")))
+    return done
+
+def _sources(metadatas: List[Dict], scores: List[float]) -> List[Dict]:
+    return [
+        {"source": m.get("source"), "section": m.get("section"), "sub_section": m.get("sub_section"),
+         "page_range": m.get("page_range"), "score": round(float(score), 4)}
+        for m, score in zip(metadatas, scores)
+    ]
+
+def _ms(seconds: float) -> float:
+    return round(seconds * 1000, 1)
+
+class BatchWriter:
+    """여러 스레드에서 결과를 한 줄씩 추가 (줄마다 flush해서 중단되어도 끝난 결과는 남음)"""
+
+    def __init__(self, path: str):
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        # 이전 실행이 줄 중간에 중단됐으면 잘린 줄 뒤에 이어 쓰지 않도록 줄바꿈부터 추가
+        needs_newline = False
+        if Path(path).exists() and Path(path).stat().st_size:
+            with open(path, "rb") as f:
+                f.seek(-1, 2)
+                needs_newline = f.read(1) != b"\n"
+        self._file = open(path, "a", encoding="utf-8")
+        if needs_newline:
+            self._file.write("\n")
+        self._lock = threading.Lock()
+        self.written = 0
+        self.failed = 0
+
+    def write(self, record: Dict):
+        line = json.dumps(record, ensure_ascii=False)
+        with self._lock:
+            self._file.write(line + "\n")
+            self._file.flush()
+            self.written += 1
+            self.failed += "error" in record
+
+    def close(self):
+        self._file.close()
+
+def _batches(items: Iterator[Dict], size: int) -> Iterator[List[Dict]]:
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+def _generate(rag, item: Dict, model: str, writer: BatchWriter):
+    """(작업 스레드) 응답 생성 후 결과 한 줄 기록"""
+    start = time.perf_counter()
+    record = {key: item[key] for key in ("id", "question", "expanded_query", "metadata_filters")}
+    try:
+        with trace_request("batch_query", id=item["id"], model=model):
+            response, _ = rag.generate_response(item["question"], item["context"], item["metadata_summary"],
+                                                model=model, raise_errors=True)
+        record.update({"answer": response, "sources": item["sources"]})
+    except Exception as e:
+        record["error"] = repr(e)
+    item["timings"]["generate_ms"] = _ms(time.perf_counter() - start)
+    item["timings"]["total_ms"] = _ms(time.perf_counter() - item["started"])
+    record["timings"] = item["timings"]
+    writer.write(record)
+
+def run_batch(rag, input_path: str, output_path: str, concurrency: int = 8, batch_size: int = 16,
+              model: Optional[str] = None, initial_k: int = 20, final_k: int = 5, expand_concurrency: int = 4) -> Dict:
+    """입력 JSONL의 모든 질문에 응답을 생성해 output_path에 추가, 요약 반환 (rag: rag_chatbot 모듈)
+
+       expand_concurrency: 질문 확장 전용 스레드 수 (생성 작업 뒤에 줄 서지 않도록 생성 풀과 분리)
+    """
+    model = model or rag.FINETUNED_MODEL_ID
+    done = completed_ids(output_path)
+    skipped = 0
+
+    def pending_items() -> Iterator[Dict]:
+        # 출력 파일의 완료 id 중 이 입력에 실제로 있는 줄만 건너뜀으로 집계
+        nonlocal skipped
+        for item in read_questions(input_path):
+            if item["id"] in done:
+                skipped += 1
+            else:
+                yield item
+
+    pending = pending_items()
+    writer = BatchWriter(output_path)
+    start = time.perf_counter()
+    in_flight = set()
+
+    try:
+        with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="batch-answer") as executor, \
+                ThreadPoolExecutor(max_workers=expand_concurrency, thread_name_prefix="batch-expand") as expander:
+            for batch in _batches(pending, batch_size):
+                # 생성 대기열이 한없이 쌓이지 않도록, 실행 중인 생성이 concurrency 미만일 때만 다음 묶음 검색
+                in_flight = {future for future in in_flight if not future.done()}
+                while len(in_flight) >= concurrency:
+                    _, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+
+                batch_start = time.perf_counter()
+                for item in batch:
+                    item["started"] = batch_start
+                    item["metadata_filters"] = rag.extract_metadata_filters(item["question"])
+
+                # 짧은 질문 확장(LLM 호출)은 동시에 실행
+                expand_start = time.perf_counter()
+                expanded = list(expander.map(
+                    lambda item: item["question"] if "pages" in item["metadata_filters"] else rag.expand_query(item["question"]),
+                    batch))
+                expand_ms = _ms(time.perf_counter() - expand_start)
+
+                retrieve_start = time.perf_counter()
+                try:
+                    with trace_request("batch_retrieve", size=len(batch)):
+                        retrieved = rag.retrieve_documents_batch(expanded, rag.get_collection(),
+                                                                 [item["metadata_filters"] for item in batch],
+                                                                 initial_k=initial_k, final_k=final_k)
+                except Exception as e:
+                    for item in batch:
+                        writer.write({"id": item["id"], "question": item["question"], "error": repr(e)})
+                    continue
+                retrieve_ms = _ms(time.perf_counter() - retrieve_start)
+
+                for item, query, (documents, metadatas, scores) in zip(batch, expanded, retrieved):
+                    context, metadata_summary = rag.build_context(documents, metadatas, scores) if documents else ("", {})
+                    item.update({
+                        "expanded_query": query,
+                        "context": context,
+                        "metadata_summary": metadata_summary,
+                        "sources": _sources(metadatas, scores),
+                        # 확장/검색 시간은 묶음 전체 기준 (batch_size개 질문이 함께 처리됨)
+                        "timings": {"expand_ms": expand_ms, "retrieve_ms": retrieve_ms, "batch_size": len(batch)},
+                    })
+                    in_flight.add(executor.submit(_generate, rag, item, model, writer))
+                print(f"{writer.written}개 완료, {len(in_flight)}개 생성 중 (건너뜀 {skipped}개)")
+    finally:
+        writer.close()
+
+    return {"written": writer.written, "failed": writer.failed, "skipped": skipped,
+            "seconds": round(time.perf_counter() - start, 1)}
@@ -0,0 +1,106 @@
+"""동시 요청 마이크로 배칭
+
+여러 스레드에서 들어온 작업을 짧은 시간 창(max_wait_ms) 동안 모아 한 번의 배치 호출로 처리합니다.
+임베딩 서비스(embedding_service.py)와 재순위화 스케줄러에서 공통으로 사용합니다.
+"""
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, Callable, List, Optional
+
+from tracing import REGISTRY, COUNT_BUCKETS
+
+QUEUE_DEPTH = REGISTRY.gauge("rag_batcher_queue_depth", "배치 대기열에 쌓인 작업 수")
+BATCH_SIZE = REGISTRY.histogram("rag_batcher_batch_size", "배치 한 번에 처리한 크기 (size_fn 기준)",
+                                buckets=COUNT_BUCKETS + (200, 500))
+BATCH_JOBS = REGISTRY.histogram("rag_batcher_batch_jobs", "배치 한 번에 합쳐진 작업(요청) 수", buckets=COUNT_BUCKETS)
+BATCH_WAIT = REGISTRY.histogram("rag_batcher_wait_seconds", "작업이 대기열에서 기다린 시간(초)")
+
+class MicroBatcher:
+    """작업을 모아 handler(작업 목록) -> 결과 목록 으로 한 번에 처리
+
+       - max_batch_size: 한 배치의 최대 크기 (size_fn으로 작업별 크기 계산, 기본 1)
+       - max_wait_ms: 첫 작업이 도착한 뒤 추가 작업을 기다리는 최대 시간
+       대기열이 비어 있으면 max_wait_ms만큼만 기다린 뒤 바로 처리하므로 단일 요청의 추가 지연은 작음
+    """
+
+    def __init__(self, handler: Callable[[List[Any]], List[Any]], max_batch_size: int = 64,
+                 max_wait_ms: float = 5.0, size_fn: Optional[Callable[[Any], int]] = None, name: str = "batcher"):
+        self.handler = handler
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self.size_fn = size_fn or (lambda item: 1)
+        self.name = name
+        self._queue: "queue.Queue[tuple]" = queue.Queue()
+        self._carry: Optional[tuple] = None
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+    @property
+    def queue_depth(self) -> int:
+        return self._queue.qsize() + (1 if self._carry is not None else 0)
+
+    def submit(self, item: Any) -> Future:
+        """작업을 대기열에 넣고 결과를 받을 Future 반환"""
+        self._ensure_worker()
+        future: Future = Future()
+        self._queue.put((item, future, time.perf_counter()))
+        QUEUE_DEPTH.set(self.queue_depth, batcher=self.name)
+        return future
+
+    def __call__(self, item: Any, timeout: Optional[float] = None) -> Any:
+        """작업을 제출하고 결과가 나올 때까지 대기"""
+        return self.submit(item).result(timeout=timeout)
+
+    def _ensure_worker(self):
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._worker, name=f"{self.name}-worker", daemon=True)
+                    self._thread.start()
+
+    def _next_batch(self) -> List[tuple]:
+        first = self._carry if self._carry is not None else self._queue.get()
+        self._carry = None
+        batch = [first]
+        size = self.size_fn(first[0])
+        deadline = time.perf_counter() + self.max_wait
+
+        while size < self.max_batch_size:
+            remaining = deadline - time.perf_counter()
+            try:
+                entry = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            entry_size = self.size_fn(entry[0])
+            if size + entry_size > self.max_batch_size:
+                # 이번 배치에 넣으면 최대 크기를 넘으므로 다음 배치의 첫 작업으로 보관
+                self._carry = entry
+                break
+            batch.append(entry)
+            size += entry_size
+
+        BATCH_SIZE.observe(size, batcher=self.name)
+        BATCH_JOBS.observe(len(batch), batcher=self.name)
+        return batch
+
+    def _worker(self):
+        while True:
+            batch = self._next_batch()
+            QUEUE_DEPTH.set(self.queue_depth, batcher=self.name)
+            now = time.perf_counter()
+            for _, _, enqueued_at in batch:
+                BATCH_WAIT.observe(now - enqueued_at, batcher=self.name)
+
+            try:
+                results = self.handler([item for item, _, _ in batch])
+                if len(results) != len(batch):
+                    raise RuntimeError(f"{self.name}: 결과 수({len(results)})가 작업 수({len(batch)})와 다릅니다.")
+            except Exception as e:
+                for _, future, _ in batch:
+                    future.set_exception(e)
+                continue
+
+            for (_, future, _), result in zip(batch, results):
+                future.set_result(result)
@@ -0,0 +1,155 @@
+"""임베딩 양자화 벤치마크 (float32 대비 메모리, 검색 속도, recall 손실)
+
+번들 코퍼스(outputs/*_chunk.json)의 청크 임베딩으로 float32 정확 검색과 압축 코드 검색을 비교합니다.
+    - 메모리: 검색에 필요한 상주 배열 크기 (float32 행렬 vs int8 코드+스케일 vs PQ 코드+중심점)
+    - 속도: 질문 하나당 점수 계산 + 상위 k 선택 시간 (중앙값), float32 대비 배수
+    - recall@k: float32 정확 검색 상위 k와 겹치는 비율 (재점수화 전/후)
+
+질문은 평가 라벨(data/eval/retrieval_labels.json) 질문을 임베딩해 사용하고,
+--corpus-queries N을 주면 청크 임베딩 N개를 질문으로 추가해 표본을 늘립니다.
+청크 저장소에 임베딩이 없으면 모델로 임베딩해 저장소를 다시 씁니다.
+번들 코퍼스(약 500청크)는 작아서 속도 차이가 잘 드러나지 않으므로, --replicate R로 임베딩에 작은 잡음을 더해
+R배로 늘린 색인에서도 측정할 수 있습니다 (recall 기준도 늘린 색인의 float32 검색).
+
+실행 예시 (저장소 루트에서):
+    python code/bench_quantization.py
+    python code/bench_quantization.py --k 20 --rescore 50 --subspaces 48 --corpus-queries 200 --json
+    python code/bench_quantization.py --replicate 100
+"""
+import argparse
+import glob
+import json
+import statistics
+import time
+from pathlib import Path
+
+import numpy as np
+
+from chunk_store import CHUNK_STORE_PATH, ChunkStore, embed_chunks, load_json_chunks, store_exists, write_chunk_store
+from quantization import Int8Index, PQIndex, top_k, normalize, search
+
+EMBEDDING_MODEL = "jhgan/ko-sroberta-multitask"
+LABELS_PATH = Path("./data/eval/retrieval_labels.json")
+
+def load_embeddings(path: str, model: str) -> np.ndarray:
+    """청크 저장소의 임베딩 (없으면 번들 청크 JSON을 임베딩해 저장소 재생성)"""
+    store = ChunkStore(path) if store_exists(path) else None
+    if store is None or store.embeddings is None:
+        print(f"청크 임베딩이 없어 {model}로 생성합니다...")
+        chunks = load_json_chunks(sorted(glob.glob("outputs/*_chunk.json")))
+        write_chunk_store(chunks, path, embed_chunks(chunks, model), model)
+        store = ChunkStore(path)
+    return np.asarray(store.embeddings)
+
+def load_queries(embeddings: np.ndarray, model: str, corpus_queries: int, seed: int = 0) -> np.ndarray:
+    queries = []
+    if LABELS_PATH.exists():
+        from embedding_service import make_embedding_function
+        with open(LABELS_PATH, encoding="utf-8") as f:
+            questions = [label["query"] for label in json.load(f)]
+        queries.extend(make_embedding_function(model)(questions))
+    if corpus_queries:
+        rng = np.random.default_rng(seed)
+        picks = rng.choice(len(embeddings), min(corpus_queries, len(embeddings)), replace=False)
+        queries.extend(embeddings[picks])
+    return np.asarray(queries, dtype=np.float32)
+
+def replicate(embeddings: np.ndarray, times: int, noise: float = 0.3, seed: int = 0) -> np.ndarray:
+    """큰 코퍼스 흉내: 임베딩을 times배로 복제하고 복제본마다 벡터 크기 대비 noise 비율의 잡음 추가"""
+    if times <= 1:
+        return embeddings
+    rng = np.random.default_rng(seed)
+    scale = noise * np.linalg.norm(embeddings, axis=1, keepdims=True) / np.sqrt(embeddings.shape[1])
+    copies = [embeddings] + [embeddings + scale * rng.standard_normal(embeddings.shape, dtype=np.float32)
+                             for _ in range(times - 1)]
+    return np.concatenate(copies).astype(np.float32)
+
+def _median_ms(fn, queries: np.ndarray, repeat: int) -> float:
+    samples = []
+    for _ in range(repeat):
+        for query in queries:
+            start = time.perf_counter()
+            fn(query)
+            samples.append((time.perf_counter() - start) * 1000)
+    return statistics.median(samples)
+
+def _recall(found: np.ndarray, expected: np.ndarray) -> float:
+    return len(set(found.tolist()) & set(expected.tolist())) / max(len(expected), 1)
+
+def run_benchmark(embeddings: np.ndarray, queries: np.ndarray, k: int, rescore: int,
+                  subspaces: int, repeat: int):
+    # float32 기준: 정규화된 행렬을 미리 상주시킨 정확 검색
+    float_matrix = normalize(embeddings)
+
+    def float_search(query):
+        scores = float_matrix @ normalize(query)
+        top = top_k(scores, k)
+        return top, scores[top]
+
+    truth = [float_search(q)[0] for q in queries]
+
+    build_start = time.perf_counter()
+    int8 = Int8Index.build(embeddings)
+    int8_build = time.perf_counter() - build_start
+    build_start = time.perf_counter()
+    pq = PQIndex.build(embeddings, subspaces)
+    pq_build = time.perf_counter() - build_start
+
+    methods = [("float32", float_matrix.nbytes, 0.0, float_search, False)]
+    for index, build_seconds in ((int8, int8_build), (pq, pq_build)):
+        methods.append((index.method, index.nbytes, build_seconds,
+                        lambda q, index=index: search(index, q, k), False))
+        if rescore > k:
+            methods.append((f"{index.method}+재점수화({rescore})", index.nbytes, build_seconds,
+                            lambda q, index=index: search(index, q, k, embeddings=embeddings, rescore_k=rescore), True))
+
+    rows = []
+    float_ms = None
+    for name, nbytes, build_seconds, fn, rescored in methods:
+        latency = _median_ms(fn, queries, repeat)
+        float_ms = float_ms or latency
+        recall = statistics.mean(_recall(fn(q)[0], t) for q, t in zip(queries, truth))
+        rows.append({
+            "method": name,
+            "memory_kb": round(nbytes / 1024, 1),
+            "memory_saved_pct": round((1 - nbytes / float_matrix.nbytes) * 100, 1),
+            "build_s": round(build_seconds, 2),
+            "latency_ms": round(latency, 3),
+            "speedup": round(float_ms / latency, 2),
+            f"recall@{k}": round(recall, 4),
+            "rescored": rescored,
+        })
+    return rows
+
+def print_table(rows, k: int):
+    print(f"{'방식':<22} {'메모리(KB)':>10} {'절약':>7} {'빌드(s)':>8} {'질문당(ms)':>10} {'속도':>6} {f'recall@{k}':>10}")
+    for r in rows:
+        print(f"{r['method']:<22} {r['memory_kb']:>10.1f} {r['memory_saved_pct']:>6.1f}% {r['build_s']:>8.2f} "
+              f"{r['latency_ms']:>10.3f} {r['speedup']:>5.2f}x {r[f'recall@{k}']:>10.4f}")
+    print("(재점수화는 상위 후보의 float 임베딩을 메모리 맵에서 읽으므로 상주 메모리는 코드 크기와 같음)")
+
+def main():
+    parser = argparse.ArgumentParser(description="임베딩 양자화 벤치마크")
+    parser.add_argument("--store", default=CHUNK_STORE_PATH, help="임베딩이 포함된 청크 저장소 경로")
+    parser.add_argument("--model", default=EMBEDDING_MODEL)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--rescore", type=int, default=40, help="float 재점수화할 코드 점수 상위 후보 수 (0이면 생략)")
+    parser.add_argument("--subspaces", type=int, default=96, help="PQ 부분 공간 수 (임베딩 차원의 약수)")
+    parser.add_argument("--corpus-queries", type=int, default=0, help="질문으로 추가할 청크 임베딩 수")
+    parser.add_argument("--replicate", type=int, default=1, help="잡음을 더해 색인을 몇 배로 늘릴지 (속도 측정용)")
+    parser.add_argument("--repeat", type=int, default=5, help="지연 시간 측정 반복 횟수")
+    parser.add_argument("--json", action="store_true", help="결과를 JSON으로 출력")
+    args = parser.parse_args()
+
+    embeddings = load_embeddings(args.store, args.model)
+    queries = load_queries(embeddings, args.model, args.corpus_queries)
+    embeddings = replicate(embeddings, args.replicate)
+    rows = run_benchmark(embeddings, queries, args.k, args.rescore, args.subspaces, args.repeat)
+    if args.json:
+        print(json.dumps(rows, ensure_ascii=False, indent=2))
+    else:
+        print(f"청크 {len(embeddings)}개 × {embeddings.shape[1]}차원, 질문 {len(queries)}개\n")
+        print_table(rows, args.k)
+
+if __name__ == "__main__":
+    main()
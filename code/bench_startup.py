@@ -0,0 +1,133 @@
+"""rag_chatbot 임포트 시간 및 첫 질문 지연 벤치마크
+
+콜드 스타트 비용을 새 파이썬 프로세스에서 측정합니다.
+    - import rag_chatbot 소요 시간 (인터프리터 기동 시간 제외) 및 가장 느린 임포트 모듈
+    - 컬렉션 연결, Cross-encoder 로드, 첫 검색/두 번째 검색, (선택) 첫 응답 생성 시간
+
+실행 예시 (저장소 루트에서):
+    python code/bench_startup.py --runs 5 --max-import-ms 300
+    python code/bench_startup.py --first-query --mock
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+CODE_DIR = Path(__file__).resolve().parent
+ROOT_DIR = CODE_DIR.parent
+
+def _run_python(args, env=None) -> subprocess.CompletedProcess:
+    return subprocess.run(
+        [sys.executable] + args,
+        cwd=ROOT_DIR,
+        env={**os.environ, "PYTHONPATH": str(CODE_DIR), **(env or {})},
+        capture_output=True,
+        text=True,
+    )
+
+def _wall_time(args) -> float:
+    start = time.perf_counter()
+    proc = _run_python(args)
+    elapsed = time.perf_counter() - start
+    if proc.returncode != 0:
+        raise RuntimeError(proc.stderr)
+    return elapsed
+
+def parse_importtime(stderr: str, top: int = 10):
+    """`python -X importtime` 출력에서 누적 시간이 큰 최상위 임포트 목록 추출"""
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        _, cumulative_us, name = line[len("import time:"):].split("|")
+        # 들여쓰기 깊이 1 = rag_chatbot이 직접 임포트한 모듈
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        if depth == 1:
+            rows.append((int(cumulative_us) / 1000, name.strip()))
+    rows.sort(reverse=True)
+    return rows[:top]
+
+def measure_import(runs: int):
+    """import rag_chatbot 시간(ms)을 runs번 측정 (빈 인터프리터 기동 시간은 차감)"""
+    baseline = statistics.median(_wall_time(["-c", "pass"]) for _ in range(runs))
+    samples = [(_wall_time(["-c", "import rag_chatbot"]) - baseline) * 1000 for _ in range(runs)]
+
+    proc = _run_python(["-X", "importtime", "-c", "import rag_chatbot"])
+    return samples, parse_importtime(proc.stderr)
+
+def _first_query_child(use_mock: bool, query: str):
+    """(자식 프로세스) 콜드 상태에서 단계별 첫 실행 시간 측정 후 JSON 출력"""
+    timings = {}
+
+    def timed(name, fn):
+        start = time.perf_counter()
+        result = fn()
+        timings[name] = round((time.perf_counter() - start) * 1000, 1)
+        return result
+
+    server = None
+    if use_mock:
+        from mock_llm_server import MockConfig, start_mock_server
+        server = start_mock_server(MockConfig())
+        os.environ["OPENAI_BASE_URL"] = server.base_url
+        os.environ["OPENAI_API_KEY"] = "mock"
+
+    rag = timed("import_rag_chatbot", lambda: __import__("rag_chatbot"))
+    collection = timed("get_collection", rag.get_collection)
+    timed("get_cross_encoder", rag.get_cross_encoder)
+    filters = rag.extract_metadata_filters(query)
+    timed("first_retrieval", lambda: rag.get_relevant_context(query, collection, metadata_filters=filters))
+    timed("second_retrieval", lambda: rag.get_relevant_context(query, collection, metadata_filters=filters))
+    if use_mock or os.getenv("OPENAI_API_KEY"):
+        timed("first_answer", lambda: rag.answer_query(query, collection))
+
+    if server is not None:
+        server.shutdown()
+    print(json.dumps(timings))
+
+def measure_first_query(use_mock: bool, query: str):
+    args = [str(CODE_DIR / "bench_startup.py"), "--child-first-query", "--query", query]
+    if use_mock:
+        args.append("--mock")
+    proc = _run_python(args)
+    if proc.returncode != 0:
+        raise RuntimeError(proc.stderr)
+    return json.loads(proc.stdout.strip().splitlines()[-1])
+
+def main():
+    parser = argparse.ArgumentParser(description="rag_chatbot 콜드 스타트 벤치마크")
+    parser.add_argument("--runs", type=int, default=5, help="임포트 시간 측정 반복 횟수")
+    parser.add_argument("--max-import-ms", type=float, default=None,
+                        help="임포트 시간(중앙값)이 이 값을 넘으면 종료 코드 1로 실패")
+    parser.add_argument("--first-query", action="store_true", help="첫 질문 지연도 측정")
+    parser.add_argument("--mock", action="store_true", help="모의 LLM 서버로 응답 생성까지 측정")
+    parser.add_argument("--query", default="CJ의 탄소배출량 감축 목표는?")
+    parser.add_argument("--child-first-query", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child_first_query:
+        _first_query_child(args.mock, args.query)
+        return
+
+    samples, slowest = measure_import(args.runs)
+    median_ms = statistics.median(samples)
+    print(f"import rag_chatbot: 중앙값 {median_ms:.1f}ms (최소 {min(samples):.1f}ms, 최대 {max(samples):.1f}ms, {args.runs}회)")
+    print("느린 임포트 모듈 (누적):")
+    for ms, name in slowest:
+        print(f"  {ms:8.1f}ms  {name}")
+
+    if args.first_query:
+        print("\n첫 질문 단계별 시간 (콜드 프로세스):")
+        for name, ms in measure_first_query(args.mock, args.query).items():
+            print(f"  {name:<20} {ms:8.1f}ms")
+
+    if args.max_import_ms is not None and median_ms > args.max_import_ms:
+        print(f"\n임포트 시간이 기준({args.max_import_ms}ms)을 초과했습니다.")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,292 @@
+"""열(column) 기반 청크 저장 형식 (메모리 맵 로드)
+
+outputs/<덱>_chunk.json은 청크마다 전체 메타데이터 dict를 반복하는 JSON이라 코퍼스 전체를 쓰려면(평가, 어휘 색인, 재임베딩 등)
+모든 청크를 파이썬 객체로 파싱해야 합니다. 이 형식은 같은 정보를 열 단위 배열로 저장하고 np.load(mmap_mode="r")로 엽니다.
+
+디렉터리 구조 (기본 outputs/chunk_store, index_snapshots와 같은 버전 디렉터리 + CURRENT 포인터):
+    CURRENT                      현재 버전 이름 (적재는 새 버전을 다 쓴 뒤 이 파일만 원자적으로 교체)
+    versions/<버전>/store/       아래 파일들 (게시 후 다시 쓰지 않음, 메모리 맵으로 읽는 중인 프로세스는 이전 버전을 계속 사용)
+    (CURRENT가 없으면 path 자체를 저장소 디렉터리로 읽음)
+
+저장소 디렉터리:
+    meta.json          청크 수, 문자열 사전(section, sub_section, source, duplicate_pages, duplicates, report)과 열별 코드 dtype, 임베딩 모델/차원
+    text.bin           모든 청크 텍스트를 이어 붙인 UTF-8 바이트
+    offsets.npy        int64 (n + 1,)  청크 i의 텍스트 = text.bin[offsets[i]:offsets[i + 1]]
+    section.npy        uint16 (n,)     사전 인코딩된 코드 (sub_section.npy, source.npy 동일, 사전 값이 65,536개를 넘으면 uint32)
+    page_start.npy     int32 (n,)      page_end.npy 동일
+    chunk_index.npy    int32 (n,)      total_chunks.npy, duplicate_count.npy 동일
+    duplicate_pages.npy  uint16 (n,)   근사 중복 역참조 문자열의 사전 코드 (duplicates.npy, report.npy 동일, 없으면 "", 코드 dtype은 위와 같음)
+    embeddings.npy     float32 (n, d)  (선택)
+
+사용 예시 (저장소 루트에서):
+    python code/chunk_store.py convert outputs/*_chunk.json --out outputs/chunk_store --embed
+    python code/chunk_store.py info outputs/chunk_store
+"""
+import argparse
+import glob
+import json
+import mmap
+import os
+from pathlib import Path
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+from index_snapshots import VERSIONS_DIR, SnapshotStore
+
+CHUNK_STORE_PATH = "./outputs/chunk_store"
+STORE_DIR = "store"
+# 이전 버전을 메모리 맵으로 열고 있는 프로세스가 있을 수 있으므로 최근 몇 개는 남겨 둠
+STORE_KEEP = 3
+FORMAT_VERSION = 2
+DICTIONARY_COLUMNS = ("section", "sub_section", "source")
+INT_COLUMNS = ("page_start", "page_end", "chunk_index", "total_chunks", "duplicate_count")
+# 근사 중복 제거(dedup.py)로 대표 청크에만 있는 메타데이터와 덱 이름 (빈 문자열/0이면 metadata()에 넣지 않음)
+OPTIONAL_TEXT_COLUMNS = ("duplicate_pages", "duplicates", "report")
+
+def parse_page_range(page_range: str) -> tuple:
+    """"3-9" → (3, 9), 알 수 없으면 (0, 0)"""
+    try:
+        start, _, end = str(page_range).partition("-")
+        return int(start), int(end or start)
+    except ValueError:
+        return 0, 0
+
+def code_dtype(size: int) -> np.dtype:
+    """사전 크기에 맞는 코드 dtype (uint16으로 표현할 수 없으면 uint32)"""
+    return np.dtype(np.uint16) if size <= np.iinfo(np.uint16).max + 1 else np.dtype(np.uint32)
+
+def resolve_store_path(path: str = CHUNK_STORE_PATH) -> Path:
+    """저장소 경로 → 실제 파일이 있는 디렉터리 (CURRENT가 가리키는 버전, CURRENT가 없으면 path 자체)"""
+    root = Path(path)
+    version = SnapshotStore(str(root)).current_version()
+    return root / VERSIONS_DIR / version / STORE_DIR if version else root
+
+def store_exists(path: str = CHUNK_STORE_PATH) -> bool:
+    return (resolve_store_path(path) / "meta.json").exists()
+
+def _write_columns(chunks: List[Dict], directory: Path, embeddings: Optional[np.ndarray], embedding_model: Optional[str]):
+    encoded = [chunk["text"].encode("utf-8") for chunk in chunks]
+    offsets = np.zeros(len(chunks) + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum([len(b) for b in encoded])
+    with open(directory / "text.bin", "wb") as f:
+        f.write(b"".join(encoded))
+    np.save(directory / "offsets.npy", offsets)
+
+    dictionaries, code_dtypes = {}, {}
+    for column in DICTIONARY_COLUMNS + OPTIONAL_TEXT_COLUMNS:
+        values = [chunk["metadata"].get(column, "") for chunk in chunks]
+        dictionary = sorted(set(values))
+        index = {value: code for code, value in enumerate(dictionary)}
+        # duplicates처럼 청크마다 거의 다른 값은 65,536개를 넘을 수 있으므로 uint16에 넣으면 코드가 넘침
+        dtype = code_dtype(len(dictionary))
+        np.save(directory / f"{column}.npy", np.array([index[v] for v in values], dtype=dtype))
+        dictionaries[column] = dictionary
+        code_dtypes[column] = dtype.name
+
+    columns = {name: [] for name in INT_COLUMNS}
+    for chunk in chunks:
+        metadata = chunk["metadata"]
+        start, end = parse_page_range(metadata.get("page_range", ""))
+        columns["page_start"].append(metadata.get("page_start", start))
+        columns["page_end"].append(metadata.get("page_end", end))
+        columns["chunk_index"].append(metadata.get("chunk_index", 0))
+        columns["total_chunks"].append(metadata.get("total_chunks_in_section", 0))
+        columns["duplicate_count"].append(metadata.get("duplicate_count", 0))
+    for name, values in columns.items():
+        np.save(directory / f"{name}.npy", np.array(values, dtype=np.int32))
+
+    meta = {"format_version": FORMAT_VERSION, "count": len(chunks), "dictionaries": dictionaries,
+            "code_dtypes": code_dtypes}
+    if embeddings is not None:
+        embeddings = np.ascontiguousarray(embeddings, dtype=np.float32)
+        np.save(directory / "embeddings.npy", embeddings)
+        meta.update({"embedding_model": embedding_model, "embedding_dim": int(embeddings.shape[1])})
+    with open(directory / "meta.json", "w", encoding="utf-8") as f:
+        json.dump(meta, f, ensure_ascii=False, indent=2)
+
+def write_chunk_store(chunks: List[Dict], path: str = CHUNK_STORE_PATH,
+                      embeddings: Optional[np.ndarray] = None, embedding_model: Optional[str] = None,
+                      add_files: Optional[Callable[[str], None]] = None) -> str:
+    """청크 목록({"text", "metadata"})을 열 기반 형식의 새 버전으로 게시하고 그 디렉터리 반환
+
+       임시 디렉터리에 모두 쓴 뒤 버전 디렉터리로 옮기고 CURRENT만 원자적으로 바꾸므로,
+       읽는 쪽은 항상 이전 버전 또는 새 버전 전체를 봅니다.
+       add_files(디렉터리)는 게시 전에 같은 버전에 파일을 더 씁니다 (예: 압축 코드).
+    """
+    if embeddings is not None and len(embeddings) != len(chunks):
+        raise ValueError(f"임베딩 수({len(embeddings)})가 청크 수({len(chunks)})와 다릅니다.")
+
+    def build(data_path: str) -> Dict:
+        directory = Path(data_path)
+        directory.mkdir()
+        _write_columns(chunks, directory, embeddings, embedding_model)
+        if add_files is not None:
+            add_files(data_path)
+        return {"count": len(chunks), "embedding_model": embedding_model}
+
+    snapshots = SnapshotStore(path)
+    version = snapshots.publish(build, data_dir=STORE_DIR)
+    snapshots.prune(STORE_KEEP)
+    return str(snapshots.version_path(version) / STORE_DIR)
+
+class ChunkStore:
+    """열 기반 청크 저장소 읽기 (배열은 메모리 맵, 텍스트는 필요할 때만 디코딩)
+
+       path가 버전 디렉터리 루트면 연 시점의 CURRENT 버전에 고정됩니다 (self.path가 실제 디렉터리).
+    """
+
+    def __init__(self, path: str = CHUNK_STORE_PATH):
+        self.path = resolve_store_path(path)
+        with open(self.path / "meta.json", encoding="utf-8") as f:
+            self.meta = json.load(f)
+        if self.meta.get("format_version") != FORMAT_VERSION:
+            raise ValueError(f"지원하지 않는 청크 저장소 형식입니다: {self.meta.get('format_version')}")
+
+        self.dictionaries: Dict[str, List[str]] = self.meta["dictionaries"]
+        # code_dtypes가 없는 저장소는 모든 사전 열이 uint16
+        self.code_dtypes: Dict[str, str] = self.meta.get("code_dtypes", {})
+        self.offsets = self._load("offsets")
+        self.columns = {name: self._load(name) for name in DICTIONARY_COLUMNS + INT_COLUMNS}
+        for column in OPTIONAL_TEXT_COLUMNS:
+            # 열이 추가되기 전에 만든 저장소는 모두 빈 값
+            if (self.path / f"{column}.npy").exists():
+                self.columns[column] = self._load(column)
+            else:
+                self.columns[column] = np.zeros(len(self), dtype=np.uint16)
+                self.dictionaries.setdefault(column, [""])
+        self.embeddings: Optional[np.ndarray] = self._load("embeddings") if (self.path / "embeddings.npy").exists() else None
+
+        with open(self.path / "text.bin", "rb") as f:
+            size = os.fstat(f.fileno()).st_size
+            self._text = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if size else b""
+
+    def _load(self, name: str) -> np.ndarray:
+        array = np.load(self.path / f"{name}.npy", mmap_mode="r")
+        expected = self.code_dtypes.get(name)
+        if expected is not None and array.dtype != np.dtype(expected):
+            raise ValueError(f"{name}.npy의 코드 dtype({array.dtype})이 meta.json({expected})과 다릅니다.")
+        return array
+
+    def __len__(self) -> int:
+        return self.meta["count"]
+
+    def text(self, i: int) -> str:
+        return self._text[self.offsets[i]:self.offsets[i + 1]].decode("utf-8")
+
+    def texts(self, indices=None) -> List[str]:
+        indices = range(len(self)) if indices is None else indices
+        return [self.text(int(i)) for i in indices]
+
+    def codes(self, column: str) -> np.ndarray:
+        """사전 인코딩된 열의 코드 배열 (uint16, 사전이 크면 uint32)"""
+        return self.columns[column]
+
+    def column(self, column: str) -> np.ndarray:
+        """열 전체 값 (사전 열은 문자열로 디코딩)"""
+        if column in DICTIONARY_COLUMNS + OPTIONAL_TEXT_COLUMNS:
+            return np.asarray(self.dictionaries[column], dtype=object)[self.columns[column]]
+        return np.asarray(self.columns[column])
+
+    def metadata(self, i: int) -> Dict:
+        """기존 JSON 청크와 같은 형태의 메타데이터 dict (중복 역참조 필드는 있는 청크에만)"""
+        page_start, page_end = int(self.columns["page_start"][i]), int(self.columns["page_end"][i])
+        metadata = {
+            "section": self.dictionaries["section"][self.columns["section"][i]],
+            "sub_section": self.dictionaries["sub_section"][self.columns["sub_section"][i]],
+            "source": self.dictionaries["source"][self.columns["source"][i]],
+            "page_range": f"{page_start}-{page_end}",
+            "page_start": page_start,
+            "page_end": page_end,
+            "chunk_index": int(self.columns["chunk_index"][i]),
+            "total_chunks_in_section": int(self.columns["total_chunks"][i]),
+        }
+        if self.columns["duplicate_count"][i]:
+            metadata["duplicate_count"] = int(self.columns["duplicate_count"][i])
+        for column in OPTIONAL_TEXT_COLUMNS:
+            value = self.dictionaries[column][self.columns[column][i]]
+            if value:
+                metadata[column] = value
+        return metadata
+
+    def __getitem__(self, i: int) -> Dict:
+        return {"text": self.text(i), "metadata": self.metadata(i)}
+
+    def __iter__(self) -> Iterator[Dict]:
+        for i in range(len(self)):
+            yield self[i]
+
+    def where(self, **filters: str) -> np.ndarray:
+        """사전 열 값이 모두 일치하는 청크 번호 (예: where(source="CJ", section="Social"))"""
+        mask = np.ones(len(self), dtype=bool)
+        for column, value in filters.items():
+            dictionary = self.dictionaries[column]
+            if value not in dictionary:
+                return np.zeros(0, dtype=np.int64)
+            mask &= self.columns[column] == dictionary.index(value)
+        return np.flatnonzero(mask)
+
+def load_json_chunks(paths: List[str]) -> List[Dict]:
+    chunks = []
+    for path in paths:
+        with open(path, encoding="utf-8") as f:
+            chunks.extend(json.load(f))
+    return chunks
+
+def replace_sources(path: str, chunks: List[Dict], embeddings: np.ndarray,
+                    embedding_model: Optional[str]) -> Optional[Tuple[List[Dict], np.ndarray]]:
+    """현재 저장소에서 chunks의 회사(source) 청크만 새 청크로 바꾼 전체 (청크, 임베딩)
+
+       다른 회사 청크와 임베딩은 저장소에서 그대로 가져옴 (다시 임베딩하지 않음).
+       저장소가 없거나 임베딩이 없거나 임베딩 모델이 다르면 None
+    """
+    if not store_exists(path):
+        return None
+    store = ChunkStore(path)
+    if store.embeddings is None or store.meta.get("embedding_model") != embedding_model:
+        return None
+    sources = sorted({chunk["metadata"].get("source", "") for chunk in chunks})
+    rows = np.flatnonzero(~np.isin(store.column("source"), sources))
+    kept = [store[int(i)] for i in rows]
+    return kept + list(chunks), np.concatenate([np.asarray(store.embeddings[rows]), np.asarray(embeddings, dtype=np.float32)])
+
+def embed_chunks(chunks: List[Dict], model_name: str, batch_size: int = 64) -> np.ndarray:
+    """청크 텍스트 임베딩 (RAG_EMBEDDING_SERVICE가 설정되면 공유 임베딩 서비스 사용)"""
+    from embedding_service import make_embedding_function
+
+    embedding_function = make_embedding_function(model_name)
+    texts = [chunk["text"] for chunk in chunks]
+    vectors = []
+    for start in range(0, len(texts), batch_size):
+        vectors.extend(embedding_function(texts[start:start + batch_size]))
+    return np.asarray(vectors, dtype=np.float32)
+
+def main():
+    parser = argparse.ArgumentParser(description="열 기반 청크 저장소 변환/확인")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    convert_parser = subparsers.add_parser("convert", help="outputs/*_chunk.json → 열 기반 저장소")
+    convert_parser.add_argument("inputs", nargs="*", help="청크 JSON 파일 (기본: outputs/*_chunk.json)")
+    convert_parser.add_argument("--out", default=CHUNK_STORE_PATH)
+    convert_parser.add_argument("--embed", action="store_true", help="청크 임베딩 행렬도 함께 저장")
+    convert_parser.add_argument("--model", default="jhgan/ko-sroberta-multitask")
+    info_parser = subparsers.add_parser("info", help="저장소 요약")
+    info_parser.add_argument("path", nargs="?", default=CHUNK_STORE_PATH)
+    args = parser.parse_args()
+
+    if args.command == "convert":
+        inputs = args.inputs or sorted(glob.glob("outputs/*_chunk.json"))
+        chunks = load_json_chunks(inputs)
+        embeddings = embed_chunks(chunks, args.model) if args.embed else None
+        path = write_chunk_store(chunks, args.out, embeddings, args.model if args.embed else None)
+        print(f"{len(inputs)}개 파일의 청크 {len(chunks)}개를 {path}에 저장했습니다.")
+    elif args.command == "info":
+        store = ChunkStore(args.path)
+        size = sum(p.stat().st_size for p in store.path.iterdir())
+        print(f"청크 {len(store)}개, {size / 1024:.0f}KB")
+        for column in DICTIONARY_COLUMNS:
+            print(f"  {column}: {len(store.dictionaries[column])}개 값")
+        if store.embeddings is not None:
+            print(f"  임베딩: {store.embeddings.shape} ({store.meta.get('embedding_model')})")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,191 @@
+"""토큰 예산이 고정된 대화 기록(메모리)
+
+최근 몇 턴은 원문 그대로 유지하고, 예산을 넘는 오래된 턴은 누적 요약(running summary)으로
+점진적으로 압축합니다. 요약(LLM 호출)은 답변을 보여준 뒤 summarize_pending으로 따로 실행할 수 있고,
+그동안 밀려난 턴은 pending에 원문으로 남아 대화 기록에 포함됩니다. 후속 질문이면 이전 턴에서 검색한 문서를 재사용할 수 있도록
+마지막 검색 결과도 함께 보관합니다.
+"""
+import math
+import re
+import threading
+from collections import deque
+from dataclasses import dataclass
+from typing import Callable, Deque, Dict, List, Optional
+
+# 이전 답변을 가리키는 지시 표현 (짧은 질문의 맨 앞에 올 때만 후속 질문으로 판단)
+# "자세히", "예시", "추가로"처럼 새 질문에도 흔한 일반 표현은 포함하지 않음
+FOLLOW_UP_MARKERS = (
+    "그럼", "그러면", "그렇다면", "그건", "그것", "그거", "그게", "그중", "그 중",
+    "이건", "이것", "이거", "위 내용", "위의", "방금", "앞서", "앞에서", "말씀하신",
+)
+FOLLOW_UP_MAX_CHARS = 40  # 이보다 긴 질문은 새 주제를 담고 있을 가능성이 높아 새로 검색
+
+# 지시 표현 + 선택적 조사 뒤에 단어가 끝나야 함 ("그것은"은 해당, "그린본드"는 해당 안 됨)
+# 관형사 "그"는 조사 없이 공백이 뒤따를 때만 ("그 회사"는 해당, "그룹", "그래프", "그로 인해"는 해당 안 됨)
+_FOLLOW_UP_PATTERN = re.compile(
+    r"^(?:(?:" + "|".join(re.escape(marker).replace(r"\ ", r"\s*") for marker in sorted(FOLLOW_UP_MARKERS, key=len, reverse=True))
+    + r")(?:은|는|이|가|을|를|의|에|도|에서|으로|로)?(?![가-힣A-Za-z0-9])|그\s)"
+)
+
+def estimate_tokens(text: str) -> int:
+    """대략적인 토큰 수 추정 (한국어 기준 약 2글자당 1토큰)"""
+    return math.ceil(len(text) / 2) if text else 0
+
+def truncate_to_tokens(text: str, max_tokens: int, keep: str = "head") -> str:
+    """토큰 예산에 맞게 텍스트 자르기 (keep="tail"이면 뒷부분 유지)"""
+    if estimate_tokens(text) <= max_tokens:
+        return text
+    max_chars = max(0, max_tokens * 2)
+    return "…" + text[-max_chars:] if keep == "tail" else text[:max_chars] + "…"
+
+@dataclass
+class Turn:
+    user: str
+    assistant: str
+
+    @property
+    def tokens(self) -> int:
+        return estimate_tokens(self.user) + estimate_tokens(self.assistant)
+
+class ConversationMemory:
+    """고정 토큰 예산 안에서 최근 턴 원문과 누적 요약을 관리
+
+       - max_recent_turns: 원문으로 유지할 최근 턴 수
+       - token_budget: 요약 + 최근 턴 원문에 사용할 전체 토큰 예산
+       - summary_token_budget: 누적 요약에 사용할 최대 토큰 수
+    """
+
+    def __init__(self, max_recent_turns: int = 3, token_budget: int = 1500, summary_token_budget: int = 300):
+        self.max_recent_turns = max_recent_turns
+        self.token_budget = token_budget
+        self.summary_token_budget = summary_token_budget
+        self.summary = ""
+        self.recent: Deque[Turn] = deque()
+        # 예산을 넘어 밀려났지만 아직 요약에 합치지 않은 턴 (summarize_pending에서 처리)
+        self.pending: List[Turn] = []
+        self._lock = threading.Lock()
+        self._summarize_lock = threading.Lock()
+        self._generation = 0  # clear()마다 증가 (초기화 전에 시작한 요약 결과는 버림)
+
+        # 후속 질문에서 재사용할 직전 검색 결과
+        self.last_context = ""
+        self.last_metadata_summary: Dict = {}
+        self.last_filters: Dict[str, str] = {}
+
+    @property
+    def tokens(self) -> int:
+        return estimate_tokens(self.summary) + sum(turn.tokens for turn in self.pending + list(self.recent))
+
+    def is_empty(self) -> bool:
+        return not self.recent and not self.pending and not self.summary
+
+    def clear(self):
+        with self._lock:
+            self.summary = ""
+            self.recent.clear()
+            self.pending = []
+            self._generation += 1
+            self.last_context = ""
+            self.last_metadata_summary = {}
+            self.last_filters = {}
+
+    def add_turn(self, user: str, assistant: str, summarizer: Optional[Callable[[str, List[Turn]], str]] = None,
+                 context: Optional[str] = None, metadata_summary: Optional[Dict] = None,
+                 metadata_filters: Optional[Dict[str, str]] = None):
+        """새 턴을 추가하고, 예산을 넘는 오래된 턴은 pending으로 옮김
+
+           summarizer(기존 요약, 밀려난 턴 목록) -> 새 요약을 주면 바로 요약에 합치고,
+           없으면 나중에 summarize_pending으로 합침 (답변을 먼저 보여주기 위해)
+        """
+        with self._lock:
+            # 한 턴이 예산 전체를 차지하지 않도록 답변 원문은 예산의 절반까지만 유지
+            self.recent.append(Turn(user, truncate_to_tokens(assistant, self.token_budget // 2)))
+
+            while len(self.recent) > 1 and (
+                len(self.recent) > self.max_recent_turns
+                or estimate_tokens(self.summary) + sum(turn.tokens for turn in self.recent) > self.token_budget
+            ):
+                self.pending.append(self.recent.popleft())
+
+            if context:
+                self.last_context = context
+                self.last_metadata_summary = metadata_summary or {}
+                self.last_filters = dict(metadata_filters or {})
+
+        if summarizer is not None:
+            self.summarize_pending(summarizer)
+
+    def summarize_pending(self, summarizer: Callable[[str, List[Turn]], str]) -> bool:
+        """pending 턴을 summarizer로 누적 요약에 합침 (백그라운드 스레드에서 호출 가능), 합친 턴이 있으면 True"""
+        # 요약은 한 번에 하나씩 (이전 요약 결과를 이어받아야 하므로)
+        with self._summarize_lock:
+            with self._lock:
+                evicted, summary, generation = list(self.pending), self.summary, self._generation
+            if not evicted:
+                return False
+            try:
+                summary = summarizer(summary, evicted)
+            except Exception as e:
+                print(f"대화 요약 중 오류 발생: {e}")
+                summary = "\n".join([summary] + [f"사용자: {t.user}" for t in evicted]).strip()
+            with self._lock:
+                if generation != self._generation:
+                    return False
+                self.summary = truncate_to_tokens(summary, self.summary_token_budget, keep="tail")
+                # 요약하는 동안 새로 밀려난 턴은 다음 요약에서 처리
+                del self.pending[:len(evicted)]
+            return True
+
+    def to_dict(self) -> Dict:
+        """세션 저장소(SQLite)에 보관할 상태 (metadata_summary의 set은 정렬된 리스트로)"""
+        with self._lock:
+            return {
+                "summary": self.summary,
+                "pending": [[turn.user, turn.assistant] for turn in self.pending],
+                "recent": [[turn.user, turn.assistant] for turn in self.recent],
+                "last_context": self.last_context,
+                "last_metadata_summary": {key: sorted(values) if isinstance(values, (set, frozenset)) else values
+                                          for key, values in self.last_metadata_summary.items()},
+                "last_filters": self.last_filters,
+            }
+
+    @classmethod
+    def from_dict(cls, state: Dict, **kwargs) -> "ConversationMemory":
+        """to_dict()로 저장한 상태 복원 (예산 설정은 kwargs, 저장된 턴은 최근 max_recent_turns개만)"""
+        memory = cls(**kwargs)
+        memory.summary = state.get("summary", "")
+        memory.pending = [Turn(user, assistant) for user, assistant in state.get("pending", [])]
+        memory.recent.extend(Turn(user, assistant) for user, assistant in state.get("recent", [])[-memory.max_recent_turns:])
+        memory.last_context = state.get("last_context", "")
+        memory.last_metadata_summary = state.get("last_metadata_summary") or {}
+        memory.last_filters = dict(state.get("last_filters") or {})
+        return memory
+
+    def build_messages(self) -> List[Dict[str, str]]:
+        """generate_response에 전달할 대화 기록 메시지 목록 (요약 + 아직 요약하지 않은 턴 + 최근 턴)"""
+        with self._lock:
+            summary, turns = self.summary, self.pending + list(self.recent)
+        messages = []
+        if summary:
+            messages.append({"role": "system", "content": f"이전 대화 요약:\n{summary}"})
+        for turn in turns:
+            messages.append({"role": "user", "content": turn.user})
+            messages.append({"role": "assistant", "content": turn.assistant})
+        return messages
+
+    def is_follow_up(self, query: str, metadata_filters: Optional[Dict[str, str]] = None) -> bool:
+        """직전 질문을 이어서 묻는 질문인지 판단 (이전 검색 결과를 재사용해도 되는지)
+
+           - 이전 검색 결과가 없으면 False
+           - 질문에 새로운 회사/섹션 필터가 있고 직전과 다르면 False
+           - 짧은 질문(FOLLOW_UP_MAX_CHARS 이하)이 지시 표현(그럼, 그것, 위 내용 등)으로 시작하면 True
+        """
+        if not self.last_context:
+            return False
+
+        for field, value in (metadata_filters or {}).items():
+            if self.last_filters.get(field) != value:
+                return False
+
+        query = query.strip()
+        return len(query) <= FOLLOW_UP_MAX_CHARS and _FOLLOW_UP_PATTERN.match(query) is not None
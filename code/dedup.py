@@ -0,0 +1,262 @@
+"""적재 단계 근사 중복 청크 제거 (MinHash + LSH)
+
+지속가능경영보고서는 섹션 표지, 비전 문구, 머리말/꼬리말 같은 상투 문구가 슬라이드와 연도마다 반복됩니다.
+모두 임베딩해 저장하면 인덱스가 커지고 검색 상위 k개가 같은 내용으로 채워지므로, 적재 전에 근사 중복을 합칩니다.
+    - 청크 텍스트를 정규화(공백/문장부호 제거, 숫자는 유지)한 뒤 한글 문자 단위 n-gram(기본 5글자) 집합으로 표현
+    - MinHash 서명(기본 128개 해시)을 계산하고 LSH(밴드 b × 행 r)로 후보 쌍만 찾음
+    - 후보 쌍의 실제 자카드 유사도가 임계값 이상이면 중복으로 판단
+      (n-gram이 MIN_SHINGLES개 미만인 짧은 청크는 비교하지 않고 항상 남김)
+    - 긴 청크는 수치가 모두 달라도 n-gram 유사도가 0.8 안팎이므로, 청크에 나오는 수치(숫자 집합)가 다르면 합치지 않음
+      (연도별 배출량처럼 문장은 같고 수치만 다른 청크는 다른 내용, 단 둘 다 BOILERPLATE_CHARS자 미만인
+       짧은 상투 문구는 쪽 번호만 다른 꼬리말처럼 수치가 달라도 합침)
+    - 먼저 나온 청크(앞 페이지)를 대표로 남기고, 중복 청크의 위치는 대표 청크 메타데이터에 역참조로 기록
+        duplicate_count  합쳐진 중복 청크 수
+        duplicate_pages  중복 청크의 "서브섹션 p.페이지" 목록 (출처 표시용, "; "로 구분)
+        duplicates       중복 청크 각각의 메타데이터(section, sub_section, page_range 등) JSON 목록
+                         (페이지 색인은 이 위치로도 대표 청크를 찾음)
+
+회사 필터와 샤드가 source 기준이므로 중복 제거는 회사(source) 안에서 합니다. 같은 회사의 여러 연도 덱
+(<회사>_<연도>.pptx)은 source가 같으므로 연도마다 반복된 문구도 합쳐지고, 역참조에는 덱 이름(report)도 기록합니다.
+섹션 필터로 찾을 수 없게 되지 않도록 같은 섹션 안의 청크끼리만 합칩니다.
+
+임계값(기본 0.8): 번들 덱에서 같은 섹션 청크 쌍의 최대 자카드 유사도는 KTNG 0.845(같은 NGP 전략 문단 반복),
+SHINHAN 0.833(쪽 번호만 다른 꼬리말)이고 그 다음은 0.31 이하(CJ, SAMPYO는 0.15 미만)입니다.
+실제 중복보다 조금 낮게 두어 연도마다 몇 글자씩 고친 문구도 합치도록 했습니다 (아래 명령이 덱별 최대 유사도를 출력).
+
+사용 예시 (저장소 루트에서, 이미 만든 청크 JSON의 중복 현황 확인):
+    python code/dedup.py outputs/*_chunk.json --threshold 0.8
+"""
+import argparse
+import glob
+import json
+import re
+import zlib
+from typing import Dict, List, Optional, Set, Tuple
+
+import numpy as np
+
+DEDUP_THRESHOLD = 0.8
+SHINGLE_SIZE = 5
+MIN_SHINGLES = 20  # 이보다 n-gram이 적은 청크(표 조각, 제목 등)는 중복 판단에서 제외
+BOILERPLATE_CHARS = 100  # 이보다 짧은 청크끼리는 수치(쪽 번호, 연도)가 달라도 합침
+NUM_PERM = 128
+EMBEDDING_BYTES = 768 * 4  # 청크 하나의 임베딩 크기 (ko-sroberta float32)
+
+_MERSENNE_PRIME = (1 << 31) - 1
+_NON_WORD = re.compile(r"[\s\W_]+")
+_NUMBER = re.compile(r"\d+(?:[.,]\d+)*")
+
+def shingles(text: str, size: int = SHINGLE_SIZE) -> Set[str]:
+    """공백/문장부호를 제거한 문자열의 글자 단위 n-gram 집합 (한글은 음절 단위, 숫자는 내용이므로 유지)"""
+    normalized = _NON_WORD.sub("", text.lower())
+    if len(normalized) <= size:
+        return {normalized} if normalized else set()
+    return {normalized[i:i + size] for i in range(len(normalized) - size + 1)}
+
+def numbers(text: str) -> Set[str]:
+    """청크에 나오는 수치 ("4,374", "2.5", "2024" 등)"""
+    return set(_NUMBER.findall(text))
+
+def same_figures(a: str, b: str) -> bool:
+    """두 청크를 합쳐도 수치를 잃지 않는지 (수치가 같거나, 둘 다 짧은 상투 문구)"""
+    return numbers(a) == numbers(b) or (len(a) < BOILERPLATE_CHARS and len(b) < BOILERPLATE_CHARS)
+
+class MinHasher:
+    """(a·x + b) mod p 형태의 해시 함수 num_perm개로 MinHash 서명 계산"""
+
+    def __init__(self, num_perm: int = NUM_PERM, seed: int = 1):
+        rng = np.random.default_rng(seed)
+        self.a = rng.integers(1, _MERSENNE_PRIME, num_perm, dtype=np.uint64)
+        self.b = rng.integers(0, _MERSENNE_PRIME, num_perm, dtype=np.uint64)
+
+    def signature(self, shingle_set: Set[str]) -> np.ndarray:
+        if not shingle_set:
+            return np.full(len(self.a), _MERSENNE_PRIME, dtype=np.uint64)
+        hashes = np.fromiter((zlib.crc32(s.encode("utf-8")) for s in shingle_set),
+                             dtype=np.uint64, count=len(shingle_set)) % _MERSENNE_PRIME
+        return ((self.a[:, None] * hashes[None, :] + self.b[:, None]) % _MERSENNE_PRIME).min(axis=1)
+
+def lsh_params(threshold: float, num_perm: int = NUM_PERM) -> Tuple[int, int]:
+    """임계값 근처에서 후보가 되기 시작하도록 (밴드 수, 밴드당 행 수) 선택: (1/b)^(1/r) ≈ threshold"""
+    best = None
+    for rows in range(1, num_perm + 1):
+        bands = num_perm // rows
+        error = abs((1 / bands) ** (1 / rows) - threshold)
+        if best is None or error < best[0]:
+            best = (error, bands, rows)
+    return best[1], best[2]
+
+def jaccard(a: Set[str], b: Set[str]) -> float:
+    if not a or not b:
+        return 0.0  # 내용이 없는 청크는 어떤 청크와도 중복이 아님
+    return len(a & b) / len(a | b)
+
+_DUPLICATE_FIELDS = ("section", "sub_section", "page_range", "page_start", "page_end", "chunk_index", "report")
+
+def _page_label(metadata: Dict, representative: Optional[Dict] = None) -> str:
+    """ "서브섹션 p.페이지" (대표 청크와 다른 덱이면 앞에 덱 이름)"""
+    label = f"{metadata.get('sub_section', '')} p.{metadata.get('page_range', '?')}"
+    report = metadata.get("report")
+    if report and representative is not None and report != representative.get("report"):
+        label = f"{report} {label}"
+    return label
+
+def duplicate_metadatas(metadata: Dict) -> List[Dict]:
+    """대표 청크에 합쳐진 중복 청크들의 원래 메타데이터 (출처 등 나머지 필드는 대표 청크 값)"""
+    if not metadata.get("duplicates"):
+        return []
+    return [{**metadata, **duplicate} for duplicate in json.loads(metadata["duplicates"])]
+
+def deduplicate_chunks(chunks: List[Dict], threshold: float = DEDUP_THRESHOLD,
+                       shingle_size: int = SHINGLE_SIZE, num_perm: int = NUM_PERM,
+                       min_shingles: int = MIN_SHINGLES) -> Tuple[List[Dict], Dict]:
+    """근사 중복 청크를 대표 청크에 합친 목록과 요약 반환: (남은 청크, {"before", "after", ...})
+
+       입력 순서를 유지하며, 각 청크는 앞에 남은 같은 섹션 청크 중 유사도 임계값 이상이고 수치가 같은 것
+       (same_figures)이 있으면 그 청크에 합쳐짐. 출처(source)는 구분하지 않으므로 회사별로 나눠 호출 (deduplicate_by_source)
+    """
+    hasher = MinHasher(num_perm)
+    bands, rows = lsh_params(threshold, num_perm)
+    # 섹션마다 별도의 LSH 버킷 (다른 섹션 청크와는 후보가 되지 않음)
+    section_buckets: Dict[str, List[Dict[bytes, List[int]]]] = {}
+    shingle_sets: List[Set[str]] = []
+    kept: List[int] = []
+    merged_into: Dict[int, int] = {}
+
+    for i, chunk in enumerate(chunks):
+        shingle_set = shingles(chunk["text"], shingle_size)
+        shingle_sets.append(shingle_set)
+        if len(shingle_set) < min_shingles:
+            kept.append(i)
+            continue
+        buckets = section_buckets.setdefault(chunk["metadata"].get("section", ""), [{} for _ in range(bands)])
+        signature = hasher.signature(shingle_set)
+        keys = [signature[band * rows:(band + 1) * rows].tobytes() for band in range(bands)]
+
+        # 같은 밴드 버킷에 들어간 대표 청크만 후보로 비교
+        candidates = {j for band, key in enumerate(keys) for j in buckets[band].get(key, ())}
+        match: Optional[int] = None
+        best = threshold
+        for j in sorted(candidates):
+            similarity = jaccard(shingle_set, shingle_sets[j])
+            if similarity >= best and same_figures(chunk["text"], chunks[j]["text"]):
+                match, best = j, similarity
+        if match is not None:
+            merged_into[i] = match
+            continue
+
+        kept.append(i)
+        for band, key in enumerate(keys):
+            buckets[band].setdefault(key, []).append(i)
+
+    # 대표 청크 메타데이터에 역참조 기록 (원본 청크는 수정하지 않음)
+    duplicates: Dict[int, List[int]] = {}
+    for i, j in merged_into.items():
+        duplicates.setdefault(j, []).append(i)
+    result = []
+    for i in kept:
+        chunk = chunks[i]
+        if i in duplicates:
+            metadata = dict(chunk["metadata"])
+            metadata["duplicate_count"] = len(duplicates[i])
+            metadata["duplicate_pages"] = "; ".join(_page_label(chunks[d]["metadata"], chunk["metadata"])
+                                                    for d in duplicates[i])
+            # 합쳐진 청크 각각의 섹션/서브섹션/페이지 (벡터 DB 메타데이터는 문자열만 허용하므로 JSON으로 저장)
+            metadata["duplicates"] = json.dumps(
+                [{field: chunks[d]["metadata"][field] for field in _DUPLICATE_FIELDS if field in chunks[d]["metadata"]}
+                 for d in duplicates[i]], ensure_ascii=False)
+            chunk = {**chunk, "metadata": metadata}
+        result.append(chunk)
+
+    removed_chars = sum(len(chunks[i]["text"]) for i in merged_into)
+    total_chars = sum(len(chunk["text"]) for chunk in chunks)
+    report = {
+        "before": len(chunks),
+        "after": len(result),
+        "removed": len(merged_into),
+        "chars_before": total_chars,
+        "chars_after": total_chars - removed_chars,
+        "bands": bands,
+        "rows": rows,
+    }
+    # 덱(report)별 청크 수 (같은 회사의 여러 연도 덱을 함께 처리한 경우 덱마다 감소량 표시)
+    decks: Dict[str, List[int]] = {}
+    for chunk in chunks:
+        decks.setdefault(chunk["metadata"].get("report", ""), [0, 0])[0] += 1
+    for chunk in result:
+        decks[chunk["metadata"].get("report", "")][1] += 1
+    if len(decks) > 1:
+        report["decks"] = decks
+    return result, report
+
+def deduplicate_by_source(chunks: List[Dict], threshold: float = DEDUP_THRESHOLD,
+                          **kwargs) -> Tuple[List[Dict], Dict[str, Dict]]:
+    """회사(source)마다 deduplicate_chunks 적용 (같은 회사의 여러 덱은 함께): (남은 청크, {source: 요약})
+
+       남은 청크는 회사가 처음 나온 순서, 회사 안에서는 입력 순서
+    """
+    by_source: Dict[str, List[Dict]] = {}
+    for chunk in chunks:
+        by_source.setdefault(chunk["metadata"].get("source", ""), []).append(chunk)
+    kept, reports = [], {}
+    for source, source_chunks in by_source.items():
+        source_kept, reports[source] = deduplicate_chunks(source_chunks, threshold, **kwargs)
+        kept.extend(source_kept)
+    return kept, reports
+
+def max_similarity(chunks: List[Dict], shingle_size: int = SHINGLE_SIZE,
+                   min_shingles: int = MIN_SHINGLES) -> Tuple[float, Optional[Tuple[int, int]]]:
+    """같은 섹션 청크 쌍의 최대 자카드 유사도와 그 쌍 (모든 쌍을 비교하므로 임계값 점검용)"""
+    sets = [shingles(chunk["text"], shingle_size) for chunk in chunks]
+    best, pair = 0.0, None
+    for i in range(len(chunks)):
+        if len(sets[i]) < min_shingles:
+            continue
+        for j in range(i + 1, len(chunks)):
+            if len(sets[j]) < min_shingles or chunks[i]["metadata"].get("section") != chunks[j]["metadata"].get("section"):
+                continue
+            similarity = jaccard(sets[i], sets[j])
+            if similarity > best:
+                best, pair = similarity, (i, j)
+    return best, pair
+
+def format_report(name: str, report: Dict) -> str:
+    """덱별 인덱스 크기 감소 요약 (청크 수, 텍스트, 임베딩 용량)"""
+    before, after = report["before"], report["after"]
+    ratio = (1 - after / before) * 100 if before else 0.0
+    text_kb = (report["chars_before"] - report["chars_after"]) / 1024
+    embedding_kb = report["removed"] * EMBEDDING_BYTES / 1024
+    line = (f"{name:<10} 청크 {before} → {after} (-{report['removed']}, {ratio:.1f}% 감소), "
+            f"텍스트 -{text_kb:.1f}K자, 임베딩 -{embedding_kb:.0f}KB")
+    if "decks" in report:
+        line += " [" + ", ".join(f"{deck} {b} → {a}" for deck, (b, a) in sorted(report["decks"].items())) + "]"
+    return line
+
+def main():
+    parser = argparse.ArgumentParser(description="청크 JSON의 근사 중복 현황 확인 (같은 회사 덱은 함께)")
+    parser.add_argument("inputs", nargs="*", help="청크 JSON 파일 (기본: outputs/*_chunk.json)")
+    parser.add_argument("--threshold", type=float, default=DEDUP_THRESHOLD, help="중복으로 볼 자카드 유사도")
+    parser.add_argument("--shingle-size", type=int, default=SHINGLE_SIZE)
+    parser.add_argument("--show", type=int, default=3, help="회사마다 보여 줄 중복 예시 수")
+    args = parser.parse_args()
+
+    chunks = []
+    for path in args.inputs or sorted(glob.glob("outputs/*_chunk.json")):
+        with open(path, encoding="utf-8") as f:
+            chunks.extend(json.load(f))
+    kept, reports = deduplicate_by_source(chunks, args.threshold, shingle_size=args.shingle_size)
+    for source, report in reports.items():
+        source_chunks = [chunk for chunk in chunks if chunk["metadata"].get("source", "") == source]
+        similarity, pair = max_similarity(source_chunks, args.shingle_size)
+        print(format_report(source, report) + f", 최대 유사도 {similarity:.3f}")
+        if pair is not None and similarity < args.threshold:
+            print(f"    (가장 비슷한 쌍: {_page_label(source_chunks[pair[0]]['metadata'])} / "
+                  f"{_page_label(source_chunks[pair[1]]['metadata'])})")
+        examples = [chunk for chunk in kept if chunk["metadata"].get("source", "") == source
+                    and chunk["metadata"].get("duplicate_count")][:args.show]
+        for chunk in examples:
+            print(f"    {_page_label(chunk['metadata'])} ← {chunk['metadata']['duplicate_pages']}")
+            print(f"      {chunk['text'][:60]!r}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,225 @@
+"""공유 임베딩 서비스 (마이크로 배칭)
+
+Streamlit 서버 프로세스가 여러 개여도 임베딩 모델(jhgan/ko-sroberta-multitask)은 이 서비스에서 한 번만 로드합니다.
+동시에 들어온 요청은 짧은 시간 창 동안 모아 한 번의 encode 호출로 처리합니다.
+ChromaDB 컬렉션과 검색기는 RemoteEmbeddingFunction으로 이 서비스를 사용합니다.
+
+실행 예시 (저장소 루트에서):
+    python code/embedding_service.py --port 8765
+    python code/embedding_service.py --socket /tmp/rag-embed.sock
+
+클라이언트 설정 (설정하지 않으면 프로세스마다 로컬 모델 사용):
+    RAG_EMBEDDING_SERVICE=http://127.0.0.1:8765
+    RAG_EMBEDDING_SERVICE=unix:///tmp/rag-embed.sock
+"""
+import argparse
+import base64
+import http.client
+import json
+import os
+import socket
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import List
+from urllib.parse import urlparse
+
+import numpy as np
+
+from batching import MicroBatcher
+
+EMBEDDING_MODEL = "jhgan/ko-sroberta-multitask"
+
+def encode_array(array: np.ndarray) -> dict:
+    """float32 행렬을 JSON으로 보낼 수 있게 base64로 인코딩"""
+    array = np.ascontiguousarray(array, dtype=np.float32)
+    return {"dtype": "float32", "shape": list(array.shape), "data": base64.b64encode(array.tobytes()).decode("ascii")}
+
+def decode_array(payload: dict) -> np.ndarray:
+    return np.frombuffer(base64.b64decode(payload["data"]), dtype=payload["dtype"]).reshape(payload["shape"])
+
+class EmbeddingService:
+    """모델을 한 번만 로드하고, 동시 요청을 마이크로 배치로 묶어 임베딩"""
+
+    def __init__(self, model_name: str = EMBEDDING_MODEL, device: str = None,
+                 max_batch_size: int = 64, max_wait_ms: float = 5.0):
+        from sentence_transformers import SentenceTransformer
+
+        self.model_name = model_name
+        self.model = SentenceTransformer(model_name, device=device)
+        # 작업 하나 = 텍스트 목록, 배치 크기는 텍스트 수 기준
+        self.batcher = MicroBatcher(self._encode_batch, max_batch_size=max_batch_size, max_wait_ms=max_wait_ms,
+                                    size_fn=len, name="embedding")
+
+    def _encode_batch(self, jobs: List[List[str]]) -> List[np.ndarray]:
+        texts = [text for job in jobs for text in job]
+        embeddings = self.model.encode(texts, convert_to_numpy=True)
+        results, offset = [], 0
+        for job in jobs:
+            results.append(embeddings[offset:offset + len(job)])
+            offset += len(job)
+        return results
+
+    def embed(self, texts: List[str]) -> np.ndarray:
+        if not texts:
+            return np.zeros((0, self.model.get_sentence_embedding_dimension()), dtype=np.float32)
+        return self.batcher(texts)
+
+class EmbeddingRequestHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def address_string(self):
+        # Unix 소켓은 client_address가 비어 있음
+        return self.client_address[0] if self.client_address else "unix"
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, status: int, payload: dict):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path.rstrip("/") == "/health":
+            service = self.server.service
+            self._send_json(200, {"status": "ok", "model": service.model_name,
+                                  "queue_depth": service.batcher.queue_depth})
+        else:
+            self._send_json(404, {"error": f"Unknown path: {self.path}"})
+
+    def do_POST(self):
+        if self.path.rstrip("/") != "/embed":
+            self._send_json(404, {"error": f"Unknown path: {self.path}"})
+            return
+        try:
+            length = int(self.headers.get("Content-Length", 0))
+            texts = json.loads(self.rfile.read(length))["texts"]
+            embeddings = self.server.service.embed([str(t) for t in texts])
+        except (KeyError, ValueError, TypeError) as e:
+            self._send_json(400, {"error": f"잘못된 요청입니다: {e}"})
+            return
+        except Exception as e:
+            self._send_json(500, {"error": f"임베딩 중 오류 발생: {e}"})
+            return
+        self._send_json(200, {"model": self.server.service.model_name, "embeddings": encode_array(embeddings)})
+
+class EmbeddingHTTPServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, service: EmbeddingService):
+        super().__init__(address, EmbeddingRequestHandler)
+        self.service = service
+
+class UnixEmbeddingHTTPServer(EmbeddingHTTPServer):
+    address_family = socket.AF_UNIX
+
+    def server_bind(self):
+        if os.path.exists(self.server_address):
+            os.unlink(self.server_address)
+        self.socket.bind(self.server_address)
+        self.server_name, self.server_port = "localhost", 0
+
+class _UnixHTTPConnection(http.client.HTTPConnection):
+    def __init__(self, socket_path: str, timeout: float):
+        super().__init__("localhost", timeout=timeout)
+        self.socket_path = socket_path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.settimeout(self.timeout)
+        self.sock.connect(self.socket_path)
+
+class EmbeddingServiceClient:
+    """임베딩 서비스 HTTP 클라이언트 (스레드별 keep-alive 연결 재사용)"""
+
+    def __init__(self, url: str, timeout: float = 30.0):
+        self.url = url
+        self.timeout = timeout
+        self._local = threading.local()
+
+    def _connection(self) -> http.client.HTTPConnection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            parsed = urlparse(self.url)
+            if parsed.scheme == "unix":
+                conn = _UnixHTTPConnection(parsed.path, self.timeout)
+            else:
+                conn = http.client.HTTPConnection(parsed.hostname, parsed.port or 80, timeout=self.timeout)
+            self._local.conn = conn
+        return conn
+
+    def embed(self, texts: List[str]) -> np.ndarray:
+        body = json.dumps({"texts": list(texts)}, ensure_ascii=False).encode("utf-8")
+        for attempt in range(2):
+            conn = self._connection()
+            try:
+                conn.request("POST", "/embed", body=body, headers={"Content-Type": "application/json"})
+                response = conn.getresponse()
+                payload = json.loads(response.read())
+                break
+            except (ConnectionError, http.client.HTTPException, OSError):
+                # 끊어진 keep-alive 연결이면 한 번만 새 연결로 재시도
+                conn.close()
+                self._local.conn = None
+                if attempt == 1:
+                    raise
+        if response.status != 200:
+            raise RuntimeError(f"임베딩 서비스 오류 ({response.status}): {payload.get('error')}")
+        return decode_array(payload["embeddings"])
+
+def _remote_embedding_function_class():
+    from chromadb.api.types import Documents, EmbeddingFunction, Embeddings
+
+    class RemoteEmbeddingFunction(EmbeddingFunction[Documents]):
+        """ChromaDB 컬렉션/검색기에서 사용하는 원격 임베딩 함수"""
+
+        def __init__(self, url: str):
+            self.client = EmbeddingServiceClient(url)
+
+        def __call__(self, input: Documents) -> Embeddings:
+            return list(self.client.embed(list(input)))
+
+    return RemoteEmbeddingFunction
+
+def make_embedding_function(model_name: str = EMBEDDING_MODEL):
+    """RAG_EMBEDDING_SERVICE가 설정되어 있으면 원격 임베딩 함수, 아니면 로컬 SentenceTransformer 임베딩 함수 반환"""
+    url = os.getenv("RAG_EMBEDDING_SERVICE")
+    if url:
+        return _remote_embedding_function_class()(url)
+
+    from chromadb.utils import embedding_functions
+    # openai의 embedding 함수는 비용 발생하기 때문에, 비용 발생하지 않는 함수 사용
+    return embedding_functions.SentenceTransformerEmbeddingFunction(model_name=model_name)
+
+def main():
+    parser = argparse.ArgumentParser(description="공유 임베딩 서비스")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--socket", default=None, help="Unix 소켓 경로 (지정하면 host/port 대신 사용)")
+    parser.add_argument("--model", default=EMBEDDING_MODEL)
+    parser.add_argument("--device", default=None)
+    parser.add_argument("--max-batch", type=int, default=64, help="배치당 최대 텍스트 수")
+    parser.add_argument("--max-wait-ms", type=float, default=5.0, help="배치를 모으는 최대 대기 시간(ms)")
+    args = parser.parse_args()
+
+    print(f"임베딩 모델 로드 중: {args.model}")
+    service = EmbeddingService(args.model, device=args.device, max_batch_size=args.max_batch, max_wait_ms=args.max_wait_ms)
+
+    if args.socket:
+        server = UnixEmbeddingHTTPServer(args.socket, service)
+        print(f"임베딩 서비스 실행 중: unix://{args.socket}")
+    else:
+        server = EmbeddingHTTPServer((args.host, args.port), service)
+        print(f"임베딩 서비스 실행 중: http://{args.host}:{args.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,153 @@
+"""검색 품질 대비 지연 시간 평가
+
+레이블된 질문 → 관련 청크 집합(data/eval/retrieval_labels.json)으로
+initial_k, final_k, 재순위화 on/off, 메타데이터 필터 on/off, MMR λ 조합을 모두 실행해
+recall@k, MRR, 지연 시간을 비교하고, 품질을 잃지 않고 더 빠른 설정을 고를 수 있도록 파레토 표를 출력합니다.
+
+청크는 "출처/서브섹션/청크 번호" 키로 식별합니다 (예: "CJ/안전,보건/2").
+    - recall@k: 상위 final_k개 중 관련 청크 수 / min(관련 청크 수, final_k)
+    - MRR: 상위 final_k개 안에서 처음 나온 관련 청크 순위의 역수 평균 (없으면 0)
+    - 지연 시간: retrieve_documents(임베딩 + 벡터 검색 + 재순위화) 소요 시간
+    - 출처 수 / 문맥 길이: 반환된 청크의 서로 다른 (출처, 서브섹션) 수와 문서 글자 수 평균 (MMR 다양성 비교용)
+질문 확장(LLM)은 사용하지 않고 원래 질문으로 검색합니다.
+
+실행 예시 (저장소 루트에서):
+    python code/eval_retrieval.py
+    python code/eval_retrieval.py --initial-k 10,20,40 --final-k 3,5 --repeat 3 --json outputs/eval_retrieval.json
+    python code/eval_retrieval.py --initial-k 20 --final-k 5 --rerank on --mmr 1,0.7,0.5
+"""
+import argparse
+import contextlib
+import io
+import itertools
+import json
+import os
+import time
+from pathlib import Path
+from typing import Dict, List
+
+import numpy as np
+
+ROOT_DIR = Path(__file__).resolve().parent.parent
+LABELS_PATH = ROOT_DIR / "data" / "eval" / "retrieval_labels.json"
+
+def chunk_key(metadata: Dict) -> str:
+    return f"{metadata['source']}/{metadata['sub_section']}/{metadata['chunk_index']}"
+
+def load_labels(path: str = str(LABELS_PATH)) -> List[Dict]:
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+def score_ranking(ranked: List[str], relevant: set, k: int) -> tuple:
+    """(recall@k, 역순위) 계산"""
+    top = ranked[:k]
+    hits = sum(key in relevant for key in top)
+    recall = hits / min(len(relevant), k) if relevant else 0.0
+    reciprocal_rank = next((1.0 / rank for rank, key in enumerate(top, 1) if key in relevant), 0.0)
+    return recall, reciprocal_rank
+
+def evaluate_config(rag, collection, labels: List[Dict], initial_k: int, final_k: int,
+                    rerank: bool, filters: bool, repeat: int = 1, mmr_lambda: float = 1.0) -> Dict:
+    """설정 하나로 모든 질문을 검색해 평균 품질과 지연 시간 계산"""
+    recalls, reciprocal_ranks, latencies, sources, context_chars = [], [], [], [], []
+    for label in labels:
+        query = label["query"]
+        metadata_filters = rag.extract_metadata_filters(query) if filters else None
+        for _ in range(repeat):
+            start = time.perf_counter()
+            # retrieve_documents의 디버깅용 출력은 보고서에서 제외
+            with contextlib.redirect_stdout(io.StringIO()):
+                documents, metadatas, _ = rag.retrieve_documents(query, collection, initial_k, final_k, metadata_filters,
+                                                                 rerank=rerank, mmr_lambda=mmr_lambda)
+            latencies.append((time.perf_counter() - start) * 1000)
+
+        recall, reciprocal_rank = score_ranking([chunk_key(m) for m in metadatas], set(label["relevant"]), final_k)
+        recalls.append(recall)
+        reciprocal_ranks.append(reciprocal_rank)
+        sources.append(len({(m["source"], m["sub_section"]) for m in metadatas}))
+        context_chars.append(sum(len(document) for document in documents))
+
+    latencies = np.asarray(latencies)
+    return {
+        "initial_k": initial_k,
+        "final_k": final_k,
+        "rerank": rerank,
+        "filters": filters,
+        "mmr_lambda": mmr_lambda,
+        "recall": round(float(np.mean(recalls)), 4),
+        "mrr": round(float(np.mean(reciprocal_ranks)), 4),
+        "p50_ms": round(float(np.percentile(latencies, 50)), 2),
+        "p95_ms": round(float(np.percentile(latencies, 95)), 2),
+        "sources": round(float(np.mean(sources)), 2),
+        "context_chars": round(float(np.mean(context_chars)), 1),
+    }
+
+def mark_pareto(results: List[Dict]) -> List[Dict]:
+    """recall, MRR은 높을수록, p50 지연은 낮을수록 좋은 기준으로 다른 설정에 지배되지 않는 설정 표시"""
+    def dominates(a, b):
+        no_worse = a["recall"] >= b["recall"] and a["mrr"] >= b["mrr"] and a["p50_ms"] <= b["p50_ms"]
+        better = a["recall"] > b["recall"] or a["mrr"] > b["mrr"] or a["p50_ms"] < b["p50_ms"]
+        return no_worse and better
+
+    for result in results:
+        result["pareto"] = not any(dominates(other, result) for other in results if other is not result)
+    return results
+
+def print_table(results: List[Dict], pareto_only: bool = False):
+    print(f"\n{'':2}{'initial_k':>9}{'final_k':>8}{'rerank':>8}{'filters':>8}{'MMR λ':>7}{'recall@k':>10}{'MRR':>8}"
+          f"{'p50(ms)':>10}{'p95(ms)':>10}{'출처 수':>8}{'문맥(자)':>9}")
+    for r in sorted(results, key=lambda r: r["p50_ms"]):
+        if pareto_only and not r["pareto"]:
+            continue
+        marker = "* " if r["pareto"] else "  "
+        print(f"{marker}{r['initial_k']:>9}{r['final_k']:>8}{'on' if r['rerank'] else 'off':>8}"
+              f"{'on' if r['filters'] else 'off':>8}{'off' if r['mmr_lambda'] >= 1 else r['mmr_lambda']:>7}"
+              f"{r['recall']:>10.3f}{r['mrr']:>8.3f}{r['p50_ms']:>10.1f}{r['p95_ms']:>10.1f}"
+              f"{r['sources']:>10.2f}{r['context_chars']:>11.0f}")
+    print("\n* 파레토 최적 설정 (더 빠르면서 recall과 MRR이 모두 같거나 높은 다른 설정이 없음)")
+
+def _parse_list(value: str, cast=int) -> List:
+    return [cast(v) for v in value.split(",") if v]
+
+def _parse_switch(value: str) -> List[bool]:
+    return [v == "on" for v in value.split(",") if v]
+
+def main():
+    parser = argparse.ArgumentParser(description="검색 품질(recall@k, MRR) 대비 지연 시간 평가")
+    parser.add_argument("--labels", default=str(LABELS_PATH), help="레이블 파일 ([{query, relevant: [청크 키]}])")
+    parser.add_argument("--initial-k", default="10,20,40")
+    parser.add_argument("--final-k", default="3,5")
+    parser.add_argument("--rerank", default="on,off")
+    parser.add_argument("--filters", default="on,off")
+    parser.add_argument("--mmr", default="1,0.7", help="MMR 관련도 가중치 λ 목록 (1이면 점수 순 선택, 재순위화 on일 때만 적용)")
+    parser.add_argument("--repeat", type=int, default=1, help="질문마다 반복 측정 횟수 (지연 시간 안정화)")
+    parser.add_argument("--pareto-only", action="store_true", help="파레토 최적 설정만 출력")
+    parser.add_argument("--json", default=None, help="결과를 JSON 파일로 저장")
+    args = parser.parse_args()
+
+    import rag_chatbot as rag
+
+    labels = load_labels(args.labels)
+    collection = rag.get_collection()
+    print(f"레이블된 질문 {len(labels)}개로 평가합니다.")
+    rag.warmup(include_client=False)
+
+    results = []
+    grid = itertools.product(_parse_list(args.initial_k), _parse_list(args.final_k),
+                             _parse_switch(args.rerank), _parse_switch(args.filters), _parse_list(args.mmr, float))
+    for initial_k, final_k, rerank, filters, mmr_lambda in grid:
+        if final_k > initial_k or (not rerank and mmr_lambda < 1):
+            continue
+        results.append(evaluate_config(rag, collection, labels, initial_k, final_k, rerank, filters, args.repeat,
+                                       mmr_lambda))
+
+    print_table(mark_pareto(results), args.pareto_only)
+
+    if args.json:
+        os.makedirs(os.path.dirname(args.json) or ".", exist_ok=True)
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+        print(f"결과 저장: {args.json}")
+
+if __name__ == "__main__":
+    main()
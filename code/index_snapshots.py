@@ -0,0 +1,250 @@
+"""버전별 불변(immutable) 벡터 인덱스 스냅샷과 원자적 교체
+
+ppt_processor(적재)는 기존 컬렉션을 지우고 다시 만드는 대신, 새 버전 디렉터리에 인덱스를 만든 뒤
+CURRENT 포인터 파일만 원자적으로 바꿔 게시합니다. 서빙 프로세스는 CURRENT가 가리키는 스냅샷을 열고,
+포인터가 바뀌면 재시작 없이 새 스냅샷으로 교체합니다 (진행 중인 요청은 이전 스냅샷으로 끝까지 처리).
+
+디렉터리 구조:
+    data/index/
+        CURRENT                      현재 버전 이름 (한 줄)
+        versions/<버전>/chroma/      ChromaDB 영속 디렉터리
+        versions/<버전>/manifest.json
+
+게시된 스냅샷은 다시 쓰지 않습니다. 서빙 쪽에는 조회 메서드만 노출하는 ReadOnlyCollection을 돌려줍니다.
+(ChromaDB는 자체적으로 sqlite/HNSW 파일을 열기 때문에 파일 수준 mmap은 ChromaDB 설정을 따릅니다)
+
+사용 예시 (저장소 루트에서):
+    python code/index_snapshots.py list
+    python code/index_snapshots.py activate 20250604-120000-ab12cd
+    python code/index_snapshots.py prune --keep 3
+"""
+import argparse
+import json
+import os
+import shutil
+import threading
+import time
+import uuid
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+INDEX_ROOT = "./data/index"
+CURRENT_FILE = "CURRENT"
+VERSIONS_DIR = "versions"
+MANIFEST_FILE = "manifest.json"
+CHROMA_DIR = "chroma"
+# 적재 후 남길 스냅샷 수 (현재 + SnapshotReader가 열어 두는 직전 버전)
+SNAPSHOT_KEEP = 2
+
+def _write_atomic(path: Path, text: str):
+    """임시 파일에 쓰고 fsync 후 os.replace로 교체 (읽는 쪽은 이전 값 또는 새 값만 보게 됨)"""
+    tmp = path.with_name(f".{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.write(text)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+class SnapshotStore:
+    """스냅샷 디렉터리 관리 (게시, 현재 버전 조회/변경, 오래된 버전 정리)"""
+
+    def __init__(self, root: str = INDEX_ROOT):
+        self.root = Path(root)
+        self.versions_dir = self.root / VERSIONS_DIR
+        self.current_file = self.root / CURRENT_FILE
+
+    def version_path(self, version: str) -> Path:
+        return self.versions_dir / version
+
+    def chroma_path(self, version: str) -> str:
+        return str(self.version_path(version) / CHROMA_DIR)
+
+    def current_version(self) -> Optional[str]:
+        try:
+            version = self.current_file.read_text(encoding="utf-8").strip()
+        except FileNotFoundError:
+            return None
+        return version or None
+
+    def versions(self) -> List[str]:
+        """게시 완료된 버전 목록 (오래된 순, 만드는 중인 임시 디렉터리 제외)"""
+        if not self.versions_dir.exists():
+            return []
+        versions = [p.name for p in self.versions_dir.iterdir()
+                    if p.is_dir() and not p.name.startswith(".") and (p / MANIFEST_FILE).exists()]
+        # 버전 이름은 초 단위라 같은 초에 게시한 버전끼리는 manifest의 생성 시각으로 순서를 정함
+        return sorted(versions, key=lambda version: (self.manifest(version).get("created_at", 0), version))
+
+    def manifest(self, version: str) -> Dict:
+        with open(self.version_path(version) / MANIFEST_FILE, encoding="utf-8") as f:
+            return json.load(f)
+
+    def publish(self, build: Callable[[str], Dict], activate: bool = True, data_dir: str = CHROMA_DIR) -> str:
+        """새 스냅샷 생성 후 게시
+
+           build(data_path)는 임시 디렉터리(기본 <버전>/chroma)에 인덱스를 만들고 manifest에 넣을 정보(dict)를 반환합니다.
+           빌드가 끝나야 버전 디렉터리 이름이 확정되고, 그 다음에 CURRENT가 바뀝니다.
+        """
+        version = time.strftime("%Y%m%d-%H%M%S") + "-" + uuid.uuid4().hex[:6]
+        self.versions_dir.mkdir(parents=True, exist_ok=True)
+        staging = self.versions_dir / f".{version}.building"
+        staging.mkdir()
+        try:
+            info = build(str(staging / data_dir)) or {}
+            manifest = {"version": version, "created_at": time.time(), **info}
+            with open(staging / MANIFEST_FILE, "w", encoding="utf-8") as f:
+                json.dump(manifest, f, ensure_ascii=False, indent=2)
+            os.rename(staging, self.version_path(version))
+        except BaseException:
+            shutil.rmtree(staging, ignore_errors=True)
+            raise
+
+        if activate:
+            self.activate(version)
+        return version
+
+    def activate(self, version: str):
+        """CURRENT 포인터를 원자적으로 변경 (롤백에도 사용)"""
+        if not (self.version_path(version) / MANIFEST_FILE).exists():
+            raise ValueError(f"게시되지 않은 스냅샷 버전입니다: {version}")
+        _write_atomic(self.current_file, version + "\n")
+
+    def prune(self, keep: int = 3) -> List[str]:
+        """최근 keep개와 현재 버전을 제외한 스냅샷 삭제 (다른 프로세스가 아직 읽고 있을 수 있으므로 여유 있게 유지)"""
+        current = self.current_version()
+        versions = self.versions()
+        keep_set = set(versions[-keep:]) if keep > 0 else set()
+        removed = []
+        for version in versions:
+            if version in keep_set or version == current:
+                continue
+            shutil.rmtree(self.version_path(version), ignore_errors=True)
+            removed.append(version)
+        return removed
+
+class ReadOnlyCollection:
+    """서빙용 컬렉션 래퍼 (조회 메서드만 허용, 게시된 스냅샷을 수정하지 못하게 함)"""
+
+    _ALLOWED = {"query", "get", "count", "peek", "name", "metadata", "id", "_embedding_function"}
+
+    def __init__(self, collection, version: Optional[str]):
+        self._collection = collection
+        self.version = version
+
+    def __getattr__(self, name):
+        if name not in self._ALLOWED:
+            raise AttributeError(f"읽기 전용 스냅샷 컬렉션에서는 '{name}'을(를) 사용할 수 없습니다.")
+        return getattr(self._collection, name)
+
+    def __repr__(self):
+        return f"ReadOnlyCollection(version={self.version!r})"
+
+class _OpenSnapshot:
+    def __init__(self, version: Optional[str], path: str, client, collection):
+        self.version = version
+        self.path = path
+        self.client = client
+        self.collection = ReadOnlyCollection(collection, version)
+
+def close_chroma(path: str):
+    """해당 경로로 열린 ChromaDB 시스템 정리 (최선의 노력, 실패해도 무시)"""
+    try:
+        from chromadb.api.shared_system_client import SharedSystemClient
+        system = SharedSystemClient._identifier_to_system.pop(path, None)
+        if system is not None:
+            system.stop()
+    except Exception:
+        pass
+
+class SnapshotReader:
+    """CURRENT가 가리키는 스냅샷을 열어 두고, 포인터가 바뀌면 새 스냅샷으로 교체
+
+       - open_collection(client) -> 컬렉션: 스냅샷의 ChromaDB 클라이언트에서 컬렉션을 가져오는 함수
+       - check_interval: CURRENT 파일을 다시 확인하는 최소 간격(초)
+       - legacy_path: 아직 게시된 스냅샷이 없을 때 사용할 기존 ChromaDB 경로
+       교체 직전 스냅샷은 진행 중인 요청을 위해 한 세대 더 열어 두고, 그보다 오래된 것은 닫습니다.
+    """
+
+    def __init__(self, open_collection: Callable[[object], object], root: str = INDEX_ROOT,
+                 check_interval: float = 5.0, legacy_path: Optional[str] = None):
+        self.store = SnapshotStore(root)
+        self._open_collection = open_collection
+        self.check_interval = check_interval
+        self.legacy_path = legacy_path
+        self._current: Optional[_OpenSnapshot] = None
+        self._previous: Optional[_OpenSnapshot] = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+
+    @property
+    def version(self) -> Optional[str]:
+        return self._current.version if self._current else None
+
+    def _open(self, version: Optional[str]) -> _OpenSnapshot:
+        import chromadb
+
+        path = self.store.chroma_path(version) if version else self.legacy_path
+        if path is None:
+            raise FileNotFoundError(f"게시된 인덱스 스냅샷이 없습니다: {self.store.current_file}")
+        client = chromadb.PersistentClient(path=path)
+        return _OpenSnapshot(version, path, client, self._open_collection(client))
+
+    def collection(self) -> ReadOnlyCollection:
+        """현재 스냅샷 컬렉션 (check_interval마다 CURRENT 변경 여부 확인)"""
+        snapshot = self._current
+        if snapshot is not None and (time.monotonic() - self._checked_at < self.check_interval or self._lock.locked()):
+            # 다른 스레드가 새 스냅샷을 여는 중이면 기다리지 않고 현재 스냅샷 사용
+            return snapshot.collection
+        self.refresh()
+        return self._current.collection
+
+    def refresh(self) -> bool:
+        """CURRENT를 다시 읽고 버전이 바뀌었으면 교체, 교체 여부 반환"""
+        with self._lock:
+            self._checked_at = time.monotonic()
+            version = self.store.current_version()
+            if self._current is not None and version == self._current.version:
+                return False
+
+            # 새 스냅샷을 완전히 연 다음 참조만 바꿈 (여는 동안에도 기존 스냅샷으로 계속 서빙)
+            try:
+                opened = self._open(version)
+            except Exception as e:
+                if self._current is None:
+                    raise
+                print(f"인덱스 스냅샷 {version}을(를) 열 수 없어 {self._current.version}을(를) 계속 사용합니다: {e}")
+                return False
+            retired, self._previous, self._current = self._previous, self._current, opened
+            if retired is not None:
+                close_chroma(retired.path)
+            if self._previous is not None:
+                print(f"인덱스 스냅샷 교체: {self._previous.version} → {version}")
+            return True
+
+def main():
+    parser = argparse.ArgumentParser(description="벡터 인덱스 스냅샷 관리")
+    parser.add_argument("--root", default=INDEX_ROOT)
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    subparsers.add_parser("list", help="스냅샷 목록")
+    activate_parser = subparsers.add_parser("activate", help="CURRENT를 지정한 버전으로 변경 (롤백)")
+    activate_parser.add_argument("version")
+    prune_parser = subparsers.add_parser("prune", help="오래된 스냅샷 삭제")
+    prune_parser.add_argument("--keep", type=int, default=3)
+    args = parser.parse_args()
+
+    store = SnapshotStore(args.root)
+    if args.command == "list":
+        current = store.current_version()
+        for version in store.versions():
+            manifest = store.manifest(version)
+            marker = "*" if version == current else " "
+            print(f"{marker} {version}  청크 {manifest.get('count', '?')}개  {manifest.get('sources', '')}")
+    elif args.command == "activate":
+        store.activate(args.version)
+        print(f"현재 스냅샷: {args.version}")
+    elif args.command == "prune":
+        removed = store.prune(args.keep)
+        print(f"삭제된 스냅샷: {removed or '없음'}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,205 @@
+"""RAG 파이프라인 동시 사용자 부하 테스트
+
+ESG 질문 워크로드를 N개의 동시 사용자(스레드)로 재생하면서
+expand_query → extract_metadata_filters → get_relevant_context → generate_response 경로의
+처리량과 단계별 p50/p95/p99 지연 시간을 측정합니다. (--mode retrieval이면 응답 생성 제외)
+
+단계별 시간은 tracing의 span(expand, embed, vector_search, rerank, retrieve, generate)에서 가져옵니다.
+기본 워크로드는 pages/2_사용방법.py의 예시 질문과 data/few_shot_examples.json의 사용자 질문입니다.
+
+실행 예시 (저장소 루트에서):
+    python code/load_generator.py --mock --concurrency 1,4,16 --requests 200
+    python code/load_generator.py --mode retrieval --concurrency 8 --duration 60
+    python code/load_generator.py --mock --mock-latency lognormal:-1.5,0.4 --tokens-per-second 40 --json outputs/load_test.json
+"""
+import argparse
+import itertools
+import json
+import os
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from tracing import span, trace_request
+
+CODE_DIR = Path(__file__).resolve().parent
+ROOT_DIR = CODE_DIR.parent
+USAGE_PAGE = CODE_DIR / "pages" / "2_사용방법.py"
+FEW_SHOT_PATH = ROOT_DIR / "data" / "few_shot_examples.json"
+
+# 보고서에 표시할 단계 순서 (그 밖의 span은 뒤에 이름순으로 표시)
+STAGE_ORDER = ["expand", "filters", "embed", "vector_search", "rerank", "retrieve", "generate", "total"]
+PERCENTILES = (50, 95, 99)
+
+def load_workload(path: Optional[str] = None) -> List[str]:
+    """질문 목록 로드
+
+       path가 없으면 사용방법 페이지의 <li> 예시 질문(물음표로 끝나는 항목)과 few-shot 예시의 사용자 질문 사용
+       path가 .jsonl이면 각 줄의 "query" 필드, 그 밖에는 한 줄에 질문 하나
+    """
+    if path:
+        with open(path, encoding="utf-8") as f:
+            lines = [line.strip() for line in f if line.strip()]
+        if path.endswith(".jsonl"):
+            return [json.loads(line)["query"] for line in lines]
+        return lines
+
+    questions = []
+    page = USAGE_PAGE.read_text(encoding="utf-8")
+    for item in re.findall(r"<li>(.*?)</li>", page):
+        text = re.sub(r"<[^>]+>", "", item).strip()
+        if text.endswith("?"):
+            questions.append(text)
+
+    with open(FEW_SHOT_PATH, encoding="utf-8") as f:
+        questions += [m["content"] for m in json.load(f) if m.get("role") == "user"]
+    return list(dict.fromkeys(questions))
+
+def run_request(rag, query: str, mode: str) -> Dict[str, float]:
+    """질문 하나를 파이프라인에 통과시키고 단계별 소요 시간(초) 반환"""
+    with trace_request("load_test", mode=mode) as trace:
+        collection = rag.get_collection()
+        # LLM 오류는 안내 문구/원래 질문으로 대신하지 않고 예외로 받아 실패 요청으로 집계
+        expanded_query = rag.expand_query(query, raise_errors=True)
+        with span("filters"):
+            metadata_filters = rag.extract_metadata_filters(query)
+        context, metadata_summary = rag.get_relevant_context(expanded_query, collection, metadata_filters=metadata_filters)
+        if mode == "full":
+            rag.generate_response(query, context, metadata_summary, raise_errors=True)
+    stages = trace.stage_durations()
+    stages["total"] = trace.duration
+    return stages
+
+def run_load(rag, questions: List[str], concurrency: int, mode: str,
+             requests: Optional[int] = None, duration: Optional[float] = None) -> Dict:
+    """concurrency개의 사용자가 워크로드를 돌아가며 요청 (requests개 또는 duration초 동안)"""
+    cycle = itertools.cycle(questions)
+    lock = threading.Lock()
+    samples: List[Dict[str, float]] = []
+    errors: List[str] = []
+    issued = 0
+    deadline = time.perf_counter() + duration if duration else None
+
+    def next_query() -> Optional[str]:
+        nonlocal issued
+        with lock:
+            if requests is not None and issued >= requests:
+                return None
+            if deadline is not None and time.perf_counter() >= deadline:
+                return None
+            issued += 1
+            return next(cycle)
+
+    def user():
+        while True:
+            query = next_query()
+            if query is None:
+                return
+            try:
+                stages = run_request(rag, query, mode)
+            except Exception as e:
+                with lock:
+                    errors.append(repr(e))
+                continue
+            with lock:
+                samples.append(stages)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="load-user") as pool:
+        for _ in range(concurrency):
+            pool.submit(user)
+    elapsed = time.perf_counter() - start
+
+    return {
+        "mode": mode,
+        "concurrency": concurrency,
+        "requests": len(samples),
+        "errors": len(errors),
+        "error_examples": errors[:3],
+        "elapsed_s": round(elapsed, 3),
+        "throughput_rps": round(len(samples) / elapsed, 3) if elapsed > 0 else 0.0,
+        "stages": summarize_stages(samples),
+    }
+
+def summarize_stages(samples: List[Dict[str, float]]) -> Dict[str, Dict[str, float]]:
+    """단계별 호출 수와 평균/p50/p95/p99 (ms)"""
+    values: Dict[str, List[float]] = {}
+    for stages in samples:
+        for name, seconds in stages.items():
+            values.setdefault(name, []).append(seconds * 1000)
+
+    order = {name: i for i, name in enumerate(STAGE_ORDER)}
+    summary = {}
+    for name in sorted(values, key=lambda n: (order.get(n, len(order) - 1), n)):
+        ms = np.asarray(values[name])
+        row = {"count": int(ms.size), "mean_ms": round(float(ms.mean()), 1)}
+        for p, value in zip(PERCENTILES, np.percentile(ms, PERCENTILES)):
+            row[f"p{p}_ms"] = round(float(value), 1)
+        summary[name] = row
+    return summary
+
+def print_report(result: Dict):
+    print(f"\n[{result['mode']}] 동시 사용자 {result['concurrency']}명: "
+          f"{result['requests']}건 / {result['elapsed_s']:.1f}초, 처리량 {result['throughput_rps']:.2f} req/s, "
+          f"오류 {result['errors']}건")
+    for example in result["error_examples"]:
+        print(f"  오류 예시: {example}")
+    header = f"  {'단계':<22}{'건수':>6}{'평균':>10}" + "".join(f"{'p' + str(p):>10}" for p in PERCENTILES)
+    print(header)
+    for name, row in result["stages"].items():
+        print(f"  {name:<22}{row['count']:>6}{row['mean_ms']:>10.1f}"
+              + "".join(f"{row[f'p{p}_ms']:>10.1f}" for p in PERCENTILES))
+
+def main():
+    parser = argparse.ArgumentParser(description="RAG 파이프라인 동시 사용자 부하 테스트")
+    parser.add_argument("--mode", choices=["full", "retrieval"], default="full",
+                        help="full: 응답 생성까지, retrieval: 문서 검색까지만")
+    parser.add_argument("--concurrency", default="1,4,16", help="동시 사용자 수 (쉼표로 여러 값 지정 시 차례로 측정)")
+    parser.add_argument("--requests", type=int, default=None, help="동시성 단계마다 보낼 요청 수 (기본: 워크로드 질문 수의 2배)")
+    parser.add_argument("--duration", type=float, default=None, help="동시성 단계마다 측정할 시간(초), 지정 시 --requests 대신 사용")
+    parser.add_argument("--workload", default=None, help="질문 파일 (한 줄에 하나 또는 query 필드가 있는 .jsonl)")
+    parser.add_argument("--no-warmup", action="store_true", help="측정 전 워밍업 생략")
+    parser.add_argument("--mock", action="store_true", help="프로세스 안에서 모의 LLM 서버를 띄워 사용")
+    parser.add_argument("--mock-latency", default="fixed:0.2", help="모의 서버 첫 토큰 지연 분포 (mock_llm_server 형식)")
+    parser.add_argument("--tokens-per-second", type=float, default=50.0, help="모의 서버 토큰 생성 속도")
+    parser.add_argument("--json", default=None, help="결과를 JSON 파일로 저장")
+    args = parser.parse_args()
+
+    server = None
+    if args.mock:
+        from mock_llm_server import MockConfig, start_mock_server
+        server = start_mock_server(MockConfig(latency=args.mock_latency, tokens_per_second=args.tokens_per_second))
+        os.environ["OPENAI_BASE_URL"] = server.base_url
+        os.environ["OPENAI_API_KEY"] = "mock"
+        print(f"모의 LLM 서버: {server.base_url}")
+
+    import rag_chatbot as rag
+
+    questions = load_workload(args.workload)
+    print(f"워크로드: 질문 {len(questions)}개")
+    if not args.no_warmup:
+        rag.warmup(include_client=args.mode == "full")
+
+    requests = None if args.duration else (args.requests or len(questions) * 2)
+    results = []
+    for concurrency in [int(c) for c in args.concurrency.split(",")]:
+        result = run_load(rag, questions, concurrency, args.mode, requests=requests, duration=args.duration)
+        print_report(result)
+        results.append(result)
+
+    if args.json:
+        os.makedirs(os.path.dirname(args.json) or ".", exist_ok=True)
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+        print(f"\n결과 저장: {args.json}")
+
+    if server is not None:
+        server.shutdown()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,216 @@
+"""요청별 마감 시간(deadline), 단계별 품질 저하(degradation), 과부하 시 조기 거절
+
+LLM API나 CPU가 포화되면 모든 요청이 질문 확장 → 후보 20개 재순위화 → max_tokens=1000 생성을 그대로 실행하다가
+결국 시간 초과로 실패합니다. 요청마다 마감 시간을 두고, 부하와 남은 시간에 따라 비싼 단계부터 줄입니다.
+
+저하 단계 (단계는 요청 안에서 올라가기만 함):
+    0  정상
+    1  질문 확장(LLM 호출) 생략
+    2  + 벡터 검색 후보 수 축소 (initial_k → DEGRADED_INITIAL_K)
+    3  + cross-encoder 재순위화 생략 (벡터 검색 순서 사용), 응답 max_tokens 제한
+
+단계를 정하는 신호:
+    - 입장 시 부하: 처리 중인 요청 수 / RAG_MAX_INFLIGHT, 재순위화 대기열 / RAG_MAX_RERANK_QUEUE 중 큰 비율
+    - 단계 시작 시 남은 시간: 마감 시간 대비 남은 비율이 STAGE_MIN_REMAINING보다 작으면 해당 단계로 올림
+      (API 서버 스레드 풀에서 기다린 시간도 마감 시간에 포함)
+한도를 넘으면(또는 시작 전에 마감 시간이 지나면) 파이프라인을 실행하지 않고 Overloaded로 거절합니다.
+
+마감 시간과 저하 상태는 contextvars로 전달되므로 rag_chatbot의 각 단계는 current_budget()으로 확인합니다.
+(예산이 없는 호출, 예: 일괄 처리/평가/워밍업은 항상 정상 단계로 실행)
+
+환경 변수:
+    RAG_REQUEST_TIMEOUT     요청 마감 시간(초, 기본 30)
+    RAG_MAX_INFLIGHT        동시에 처리할 최대 요청 수 (기본 32, 넘으면 거절)
+    RAG_MAX_RERANK_QUEUE    재순위화 대기열 최대 작업 수 (기본 64, 넘으면 거절)
+"""
+import os
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass
+from typing import Callable, Dict, Iterator, List, Optional
+
+from tracing import REGISTRY, current_trace, reset_quietly
+
+BUSY_MESSAGE = "죄송합니다. 지금은 요청이 많아 답변할 수 없습니다. 잠시 후 다시 시도해주세요."
+DEGRADED_INITIAL_K = 10
+DEGRADED_MAX_TOKENS = 500
+
+# 입장 시 부하 비율이 이 값 이상이면 해당 단계로 시작 (1.0 이상은 거절)
+LOAD_THRESHOLDS = ((0.85, 3), (0.7, 2), (0.5, 1))
+# 단계 시작 시 필요한 남은 시간 비율과, 부족할 때 올릴 단계
+STAGE_MIN_REMAINING = {
+    "expand": (0.8, 1),
+    "retrieve": (0.7, 2),
+    "rerank": (0.6, 3),
+    "generate": (0.5, 3),
+    # 대화 요약은 답변과 별개의 LLM 호출이라 단계를 올리지 않고, 시간이 부족하면 생략 (has_time_for)
+    "summarize": (0.5, 3),
+}
+
+SHED_REQUESTS = REGISTRY.counter("rag_shed_requests_total", "과부하로 거절한 요청 수 (reason별)")
+DEGRADED_REQUESTS = REGISTRY.counter("rag_degraded_requests_total", "저하 단계별 요청 수 (level별)")
+IN_FLIGHT = REGISTRY.gauge("rag_requests_in_flight", "처리 중인 요청 수 (입장 제어 기준)")
+
+@dataclass(frozen=True)
+class DegradationStep:
+    expand: bool
+    initial_k: Optional[int]  # None이면 요청한 값 그대로
+    rerank: bool
+    max_tokens: Optional[int]
+
+DEGRADATION_STEPS = (
+    DegradationStep(expand=True, initial_k=None, rerank=True, max_tokens=None),
+    DegradationStep(expand=False, initial_k=None, rerank=True, max_tokens=None),
+    DegradationStep(expand=False, initial_k=DEGRADED_INITIAL_K, rerank=True, max_tokens=None),
+    DegradationStep(expand=False, initial_k=DEGRADED_INITIAL_K, rerank=False, max_tokens=DEGRADED_MAX_TOKENS),
+)
+
+class Overloaded(RuntimeError):
+    """과부하 또는 마감 시간 초과로 요청을 거절 (reason: inflight | rerank_queue | deadline)"""
+
+    def __init__(self, reason: str, metadata: Optional[Dict] = None):
+        super().__init__(f"요청 거절: {reason}")
+        self.reason = reason
+        self.metadata = metadata or {"level": None, "rejected": True, "reasons": [reason]}
+
+class Deadline:
+    """요청 도착 시각 기준 마감 시간"""
+
+    def __init__(self, timeout: Optional[float] = None, start: Optional[float] = None):
+        self.timeout = timeout if timeout is not None else float(os.getenv("RAG_REQUEST_TIMEOUT", "30"))
+        self.start = start if start is not None else time.monotonic()
+
+    def elapsed(self) -> float:
+        return time.monotonic() - self.start
+
+    def remaining(self) -> float:
+        return self.timeout - self.elapsed()
+
+    def remaining_fraction(self) -> float:
+        return self.remaining() / self.timeout if self.timeout > 0 else 0.0
+
+    @property
+    def expired(self) -> bool:
+        return self.remaining() <= 0
+
+class RequestBudget:
+    """요청 하나의 마감 시간과 현재 저하 단계"""
+
+    def __init__(self, deadline: Deadline, level: int = 0, reasons: Optional[List[str]] = None):
+        self.deadline = deadline
+        self.level = level
+        self.reasons = list(reasons or [])
+        self.stages: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    @property
+    def step(self) -> DegradationStep:
+        return DEGRADATION_STEPS[self.level]
+
+    def degrade(self, level: int, reason: str):
+        with self._lock:
+            if level > self.level:
+                self.level = min(level, len(DEGRADATION_STEPS) - 1)
+                self.reasons.append(reason)
+
+    def check(self, stage: str) -> DegradationStep:
+        """단계 시작 시 남은 시간을 확인해 필요하면 저하 단계를 올리고 적용할 설정 반환"""
+        min_remaining, level = STAGE_MIN_REMAINING[stage]
+        if self.deadline.remaining_fraction() < min_remaining:
+            self.degrade(level, f"deadline:{stage}")
+        self.stages[stage] = self.level
+        return self.step
+
+    def has_time_for(self, stage: str) -> bool:
+        """단계를 시작할 만큼 시간이 남았는지 (저하 단계는 바꾸지 않음)"""
+        return self.deadline.remaining_fraction() >= STAGE_MIN_REMAINING[stage][0]
+
+    def timeout(self, minimum: float = 1.0) -> float:
+        """LLM 호출 등에 넘길 타임아웃 (남은 시간, 최소 minimum초)"""
+        return max(minimum, self.deadline.remaining())
+
+    def metadata(self) -> Dict:
+        """응답 메타데이터에 기록할 저하 정보"""
+        step = self.step
+        return {
+            "level": self.level,
+            "rejected": False,
+            "reasons": list(self.reasons),
+            "stages": dict(self.stages),
+            "expand": step.expand,
+            "initial_k": step.initial_k,
+            "rerank": step.rerank,
+            "max_tokens": step.max_tokens,
+            "timeout_s": self.deadline.timeout,
+            "elapsed_ms": round(self.deadline.elapsed() * 1000, 1),
+        }
+
+_current_budget: ContextVar[Optional[RequestBudget]] = ContextVar("rag_request_budget", default=None)
+
+def current_budget() -> Optional[RequestBudget]:
+    return _current_budget.get()
+
+def load_level(ratio: float) -> int:
+    for threshold, level in LOAD_THRESHOLDS:
+        if ratio >= threshold:
+            return level
+    return 0
+
+class LoadShedder:
+    """처리 중인 요청 수와 대기열 길이로 입장 제어 (프로세스 전역 하나)
+
+       queue_depth_fns: 이름 → 현재 대기열 길이 함수, max_queue와 비교
+    """
+
+    def __init__(self, max_inflight: Optional[int] = None, max_queue: Optional[int] = None,
+                 queue_depth_fns: Optional[Dict[str, Callable[[], int]]] = None):
+        self.max_inflight = max_inflight or int(os.getenv("RAG_MAX_INFLIGHT", "32"))
+        self.max_queue = max_queue or int(os.getenv("RAG_MAX_RERANK_QUEUE", "64"))
+        self.queue_depth_fns = dict(queue_depth_fns or {})
+        self.in_flight = 0
+        self._lock = threading.Lock()
+
+    def _reject(self, reason: str):
+        SHED_REQUESTS.inc(reason=reason)
+        trace = current_trace()
+        if trace is not None:
+            trace.attrs.update({"rejected": reason, "degradation_level": None})
+        raise Overloaded(reason)
+
+    @contextmanager
+    def admit(self, deadline: Optional[Deadline] = None) -> Iterator[RequestBudget]:
+        """요청을 받아들이면 RequestBudget을 현재 컨텍스트에 설정, 한도를 넘으면 Overloaded"""
+        deadline = deadline or Deadline()
+        if deadline.expired:
+            self._reject("deadline")
+        queue_depth = max((fn() for fn in self.queue_depth_fns.values()), default=0)
+        with self._lock:
+            if self.in_flight >= self.max_inflight:
+                reason = "inflight"
+            elif queue_depth >= self.max_queue:
+                reason = "rerank_queue"
+            else:
+                reason = None
+                self.in_flight += 1
+                ratio = max(self.in_flight / self.max_inflight, queue_depth / self.max_queue)
+        if reason is not None:
+            self._reject(reason)
+        IN_FLIGHT.set(self.in_flight)
+
+        level = load_level(ratio)
+        budget = RequestBudget(deadline, level, [f"load:{ratio:.2f}"] if level else [])
+        token = _current_budget.set(budget)
+        try:
+            yield budget
+        finally:
+            # 버려진 스트리밍 제너레이터는 GC가 다른 Context에서 닫을 수 있으므로 슬롯부터 반납
+            with self._lock:
+                self.in_flight -= 1
+            IN_FLIGHT.set(self.in_flight)
+            reset_quietly(_current_budget, token)
+            DEGRADED_REQUESTS.inc(level=budget.level)
+            trace = current_trace()
+            if trace is not None:
+                trace.attrs["degradation_level"] = budget.level
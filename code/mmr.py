@@ -0,0 +1,57 @@
+"""재순위화 후보의 MMR(maximal marginal relevance) 다양성 선택
+
+cross-encoder 점수 상위 final_k개만 고르면 같은 서브섹션의 이웃 청크가 여러 개 들어가 프롬프트가 길고 중복됩니다.
+MMR은 관련도가 높으면서 이미 고른 청크와 덜 비슷한 후보를 하나씩 고릅니다.
+
+    score(i) = λ · 관련도(i) − (1 − λ) · max_{j ∈ 선택됨} 유사도(i, j)
+
+    - 관련도: 재순위화 점수(후보 안에서 0~1로 정규화), 유사도: 벡터 검색이 함께 반환한 후보 임베딩의 코사인 유사도
+    - 후보 간 유사도 행렬은 한 번의 행렬 곱으로 계산하고, 선택 단계마다 "선택된 청크와의 최대 유사도"를 벡터로 갱신
+    - λ = 1이면 점수 순 선택과 같고, 작을수록 다양성을 우선
+    - max_similarity를 지정하면 이미 고른 청크와 유사도가 그 이상인 후보(거의 같은 내용)는 고르지 않음
+      (문맥이 final_k개보다 짧아질 수 있음, 임베딩 모델마다 유사도 분포가 달라 기본값은 사용 안 함)
+"""
+from typing import List, Optional, Sequence
+
+import numpy as np
+
+MMR_LAMBDA = 0.7
+MMR_MAX_SIMILARITY = None
+MMR_POOL_FACTOR = 3  # 점수 상위 final_k × 3개 후보 안에서만 선택 (관련도 낮은 후보가 다양성 때문에 뽑히지 않도록)
+
+def cosine_similarity_matrix(embeddings) -> np.ndarray:
+    """(n, d) 임베딩의 (n, n) 코사인 유사도"""
+    matrix = np.asarray(embeddings, dtype=np.float32)
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    matrix = matrix / np.maximum(norms, 1e-12)
+    return matrix @ matrix.T
+
+def mmr_select(embeddings, relevance: Sequence[float], k: int, lambda_: float = MMR_LAMBDA,
+               max_similarity: Optional[float] = None, pool_size: Optional[int] = None) -> List[int]:
+    """MMR 순서로 고른 후보 인덱스 (최대 k개)"""
+    relevance = np.asarray(relevance, dtype=np.float32)
+    if k <= 0 or len(relevance) == 0:
+        return []
+    pool = np.argsort(-relevance, kind="stable")[:pool_size or len(relevance)]
+    similarity = cosine_similarity_matrix(np.asarray(embeddings)[pool])
+    # 재순위화 점수는 좁은 범위에 몰려 있을 수 있으므로 후보 안에서 0~1로 다시 맞춰 λ의 의미를 일정하게 유지
+    relevance = relevance[pool]
+    spread = float(relevance.max() - relevance.min())
+    relevance = (relevance - relevance.min()) / spread if spread > 0 else np.ones_like(relevance)
+
+    available = np.ones(len(pool), dtype=bool)
+    max_sim = np.zeros(len(pool), dtype=np.float32)
+    selected: List[int] = []
+    while len(selected) < k and available.any():
+        if selected:
+            scores = lambda_ * relevance - (1 - lambda_) * max_sim
+        else:
+            scores = relevance.copy()
+        scores[~available] = -np.inf
+        best = int(np.argmax(scores))
+        selected.append(best)
+        available[best] = False
+        max_sim = np.maximum(max_sim, similarity[best])
+        if max_similarity is not None:
+            available &= max_sim < max_similarity
+    return [int(pool[i]) for i in selected]
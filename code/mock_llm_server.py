@@ -0,0 +1,333 @@
+"""OpenAI 호환 모의(mock) LLM 서버
+
+실제 API를 호출하지 않고 expand_query → get_relevant_context → generate_response 전체 흐름을
+부하 테스트/프로파일링하기 위한 로컬 서버입니다.
+`/v1/chat/completions`의 스트리밍·비스트리밍 응답을 모두 지원하며,
+지연 시간 분포, 초당 토큰 수, 오류 주입을 설정할 수 있습니다.
+
+실행 예시:
+    python code/mock_llm_server.py --port 8001 --latency lognormal:-1.5,0.4 --tokens-per-second 40
+    OPENAI_BASE_URL=http://127.0.0.1:8001/v1 OPENAI_API_KEY=mock streamlit run code/ESG.py
+"""
+import argparse
+import json
+import math
+import random
+import threading
+import time
+import uuid
+from dataclasses import dataclass, field
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional, Tuple
+
+# 응답 본문으로 사용할 고정 문단 (토큰 단위로 잘라서 반환)
+MOCK_ANSWER = """### 1. 개요·정의
+요청하신 내용은 ESG 경영에서 자주 다뤄지는 주제로, 우수 기업들은 이를 중장기 전략과 연계하여 관리하고 있습니다.
+
+### 2. 배경·맥락
+투자자와 평가기관은 정량 목표와 이행 현황을 함께 공개하는 기업을 높게 평가합니다.
+
+### 3. ESG 핵심 지표 (KPI)
+- 목표 대비 이행률, 연도별 개선 추이, 이해관계자 참여 지표
+
+### 4. 단계별 실행 로드맵
+- (0~6개월): 현황 진단 및 기준 수립
+- (7~12개월): 실행 과제 도입 및 성과 모니터링
+
+### 6. 문서 출처 요약
+(출처: 모의 응답, p.0)
+
+**요약: 이 응답은 부하 테스트를 위한 모의 LLM 서버에서 생성되었습니다.**"""
+
+# 질문 확장(expand_query) 요청에 사용할 짧은 응답
+MOCK_EXPANSION = "기업의 ESG 전략과 관련 지표는 어떻게 설정되어 있으며, 어떤 실행 방안을 사용하고 있나요?"
+
+def parse_latency(spec: str):
+    """지연 시간 분포 문자열을 (초 단위) 샘플링 함수로 변환
+
+       예시:
+        "fixed:0.2"            → 항상 0.2초
+        "uniform:0.1,0.5"      → 0.1~0.5초 균등 분포
+        "normal:0.3,0.05"      → 평균 0.3초, 표준편차 0.05초
+        "lognormal:-1.5,0.4"   → ln(지연)이 N(-1.5, 0.4)를 따름
+    """
+    kind, _, params = spec.partition(":")
+    values = [float(v) for v in params.split(",") if v.strip()] if params else []
+
+    if kind == "fixed":
+        delay = values[0] if values else 0.0
+        return lambda rng: delay
+    if kind == "uniform":
+        low, high = values
+        return lambda rng: rng.uniform(low, high)
+    if kind == "normal":
+        mean, std = values
+        return lambda rng: max(0.0, rng.gauss(mean, std))
+    if kind == "lognormal":
+        mu, sigma = values
+        return lambda rng: rng.lognormvariate(mu, sigma)
+    raise ValueError(f"지원하지 않는 지연 시간 분포입니다: {spec}")
+
+def estimate_tokens(text: str) -> int:
+    """대략적인 토큰 수 추정 (한국어 기준 약 2글자당 1토큰)"""
+    return max(1, math.ceil(len(text) / 2)) if text else 0
+
+def tokenize(text: str) -> List[str]:
+    """응답 텍스트를 스트리밍용 토큰 조각으로 분할 (공백을 포함한 단어 단위)"""
+    tokens = []
+    current = ""
+    for ch in text:
+        current += ch
+        if ch in (" ", "\n"):
+            tokens.append(current)
+            current = ""
+    if current:
+        tokens.append(current)
+    return tokens
+
+@dataclass
+class MockConfig:
+    """모의 서버 동작 설정"""
+    latency: str = "fixed:0.0"               # 첫 토큰까지의 지연 시간 분포
+    tokens_per_second: float = 0.0          # 0이면 토큰 생성 지연 없음
+    error_rate: float = 0.0                 # 오류를 반환할 요청 비율 (0~1)
+    error_statuses: Tuple[int, ...] = (500,)  # 주입할 HTTP 상태 코드 후보
+    seed: int = 0                           # 재현 가능한 결과를 위한 시드
+    max_answer_tokens: Optional[int] = None  # 응답 토큰 수 상한 (None이면 max_tokens만 적용)
+    _counter: int = field(default=0, repr=False)
+    _lock: threading.Lock = field(default_factory=threading.Lock, repr=False)
+
+    def __post_init__(self):
+        self._sample_latency = parse_latency(self.latency)
+
+    def next_rng(self) -> random.Random:
+        """요청 순서에 따라 결정되는 난수 생성기 반환 (동일 시드 → 동일 결과)"""
+        with self._lock:
+            self._counter += 1
+            index = self._counter
+        return random.Random(f"{self.seed}:{index}")
+
+    def sample_latency(self, rng: random.Random) -> float:
+        return self._sample_latency(rng)
+
+class MockOpenAIHandler(BaseHTTPRequestHandler):
+    """`/v1/chat/completions`, `/v1/models`, `/health` 엔드포인트 처리"""
+    server_version = "MockOpenAI/1.0"
+    protocol_version = "HTTP/1.1"
+
+    @property
+    def config(self) -> MockConfig:
+        return self.server.mock_config
+
+    def log_message(self, format, *args):
+        # 부하 테스트 중 콘솔 출력 비용을 줄이기 위해 요청 로그는 생략
+        pass
+
+    def _send_json(self, status: int, payload: Dict):
+        body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_error(self, status: int, message: str):
+        self._send_json(status, {
+            "error": {
+                "message": message,
+                "type": "mock_error",
+                "param": None,
+                "code": str(status),
+            }
+        })
+
+    def do_GET(self):
+        if self.path.rstrip("/") in ("/health", "/v1/health"):
+            self._send_json(200, {"status": "ok"})
+        elif self.path.rstrip("/") == "/v1/models":
+            self._send_json(200, {
+                "object": "list",
+                "data": [{"id": "mock-model", "object": "model", "owned_by": "mock"}],
+            })
+        else:
+            self._send_error(404, f"Unknown path: {self.path}")
+
+    def do_POST(self):
+        if self.path.rstrip("/") != "/v1/chat/completions":
+            self._send_error(404, f"Unknown path: {self.path}")
+            return
+
+        length = int(self.headers.get("Content-Length", 0))
+        try:
+            request = json.loads(self.rfile.read(length) or b"{}")
+        except json.JSONDecodeError:
+            self._send_error(400, "Invalid JSON body")
+            return
+
+        rng = self.config.next_rng()
+
+        # 첫 토큰까지의 지연 (네트워크 + 큐잉 + 프리필 시간 흉내)
+        delay = self.config.sample_latency(rng)
+        if delay > 0:
+            time.sleep(delay)
+
+        # 오류 주입
+        if self.config.error_rate > 0 and rng.random() < self.config.error_rate:
+            status = rng.choice(self.config.error_statuses)
+            self._send_error(status, f"Injected mock error ({status})")
+            return
+
+        messages = request.get("messages", [])
+        model = request.get("model", "mock-model")
+        tokens = self._build_answer(messages, request.get("max_tokens"))
+        prompt_tokens = sum(estimate_tokens(str(m.get("content", ""))) for m in messages)
+        usage = {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": len(tokens),
+            "total_tokens": prompt_tokens + len(tokens),
+        }
+
+        if request.get("stream"):
+            include_usage = bool((request.get("stream_options") or {}).get("include_usage"))
+            self._stream(model, tokens, usage if include_usage else None)
+        else:
+            self._complete(model, tokens, usage)
+
+    def _build_answer(self, messages: List[Dict], max_tokens: Optional[int]) -> List[str]:
+        """요청 종류(질문 확장 / 답변 생성)에 맞는 모의 응답 토큰 목록 생성"""
+        last_user = next((m.get("content", "") for m in reversed(messages) if m.get("role") == "user"), "")
+        text = MOCK_EXPANSION if "질문을 확장해주세요" in str(last_user) else MOCK_ANSWER
+
+        tokens = tokenize(text)
+        limits = [n for n in (max_tokens, self.config.max_answer_tokens) if n]
+        if limits:
+            tokens = tokens[:min(limits)]
+        return tokens
+
+    def _token_delay(self) -> float:
+        tps = self.config.tokens_per_second
+        return 1.0 / tps if tps > 0 else 0.0
+
+    def _complete(self, model: str, tokens: List[str], usage: Dict):
+        # 비스트리밍 응답도 토큰 생성 시간만큼 대기
+        delay = self._token_delay() * len(tokens)
+        if delay > 0:
+            time.sleep(delay)
+
+        self._send_json(200, {
+            "id": f"chatcmpl-mock-{uuid.uuid4().hex[:12]}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": model,
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": "".join(tokens)},
+                "finish_reason": "stop",
+            }],
+            "usage": usage,
+        })
+
+    def _stream(self, model: str, tokens: List[str], usage: Optional[Dict]):
+        completion_id = f"chatcmpl-mock-{uuid.uuid4().hex[:12]}"
+        created = int(time.time())
+
+        def chunk(delta: Dict, finish_reason=None) -> Dict:
+            return {
+                "id": completion_id,
+                "object": "chat.completion.chunk",
+                "created": created,
+                "model": model,
+                "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+            }
+
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        self.close_connection = True
+
+        delay = self._token_delay()
+        try:
+            self._write_event(chunk({"role": "assistant", "content": ""}))
+            for token in tokens:
+                if delay > 0:
+                    time.sleep(delay)
+                self._write_event(chunk({"content": token}))
+            self._write_event(chunk({}, finish_reason="stop"))
+            if usage is not None:
+                final = chunk({})
+                final["choices"] = []
+                final["usage"] = usage
+                self._write_event(final)
+            self.wfile.write(b"data: [DONE]\n\n")
+            self.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError):
+            # 클라이언트가 스트림을 중간에 끊은 경우
+            pass
+
+    def _write_event(self, payload: Dict):
+        self.wfile.write(f"data: {json.dumps(payload, ensure_ascii=False)}\n\n".encode("utf-8"))
+        self.wfile.flush()
+
+class MockOpenAIServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, config: MockConfig):
+        super().__init__(address, MockOpenAIHandler)
+        self.mock_config = config
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+def start_mock_server(config: Optional[MockConfig] = None, host: str = "127.0.0.1", port: int = 0) -> MockOpenAIServer:
+    """백그라운드 스레드에서 모의 서버를 시작하고 서버 객체 반환 (port=0이면 빈 포트 자동 선택)
+
+       사용 예시:
+        server = start_mock_server(MockConfig(latency="fixed:0.1", tokens_per_second=50))
+        os.environ["OPENAI_BASE_URL"] = server.base_url
+        ...
+        server.shutdown()
+    """
+    server = MockOpenAIServer((host, port), config or MockConfig())
+    thread = threading.Thread(target=server.serve_forever, name="mock-openai-server", daemon=True)
+    thread.start()
+    return server
+
+def main():
+    parser = argparse.ArgumentParser(description="OpenAI 호환 모의 LLM 서버")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8001)
+    parser.add_argument("--latency", default="fixed:0.0",
+                        help="첫 토큰 지연 분포 (fixed:s | uniform:a,b | normal:mean,std | lognormal:mu,sigma)")
+    parser.add_argument("--tokens-per-second", type=float, default=0.0,
+                        help="토큰 생성 속도 (0이면 지연 없음)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="오류 주입 비율 (0~1)")
+    parser.add_argument("--error-status", type=int, nargs="+", default=[500],
+                        help="주입할 HTTP 상태 코드 (예: 429 500 503)")
+    parser.add_argument("--max-answer-tokens", type=int, default=None)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    config = MockConfig(
+        latency=args.latency,
+        tokens_per_second=args.tokens_per_second,
+        error_rate=args.error_rate,
+        error_statuses=tuple(args.error_status),
+        seed=args.seed,
+        max_answer_tokens=args.max_answer_tokens,
+    )
+    server = MockOpenAIServer((args.host, args.port), config)
+    print(f"모의 LLM 서버 실행 중: {server.base_url}")
+    print(f"설정: {config}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+if __name__ == "__main__":
+    main()
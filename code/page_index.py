@@ -0,0 +1,132 @@
+"""페이지 구간 색인과 페이지 참조 질문 직접 조회
+
+"신한 보고서 4~5페이지 내용"처럼 페이지를 지정한 질문은 벡터 검색/재순위화 없이
+출처별 페이지 구간 색인에서 해당 페이지와 겹치는 청크를 바로 찾습니다.
+
+청크 메타데이터의 page_start/page_end(정수)를 사용하고, 이전에 적재한 청크처럼 없으면 page_range("3-9")를 해석합니다.
+적재 시 근사 중복으로 합쳐진 청크(dedup.py)는 대표 청크 메타데이터의 duplicates 위치로도 찾을 수 있습니다.
+"""
+import re
+import threading
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from dedup import duplicate_metadatas
+
+# "4~5페이지", "4-5 페이지", "4페이지", "12쪽", "p.4", "p4~5", "4p", "보고서p.4", "4p에서", "page 4"
+# \b는 한글과 영문 사이를 단어 경계로 보지 않으므로 영문/숫자만 막는 lookaround 사용
+# 영문 표기(page, p)는 숫자에 붙어 있어야 함 ("1 page 요약", "CJ 2030 page"는 페이지 참조가 아님)
+_RANGE = r"(\d{1,4})(?:\s*[~\-–]\s*(\d{1,4}))?"
+_PAGE_PATTERNS = [
+    re.compile(r"(?<![\d.,])" + _RANGE + r"\s*(?:페이지|쪽)"),
+    re.compile(r"(?<![\d.,])(\d{1,4})(?:[~\-–](\d{1,4}))?(?:pages?|p)(?![A-Za-z])", re.IGNORECASE),
+    re.compile(r"(?<![A-Za-z])(?:pages?\s*|pp?\.\s*|p)" + _RANGE + r"(?!\d)", re.IGNORECASE),
+]
+
+def parse_page_reference(query: str) -> Optional[Tuple[int, int]]:
+    """질문에서 페이지 참조를 찾아 (시작, 끝) 페이지 반환, 없으면 None
+
+       덱 페이지 수와의 비교(예: "2030페이지")는 페이지 색인을 가진 조회 시점에 PageIndex.page_count로 확인
+    """
+    for pattern in _PAGE_PATTERNS:
+        match = pattern.search(query)
+        if match:
+            first = int(match.group(1))
+            last = int(match.group(2)) if match.group(2) else first
+            return min(first, last), max(first, last)
+    return None
+
+def format_pages(pages: Tuple[int, int]) -> str:
+    return f"{pages[0]}-{pages[1]}"
+
+def parse_pages(value: str) -> Tuple[int, int]:
+    start, _, end = str(value).partition("-")
+    return int(start), int(end or start)
+
+def page_bounds(metadata: Dict) -> Tuple[int, int]:
+    """청크의 (시작, 끝) 페이지 (page_start/page_end가 없으면 page_range 해석, 알 수 없으면 (0, 0))"""
+    if "page_start" in metadata and "page_end" in metadata:
+        return int(metadata["page_start"]), int(metadata["page_end"])
+    try:
+        return parse_pages(metadata.get("page_range", ""))
+    except ValueError:
+        return 0, 0
+
+class PageIndex:
+    """출처(source)별 페이지 구간 색인
+
+       출처마다 시작 페이지 순으로 정렬한 (시작, 끝, 청크 위치) 배열을 두고,
+       조회 시 searchsorted로 시작 페이지가 범위 안인 후보를 자른 뒤 끝 페이지로 겹침을 확인
+       중복으로 합쳐진 청크 위치는 대표 청크 문서에 그 위치의 메타데이터를 붙인 행으로 documents/metadatas 뒤에 추가
+    """
+
+    def __init__(self, documents: List[str], metadatas: List[Dict]):
+        self.documents = list(documents)
+        self.metadatas = list(metadatas)
+        origins = list(range(len(documents)))
+        for position, metadata in enumerate(metadatas):
+            for duplicate in duplicate_metadatas(metadata):
+                self.documents.append(documents[position])
+                self.metadatas.append(duplicate)
+                origins.append(position)
+        self._origins = origins
+        metadatas = self.metadatas
+
+        by_source: Dict[str, List[Tuple[int, int, int]]] = {}
+        for position, metadata in enumerate(metadatas):
+            start, end = page_bounds(metadata)
+            by_source.setdefault(metadata.get("source", ""), []).append((start, end, position))
+
+        self._sources = {}
+        for source, rows in by_source.items():
+            # 같은 페이지 안에서는 청크 순서(chunk_index)대로 나오도록 위치도 정렬 키에 포함
+            rows.sort(key=lambda row: (row[0], metadatas[row[2]].get("chunk_index", 0), row[2]))
+            array = np.asarray(rows, dtype=np.int64).reshape(-1, 3)
+            self._sources[source] = (array[:, 0], array[:, 1], array[:, 2])
+
+    def page_count(self, source: Optional[str] = None) -> int:
+        """출처 덱의 마지막 페이지 (출처가 없으면 가장 긴 덱 기준, 모르는 출처는 0)"""
+        sources = [source] if source else list(self._sources)
+        return max((int(self._sources[name][1].max()) for name in sources
+                    if name in self._sources and len(self._sources[name][1])), default=0)
+
+    @classmethod
+    def from_collection(cls, collection) -> "PageIndex":
+        results = collection.get(include=["documents", "metadatas"])
+        return cls(results["documents"], results["metadatas"])
+
+    def lookup(self, first: int, last: int, source: Optional[str] = None) -> List[int]:
+        """[first, last] 페이지와 겹치는 청크 위치 (출처 → 페이지 → 청크 순서, 같은 대표 청크는 한 번만)"""
+        sources = [source] if source else sorted(self._sources)
+        positions, seen = [], set()
+        for name in sources:
+            if name not in self._sources:
+                continue
+            starts, ends, rows = self._sources[name]
+            candidates = slice(0, np.searchsorted(starts, last, side="right"))
+            overlap = ends[candidates] >= first
+            for position in rows[candidates][overlap]:
+                origin = self._origins[int(position)]
+                if origin not in seen:
+                    seen.add(origin)
+                    positions.append(int(position))
+        return positions
+
+_indexes: Dict[Tuple[int, Optional[str]], PageIndex] = {}
+_lock = threading.Lock()
+
+def get_page_index(collection) -> PageIndex:
+    """컬렉션(스냅샷)별 페이지 색인 (처음 조회할 때 한 번 생성)"""
+    key = (id(collection), getattr(collection, "version", None))
+    index = _indexes.get(key)
+    if index is None:
+        with _lock:
+            index = _indexes.get(key)
+            if index is None:
+                index = PageIndex.from_collection(collection)
+                # 교체된 스냅샷의 색인은 최근 것 하나만 남기고 정리
+                for old_key in list(_indexes)[:-1]:
+                    del _indexes[old_key]
+                _indexes[key] = index
+    return index
@@ -2,11 +2,14 @@ import streamlit as st
 import os
 import sys
 from pathlib import Path
-from rag_chatbot import get_relevant_context, generate_response, extract_metadata_filters, expand_query
-import chromadb
-from chromadb.utils import embedding_functions
-from dotenv import load_dotenv
+from rag_chatbot import answer_with_context, extract_metadata_filters, answer_query, coalesced_answer, summarize_conversation, get_collection, is_failed_response
+from conversation_memory import ConversationMemory
+from session_store import SessionStore
+from profiling import profile_request, profiling_enabled
+from warmup import start_background_warmup, get_warmup_state, DONE, FAILED, RUNNING
+import threading
 import time
+import uuid
 import pandas as pd
 
 # 페이지 설정 
@@ -17,27 +20,32 @@ st.set_page_config(
 )
 
 @st.cache_resource
-def load_data():
-    # .env 파일 로드
-    load_dotenv()
+def get_api_client():
+    # RAG_API_URL이 설정되면 이 페이지는 api_server.py의 씬 클라이언트로 동작 (모델을 직접 로드하지 않음)
+    api_url = os.getenv("RAG_API_URL")
+    if not api_url:
+        return None
+    from api_client import RagApiClient
+    return RagApiClient(api_url)
 
-    # 데이터 로딩
-    embedding_function = embedding_functions.SentenceTransformerEmbeddingFunction(
-        model_name="jhgan/ko-sroberta-multitask"
-    )
-    
-    client = chromadb.PersistentClient(path="./data/chromadb")
-    collection = client.get_collection(
-        name="ppt_documents_collection",
-        embedding_function=embedding_function
-    )
+api = get_api_client()
 
-    return collection
+@st.cache_resource
+def get_session_store():
+    # 대화 기록은 세션 상태 대신 SQLite에 저장 (세션별 메시지 수/크기 제한, 유휴 세션 정리)
+    return SessionStore()
 
-with st.spinner("ChromaDB 컬렉션을 초기화하는 중입니다. 잠시만 기다려주세요..."):
-    # 데이터 로딩 및 세션 상태에 저장
-    if "collection" not in st.session_state:
-        st.session_state.collection = load_data()
+session_store = get_session_store()
+VISIBLE_MESSAGES = 20  # 한 번에 화면에 불러오는 최근 메시지 수
+
+def summarize_memory(memory, summarizer, session_id):
+    # (백그라운드 스레드) 밀려난 턴을 누적 요약에 합치고 세션 저장소에도 반영
+    if memory.summarize_pending(summarizer):
+        session_store.save_memory(session_id, memory.to_dict())
+
+if api is None:
+    # 모델/벡터 인덱스 로딩은 백그라운드에서 진행 (이미 ESG.py에서 시작했다면 상태만 반환)
+    start_background_warmup()
 
 # 스타일 설정
 st.markdown("""
@@ -78,12 +86,82 @@ with st.sidebar:
     else:
         model_id = "gpt-3.5-turbo"
 
-# 채팅 인터페이스
-if "messages" not in st.session_state:
-    st.session_state.messages = []
+    use_memory = st.toggle(
+        "대화 맥락 유지",
+        value=True,
+        help="이전 대화(최근 대화 원문 + 요약)를 함께 전달하여 후속 질문에 답변합니다"
+    )
+
+    profile_on = st.toggle(
+        "성능 프로파일링",
+        value=profiling_enabled(),
+        help="질문 처리 과정을 프로파일링하여 단계별 소요 시간을 표시하고 .prof/speedscope 파일로 저장합니다"
+    )
+
+    def show_readiness() -> bool:
+        """준비 상태 표시, 더 갱신할 필요가 없으면(준비 완료 또는 로딩 종료) True"""
+        if api is not None:
+            try:
+                ready = api.health()["ready"]
+            except Exception:
+                ready = False
+            if ready:
+                st.success("API 서버 준비 완료")
+            else:
+                st.info("API 서버를 준비하는 중이거나 연결할 수 없습니다.")
+            return ready
+
+        state = get_warmup_state()
+        step_icons = {DONE: "✅", FAILED: "❌", RUNNING: "⏳"}
+        if state.ready:
+            st.success("챗봇 준비 완료")
+        elif state.finished:
+            st.warning("일부 구성요소를 불러오지 못했습니다. 질문 시 다시 시도합니다.")
+        else:
+            st.info("모델과 문서 인덱스를 준비하는 중입니다. 지금 질문하면 준비가 끝난 뒤 답변합니다.")
+            st.progress(state.progress)
+        if not state.ready:
+            with st.expander("준비 상태"):
+                for step in state.steps:
+                    seconds = f" ({step.seconds:.1f}초)" if step.seconds is not None else ""
+                    st.write(f"{step_icons.get(step.status, '▫️')} {step.name}{seconds}")
+        return state.finished
+
+    # 로딩이 끝날 때까지만 2초마다 이 영역을 갱신하고, 끝나면 전체를 한 번 다시 실행해 타이머 없는 표시로 바꿈
+    @st.fragment(run_every=2)
+    def poll_readiness():
+        if show_readiness():
+            st.session_state.readiness_settled = True
+            st.rerun()
 
-# 이전 대화 내용 표시
-for message in st.session_state.messages:
+    if st.session_state.get("readiness_settled"):
+        show_readiness()
+    else:
+        poll_readiness()
+
+# 채팅 인터페이스 (세션 상태에는 세션 ID와 화면에 표시할 메시지 수만 보관)
+# 세션 ID는 URL(?session=...)에도 두어 페이지를 다시 불러와도 같은 대화 기록을 이어감
+if "session_id" not in st.session_state:
+    st.session_state.session_id = st.query_params.get("session") or uuid.uuid4().hex
+    st.session_state.visible_messages = VISIBLE_MESSAGES
+session_id = st.session_state.session_id
+st.query_params["session"] = session_id
+# 페이지를 볼 때마다 사용 시각을 갱신해 대화 중인 세션은 유휴 정리에서 제외
+session_store.touch(session_id)
+
+# 토큰 예산이 고정된 대화 메모리 (최근 턴 원문 + 누적 요약), 대화 기록과 함께 SQLite에 저장된 상태에서 복원
+if "memory" not in st.session_state:
+    saved_memory = session_store.load_memory(session_id)
+    st.session_state.memory = ConversationMemory.from_dict(saved_memory) if saved_memory else ConversationMemory()
+memory = st.session_state.memory
+
+# 이전 대화 내용 표시 (화면에 보이는 최근 메시지만 불러옴)
+if session_store.count(session_id) > st.session_state.visible_messages:
+    if st.button("이전 대화 더 보기"):
+        st.session_state.visible_messages += VISIBLE_MESSAGES
+        st.rerun()
+
+for message in session_store.recent(session_id, st.session_state.visible_messages):
     if message["role"] == "user":
         st.markdown(f'<div class="user-message">{message["content"]}</div>', unsafe_allow_html=True)
     else:
@@ -96,29 +174,62 @@ for message in st.session_state.messages:
 # 사용자 입력
 if prompt := st.chat_input("ESG 관련 질문을 입력하세요"):
     # 사용자 메시지 추가
-    st.session_state.messages.append({"role": "user", "content": prompt})
+    session_store.append(session_id, "user", prompt)
     st.markdown(f'<div class="user-message">{prompt}</div>', unsafe_allow_html=True)
 
     # AI 응답 생성
     with st.chat_message("assistant"):
         with st.spinner("답변 생성 중..."):
             try:
-                # 질문 확장
-                expanded_query = expand_query(prompt)
-                
-                # 메타데이터 필터 추출
-                metadata_filters = extract_metadata_filters(expanded_query)
-                
-                # 관련 문서 검색
-                context, metadata_summary = get_relevant_context(
-                    expanded_query,
-                    st.session_state.collection,
-                    metadata_filters=metadata_filters
-                )
-                
-                # 응답 생성
-                response, metadata_info = generate_response(expanded_query, context, metadata_summary)
+                with profile_request("chat_query", enabled=profile_on, model=model_id) as (trace, profile):
+                    # 대화 맥락 유지 시 이전 대화 요약 + 최근 턴을 함께 전달
+                    history = memory.build_messages() if use_memory else []
+
+                    # 직전 질문을 이어서 묻는 경우 이전 검색 결과 재사용
+                    follow_up = use_memory and memory.is_follow_up(prompt, extract_metadata_filters(prompt))
+                    trace.attrs["follow_up"] = follow_up
+
+                    if follow_up:
+                        metadata_filters = memory.last_filters
+                        context, metadata_summary = memory.last_context, memory.last_metadata_summary
+                        if api is not None:
+                            response = api.answer(
+                                prompt, model=model_id, history=history, context=context, metadata_summary=metadata_summary
+                            )["response"]
+                        else:
+                            # 새 검색과 같은 입장 제어 (과부하면 BUSY_MESSAGE)
+                            response = answer_with_context(
+                                prompt, context, metadata_summary, model=model_id, history=history
+                            )["response"]
+                    else:
+                        if api is not None:
+                            # API 서버에서 파이프라인 실행 (대화 기록이 없으면 서버에서 동일 질문과 병합)
+                            result = api.answer(prompt, model=model_id, history=history)
+                            trace.attrs["coalesced"] = result.get("coalesced", False)
+                        elif history or profile_on:
+                            # 질문 확장 → 필터 추출 → 문서 검색 → 응답 생성
+                            result = answer_query(prompt, get_collection(), model=model_id, history=history)
+                        else:
+                            # 대화 기록이 없는 질문은 다른 세션의 동일한 질문과 실행을 공유
+                            # (프로파일링 중에는 이 요청의 실행을 측정해야 하므로 공유하지 않음)
+                            result, shared = coalesced_answer(prompt, get_collection(), model=model_id)
+                            trace.attrs["coalesced"] = shared
+                        metadata_filters = result["metadata_filters"]
+                        context, metadata_summary = result["context"], result["metadata_summary"]
+                        response, metadata_info = result["response"], result["metadata_info"]
+
+                    # 거절/오류 안내 문구는 대화 기록과 재사용할 검색 결과에 남기지 않음
+                    # (밀려난 턴의 요약은 답변을 보여준 뒤 백그라운드에서 합침)
+                    if use_memory and not is_failed_response(response):
+                        memory.add_turn(
+                            prompt, response,
+                            context=context, metadata_summary=metadata_summary, metadata_filters=metadata_filters
+                        )
+                        session_store.save_memory(session_id, memory.to_dict())
                 
+                if profile is not None:
+                    st.session_state.last_profile = profile
+
                 st.markdown(response)
                 
                 # 메타데이터 요약 정보 표시
@@ -127,16 +238,33 @@ if prompt := st.chat_input("ESG 관련 질문을 입력하세요"):
                         st.code(context, language="text")
                 
                 # 응답 저장
-                st.session_state.messages.append({
-                    "role": "assistant",
-                    "content": response,
-                    "metadata_summary": metadata_summary
-                })
+                session_store.append(session_id, "assistant", response, metadata_summary)
+
+                if memory.pending:
+                    # 요약 LLM 호출은 답변 표시를 막지 않도록 별도 스레드에서 (끝나기 전 다음 질문에는 원문으로 전달)
+                    summarizer = api.summarize if api is not None else summarize_conversation
+                    threading.Thread(target=summarize_memory, args=(memory, summarizer, session_id),
+                                     name="summarize-memory", daemon=True).start()
                 
             except Exception as e:
                 st.error(f"오류가 발생했습니다: {str(e)}")
 
+# 마지막 질문의 프로파일 결과
+if profile_on and st.session_state.get("last_profile") is not None:
+    last_profile = st.session_state.last_profile
+    with st.sidebar:
+        st.header("프로파일")
+        st.caption(f"총 {(last_profile.trace.duration or 0) * 1000:.0f}ms")
+        st.code("\n".join(last_profile.flame_lines(width=24)), language="text")
+        st.dataframe(pd.DataFrame(last_profile.stage_table()), hide_index=True)
+        with st.expander("함수별 누적 시간 (cProfile)"):
+            st.code(last_profile.top_functions(), language="text")
+        if last_profile.prof_path:
+            st.caption(f"저장됨: {last_profile.prof_path}, {last_profile.speedscope_path}")
+
 # 대화 초기화 버튼
 if st.sidebar.button("대화 초기화"):
-    st.session_state.messages = []
+    session_store.clear(session_id)
+    st.session_state.visible_messages = VISIBLE_MESSAGES
+    st.session_state.memory.clear()
     st.rerun() 
\ No newline at end of file
@@ -1,13 +1,26 @@
 from pptx import Presentation
+import bisect
 import re
 from pathlib import Path
 import json
 import os
 import chromadb
-from chromadb.utils import embedding_functions
+import numpy as np
+from embedding_service import make_embedding_function, EMBEDDING_MODEL
+from index_snapshots import SnapshotStore, INDEX_ROOT, SNAPSHOT_KEEP, close_chroma
+from chunk_store import write_chunk_store, load_json_chunks, embed_chunks, replace_sources, CHUNK_STORE_PATH
+from quantization import build_index
+from sharding import select_shard_chunks, shard_root
+from dedup import deduplicate_by_source, format_report, DEDUP_THRESHOLD
+from token_cache import build_token_cache, cache_path, load_tokenizer, open_token_cache, CROSS_ENCODER_MODEL, TOKEN_CACHE_ROOT
+import argparse
 import uuid
 from langchain.text_splitter import RecursiveCharacterTextSplitter
 
+def company_name(deck_name):
+    """덱 파일 이름(확장자 제외)에서 회사 이름 ("ktng_2024" → "ktng", 연도가 없으면 그대로)"""
+    return re.sub(r"[_-](?:19|20)\d{2}$", "", deck_name)
+
 def get_section_and_subsection(page_num, ppt_name):
     """페이지 번호와 PPT 이름에 따라 섹션과 서브섹션을 결정하는 함수
        각 섹션과 서브섹션은 ppt 파일에 따라 다르게 정의되어 있음
@@ -43,9 +56,11 @@ def get_section_and_subsection(page_num, ppt_name):
             49-51:안전 및 보건
             52:지속가능한 공급망
     """
-    # PPT 파일명에서 확장자를 제외한 이름을 추출
+    # PPT 파일명에서 확장자를 제외한 이름을 추출 (연도별 덱에 섹션 파일이 없으면 회사 섹션 파일 사용)
     base_name = Path(ppt_name).stem
     section_file = f'data/config/{base_name}_section_data.txt'
+    if not os.path.exists(section_file):
+        section_file = f'data/config/{company_name(base_name)}_section_data.txt'
     
     try: # 섹션 데이터 파일 읽기
         with open(section_file, 'r', encoding='utf-8') as f:
@@ -171,55 +186,65 @@ def process_ppt(ppt_path):
         # 해당 섹션의 모든 텍스트를 결합
         combined_text = "\n".join(texts)
         
-        # RecursiveCharacterTextSplitter로 분할
+        # 결합된 텍스트에서 각 슬라이드가 시작하는 위치 (청크 위치 → 페이지 번호 계산용)
+        page_numbers = text_page_numbers[(section_type, sub_section)]
+        slide_offsets = []
+        offset = 0
+        for text in texts:
+            slide_offsets.append(offset)
+            offset += len(text) + 1
+        
+        # RecursiveCharacterTextSplitter로 분할 (add_start_index: 청크의 시작 위치를 메타데이터에 기록)
         text_splitter = RecursiveCharacterTextSplitter(
             chunk_size=1000,
             chunk_overlap=50,
             length_function=len,
-            separators=["\n\n", "\n", ".", "!", "?", ",", " ", ""]
+            separators=["\n\n", "\n", ".", "!", "?", ",", " ", ""],
+            add_start_index=True
         )
         
-        split_texts = text_splitter.split_text(combined_text)
+        split_docs = text_splitter.create_documents([combined_text])
         
-        # 각 청크에 대한 메타데이터 생성
-        page_numbers = text_page_numbers[(section_type, sub_section)]
-        page_range = f"{min(page_numbers)}-{max(page_numbers)}"  # 페이지 범위를 문자열로 변환
-        
-        for i, chunk_text in enumerate(split_texts):
+        for i, doc in enumerate(split_docs):
+            chunk_text = doc.page_content
+            start_index = doc.metadata.get("start_index", -1)
+            if start_index >= 0:
+                # 청크의 첫 글자와 마지막 글자가 속한 슬라이드의 페이지 번호
+                page_start = page_numbers[bisect.bisect_right(slide_offsets, start_index) - 1]
+                page_end = page_numbers[bisect.bisect_right(slide_offsets, start_index + len(chunk_text) - 1) - 1]
+            else:
+                page_start, page_end = min(page_numbers), max(page_numbers)
+            
             chunk = {
                 'text': chunk_text,
                 'metadata': {
                     'section': section_type, # 섹션
                     'sub_section': sub_section, # 서브섹션
-                    'source': source_name.upper(), # 회사 이름
-                    'page_range': page_range,  # 페이지 범위를 문자열로 저장
+                    'source': company_name(source_name).upper(), # 회사 이름
+                    'report': source_name, # 덱 이름 (같은 회사의 연도별 덱 구분)
+                    'page_range': f"{page_start}-{page_end}",  # 청크가 나온 페이지 범위 (표시용 문자열)
+                    'page_start': page_start, # 청크가 시작하는 페이지
+                    'page_end': page_end, # 청크가 끝나는 페이지
                     'chunk_index': i, # 청크 인덱스
-                    'total_chunks_in_section': len(split_texts) # 섹션 내 청크 수
+                    'total_chunks_in_section': len(split_docs) # 섹션 내 청크 수
                 }
             }
             all_chunks.append(chunk)
             
-        print(f"{section_type} 섹션({sub_section})에서 {len(split_texts)}개의 청크 생성됨")
+        print(f"{section_type} 섹션({sub_section})에서 {len(split_docs)}개의 청크 생성됨")
     
     return all_chunks, source_name
 
-def save_to_chroma(chunks, collection_name):
-    """청크를 ChromaDB에 저장하는 함수"""
+def build_chroma_index(chunks, collection_name, chroma_path, embeddings=None):
+    """청크를 지정한 경로의 새 ChromaDB에 저장하는 함수 (embeddings가 있으면 다시 임베딩하지 않음)"""
     # ChromaDB 클라이언트 초기화
-    client = chromadb.PersistentClient(path="./data/chromadb")
+    client = chromadb.PersistentClient(path=chroma_path)
     
     # openai의 embedding 함수는 비용 발생하기 때문에, 비용 발생하지 않는 함수 사용
-    embedding_function = embedding_functions.SentenceTransformerEmbeddingFunction(
-        model_name="jhgan/ko-sroberta-multitask"
-    )
-    
-    # 컬렉션이 이미 존재하면 삭제
-    try:
-        client.delete_collection(name=collection_name)
-    except:
-        pass
+    # (RAG_EMBEDDING_SERVICE가 설정되면 공유 임베딩 서비스로 임베딩)
+    embedding_function = make_embedding_function(EMBEDDING_MODEL)
     
-    # 새로운 컬렉션 생성
+    # 새로운 컬렉션 생성 (스냅샷마다 빈 디렉터리에서 시작하므로 기존 컬렉션 삭제 불필요)
     collection = client.create_collection(
         name=collection_name,
         embedding_function=embedding_function
@@ -240,41 +265,150 @@ def save_to_chroma(chunks, collection_name):
     collection.add(
         ids=ids,
         documents=texts,
-        metadatas=metadatas
+        metadatas=metadatas,
+        embeddings=embeddings
     )
-    
-    print(f"ChromaDB에 {len(chunks)}개의 청크가 저장되었습니다.")
     return collection
 
+def save_to_chroma(chunks, collection_name, index_root=INDEX_ROOT, embeddings=None):
+    """청크를 새 인덱스 스냅샷으로 만들어 게시하는 함수
+
+       서빙 중인 스냅샷은 건드리지 않고, 새 버전을 완성한 뒤 CURRENT 포인터만 원자적으로 교체
+    """
+    store = SnapshotStore(index_root)
+
+    def build(chroma_path):
+        build_chroma_index(chunks, collection_name, chroma_path, embeddings)
+        # 게시(디렉터리 이동) 전에 이 프로세스의 DB 연결을 닫음
+        close_chroma(chroma_path)
+        return {
+            "collection": collection_name,
+            "count": len(chunks),
+            "sources": sorted({chunk['metadata'].get('source', '') for chunk in chunks}),
+        }
+
+    version = store.publish(build)
+    print(f"ChromaDB에 {len(chunks)}개의 청크가 저장되었습니다. (스냅샷 {version})")
+    # 서빙 중인 SnapshotReader는 교체 직전 스냅샷을 한 세대 더 열어 두므로 현재와 직전 버전만 남김
+    removed = store.prune(keep=SNAPSHOT_KEEP)
+    if removed:
+        print(f"오래된 스냅샷 {len(removed)}개 삭제: {', '.join(removed)}")
+    return version
+
+def save_to_shards(chunks, collection_name, embeddings=None):
+    """청크를 회사(source)별로 나눠 각 회사 샤드의 새 스냅샷으로 게시하는 함수 (다른 회사 샤드는 건드리지 않음)"""
+    by_source = {}
+    for position, chunk in enumerate(chunks):
+        by_source.setdefault(chunk['metadata'].get('source', ''), []).append(position)
+    for source, positions in sorted(by_source.items()):
+        print(f"[{source}] 샤드 적재")
+        save_to_chroma([chunks[p] for p in positions], collection_name, index_root=shard_root(source),
+                       embeddings=embeddings[positions] if embeddings is not None else None)
+
 def main():
+    parser = argparse.ArgumentParser(description="PPT 전처리 및 벡터 DB 적재")
+    parser.add_argument("--sharded", action="store_true",
+                        help="하나의 통합 컬렉션 대신 회사별 샤드(data/index/shards/<회사>)로 적재")
+    parser.add_argument("--company", help="이 회사 덱만 다시 처리해 해당 샤드만 교체 (예: CJ, --sharded 포함)")
+    parser.add_argument("--dedup-threshold", type=float, default=DEDUP_THRESHOLD,
+                        help="이 자카드 유사도 이상인 근사 중복 청크를 합침 (MinHash/LSH, 같은 회사 덱끼리)")
+    parser.add_argument("--no-dedup", action="store_true", help="근사 중복 제거 생략")
+    parser.add_argument("--quantize", choices=["int8", "pq", "none"], default="none",
+                        help="청크 저장소 임베딩의 압축 코드도 저장 (서빙은 RAG_VECTOR_INDEX=auto|int8|pq일 때만 사용)")
+    args = parser.parse_args()
+
     ppt_dir = "data/ppts"
     print("프로그램 시작")
     
     all_ppt_chunks = []
     
-    # data/ppts 디렉토리의 모든 PPT/PPTX 파일 처리
-    for ppt_file in Path(ppt_dir).glob("*.ppt*"):
+    # data/ppts 디렉토리의 모든 PPT/PPTX 파일 처리 (--company이면 해당 회사 파일만, <회사>_<연도>.pptx 포함)
+    ppt_files = sorted(Path(ppt_dir).glob("*.ppt*"), key=lambda f: f.stem, reverse=True)
+    # 같은 회사 덱은 이어서 처리하고 최신 연도 덱을 먼저 (중복 제거 때 최신 덱 청크가 대표로 남음)
+    ppt_files.sort(key=lambda f: company_name(f.stem))
+    if args.company:
+        ppt_files = [f for f in ppt_files if company_name(f.stem).upper() == args.company.upper()]
+        if not ppt_files:
+            print(f"{ppt_dir}에서 {args.company} 파일을 찾을 수 없습니다.")
+            return
+
+    deck_names = []
+    for ppt_file in ppt_files:
         print(f"\n{ppt_file.name} 처리 시작")
         chunks, source_name = process_ppt(str(ppt_file))
-        
         if chunks:
-            # JSON 파일로 저장
-            output_path = f"outputs/{source_name}_chunk.json"
-            os.makedirs(os.path.dirname(output_path), exist_ok=True)
-            
-            with open(output_path, 'w', encoding='utf-8') as f:
-                json.dump(chunks, f, ensure_ascii=False, indent=2)
-            print(f"데이터가 {len(chunks)}개의 청크로 나뉘어 {output_path}에 저장되었습니다.")
-            
-            # 모든 청크를 리스트에 추가
+            deck_names.append(source_name)
             all_ppt_chunks.extend(chunks)
         else:
             print(f"{ppt_file.name}에서 처리할 수 있는 텍스트를 찾을 수 없습니다.")
     
-    # 모든 PPT의 청크를 하나의 ChromaDB 컬렉션에 저장
-    if all_ppt_chunks:
-        collection_name = "ppt_documents_collection"
-        collection = save_to_chroma(all_ppt_chunks, collection_name)
+    # 반복되는 상투 문구(섹션 표지, 비전 문구, 꼬리말 등) 청크는 대표 청크 하나로 합침 (역참조는 메타데이터에 기록)
+    # 같은 회사의 여러 연도 덱은 함께 비교해 연도마다 반복된 문구도 합침
+    if all_ppt_chunks and not args.no_dedup:
+        all_ppt_chunks, dedup_reports = deduplicate_by_source(all_ppt_chunks, args.dedup_threshold)
+        print(f"\n근사 중복 제거 결과 (임계값 {args.dedup_threshold}):")
+        for name, report in dedup_reports.items():
+            print("  " + format_report(name, report))
+
+    for deck_name in deck_names:
+        # JSON 파일로 저장 (저장소에 커밋되는 덱별 사람이 읽는 결과물이자 chunk_store.py convert의 입력, 서빙은 청크 저장소 사용)
+        chunks = [chunk for chunk in all_ppt_chunks if chunk['metadata']['report'] == deck_name]
+        output_path = f"outputs/{deck_name}_chunk.json"
+        os.makedirs(os.path.dirname(output_path), exist_ok=True)
+        
+        with open(output_path, 'w', encoding='utf-8') as f:
+            json.dump(chunks, f, ensure_ascii=False, indent=2)
+        print(f"데이터가 {len(chunks)}개의 청크로 나뉘어 {output_path}에 저장되었습니다.")
+
+    # 모든 PPT의 청크를 열 기반 저장소로도 저장 (평가/색인 등에서 JSON 파싱 없이 메모리 맵으로 사용)
+    # 임베딩은 다시 처리한 덱의 청크만 한 번 계산해 청크 저장소(압축 코드의 원본, 재점수화용)와 ChromaDB 적재에 함께 사용
+    chunk_embeddings = embed_chunks(all_ppt_chunks, EMBEDDING_MODEL) if all_ppt_chunks else None
+    store_chunks, store_embeddings = all_ppt_chunks, chunk_embeddings
+    if all_ppt_chunks and args.company:
+        # 한 회사만 다시 처리한 경우 다른 회사 청크와 임베딩은 현재 청크 저장소에서 그대로 가져옴
+        merged = replace_sources(CHUNK_STORE_PATH, all_ppt_chunks, chunk_embeddings, EMBEDDING_MODEL)
+        if merged is None:
+            print("재사용할 청크 저장소가 없어 다른 회사 청크는 outputs/*_chunk.json에서 다시 임베딩합니다.")
+            sources = {chunk["metadata"]["source"] for chunk in all_ppt_chunks}
+            others = [chunk for chunk in load_json_chunks(sorted(str(p) for p in Path("outputs").glob("*_chunk.json")))
+                      if chunk["metadata"].get("source") not in sources]
+            other_embeddings = embed_chunks(others, EMBEDDING_MODEL) if others else chunk_embeddings[:0]
+            merged = others + all_ppt_chunks, np.concatenate([other_embeddings, chunk_embeddings])
+        store_chunks, store_embeddings = merged
+    if store_chunks:
+        # 압축 코드는 같은 버전의 임시 디렉터리에 함께 만들어, 게시된 저장소에는 항상 코드까지 모두 있음
+        index = build_index(store_embeddings, args.quantize) if args.quantize != "none" else None
+        store_path = write_chunk_store(store_chunks, CHUNK_STORE_PATH, store_embeddings, EMBEDDING_MODEL,
+                                       add_files=index.save if index is not None else None)
+        print(f"열 기반 청크 저장소: {store_path}")
+        if index is not None:
+            print(f"임베딩 {args.quantize} 코드: {store_embeddings.nbytes / 1024:.0f}KB → {index.nbytes / 1024:.0f}KB")
+
+        # 재순위화 때 청크를 다시 토큰화하지 않도록 cross-encoder 토큰을 미리 저장 (질문만 토큰화)
+        # (기존 캐시에 있는 청크는 복사하므로 한 회사만 다시 처리하면 그 회사 청크만 토큰화)
+        try:
+            token_path = build_token_cache([chunk["text"] for chunk in store_chunks], load_tokenizer(CROSS_ENCODER_MODEL),
+                                           cache_path(CROSS_ENCODER_MODEL, TOKEN_CACHE_ROOT), CROSS_ENCODER_MODEL,
+                                           reuse=open_token_cache(CROSS_ENCODER_MODEL, TOKEN_CACHE_ROOT))
+            print(f"청크 토큰 캐시: {token_path}")
+        except OSError as e:
+            print(f"토크나이저를 불러올 수 없어 토큰 캐시를 만들지 않았습니다: {e}")
+
+    collection_name = "ppt_documents_collection"
+    if all_ppt_chunks and (args.sharded or args.company):
+        # 회사별 샤드에 저장
+        shard_chunks, shard_embeddings = all_ppt_chunks, chunk_embeddings
+        if args.company:
+            # 통합 컬렉션으로 운영 중이었다면 다른 회사 샤드도 청크 저장소에서 함께 만듦 (CJ 샤드만 생기면 CJ만 검색됨)
+            shard_chunks, shard_embeddings = select_shard_chunks(all_ppt_chunks, chunk_embeddings,
+                                                                 store_chunks, store_embeddings)
+            if shard_chunks is not all_ppt_chunks:
+                print("아직 샤드가 없는 회사가 있어 청크 저장소의 모든 회사 샤드를 만듭니다.")
+        save_to_shards(shard_chunks, collection_name, shard_embeddings)
+        print(f"총 {len(shard_chunks)}개의 청크가 회사별 샤드에 저장되었습니다.")
+    elif all_ppt_chunks:
+        # 모든 PPT의 청크를 하나의 ChromaDB 컬렉션에 저장
+        save_to_chroma(all_ppt_chunks, collection_name, embeddings=chunk_embeddings)
         print(f"총 {len(all_ppt_chunks)}개의 청크가 통합 컬렉션에 저장되었습니다.")
 
 if __name__ == "__main__":
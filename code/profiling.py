@@ -0,0 +1,163 @@
+"""요청 단위 선택적(opt-in) 프로파일링
+
+RAG_PROFILE=1 환경 변수 또는 챗봇 페이지 사이드바 토글로 켜면, 요청 하나를 cProfile(결정적 프로파일러)로 감싸고
+tracing span(expand, embed, vector_search, rerank, generate 등)으로 단계별 시간을 모읍니다.
+결과는 사이드바의 플레임 요약/시간 표로 보여 주고, 오프라인 분석용 파일로 저장합니다.
+    - <이름>.prof: pstats / snakeviz 등으로 열 수 있는 cProfile 결과
+    - <이름>.speedscope.json: https://www.speedscope.app 에서 열 수 있는 단계별 타임라인
+
+꺼져 있으면 기존 trace_request만 실행하며 프로파일러를 만들지 않습니다.
+cProfile은 요청을 처리한 스레드만 측정합니다 (배치 스레드에서 실행되는 재순위화 predict 등은 span 시간으로만 보임).
+"""
+import cProfile
+import io
+import json
+import os
+import pstats
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from tracing import Trace, trace_request
+
+PROFILE_DIR = "./outputs/profiles"  # RAG_PROFILE_DIR로 변경 가능
+FLAME_WIDTH = 40
+
+def profiling_enabled() -> bool:
+    return os.getenv("RAG_PROFILE", "").lower() in ("1", "true", "yes")
+
+class RequestProfile:
+    """프로파일링된 요청 하나의 결과 (단계별 시간, 함수별 통계, 저장된 파일 경로)"""
+
+    def __init__(self, trace: Trace, profiler: cProfile.Profile):
+        self.trace = trace
+        self.profiler = profiler
+        self.prof_path: Optional[str] = None
+        self.speedscope_path: Optional[str] = None
+
+    def span_tree(self) -> List[Dict]:
+        """span을 시작 시각 순으로 정렬하고 시간 포함 관계로 깊이 계산 [{name, start_ms, duration_ms, depth}]"""
+        rows = [{"name": self.trace.name, "start_ms": 0.0, "duration_ms": (self.trace.duration or 0.0) * 1000, "depth": 0}]
+        stack = [rows[0]]
+        for s in sorted(self.trace.spans, key=lambda s: (s.start, -(s.duration or 0.0))):
+            start_ms = (s.start - self.trace.start) * 1000
+            duration_ms = (s.duration or 0.0) * 1000
+            while len(stack) > 1 and start_ms >= stack[-1]["start_ms"] + stack[-1]["duration_ms"]:
+                stack.pop()
+            row = {"name": s.name, "start_ms": start_ms, "duration_ms": duration_ms, "depth": len(stack)}
+            rows.append(row)
+            stack.append(row)
+        return rows
+
+    def flame_lines(self, width: int = FLAME_WIDTH) -> List[str]:
+        """텍스트 플레임 요약 (막대 위치/길이 = 요청 전체 대비 시작 시각/소요 시간)"""
+        rows = self.span_tree()
+        total_ms = rows[0]["duration_ms"] or 1.0
+        name_width = max(len("  " * r["depth"] + r["name"]) for r in rows)
+        lines = []
+        for r in rows:
+            offset = int(r["start_ms"] / total_ms * width)
+            length = max(1, round(r["duration_ms"] / total_ms * width))
+            bar = (" " * offset + "█" * length).ljust(width)[:width]
+            label = ("  " * r["depth"] + r["name"]).ljust(name_width)
+            lines.append(f"{label} |{bar}| {r['duration_ms']:8.1f}ms")
+        return lines
+
+    def stage_table(self) -> List[Dict]:
+        """단계별 호출 수, 합계, 요청 대비 비율"""
+        total_ms = (self.trace.duration or 0.0) * 1000 or 1.0
+        counts: Dict[str, int] = {}
+        for s in self.trace.spans:
+            counts[s.name] = counts.get(s.name, 0) + 1
+        return [
+            {"단계": name, "호출 수": counts[name], "시간(ms)": round(seconds * 1000, 1),
+             "비율(%)": round(seconds * 1000 / total_ms * 100, 1)}
+            for name, seconds in sorted(self.trace.stage_durations().items(), key=lambda kv: -kv[1])
+        ]
+
+    def top_functions(self, limit: int = 15) -> str:
+        """누적 시간 기준 상위 함수 (pstats 출력)"""
+        buffer = io.StringIO()
+        pstats.Stats(self.profiler, stream=buffer).sort_stats("cumulative").print_stats(limit)
+        return buffer.getvalue()
+
+    def to_speedscope(self) -> Dict:
+        """speedscope evented 형식으로 변환 (단계 span 타임라인)"""
+        rows = self.span_tree()
+        frames, frame_index, events = [], {}, []
+        for row in rows:
+            if row["name"] not in frame_index:
+                frame_index[row["name"]] = len(frames)
+                frames.append({"name": row["name"]})
+
+        # 부모보다 늦게 끝나는 자식이 없도록 종료 시각을 부모 범위로 제한하고, 깊이 순서대로 열고 닫음
+        open_stack = []
+        for row in rows:
+            while open_stack and open_stack[-1][0] >= row["depth"]:
+                depth, name, end = open_stack.pop()
+                events.append({"type": "C", "frame": frame_index[name], "at": end})
+            end = row["start_ms"] + row["duration_ms"]
+            if open_stack:
+                end = min(end, open_stack[-1][2])
+            events.append({"type": "O", "frame": frame_index[row["name"]], "at": row["start_ms"]})
+            open_stack.append((row["depth"], row["name"], end))
+        while open_stack:
+            _, name, end = open_stack.pop()
+            events.append({"type": "C", "frame": frame_index[name], "at": end})
+
+        return {
+            "$schema": "https://www.speedscope.app/file-format-schema.json",
+            "shared": {"frames": frames},
+            "profiles": [{
+                "type": "evented",
+                "name": f"{self.trace.name} {self.trace.trace_id[:8]}",
+                "unit": "milliseconds",
+                "startValue": 0,
+                "endValue": rows[0]["duration_ms"],
+                "events": events,
+            }],
+            "name": self.trace.name,
+        }
+
+    def dump(self, directory: Optional[str] = None) -> str:
+        """.prof와 .speedscope.json 파일 저장 후 파일 이름 앞부분 반환"""
+        directory = directory or os.getenv("RAG_PROFILE_DIR", PROFILE_DIR)
+        Path(directory).mkdir(parents=True, exist_ok=True)
+        stem = Path(directory) / f"{time.strftime('%Y%m%d-%H%M%S')}-{self.trace.name}-{self.trace.trace_id[:8]}"
+        self.prof_path = f"{stem}.prof"
+        self.speedscope_path = f"{stem}.speedscope.json"
+        self.profiler.dump_stats(self.prof_path)
+        with open(self.speedscope_path, "w", encoding="utf-8") as f:
+            json.dump(self.to_speedscope(), f, ensure_ascii=False)
+        return str(stem)
+
+@contextmanager
+def profile_request(name: str, enabled: Optional[bool] = None, dump: bool = True, **attrs):
+    """trace_request처럼 요청을 감싸고 (trace, RequestProfile)을 반환
+
+       with profile_request("chat_query", enabled=toggle) as (trace, profile):
+           ...
+       # 블록이 끝난 뒤 profile.flame_lines() 등 사용 (꺼져 있으면 profile은 None)
+    """
+    if enabled is None:
+        enabled = profiling_enabled()
+    if not enabled:
+        with trace_request(name, **attrs) as trace:
+            yield trace, None
+        return
+
+    profiler = cProfile.Profile()
+    with trace_request(name, profiled=True, **attrs) as trace:
+        profile = RequestProfile(trace, profiler)
+        profiler.enable()
+        try:
+            yield trace, profile
+        finally:
+            profiler.disable()
+    # trace_request가 끝나야 전체 소요 시간이 기록되므로 파일 저장은 블록 밖에서 실행
+    if dump:
+        try:
+            profile.dump()
+        except OSError as e:
+            print(f"프로파일 저장 실패: {e}")
@@ -0,0 +1,364 @@
+"""청크 임베딩 압축 저장 (int8 스칼라 양자화, 선택적 곱 양자화(PQ))
+
+jhgan/ko-sroberta-multitask 임베딩(768차원 float32)을 그대로 들고 있으면 보고서가 늘어날수록 워커 메모리의 대부분을 차지합니다.
+이 모듈은 열 기반 청크 저장소(chunk_store.py)의 embeddings.npy를 압축한 코드로 저장하고, 코드만으로 후보 점수를 계산합니다.
+    - int8: 차원별 스케일로 -127~127 정수로 변환 (4배 절약), 점수 = 코드 · (질문 벡터 × 스케일)
+    - pq: 벡터를 m개 부분 공간으로 나누고 부분 공간마다 256개 중심점 번호(uint8)로 저장 (768차원, m=96이면 코드 32배 절약)
+          점수 = 질문-중심점 내적 표(m × 256)를 코드로 찾아 합산 (ADC), 코드는 부분 공간별로 연속되게 (m, n) 배치
+          중심점(256 × 768 float32 = 768KB)은 코퍼스 크기와 무관한 고정 비용이라 청크가 많을수록 유리
+    - rescore_k를 주면 코드 점수 상위 후보만 원래 float 임베딩(메모리 맵)으로 다시 계산
+
+유사도는 정규화된 벡터의 내적(코사인)입니다.
+
+서빙: QuantizedCollection은 청크 저장소 + 압축 코드를 ChromaDB 컬렉션과 같은 query/get/count로 감싸고,
+QuantizedReader는 적재로 저장소 버전이 바뀌면(CURRENT 변경) 다시 엽니다. rag_chatbot은 RAG_VECTOR_INDEX=auto|int8|pq일 때만
+float32 HNSW(ChromaDB) 대신 이 경로로 후보를 검색합니다 (RAG_QUANT_RESCORE). 순위는 코사인 기준이라 ChromaDB(L2)와 다를 수 있음
+    - where 절: section / sub_section / source의 $eq 조건 ($and 결합)만 지원, 그 외는 ValueError
+    - 거리: 1 - 코사인 유사도, 후보 임베딩(MMR용): 코드를 복원한 근사 벡터
+
+적재(ppt_processor.py --quantize int8|pq)가 임베딩과 코드를 함께 저장할 수 있고, build는 현재 저장소에 코드를 더한 새 버전을 게시합니다.
+사용 예시 (저장소 루트에서, 임베딩이 포함된 청크 저장소 필요):
+    python code/quantization.py build outputs/chunk_store --method int8
+    python code/quantization.py build outputs/chunk_store --method pq --subspaces 96
+"""
+import argparse
+import threading
+import time
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from chunk_store import CHUNK_STORE_PATH, DICTIONARY_COLUMNS, ChunkStore, resolve_store_path, write_chunk_store
+
+PQ_TRAIN_SIZE = 20000  # PQ 중심점 학습에 쓸 최대 벡터 수 (나머지는 학습된 중심점으로 부호화만)
+SCORE_BLOCK = 256  # int8 코드를 float으로 바꿔 계산할 행 수 (변환 블록이 CPU 캐시에 머무는 크기)
+
+def normalize(vectors: np.ndarray) -> np.ndarray:
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+def top_k(scores: np.ndarray, k: int) -> np.ndarray:
+    k = min(k, scores.shape[0])
+    if k <= 0:
+        return np.zeros(0, dtype=np.int64)
+    top = np.argpartition(-scores, k - 1)[:k]
+    return top[np.argsort(-scores[top])]
+
+def _nearest(vectors: np.ndarray, centers: np.ndarray) -> np.ndarray:
+    """각 벡터에서 가장 가까운 중심점 번호 (L2)"""
+    return ((centers ** 2).sum(1) - 2 * vectors @ centers.T).argmin(1)
+
+class Int8Index:
+    """차원별 대칭 스케일 int8 양자화"""
+
+    method = "int8"
+
+    def __init__(self, codes: np.ndarray, scale: np.ndarray):
+        self.codes = codes  # int8 (n, d)
+        self.scale = scale  # float32 (d,)
+
+    @classmethod
+    def build(cls, embeddings: np.ndarray) -> "Int8Index":
+        vectors = normalize(embeddings)
+        scale = np.maximum(np.abs(vectors).max(axis=0), 1e-12) / 127.0
+        codes = np.clip(np.rint(vectors / scale), -127, 127).astype(np.int8)
+        return cls(codes, scale.astype(np.float32))
+
+    @property
+    def nbytes(self) -> int:
+        return self.codes.nbytes + self.scale.nbytes
+
+    def __len__(self) -> int:
+        return self.codes.shape[0]
+
+    def scores(self, query: np.ndarray, rows: Optional[np.ndarray] = None) -> np.ndarray:
+        codes = self.codes if rows is None else self.codes[rows]
+        weighted = (normalize(query) * self.scale).astype(np.float32)
+        out = np.empty(codes.shape[0], dtype=np.float32)
+        for start in range(0, codes.shape[0], SCORE_BLOCK):
+            out[start:start + SCORE_BLOCK] = codes[start:start + SCORE_BLOCK].astype(np.float32) @ weighted
+        return out
+
+    def reconstruct(self, rows: np.ndarray) -> np.ndarray:
+        """코드로 복원한 근사 벡터 (len(rows), d)"""
+        return self.codes[rows].astype(np.float32) * self.scale
+
+    def save(self, directory: str):
+        np.save(Path(directory) / "embeddings_int8.npy", self.codes)
+        np.save(Path(directory) / "int8_scale.npy", self.scale)
+
+    @classmethod
+    def load(cls, directory: str) -> "Int8Index":
+        return cls(np.load(Path(directory) / "embeddings_int8.npy", mmap_mode="r"),
+                   np.load(Path(directory) / "int8_scale.npy"))
+
+class PQIndex:
+    """곱 양자화 (부분 공간마다 256개 중심점, 코드는 uint8)"""
+
+    method = "pq"
+
+    def __init__(self, codes: np.ndarray, centroids: np.ndarray):
+        self.codes = codes          # uint8 (m, n)
+        self.centroids = centroids  # float32 (m, 256, d / m)
+
+    @classmethod
+    def build(cls, embeddings: np.ndarray, subspaces: int = 96, iterations: int = 20,
+              train_size: int = PQ_TRAIN_SIZE, seed: int = 0) -> "PQIndex":
+        vectors = normalize(embeddings)
+        n, dim = vectors.shape
+        if dim % subspaces:
+            raise ValueError(f"임베딩 차원({dim})이 부분 공간 수({subspaces})로 나누어떨어지지 않습니다.")
+        sub_dim = dim // subspaces
+        rng = np.random.default_rng(seed)
+        train = vectors[rng.choice(n, train_size, replace=False)] if n > train_size else vectors
+        clusters = min(256, len(train))
+
+        centroids = np.zeros((subspaces, 256, sub_dim), dtype=np.float32)
+        codes = np.zeros((subspaces, n), dtype=np.uint8)
+        for j in range(subspaces):
+            columns = slice(j * sub_dim, (j + 1) * sub_dim)
+            part = train[:, columns]
+            centers = part[rng.choice(len(part), clusters, replace=False)].copy()
+            for _ in range(iterations):
+                # k-means (Lloyd): 가장 가까운 중심점 배정 후 비어 있지 않은 군집의 중심점 갱신
+                assignment = _nearest(part, centers)
+                counts = np.bincount(assignment, minlength=clusters)
+                sums = np.stack([np.bincount(assignment, weights=part[:, d], minlength=clusters)
+                                 for d in range(sub_dim)], axis=1)
+                filled = counts > 0
+                centers[filled] = (sums[filled] / counts[filled, None]).astype(np.float32)
+            centroids[j, :clusters] = centers
+            codes[j] = _nearest(vectors[:, columns], centers)
+        return cls(codes, centroids)
+
+    @property
+    def nbytes(self) -> int:
+        return self.codes.nbytes + self.centroids.nbytes
+
+    def __len__(self) -> int:
+        return self.codes.shape[1]
+
+    def scores(self, query: np.ndarray, rows: Optional[np.ndarray] = None) -> np.ndarray:
+        codes = self.codes if rows is None else self.codes[:, rows]
+        subspaces, _, sub_dim = self.centroids.shape
+        table = np.matmul(self.centroids, normalize(query).reshape(subspaces, sub_dim, 1))[..., 0]  # (m, 256)
+        out = np.zeros(codes.shape[1], dtype=np.float32)
+        for j in range(subspaces):
+            out += table[j].take(codes[j])
+        return out
+
+    def reconstruct(self, rows: np.ndarray) -> np.ndarray:
+        """코드로 복원한 근사 벡터 (len(rows), d): 부분 공간마다 중심점을 이어 붙임"""
+        codes = self.codes[:, rows]
+        return np.concatenate([self.centroids[j][codes[j]] for j in range(self.codes.shape[0])], axis=1)
+
+    def save(self, directory: str):
+        np.save(Path(directory) / "pq_codes.npy", self.codes)
+        np.save(Path(directory) / "pq_centroids.npy", self.centroids)
+
+    @classmethod
+    def load(cls, directory: str) -> "PQIndex":
+        return cls(np.load(Path(directory) / "pq_codes.npy", mmap_mode="r"),
+                   np.load(Path(directory) / "pq_centroids.npy"))
+
+def search(index, query: np.ndarray, k: int, rows: Optional[np.ndarray] = None,
+           embeddings: Optional[np.ndarray] = None, rescore_k: int = 0) -> Tuple[np.ndarray, np.ndarray]:
+    """압축 코드로 상위 k개 검색: (청크 번호, 점수)
+
+       - rows: 검색 대상 청크 번호 (메타데이터 필터 결과, 없으면 전체)
+       - embeddings + rescore_k: 코드 점수 상위 rescore_k개를 원래 float 임베딩으로 다시 계산해 순위 결정
+    """
+    scores = index.scores(query, rows)
+    if embeddings is not None and rescore_k > k:
+        candidates = top_k(scores, rescore_k)
+        positions = candidates if rows is None else np.asarray(rows)[candidates]
+        exact = normalize(np.asarray(embeddings[np.sort(positions)]))
+        exact_scores = exact @ normalize(query)
+        order = top_k(exact_scores, k)
+        return np.sort(positions)[order], exact_scores[order]
+
+    top = top_k(scores, k)
+    positions = top if rows is None else np.asarray(rows)[top]
+    return positions, scores[top]
+
+def exact_search(embeddings: np.ndarray, query: np.ndarray, k: int, rows: Optional[np.ndarray] = None):
+    """압축하지 않은 float 임베딩 기준 검색 (비교 기준)"""
+    vectors = normalize(np.asarray(embeddings if rows is None else embeddings[rows]))
+    scores = vectors @ normalize(query)
+    top = top_k(scores, k)
+    positions = top if rows is None else np.asarray(rows)[top]
+    return positions, scores[top]
+
+INDEX_FILES = {"int8": "embeddings_int8.npy", "pq": "pq_codes.npy"}
+
+def load_index(directory: str, method: str):
+    return {"int8": Int8Index, "pq": PQIndex}[method].load(directory)
+
+def build_index(embeddings: np.ndarray, method: str = "int8", subspaces: int = 96):
+    return Int8Index.build(embeddings) if method == "int8" else PQIndex.build(embeddings, subspaces)
+
+def available_method(directory: str) -> Optional[str]:
+    """저장소에 있는 압축 코드 종류 (int8 우선, 없으면 None)"""
+    for method, filename in INDEX_FILES.items():
+        if (Path(directory) / filename).exists():
+            return method
+    return None
+
+def where_filters(where: Optional[Dict]) -> Dict[str, str]:
+    """ChromaDB where 절({"f": {"$eq": v}} 또는 {"$and": [...]})을 청크 저장소 사전 열 조건으로 변환"""
+    if not where:
+        return {}
+    filters = {}
+    for condition in (where["$and"] if "$and" in where else [where]):
+        (field, test), = condition.items()
+        if isinstance(test, dict):
+            if set(test) != {"$eq"}:
+                raise ValueError(f"지원하지 않는 검색 조건입니다: {condition}")
+            test = test["$eq"]
+        if field not in DICTIONARY_COLUMNS:
+            raise ValueError(f"압축 색인에서 필터할 수 없는 필드입니다: {field}")
+        filters[field] = test
+    return filters
+
+class QuantizedCollection:
+    """청크 저장소 + 압축 코드 검색을 ChromaDB 컬렉션처럼 사용 (query/get/count, 읽기 전용)
+
+       - rescore_k: 코드 점수 상위 rescore_k개를 저장소의 float 임베딩(메모리 맵)으로 다시 계산 (0이면 코드 점수만)
+    """
+
+    def __init__(self, store: ChunkStore, index, embedding_function: Callable, rescore_k: int = 0,
+                 version=None):
+        self.store = store
+        self.index = index
+        self._embedding_function = embedding_function
+        self.rescore_k = rescore_k if store.embeddings is not None else 0
+        self.version = version
+        self.name = f"{index.method}:{store.path}"
+
+    def __repr__(self):
+        return f"QuantizedCollection({self.index.method}, {len(self.store)}개, rescore_k={self.rescore_k})"
+
+    def _rows(self, where: Optional[Dict]) -> Optional[np.ndarray]:
+        filters = where_filters(where)
+        return self.store.where(**filters) if filters else None
+
+    def _rows_result(self, positions: np.ndarray, include: List[str]) -> Dict:
+        result = {"ids": [str(int(p)) for p in positions]}
+        if "documents" in include:
+            result["documents"] = self.store.texts(positions)
+        if "metadatas" in include:
+            result["metadatas"] = [self.store.metadata(int(p)) for p in positions]
+        if "embeddings" in include:
+            result["embeddings"] = self.index.reconstruct(np.asarray(positions, dtype=np.int64))
+        return result
+
+    def query(self, query_embeddings=None, query_texts=None, n_results: int = 10, where: Optional[Dict] = None,
+              include: Optional[List[str]] = None, **kwargs) -> Dict:
+        include = list(include or ["metadatas", "documents", "distances"])
+        if query_embeddings is None:
+            query_embeddings = self._embedding_function(query_texts)
+        rows = self._rows(where)
+        merged = {key: [] for key in ["ids"] + include}
+        for query in query_embeddings:
+            if rows is not None and len(rows) == 0:
+                positions, scores = np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)
+            else:
+                positions, scores = search(self.index, np.asarray(query, dtype=np.float32), n_results, rows,
+                                           self.store.embeddings, self.rescore_k)
+            result = self._rows_result(positions, include)
+            result["distances"] = [float(1.0 - score) for score in scores]
+            for key in merged:
+                merged[key].append(result[key])
+        return merged
+
+    def get(self, ids=None, where: Optional[Dict] = None, include: Optional[List[str]] = None, **kwargs) -> Dict:
+        include = list(include or ["metadatas", "documents"])
+        rows = self._rows(where)
+        positions = np.arange(len(self.store)) if rows is None else rows
+        if ids is not None:
+            wanted = {int(i) for i in ids}
+            positions = np.asarray([p for p in positions if int(p) in wanted], dtype=np.int64)
+        return self._rows_result(positions, include)
+
+    def count(self) -> int:
+        return len(self.store)
+
+class QuantizedReader:
+    """압축 색인 서빙용 리더 (SnapshotReader와 같은 방식)
+
+       적재는 청크 저장소의 새 버전을 게시하므로, check_interval마다 CURRENT가 가리키는 버전이 바뀌었는지 확인해 다시 엽니다.
+       새 저장소를 열 수 없으면(코드를 만드는 중 등) 기존 저장소로 계속 서빙 (이미 연 메모리 맵은 유지됨)
+    """
+
+    def __init__(self, embedding_function: Callable, path: str = CHUNK_STORE_PATH, method: Optional[str] = None,
+                 rescore_k: int = 0, check_interval: float = 5.0):
+        self.path = path
+        self.method = method
+        self.rescore_k = rescore_k
+        self.check_interval = check_interval
+        self._embedding_function = embedding_function
+        self._current: Optional[QuantizedCollection] = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+
+    def _stamp(self) -> str:
+        return str(resolve_store_path(self.path))
+
+    def _open(self, stamp: str) -> QuantizedCollection:
+        method = self.method or available_method(stamp)
+        if method is None:
+            raise FileNotFoundError(f"압축 코드가 없는 청크 저장소입니다: {stamp}")
+        return QuantizedCollection(ChunkStore(stamp), load_index(stamp, method), self._embedding_function,
+                                   self.rescore_k, version=stamp)
+
+    def collection(self) -> QuantizedCollection:
+        current = self._current
+        if current is not None and (time.monotonic() - self._checked_at < self.check_interval or self._lock.locked()):
+            return current
+        self.refresh()
+        return self._current
+
+    def refresh(self) -> bool:
+        """저장소 버전이 바뀌었으면 저장소와 코드를 다시 열고 교체 여부 반환"""
+        with self._lock:
+            self._checked_at = time.monotonic()
+            try:
+                stamp = self._stamp()
+                if self._current is not None and stamp == self._current.version:
+                    return False
+                opened = self._open(stamp)
+            except (OSError, ValueError) as e:
+                if self._current is None:
+                    raise
+                print(f"청크 저장소를 다시 열 수 없어 기존 압축 색인을 계속 사용합니다: {e}")
+                return False
+            replaced, self._current = self._current, opened
+            if replaced is not None:
+                print(f"압축 색인 교체: {self.path} ({opened.index.method}, {len(opened.store)}개)")
+            return True
+
+def main():
+    parser = argparse.ArgumentParser(description="청크 저장소 임베딩 양자화")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    build_parser = subparsers.add_parser("build", help="embeddings.npy를 압축 코드로 저장")
+    build_parser.add_argument("path", nargs="?", default=CHUNK_STORE_PATH)
+    build_parser.add_argument("--method", choices=["int8", "pq"], default="int8")
+    build_parser.add_argument("--subspaces", type=int, default=96, help="PQ 부분 공간 수 (임베딩 차원의 약수)")
+    args = parser.parse_args()
+
+    store = ChunkStore(args.path)
+    if store.embeddings is None:
+        raise SystemExit("임베딩이 없는 청크 저장소입니다. python code/ppt_processor.py로 다시 적재하거나 "
+                         "python code/chunk_store.py convert --embed 로 다시 만드세요.")
+    embeddings = np.asarray(store.embeddings)
+    index = build_index(embeddings, args.method, args.subspaces)
+    # 게시된 버전은 수정하지 않고 같은 청크 + 코드로 새 버전 게시
+    path = write_chunk_store(list(store), args.path, embeddings, store.meta.get("embedding_model"), add_files=index.save)
+    print(f"압축 코드를 포함한 청크 저장소: {path}")
+    print(f"{args.method}: {embeddings.nbytes / 1024:.0f}KB → {index.nbytes / 1024:.0f}KB "
+          f"({embeddings.nbytes / index.nbytes:.1f}배 절약)")
+
+if __name__ == "__main__":
+    main()
@@ -1,33 +1,280 @@
-from openai import OpenAI
 from dotenv import load_dotenv
 import os
-import chromadb
-from chromadb.utils import embedding_functions
 import json
+import threading
+import time
 from pathlib import Path
-from typing import Optional, Dict, List
-from sentence_transformers import CrossEncoder
-import numpy as np
-import torch
-from torch.nn.functional import sigmoid
+from typing import Optional, Dict, List, Iterator, Callable
+from tracing import trace_request, span, record_tokens, record_cache
+from single_flight import FlightTimeout, SingleFlight, make_key
+from page_index import parse_page_reference, format_pages, parse_pages, get_page_index
+from load_shedding import BUSY_MESSAGE, Deadline, LoadShedder, Overloaded, current_budget
+from mmr import MMR_LAMBDA, MMR_MAX_SIMILARITY, MMR_POOL_FACTOR, mmr_select
+
+# 무거운 모듈(openai, chromadb, sentence_transformers/torch)은 처음 사용할 때 불러옴
+# → import rag_chatbot 자체는 가볍고, 검색만 쓰는 경우 OPENAI_API_KEY가 없어도 동작
 
 # .env 파일 로드
 load_dotenv()
 
-# OpenAI API 키 설정
-api_key = os.getenv('OPENAI_API_KEY')
-if not api_key:
-    raise ValueError("OPENAI_API_KEY가 설정되지 않았습니다. .env 파일을 생성하고 OPENAI_API_KEY를 설정해주세요.")
+# 응답 생성에 사용하는 파인튜닝된 모델 ID
+FINETUNED_MODEL_ID = "ft:gpt-3.5-turbo-0125:personal::BdZzCnDt"
+CROSS_ENCODER_MODEL = "cross-encoder/ms-marco-MiniLM-L-6-v2"
+EMBEDDING_MODEL = "jhgan/ko-sroberta-multitask"
+CHROMA_PATH = "./data/chromadb"  # 게시된 스냅샷이 없을 때 사용하는 기존 경로
+INDEX_ROOT = "./data/index"
+COLLECTION_NAME = "ppt_documents_collection"
+ERROR_MESSAGE = "죄송합니다. 응답을 생성하는 중에 오류가 발생했습니다."
+
+class LazyResource:
+    """처음 사용할 때 한 번만 생성되는 스레드 안전 리소스"""
+
+    def __init__(self, name: str, factory: Callable):
+        self.name = name
+        self._factory = factory
+        self._value = None
+        self._lock = threading.Lock()
+
+    @property
+    def loaded(self) -> bool:
+        return self._value is not None
+
+    def get(self):
+        if self._value is None:
+            with self._lock:
+                if self._value is None:
+                    with span(f"load_{self.name}"):
+                        self._value = self._factory()
+        return self._value
+
+def _patch_torch_classes():
+    # torch.classes 패치 (Streamlit 파일 감시기 에러 우회용, torch를 처음 불러온 직후 적용)
+    import types
+    import torch
+    torch.classes = types.SimpleNamespace()
+
+def _create_client():
+    from openai import OpenAI
+
+    # OpenAI API 키 설정
+    api_key = os.getenv('OPENAI_API_KEY')
+    if not api_key:
+        raise ValueError("OPENAI_API_KEY가 설정되지 않았습니다. .env 파일을 생성하고 OPENAI_API_KEY를 설정해주세요.")
+
+    # OPENAI_BASE_URL이 설정되면 해당 주소로 요청 (예: 부하 테스트용 모의 서버 code/mock_llm_server.py)
+    return OpenAI(api_key=api_key, base_url=os.getenv('OPENAI_BASE_URL') or None)
+
+def _create_cross_encoder():
+    from sentence_transformers import CrossEncoder
+    _patch_torch_classes()
+
+    # Cross-encoder 모델 초기화
+    return CrossEncoder(CROSS_ENCODER_MODEL)
+
+def _create_rerank_scheduler():
+    from rerank_scheduler import RerankScheduler
+    from token_cache import TokenCacheReader
+
+    # 적재 시 만든 청크 토큰 캐시(outputs/token_cache)가 있으면 질문만 토큰화 (RAG_TOKEN_CACHE=0이면 사용 안 함)
+    # (다시 적재해 캐시가 바뀌면 재시작 없이 새 캐시 사용)
+    return RerankScheduler(
+        get_cross_encoder,
+        max_pairs=int(os.getenv("RAG_RERANK_MAX_PAIRS", "128")),
+        max_wait_ms=float(os.getenv("RAG_RERANK_MAX_WAIT_MS", "2")),
+        token_cache_reader=TokenCacheReader(CROSS_ENCODER_MODEL,
+                                            check_interval=float(os.getenv("RAG_INDEX_CHECK_INTERVAL", "5")))
+    )
+
+def _create_embedding_function():
+    from embedding_service import make_embedding_function
+
+    # 임베딩 함수 설정 -> ChromaDB에서 사용하는 임베딩 함수 (스냅샷이 바뀌어도 모델은 한 번만 로드)
+    # (RAG_EMBEDDING_SERVICE가 설정되면 공유 임베딩 서비스 사용, 이 프로세스에서는 모델을 로드하지 않음)
+    embedding_function = make_embedding_function(EMBEDDING_MODEL)
+    if not os.getenv("RAG_EMBEDDING_SERVICE"):
+        _patch_torch_classes()
+    return embedding_function
+
+def _open_collection(chroma_client):
+    # 컬렉션 가져오기
+    return chroma_client.get_collection(
+        name=COLLECTION_NAME,
+        embedding_function=_embedding_function.get()
+    )
+
+def _quantized_method() -> Optional[str]:
+    """서빙에 쓸 압축 코드 종류 (RAG_VECTOR_INDEX=chroma|auto|int8|pq, 기본 chroma, auto면 청크 저장소에 코드가 있을 때만)
+
+       압축 색인은 코사인 유사도로 순위를 매기므로 ChromaDB(L2 거리)와 순위가 다를 수 있어 명시적으로 켤 때만 사용
+    """
+    from chunk_store import CHUNK_STORE_PATH, ChunkStore, resolve_store_path, store_exists
+    from quantization import available_method
+
+    choice = os.getenv("RAG_VECTOR_INDEX", "chroma")
+    if choice == "chroma" or not store_exists(CHUNK_STORE_PATH):
+        return None
+    method = available_method(str(resolve_store_path(CHUNK_STORE_PATH))) if choice == "auto" else choice
+    if method is None:
+        return None
+    # 다른 임베딩 모델로 만든 저장소는 질문 임베딩과 비교할 수 없으므로 ChromaDB 사용
+    model = ChunkStore(CHUNK_STORE_PATH).meta.get("embedding_model")
+    if model != EMBEDDING_MODEL:
+        print(f"청크 저장소 임베딩 모델({model})이 {EMBEDDING_MODEL}와 달라 압축 색인을 사용하지 않습니다.")
+        return None
+    return method
+
+def _create_index_reader():
+    from index_snapshots import SnapshotReader
+    from sharding import ShardRouter, shard_sources
+
+    # RAG_VECTOR_INDEX로 켠 경우에만 적재 때 청크 저장소에 만든 압축 코드(int8/PQ)로 후보 검색 (스냅샷/샤드 대신)
+    # (RAG_QUANT_RESCORE: 코드 점수 상위 몇 개를 float 임베딩으로 다시 계산할지, 0이면 코드 점수만)
+    method = _quantized_method()
+    if method is not None:
+        from chunk_store import CHUNK_STORE_PATH
+        from quantization import QuantizedReader
+        return QuantizedReader(
+            _embedding_function.get(),
+            path=CHUNK_STORE_PATH,
+            method=method,
+            rescore_k=int(os.getenv("RAG_QUANT_RESCORE", "40")),
+            check_interval=float(os.getenv("RAG_INDEX_CHECK_INTERVAL", "5"))
+        )
+
+    # 회사별 샤드(data/index/shards/<SOURCE>)가 있으면 라우터로 검색 (RAG_INDEX_LAYOUT=single|sharded로 고정 가능)
+    layout = os.getenv("RAG_INDEX_LAYOUT", "auto")
+    if layout == "sharded" or (layout == "auto" and shard_sources()):
+        return ShardRouter(
+            _open_collection,
+            check_interval=float(os.getenv("RAG_INDEX_CHECK_INTERVAL", "5")),
+            max_workers=int(os.getenv("RAG_SHARD_WORKERS", "8")),
+            embedding_function=_embedding_function.get()
+        )
+
+    # data/index/CURRENT가 가리키는 스냅샷을 열고, 적재로 CURRENT가 바뀌면 재시작 없이 교체
+    # (게시된 스냅샷이 없으면 기존 ./data/chromadb 사용)
+    return SnapshotReader(
+        _open_collection,
+        root=INDEX_ROOT,
+        check_interval=float(os.getenv("RAG_INDEX_CHECK_INTERVAL", "5")),
+        legacy_path=CHROMA_PATH
+    )
+
+_client = LazyResource("openai_client", _create_client)
+_cross_encoder = LazyResource("cross_encoder", _create_cross_encoder)
+_embedding_function = LazyResource("embedding_function", _create_embedding_function)
+_index_reader = LazyResource("index_reader", _create_index_reader)
+_rerank_scheduler = LazyResource("rerank_scheduler", _create_rerank_scheduler)
+
+# 처리 중인 요청 수와 재순위화 대기열 길이로 입장 제어 (한도는 RAG_MAX_INFLIGHT, RAG_MAX_RERANK_QUEUE)
+_load_shedder = LoadShedder(queue_depth_fns={
+    "rerank": lambda: _rerank_scheduler.get().queue_depth if _rerank_scheduler.loaded else 0
+})
+
+def get_client():
+    """OpenAI 클라이언트 (최초 호출 시 생성, OPENAI_API_KEY가 없으면 ValueError)"""
+    return _client.get()
+
+def get_cross_encoder():
+    """재순위화용 Cross-encoder 모델 (최초 호출 시 로드)"""
+    return _cross_encoder.get()
+
+def get_rerank_scheduler():
+    """프로세스 전역 재순위화 배치 스케줄러"""
+    return _rerank_scheduler.get()
+
+def admit_request(deadline: Optional[Deadline] = None):
+    """요청 입장 제어 (with 블록 안의 단계들은 마감 시간과 부하에 따라 저하, 한도를 넘으면 Overloaded)"""
+    return _load_shedder.admit(deadline)
+
+def busy_result(query: str, error: Overloaded) -> Dict:
+    """거절한 요청의 answer_query 형식 결과 (파이프라인은 실행하지 않음)"""
+    return {
+        "query": query,
+        "expanded_query": query,
+        "metadata_filters": {},
+        "context": "",
+        "metadata_summary": {},
+        "metadata_info": "",
+        "response": BUSY_MESSAGE,
+        "degradation": error.metadata,
+    }
+
+def is_failed_response(response: str) -> bool:
+    """거절(BUSY_MESSAGE) 또는 생성 오류 안내 문구인지 (대화 기록에 남기지 않을 응답)"""
+    return response in (BUSY_MESSAGE, ERROR_MESSAGE)
+
+def _llm_options() -> Dict:
+    # 요청 마감 시간이 있으면 LLM 호출도 남은 시간 안에서 끝나도록 타임아웃 지정
+    budget = current_budget()
+    return {"timeout": budget.timeout()} if budget is not None else {}
+
+def get_collection():
+    """현재 인덱스 스냅샷의 읽기 전용 컬렉션 (최초 호출 시 임베딩 모델 로드 및 DB 연결)
+       샤드 구조이면 회사별 샤드를 묶은 ShardedCollection, 청크 저장소에 압축 코드가 있으면 QuantizedCollection
+
+       요청 하나는 처음 받은 컬렉션을 끝까지 사용해야 같은 스냅샷 기준으로 검색됨
+    """
+    return _index_reader.get().collection()
+
+def __getattr__(name):
+    # 이전 코드와의 호환: rag_chatbot.client / rag_chatbot.cross_encoder 접근 시 지연 생성
+    if name == "client":
+        return get_client()
+    if name == "cross_encoder":
+        return get_cross_encoder()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+WARMUP_QUERY = "ESG 경영 전략"
 
-client = OpenAI(api_key=api_key)
+def warmup_steps(include_client: bool = True, include_collection: bool = True) -> List[tuple]:
+    """워밍업 단계 목록 [(단계 이름, 실행 함수)] (code/warmup.py의 백그라운드 워밍업에서도 사용)"""
+    steps = [
+        ("prompt_assets", load_few_shot_examples),
+        # 첫 predict 호출은 torch 초기화 비용이 크므로 더미 쌍으로 한 번 실행
+        ("reranker", lambda: get_cross_encoder().predict([[WARMUP_QUERY, "ESG 경영"]])),
+    ]
+    if include_collection:
+        steps += [
+            ("vector_index", get_collection),
+            ("embedder", lambda: embed_query(WARMUP_QUERY, get_collection())),
+            # 임베딩 → 벡터 검색 → 재순위화 전체를 한 번 실행
+            ("dummy_query", lambda: get_relevant_context(WARMUP_QUERY, get_collection())),
+        ]
+    # OPENAI_API_KEY가 없으면 클라이언트 생성이 항상 실패하므로 준비 상태 판단에서 제외 (검색만 쓰는 환경)
+    if include_client and os.getenv("OPENAI_API_KEY"):
+        steps.append(("openai_client", get_client))
+    return steps
+
+def warmup(include_client: bool = True, include_collection: bool = True) -> Dict[str, float]:
+    """무거운 리소스를 미리 로드하고 첫 추론 비용을 미리 지불
+
+       반환: 단계별 소요 시간(초)
+    """
+    timings = {}
+    for name, fn in warmup_steps(include_client, include_collection):
+        start = time.perf_counter()
+        fn()
+        timings[name] = time.perf_counter() - start
+    return timings
 
-# Cross-encoder 모델 초기화
-cross_encoder = CrossEncoder('cross-encoder/ms-marco-MiniLM-L-6-v2')
+def expand_query(query: str, min_length: int = 10, raise_errors: bool = False) -> str:
+    """짧은 쿼리를 LLM을 사용하여 확장
 
-def expand_query(query: str, min_length: int = 10) -> str:
-    """짧은 쿼리를 LLM을 사용하여 확장"""
+       raise_errors: True이면 오류 시 원래 질문 대신 예외 발생 (부하 테스트에서 실패를 성공으로 세지 않기 위함)
+    """
     if len(query) > min_length: # 쿼리가 최소 길이보다 크면 쿼리 반환
         return query
+
+    # 부하가 높거나 남은 시간이 부족하면 확장(LLM 호출) 생략
+    budget = current_budget()
+    if budget is not None and not budget.check("expand").expand:
+        return query
+
+    with span("expand", query_length=len(query)) as attrs:
+        return _expand_query(query, attrs, raise_errors)
+
+def _expand_query(query: str, attrs: Dict, raise_errors: bool = False) -> str:
         
     system_prompt = """너는 사용자의 짧은 질문을 ESG 컨텍스트에 맞게 더 구체적이고 풍부하게 바꿔주는 전문가야.
     다음 규칙을 따라야 해:
@@ -46,21 +293,26 @@ def expand_query(query: str, min_length: int = 10) -> str:
     """
 
     try:
-        response = client.chat.completions.create(
+        response = get_client().chat.completions.create(
             model="gpt-3.5-turbo",
             messages=[
                 {"role": "system", "content": system_prompt},
                 {"role": "user", "content": f"다음 질문을 확장해주세요: {query}"}
             ],
             temperature=0.3,  # 일관성을 위해 낮은 temperature 사용
-            max_tokens=200
+            max_tokens=200,
+            **_llm_options()
         )
+        record_tokens(attrs, "expand", response.usage)
         expanded_query = response.choices[0].message.content.strip()
         print(f"\n원래 질문: {query}")
         print(f"확장된 질문: {expanded_query}\n")
         return expanded_query
     except Exception as e:
         print(f"질문 확장 중 오류 발생: {e}")
+        attrs["error"] = repr(e)
+        if raise_errors:
+            raise
         return query
 
 def extract_metadata_filters(query: str) -> Dict[str, str]:
@@ -74,6 +326,9 @@ def extract_metadata_filters(query: str) -> Dict[str, str]:
         
         query: "cj의 환경 관리"
         return: {"section": "Environment", "source": "CJ"}
+
+        query: "신한 보고서 4~5페이지 내용"
+        return: {"source": "SHINHAN", "pages": "4-5"}  (pages가 있으면 벡터 검색 없이 페이지 색인에서 직접 조회)
     """
     filters = {}
     
@@ -103,6 +358,11 @@ def extract_metadata_filters(query: str) -> Dict[str, str]:
             filters["source"] = company
             break
     
+    # 페이지 참조 ("4~5페이지", "p.12" 등)
+    pages = parse_page_reference(query)
+    if pages:
+        filters["pages"] = format_pages(pages)
+    
     return filters
 
 def get_relevance_label(score: float) -> str:
@@ -116,19 +376,73 @@ def get_relevance_label(score: float) -> str:
     else:
         return "낮은 관련성 ⚪"
 
-def rerank_documents(query: str, documents: List[str], metadata_list: List[Dict], top_k: int = 5) -> tuple:
-    """Cross-encoder를 사용하여 문서 재순위화 (정규화 포함)"""
+def rerank_documents(query: str, documents: List[str], metadata_list: List[Dict], top_k: int = 5,
+                     embeddings=None, mmr_lambda: Optional[float] = None) -> tuple:
+    """Cross-encoder를 사용하여 문서 재순위화 (정규화 포함)
+
+       embeddings(후보 임베딩)가 있고 MMR이 켜져 있으면 점수 순 대신 MMR로 다양한 후보 선택
+    """
+    with span("rerank", candidates=len(documents), top_k=top_k):
+        return _rerank_documents(query, documents, metadata_list, top_k, embeddings, mmr_lambda)
+
+def score_documents(query: str, documents: List[str]) -> List[float]:
+    """질문과 각 문서의 cross-encoder 관련도 점수(0~1)
+
+       RAG_RERANK_BATCHING이 켜져 있으면(기본값) 다른 세션의 요청과 함께 배치로 처리
+    """
+    if os.getenv("RAG_RERANK_BATCHING", "1") != "0":
+        return get_rerank_scheduler().score(query, documents)
+
     # 각 문서와 쿼리의 쌍을 생성
     pairs = [[query, doc] for doc in documents]
     
+    import torch
+    from torch.nn.functional import sigmoid
+
     # Cross-encoder로 유사도 점수 계산 (Tensor로 반환)
-    raw_scores = cross_encoder.predict(pairs, convert_to_numpy=False)
+    raw_scores = get_cross_encoder().predict(pairs, convert_to_numpy=False)
     
     # sigmoid로 점수 정규화 (0~1 범위)
     if not isinstance(raw_scores, torch.Tensor):
         raw_scores = torch.tensor(raw_scores)
-    norm_scores = sigmoid(raw_scores).tolist()
-    
+    return sigmoid(raw_scores).tolist()
+
+def _rerank_documents(query: str, documents: List[str], metadata_list: List[Dict], top_k: int,
+                      embeddings, mmr_lambda: Optional[float]) -> tuple:
+    norm_scores = score_documents(query, documents)
+    return select_documents(documents, metadata_list, norm_scores, top_k, embeddings, mmr_lambda)
+
+def score_documents_batch(jobs: List[tuple]) -> List[List[float]]:
+    """여러 (질문, 문서 목록)의 cross-encoder 점수를 한 번에 계산 (일괄 처리용, 최대 쌍 수 단위로 predict)"""
+    jobs = [(query, documents) for query, documents in jobs]
+    if os.getenv("RAG_RERANK_BATCHING", "1") != "0":
+        return get_rerank_scheduler().score_many(jobs)
+    return [score_documents(query, documents) for query, documents in jobs]
+
+def resolve_mmr_lambda(mmr_lambda: Optional[float] = None) -> Optional[float]:
+    """MMR 관련도 가중치 λ (None이면 RAG_MMR_LAMBDA, 기본 0.7), 1 이상이면 MMR을 쓰지 않으므로 None"""
+    if mmr_lambda is None:
+        mmr_lambda = float(os.getenv("RAG_MMR_LAMBDA", str(MMR_LAMBDA)))
+    return mmr_lambda if mmr_lambda < 1 else None
+
+def select_documents(documents: List[str], metadata_list: List[Dict], norm_scores: List[float], top_k: int,
+                     embeddings=None, mmr_lambda: Optional[float] = None) -> tuple:
+    """재순위화 점수로 최종 문서 선택: 후보 임베딩이 있고 MMR이 켜져 있으면 MMR, 아니면 점수 상위 top_k"""
+    mmr_lambda = resolve_mmr_lambda(mmr_lambda)
+    if embeddings is None or mmr_lambda is None or len(documents) <= 1:
+        return select_top_k(documents, metadata_list, norm_scores, top_k)
+    with span("mmr", candidates=len(documents), top_k=top_k, mmr_lambda=mmr_lambda) as attrs:
+        # RAG_MMR_MAX_SIMILARITY를 지정하면 이미 고른 청크와 거의 같은 후보는 문맥에서 제외
+        max_similarity = os.getenv("RAG_MMR_MAX_SIMILARITY")
+        selected = mmr_select(embeddings, norm_scores, top_k, mmr_lambda,
+                              max_similarity=float(max_similarity) if max_similarity else MMR_MAX_SIMILARITY,
+                              pool_size=top_k * MMR_POOL_FACTOR)
+        attrs["selected"] = len(selected)
+    return ([documents[i] for i in selected], [metadata_list[i] for i in selected],
+            [norm_scores[i] for i in selected])
+
+def select_top_k(documents: List[str], metadata_list: List[Dict], norm_scores: List[float], top_k: int) -> tuple:
+    """점수 높은 순으로 top_k개 (문서 목록, 메타데이터 목록, 점수 목록)"""
     # 점수에 따라 문서 정렬
     doc_score_pairs = list(zip(documents, metadata_list, norm_scores))
     doc_score_pairs.sort(key=lambda x: x[2], reverse=True)
@@ -145,63 +459,242 @@ def rerank_documents(query: str, documents: List[str], metadata_list: List[Dict]
     
     return reranked_docs, reranked_metadata, reranked_scores
 
+def embed_query(query: str, collection):
+    """컬렉션의 임베딩 함수로 쿼리 임베딩 계산 (필터 없이 재검색할 때도 재사용)"""
+    embedding_function = getattr(collection, "_embedding_function", None)
+    if embedding_function is None:
+        return None
+    with span("embed"):
+        return embedding_function([query])
+
+def _search_include(include_embeddings: bool) -> List[str]:
+    return ["metadatas", "documents", "distances"] + (["embeddings"] if include_embeddings else [])
+
+def search_collection(collection, query: str, query_embeddings, n_results: int, where: Optional[Dict] = None,
+                      include_embeddings: bool = False) -> Dict:
+    """벡터 검색 실행 (미리 계산된 쿼리 임베딩이 있으면 사용, include_embeddings이면 후보 임베딩도 반환)"""
+    include = _search_include(include_embeddings)
+    with span("vector_search", n_results=n_results, filtered=where is not None) as attrs:
+        if query_embeddings is not None:
+            results = collection.query(query_embeddings=query_embeddings, n_results=n_results, where=where, include=include)
+        else:
+            results = collection.query(query_texts=[query], n_results=n_results, where=where, include=include)
+        attrs["candidates"] = len(results['documents'][0])
+        return results
+
 def get_relevant_context(query: str, collection, initial_k: int = 20, final_k: int = 5, metadata_filters: Optional[Dict[str, str]] = None) -> tuple:
     """사용자 질문과 관련된 문서 검색 (2단계 검색)"""
+    reranked_docs, reranked_metadata, scores = retrieve_documents(query, collection, initial_k, final_k, metadata_filters)
+    if not reranked_docs:
+        return "", {}
+    return build_context(reranked_docs, reranked_metadata, scores)
+
+def retrieve_documents(query: str, collection, initial_k: int = 20, final_k: int = 5,
+                       metadata_filters: Optional[Dict[str, str]] = None, rerank: bool = True,
+                       mmr_lambda: Optional[float] = None) -> tuple:
+    """벡터 검색(initial_k) → 재순위화(final_k) 결과 반환: (문서 목록, 메타데이터 목록, 점수 목록)
+
+       rerank=False이면 벡터 검색 순서대로 final_k개 반환 (점수는 1 / (1 + 거리))
+       mmr_lambda: 재순위화 후 MMR 다양성 선택의 관련도 가중치 (None이면 RAG_MMR_LAMBDA, 1이면 점수 순)
+    """
+    with span("retrieve", initial_k=initial_k, final_k=final_k, filters=metadata_filters or {}, rerank=rerank):
+        return _retrieve_documents(query, collection, initial_k, final_k, metadata_filters, rerank, mmr_lambda)
+
+def _retrieve_documents(query: str, collection, initial_k: int, final_k: int,
+                        metadata_filters: Optional[Dict[str, str]], rerank: bool,
+                        mmr_lambda: Optional[float]) -> tuple:
+    if metadata_filters and "pages" in metadata_filters:
+        # 페이지를 지정한 질문: 임베딩/벡터 검색/재순위화 없이 페이지 색인에서 직접 조회
+        found = lookup_pages(collection, metadata_filters)
+        if found[0]:
+            return found
+        print("지정한 페이지에 해당하는 문서가 없어 벡터 검색을 수행합니다.")
+        metadata_filters = {field: value for field, value in metadata_filters.items() if field != "pages"}
+
+    # 부하가 높거나 남은 시간이 부족하면 후보 수를 줄이고, 재순위화 직전에 다시 확인
+    budget = current_budget()
+    if budget is not None:
+        step = budget.check("retrieve")
+        if step.initial_k is not None:
+            initial_k = min(initial_k, step.initial_k)
+
+    # 쿼리 임베딩은 한 번만 계산
+    query_embeddings = embed_query(query, collection)
+    # MMR에 쓸 후보 임베딩은 벡터 검색 결과에 함께 받음 (다시 임베딩하지 않음)
+    include_embeddings = rerank and resolve_mmr_lambda(mmr_lambda) is not None
+
     try:
         # metadata_filters를 ChromaDB where 절 형식으로 변환
-        where_clause = None
-        if metadata_filters and len(metadata_filters) > 0:
-            # 각 필드에 대해 $eq 연산자를 사용한 조건 생성
-            conditions = []
-            for field, value in metadata_filters.items():
-                conditions.append({
-                    field: {"$eq": value}
-                })
-            
-            # 조건이 하나면 그대로 사용, 여러 개면 $and로 결합
-            if len(conditions) == 1:
-                where_clause = conditions[0]
-            else:
-                where_clause = {
-                    "$and": conditions
-                }
-            
+        where_clause = build_where_clause(metadata_filters)
+        if where_clause is not None:
             print(f"적용된 검색 필터: {where_clause}")  # 디버깅용 출력
         
         # 1단계: 벡터 검색으로 initial_k개 문서 검색
-        results = collection.query(
-            query_texts=[query],
-            n_results=initial_k,
-            where=where_clause
-        )
+        results = search_collection(collection, query, query_embeddings, initial_k, where_clause, include_embeddings)
         
         # 결과가 없으면 필터 없이 다시 검색
         if not results['documents'][0]:
             print("지정된 필터로 검색된 결과가 없어 전체 검색을 수행합니다.")
-            results = collection.query(
-                query_texts=[query],
-                n_results=initial_k
-            )
+            results = search_collection(collection, query, query_embeddings, initial_k,
+                                        include_embeddings=include_embeddings)
     except Exception as e:
         print(f"검색 중 오류 발생: {e}")
         print("필터 없이 전체 검색을 수행합니다.")
         # 오류 발생시 필터 없이 검색
-        results = collection.query(
-            query_texts=[query],
-            n_results=initial_k
-        )
-    
-    # 2단계: Cross-encoder로 재순위화
-    if results['documents'][0]:
-        reranked_docs, reranked_metadata, scores = rerank_documents(
-            query,
-            results['documents'][0],
-            results['metadatas'][0],
-            final_k
-        )
-    else:
-        return "", {}
+        results = search_collection(collection, query, query_embeddings, initial_k,
+                                    include_embeddings=include_embeddings)
     
+    if not results['documents'][0]:
+        return [], [], []
+
+    if rerank and budget is not None:
+        rerank = budget.check("rerank").rerank
+
+    if not rerank:
+        distances = (results.get('distances') or [[0.0] * len(results['documents'][0])])[0]
+        return (results['documents'][0][:final_k], results['metadatas'][0][:final_k],
+                [1.0 / (1.0 + distance) for distance in distances[:final_k]])
+
+    # 2단계: Cross-encoder로 재순위화 (후보 임베딩이 있으면 MMR로 다양한 출처 선택)
+    embeddings = results.get('embeddings') if include_embeddings else None
+    return rerank_documents(
+        query,
+        results['documents'][0],
+        results['metadatas'][0],
+        final_k,
+        embeddings=embeddings[0] if embeddings is not None else None,
+        mmr_lambda=mmr_lambda
+    )
+
+def build_where_clause(metadata_filters: Optional[Dict[str, str]]) -> Optional[Dict]:
+    """metadata_filters를 ChromaDB where 절로 변환 (필터가 없으면 None)"""
+    if not metadata_filters:
+        return None
+    # 각 필드에 대해 $eq 연산자를 사용한 조건 생성
+    conditions = [{field: {"$eq": value}} for field, value in metadata_filters.items()]
+    # 조건이 하나면 그대로 사용, 여러 개면 $and로 결합
+    return conditions[0] if len(conditions) == 1 else {"$and": conditions}
+
+def _search_many(collection, queries: List[str], query_embeddings, n_results: int, where: Optional[Dict],
+                 include_embeddings: bool = False) -> List[tuple]:
+    """같은 where 절을 쓰는 여러 질문을 한 번의 query 호출로 검색: 질문별 (문서 목록, 메타데이터 목록, 거리 목록, 임베딩)"""
+    include = _search_include(include_embeddings)
+    with span("vector_search", n_results=n_results, filtered=where is not None, batch=len(queries)) as attrs:
+        if query_embeddings is not None:
+            results = collection.query(query_embeddings=query_embeddings, n_results=n_results, where=where, include=include)
+        else:
+            results = collection.query(query_texts=queries, n_results=n_results, where=where, include=include)
+        attrs["candidates"] = sum(len(documents) for documents in results['documents'])
+    distances = results.get('distances') or [[0.0] * len(documents) for documents in results['documents']]
+    embeddings = results.get('embeddings') if include_embeddings else None
+    if embeddings is None:
+        embeddings = [None] * len(results['documents'])
+    return list(zip(results['documents'], results['metadatas'], distances, embeddings))
+
+def retrieve_documents_batch(queries: List[str], collection, filters_list: Optional[List[Dict[str, str]]] = None,
+                             initial_k: int = 20, final_k: int = 5, rerank: bool = True,
+                             mmr_lambda: Optional[float] = None) -> List[tuple]:
+    """여러 질문을 한꺼번에 검색 (일괄 처리용): 질문마다 retrieve_documents와 같은 (문서, 메타데이터, 점수) 반환
+
+       - 쿼리 임베딩: 모든 질문을 한 번에 계산
+       - 벡터 검색: 같은 필터를 쓰는 질문끼리 한 번의 query 호출 (필터 결과가 없으면 필터 없이 다시 검색)
+       - 재순위화: 모든 (질문, 후보) 쌍을 최대 쌍 수 단위 배치로 계산 (이후 질문마다 MMR 선택)
+    """
+    include_embeddings = rerank and resolve_mmr_lambda(mmr_lambda) is not None
+    filters_list = filters_list or [{} for _ in queries]
+    results: List[tuple] = [([], [], []) for _ in queries]
+    with span("retrieve", initial_k=initial_k, final_k=final_k, rerank=rerank, batch=len(queries)):
+        pending = []
+        for i, metadata_filters in enumerate(filters_list):
+            metadata_filters = dict(metadata_filters or {})
+            if "pages" in metadata_filters:
+                # 페이지를 지정한 질문은 페이지 색인에서 직접 조회
+                found = lookup_pages(collection, metadata_filters)
+                if found[0]:
+                    results[i] = found
+                    continue
+                metadata_filters.pop("pages")
+            pending.append((i, metadata_filters))
+        if not pending:
+            return results
+
+        embedding_function = getattr(collection, "_embedding_function", None)
+        embeddings = None
+        if embedding_function is not None:
+            with span("embed", batch=len(pending)):
+                embeddings = embedding_function([queries[i] for i, _ in pending])
+
+        # where 절이 같은 질문끼리 묶어 검색
+        groups: Dict[str, tuple] = {}
+        for position, (i, metadata_filters) in enumerate(pending):
+            where = build_where_clause(metadata_filters)
+            key = json.dumps(where, sort_keys=True, ensure_ascii=False)
+            groups.setdefault(key, (where, []))[1].append((i, position))
+
+        candidates: Dict[int, tuple] = {}
+        unfiltered = []
+        for where, members in groups.values():
+            group_embeddings = [embeddings[p] for _, p in members] if embeddings is not None else None
+            try:
+                found = _search_many(collection, [queries[i] for i, _ in members], group_embeddings, initial_k, where,
+                                     include_embeddings)
+            except Exception as e:
+                if where is None:
+                    raise
+                print(f"검색 중 오류 발생: {e}")
+                unfiltered.extend(members)
+                continue
+            for (i, p), result in zip(members, found):
+                if result[0] or where is None:
+                    candidates[i] = result
+                else:
+                    unfiltered.append((i, p))
+        if unfiltered:
+            # 필터로 검색된 결과가 없는 질문은 필터 없이 다시 검색
+            group_embeddings = [embeddings[p] for _, p in unfiltered] if embeddings is not None else None
+            found = _search_many(collection, [queries[i] for i, _ in unfiltered], group_embeddings, initial_k, None,
+                                 include_embeddings)
+            candidates.update({i: result for (i, _), result in zip(unfiltered, found)})
+
+        ordered = [i for i in sorted(candidates) if candidates[i][0]]
+        if not rerank:
+            for i in ordered:
+                documents, metadatas, distances, _ = candidates[i]
+                results[i] = (documents[:final_k], metadatas[:final_k],
+                              [1.0 / (1.0 + distance) for distance in distances[:final_k]])
+            return results
+
+        with span("rerank", candidates=sum(len(candidates[i][0]) for i in ordered), top_k=final_k, batch=len(ordered)):
+            scores = score_documents_batch([(queries[i], candidates[i][0]) for i in ordered])
+        for i, norm_scores in zip(ordered, scores):
+            documents, metadatas, _, candidate_embeddings = candidates[i]
+            results[i] = select_documents(documents, metadatas, norm_scores, final_k, candidate_embeddings, mmr_lambda)
+    return results
+
+PAGE_LOOKUP_MAX_CHUNKS = 10
+
+def lookup_pages(collection, metadata_filters: Dict[str, str], max_chunks: int = PAGE_LOOKUP_MAX_CHUNKS) -> tuple:
+    """metadata_filters["pages"] 범위와 겹치는 청크를 페이지 순서대로 반환: (문서 목록, 메타데이터 목록, 점수 목록)"""
+    first, last = parse_pages(metadata_filters["pages"])
+    source = metadata_filters.get("source")
+    with span("page_lookup", pages=metadata_filters["pages"], source=source) as attrs:
+        index = get_page_index(collection)
+        # 덱에 없는 페이지 번호(예: 연도 "2030페이지")는 페이지 참조로 보지 않음 → 호출한 쪽에서 벡터 검색
+        page_count = index.page_count(source)
+        if first < 1 or first > page_count:
+            attrs["out_of_range"] = page_count
+            return [], [], []
+        positions = index.lookup(first, min(last, page_count), source)
+        # 섹션 조건은 맞는 청크가 있을 때만 적용 (페이지 지정이 더 구체적인 조건)
+        section = metadata_filters.get("section")
+        in_section = [p for p in positions if index.metadatas[p].get("section") == section]
+        positions = (in_section or positions)[:max_chunks]
+        attrs["candidates"] = len(positions)
+    # 직접 조회한 문서는 관련도 1.0으로 표시
+    return [index.documents[p] for p in positions], [index.metadatas[p] for p in positions], [1.0] * len(positions)
+
+def build_context(reranked_docs: List[str], reranked_metadata: List[Dict], scores: List[float]) -> tuple:
+    """검색된 문서로 응답 생성용 문맥 문자열과 메타데이터 요약 생성"""
     # 메타데이터 요약 정보 수집
     metadata_summary = {
         "sections": set(),
@@ -221,12 +714,17 @@ def get_relevant_context(query: str, collection, initial_k: int = 20, final_k: i
         # 관련도 레이블 생성
         relevance_label = get_relevance_label(score)
         
+        # 적재 시 합쳐진 중복 청크가 있으면 그 위치도 출처로 표시
+        pages = metadata.get('page_range', '알 수 없음')
+        if metadata.get('duplicate_pages'):
+            pages += f" (같은 내용: {metadata['duplicate_pages']})"
+        
         # 문맥 구성 (유사도 점수와 레이블 포함)
         context = f"""
                     출처: {metadata['source']}
                     섹션: {metadata['section']}
                     서브섹션: {metadata['sub_section']}
-                    페이지: {metadata.get('page_range', '알 수 없음')}
+                    페이지: {pages}
                     관련도: {score:.4f} ({relevance_label})
                     내용: {doc}
                     ---"""
@@ -234,21 +732,64 @@ def get_relevant_context(query: str, collection, initial_k: int = 20, final_k: i
     
     return "\n".join(contexts), metadata_summary
 
-def generate_response(query: str, context: str, metadata_summary: Dict):
+_few_shot_examples = None
+
+def load_few_shot_examples() -> List[Dict]:
+    """few-shot 예시 로드 (최초 1회만 파일을 읽고 이후에는 캐시 사용)"""
+    global _few_shot_examples
+    if _few_shot_examples is not None:
+        record_cache("few_shot_examples", True)
+        return _few_shot_examples
 
+    record_cache("few_shot_examples", False)
     # 현재 파일 기준 상대 경로로 few-shot 예시 로드
     examples_path = Path(__file__).resolve().parent.parent / "data/few_shot_examples.json"
     with open(examples_path, "r", encoding="utf-8") as f:
-        few_shot_examples = json.load(f)
+        _few_shot_examples = json.load(f)
+    return _few_shot_examples
+
+def summarize_conversation(summary: str, turns: List, deadline: Optional[Deadline] = None) -> str:
+    """기존 대화 요약에 밀려난 턴(conversation_memory.Turn)을 합쳐 새 요약 생성
+
+       요청 예산 안에서 실행 (답변이 끝난 뒤처럼 현재 예산이 없으면 deadline으로 새로 입장),
+       남은 시간이 부족하면 호출하지 않고 Overloaded (ConversationMemory는 기존 요약에 질문만 덧붙임)
+    """
+    if current_budget() is None:
+        with admit_request(deadline):
+            return _summarize_conversation(summary, turns)
+    return _summarize_conversation(summary, turns)
 
-    """파인튜닝된 모델을 사용하여 응답 생성"""
-    # 메타데이터 요약 문자열 생성
+def _summarize_conversation(summary: str, turns: List) -> str:
+    if not current_budget().has_time_for("summarize"):
+        raise Overloaded("deadline")
+    dialogue = "\n".join(f"사용자: {turn.user}\n챗봇: {turn.assistant}" for turn in turns)
+
+    with span("summarize", turns=len(turns)) as attrs:
+        response = get_client().chat.completions.create(
+            model="gpt-3.5-turbo",
+            messages=[
+                {"role": "system", "content": "너는 ESG 상담 대화를 요약하는 도우미야. 기존 요약에 새 대화를 반영해서, "
+                                              "사용자의 관심 기업·주제·요구사항과 챗봇이 제시한 핵심 결론을 한국어 5문장 이내로 요약해."},
+                {"role": "user", "content": f"기존 요약:\n{summary or '(없음)'}\n\n새 대화:\n{dialogue}"}
+            ],
+            temperature=0.2,
+            max_tokens=300,
+            **_llm_options()
+        )
+        record_tokens(attrs, "summarize", response.usage)
+        return response.choices[0].message.content.strip()
+
+def build_generation_messages(query: str, context: str, metadata_summary: Dict, history: Optional[List[Dict]] = None) -> tuple:
+    """응답 생성에 사용할 메시지 목록(시스템 프롬프트 + few-shot + 대화 기록 + 질문)과 메타데이터 요약 문자열 생성"""
+    few_shot_examples = load_few_shot_examples()
+
+    # 메타데이터 요약 문자열 생성 (검색 결과가 없으면 빈 값)
     metadata_info = f"""
     참고한 문서 정보:
-    - 섹션: {', '.join(metadata_summary['sections'])}
-    - 서브섹션: {', '.join(metadata_summary['subsections'])}
-    - 출처: {', '.join(metadata_summary['sources'])}
-    - 페이지: {', '.join(metadata_summary['page_ranges'])}
+    - 섹션: {', '.join(metadata_summary.get('sections', []))}
+    - 서브섹션: {', '.join(metadata_summary.get('subsections', []))}
+    - 출처: {', '.join(metadata_summary.get('sources', []))}
+    - 페이지: {', '.join(metadata_summary.get('page_ranges', []))}
     """
     
     system_prompt = f"""
@@ -289,36 +830,269 @@ def generate_response(query: str, context: str, metadata_summary: Dict):
     관련 문서:
     {context}"""
 
+    messages = [{"role": "system", "content": system_prompt}] + \
+                few_shot_examples + \
+                (history or []) + \
+                [{"role": "user", "content": query}]
+    return messages, metadata_info
+
+def _max_tokens(default: int) -> int:
+    """응답 최대 토큰 수 (저하 단계에서는 DEGRADED_MAX_TOKENS로 제한)"""
+    budget = current_budget()
+    if budget is None:
+        return default
+    step = budget.check("generate")
+    return min(default, step.max_tokens) if step.max_tokens else default
+
+def generate_response(query: str, context: str, metadata_summary: Dict, history: Optional[List[Dict]] = None,
+                      model: str = FINETUNED_MODEL_ID, raise_errors: bool = False):
+    """파인튜닝된 모델을 사용하여 응답 생성
+
+       history: 이전 대화 메시지 목록 (ConversationMemory.build_messages()), 없으면 현재 질문만 전송
+       raise_errors: True이면 오류 시 안내 문구 대신 예외 발생 (일괄 처리에서 실패한 질문을 다시 실행하기 위함)
+    """
+    with span("generate", model=model, history_messages=len(history or [])) as attrs:
+        messages, metadata_info = build_generation_messages(query, context, metadata_summary, history)
+        attrs["max_tokens"] = max_tokens = _max_tokens(1000)
+        try:
+            result = get_client().chat.completions.create(
+                model=model,
+                messages=messages,
+                temperature=0.7,  # 일관성을 위해 낮은 temperature 사용
+                max_tokens=max_tokens,    # 더 긴 응답 허용 (저하 단계에서는 제한)
+                **_llm_options()
+            )
+            record_tokens(attrs, "generate", result.usage)
+            return result.choices[0].message.content, metadata_info
+        except Exception as e:
+            print(f"응답 생성 중 오류 발생: {e}")
+            attrs["error"] = repr(e)
+            if raise_errors:
+                raise
+            return ERROR_MESSAGE, metadata_info
+
+def generate_response_stream(query: str, context: str, metadata_summary: Dict, history: Optional[List[Dict]] = None,
+                             model: str = FINETUNED_MODEL_ID) -> Iterator[str]:
+    """generate_response의 스트리밍 버전 (생성되는 텍스트 조각을 순서대로 반환)"""
+    with span("generate", model=model, history_messages=len(history or []), stream=True) as attrs:
+        messages, _ = build_generation_messages(query, context, metadata_summary, history)
+        attrs["max_tokens"] = max_tokens = _max_tokens(1000)
+        try:
+            stream = get_client().chat.completions.create(
+                model=model,
+                messages=messages,
+                temperature=0.7,
+                max_tokens=max_tokens,
+                stream=True,
+                stream_options={"include_usage": True},
+                **_llm_options()
+            )
+            for chunk in stream:
+                if chunk.usage is not None:
+                    record_tokens(attrs, "generate", chunk.usage)
+                if chunk.choices and chunk.choices[0].delta.content:
+                    yield chunk.choices[0].delta.content
+        except Exception as e:
+            print(f"응답 생성 중 오류 발생: {e}")
+            attrs["error"] = repr(e)
+            yield ERROR_MESSAGE
+
+def answer_query(query: str, collection, model: str = FINETUNED_MODEL_ID, history: Optional[List[Dict]] = None,
+                 deadline: Optional[Deadline] = None) -> Dict:
+    """질문 하나에 대한 전체 파이프라인 실행 (질문 확장 → 필터 추출 → 문서 검색 → 응답 생성)
+
+       deadline: 요청 도착 시각 기준 마감 시간 (없으면 지금부터 RAG_REQUEST_TIMEOUT초)
+       결과의 "degradation"에 저하 단계 기록, 과부하로 거절하면 response는 BUSY_MESSAGE
+    """
     try:
-        result = client.chat.completions.create(
-            model="ft:gpt-3.5-turbo-0125:personal::BdZzCnDt",  # 파인튜닝된 모델 ID
-            messages = [{"role": "system", "content": system_prompt}] + 
-                        few_shot_examples + 
-                        [{"role": "user", "content": query}],
-            temperature=0.7,  # 일관성을 위해 낮은 temperature 사용
-            max_tokens=1000    # 더 긴 응답 허용
-        )
-        return result.choices[0].message.content, metadata_info
-    except Exception as e:
-        print(f"응답 생성 중 오류 발생: {e}")
-        return "죄송합니다. 응답을 생성하는 중에 오류가 발생했습니다.", metadata_info
+        with admit_request(deadline) as budget:
+            result = _answer_query(query, collection, model, history)
+            result["degradation"] = budget.metadata()
+            return result
+    except Overloaded as e:
+        return busy_result(query, e)
 
-def main():
-    print("ESG 챗봇을 초기화하는 중...")
+def answer_with_context(query: str, context: str, metadata_summary: Dict, model: str = FINETUNED_MODEL_ID,
+                        history: Optional[List[Dict]] = None, deadline: Optional[Deadline] = None) -> Dict:
+    """이전 검색 결과(context)를 재사용해 응답만 생성 (후속 질문), answer_query와 같은 입장 제어와 결과 형식"""
+    try:
+        with admit_request(deadline) as budget:
+            response, metadata_info = generate_response(query, context, metadata_summary, history=history, model=model)
+            degradation = budget.metadata()
+    except Overloaded as e:
+        return busy_result(query, e)
+    return {
+        "query": query,
+        "expanded_query": query,
+        "metadata_filters": {},
+        "context": context,
+        "metadata_summary": metadata_summary,
+        "metadata_info": metadata_info,
+        "response": response,
+        "degradation": degradation,
+    }
+
+def _answer_query(query: str, collection, model: str, history: Optional[List[Dict]]) -> Dict:
+    # 메타데이터 필터 추출 (원래 질문에서)
+    metadata_filters = extract_metadata_filters(query)
     
-    # ChromaDB 클라이언트 초기화
-    chroma_client = chromadb.PersistentClient(path="./data/chromadb")
+    # 짧은 질문 확장 (페이지를 지정한 질문은 직접 조회하므로 확장하지 않음)
+    expanded_query = query if "pages" in metadata_filters else expand_query(query)
     
-    # 임베딩 함수 설정 -> ChromaDB에서 사용하는 임베딩 함수
-    embedding_function = embedding_functions.SentenceTransformerEmbeddingFunction(
-        model_name="jhgan/ko-sroberta-multitask"
+    # 관련 문서 검색 (확장된 질문 사용)
+    context, metadata_summary = get_relevant_context(
+        expanded_query,
+        collection,
+        metadata_filters=metadata_filters
     )
     
-    # 컬렉션 가져오기
-    collection = chroma_client.get_collection(
-        name="ppt_documents_collection",
-        embedding_function=embedding_function
+    # 응답 생성 (원래 질문 사용)
+    response, metadata_info = generate_response(query, context, metadata_summary, history=history, model=model)
+    return {
+        "query": query,
+        "expanded_query": expanded_query,
+        "metadata_filters": metadata_filters,
+        "context": context,
+        "metadata_summary": metadata_summary,
+        "metadata_info": metadata_info,
+        "response": response,
+    }
+
+def answer_query_stream(query: str, collection, model: str = FINETUNED_MODEL_ID, history: Optional[List[Dict]] = None,
+                        deadline: Optional[Deadline] = None) -> Iterator[Dict]:
+    """answer_query의 스트리밍 버전
+
+       먼저 {"type": "context", ...} 이벤트로 검색 결과(저하 단계 포함)를 보내고,
+       이후 {"type": "token", "content": ...} 이벤트로 응답 조각을 보낸 뒤 {"type": "done"}으로 끝남
+       (과부하로 거절하면 빈 검색 결과와 BUSY_MESSAGE 한 조각)
+    """
+    with trace_request("stream_query", model=model):
+        try:
+            with admit_request(deadline) as budget:
+                yield from _answer_query_stream(query, collection, model, history, budget)
+        except Overloaded as e:
+            yield from _busy_stream(query, e)
+
+def answer_with_context_stream(query: str, context: str, metadata_summary: Dict, model: str = FINETUNED_MODEL_ID,
+                               history: Optional[List[Dict]] = None,
+                               deadline: Optional[Deadline] = None) -> Iterator[Dict]:
+    """answer_with_context의 스트리밍 버전 (이전 검색 결과 재사용, 이벤트 형식은 answer_query_stream과 같음)"""
+    with trace_request("stream_with_context", model=model):
+        try:
+            with admit_request(deadline) as budget:
+                yield {
+                    "type": "context",
+                    "expanded_query": query,
+                    "metadata_filters": {},
+                    "context": context,
+                    "metadata_summary": metadata_summary,
+                    "degradation": budget.metadata(),
+                }
+                yield from _response_events(query, context, metadata_summary, model, history, budget)
+        except Overloaded as e:
+            yield from _busy_stream(query, e)
+
+def _busy_stream(query: str, error: Overloaded) -> Iterator[Dict]:
+    result = busy_result(query, error)
+    yield {"type": "context", **{key: result[key] for key in
+                                 ("expanded_query", "metadata_filters", "context", "metadata_summary", "degradation")}}
+    yield {"type": "token", "content": result["response"]}
+    yield {"type": "done"}
+
+def _response_events(query: str, context: str, metadata_summary: Dict, model: str, history: Optional[List[Dict]],
+                     budget) -> Iterator[Dict]:
+    for token in generate_response_stream(query, context, metadata_summary, history=history, model=model):
+        yield {"type": "token", "content": token}
+    yield {"type": "done", "degradation": budget.metadata()}
+
+def _answer_query_stream(query: str, collection, model: str, history: Optional[List[Dict]], budget) -> Iterator[Dict]:
+    metadata_filters = extract_metadata_filters(query)
+    expanded_query = query if "pages" in metadata_filters else expand_query(query)
+    context, metadata_summary = get_relevant_context(
+        expanded_query,
+        collection,
+        metadata_filters=metadata_filters
     )
+    yield {
+        "type": "context",
+        "expanded_query": expanded_query,
+        "metadata_filters": metadata_filters,
+        "context": context,
+        "metadata_summary": metadata_summary,
+        "degradation": budget.metadata(),
+    }
+    yield from _response_events(query, context, metadata_summary, model, history, budget)
+
+# 동시에 들어온 동일한 질문을 하나의 파이프라인 실행으로 병합 (프로세스 전역)
+_answer_flights = SingleFlight("answer")
+
+def coalesced_answer(query: str, collection, model: str = FINETUNED_MODEL_ID, deadline: Optional[Deadline] = None) -> tuple:
+    """answer_query와 같지만, 같은 질문·필터·모델로 실행 중인 요청이 있으면 그 결과를 공유
+
+       대화 기록에 따라 답이 달라지므로 history가 없는 질문에만 사용
+       합류한 요청은 자기 마감 시간까지만 기다리고, 지나면 과부하 거절과 같은 결과 반환
+       반환: (결과 dict, 다른 요청의 결과를 공유했는지 여부)
+    """
+    deadline = deadline or Deadline()
+    key = make_key(query, extract_metadata_filters(query), model)
+    try:
+        result, shared = _answer_flights.do(key, lambda: answer_query(query, collection, model=model, deadline=deadline),
+                                            timeout=deadline.remaining())
+    except FlightTimeout:
+        return busy_result(query, Overloaded("deadline")), True
+    return dict(result), shared
+
+def coalesced_answer_stream(query: str, collection, model: str = FINETUNED_MODEL_ID,
+                            deadline: Optional[Deadline] = None) -> tuple:
+    """answer_query_stream과 같지만, 실행 중인 동일 요청이 있으면 그 토큰 스트림에 합류
+
+       대화 기록에 따라 답이 달라지므로 history가 없는 질문에만 사용
+       합류한 요청이 마감 시간까지 첫 이벤트를 받지 못하면 과부하 거절과 같은 이벤트로 끝남
+       반환: (이벤트 이터레이터, 다른 요청의 스트림에 합류했는지 여부)
+    """
+    deadline = deadline or Deadline()
+    key = make_key(query, extract_metadata_filters(query), model)
+    events, shared = _answer_flights.stream(key, lambda: answer_query_stream(query, collection, model=model,
+                                                                              deadline=deadline),
+                                            timeout=deadline.remaining())
+    return _busy_on_flight_timeout(query, events), shared
+
+def _busy_on_flight_timeout(query: str, events: Iterator[Dict]) -> Iterator[Dict]:
+    try:
+        yield from events
+    except FlightTimeout:
+        yield from _busy_stream(query, Overloaded("deadline"))
+    finally:
+        # 중간에 닫혀도 구독 해제 (마지막 구독자였으면 single-flight가 생산을 멈춤)
+        events.close()
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description="ESG 챗봇 (대화형 또는 JSONL 일괄 처리)")
+    parser.add_argument("--batch", metavar="INPUT", help="질문 JSONL 일괄 처리 (한 줄에 {\"id\", \"question\"})")
+    parser.add_argument("--output", default="outputs/answers.jsonl", help="일괄 처리 결과 JSONL (이미 있으면 이어서 실행)")
+    parser.add_argument("--concurrency", type=int, default=8, help="동시에 실행할 응답 생성 수")
+    parser.add_argument("--batch-size", type=int, default=16, help="한 번에 검색할 질문 수")
+    parser.add_argument("--expand-concurrency", type=int, default=4, help="동시에 실행할 질문 확장 수 (생성과 별도 스레드 풀)")
+    parser.add_argument("--model", default=FINETUNED_MODEL_ID)
+    args = parser.parse_args()
+
+    print("ESG 챗봇을 초기화하는 중...")
+    
+    # 컬렉션 연결 및 모델 로드 (첫 질문의 지연을 줄이기 위해 미리 실행)
+    get_collection()
+    warmup()
+    
+    if args.batch:
+        import sys
+        from batch_answer import run_batch
+
+        # python code/rag_chatbot.py로 실행하면 이 모듈은 __main__이므로, 이미 로드한 리소스를 그대로 넘김
+        summary = run_batch(sys.modules[__name__], args.batch, args.output, concurrency=args.concurrency,
+                            batch_size=args.batch_size, model=args.model, expand_concurrency=args.expand_concurrency)
+        print(f"일괄 처리 완료: {summary} → {args.output}")
+        return
     
     print("초기화 완료! 질문해주세요.")
     # print("특정 영역(Environmental/Social/Governance)에 대해 물어보시면 해당 영역의 정보를 우선적으로 검색합니다.")
@@ -330,24 +1104,19 @@ def main():
         if query.lower() == 'quit':
             break
             
-        # 짧은 질문 확장
-        expanded_query = expand_query(query)
-        
-        # 메타데이터 필터 추출 (원래 질문에서)
-        metadata_filters = extract_metadata_filters(query)
-        
-        # 관련 문서 검색 (확장된 질문 사용)
-        context, metadata_summary = get_relevant_context(
-            expanded_query, 
-            collection,
-            metadata_filters=metadata_filters
-        )
-        
-        # 응답 생성 (원래 질문 사용)
-        response, metadata_info = generate_response(query, context, metadata_summary)
+        with trace_request("cli_query"):
+            # 질문 확장 → 필터 추출 → 문서 검색 → 응답 생성
+            # 질문마다 현재 스냅샷을 다시 가져옴 (새 인덱스가 게시되면 재시작 없이 반영)
+            result = answer_query(query, get_collection())
+        response = result["response"]
+        metadata_info = result["metadata_info"]
+        context = result["context"]
         
         print("\n답변:")
         print(response)
+        degradation = result["degradation"]
+        if degradation["level"]:
+            print(f"\n(부하로 일부 단계를 생략했습니다: 저하 단계 {degradation['level']}, {', '.join(degradation['reasons'])})")
         
         # 사용된 문서 출력 여부 확인
         show_sources = input("\n참고한 문서 정보를 보시겠습니까? (y/n): ")
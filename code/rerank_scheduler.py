@@ -0,0 +1,84 @@
+"""Cross-encoder 재순위화 동적 마이크로 배칭 스케줄러
+
+여러 세션에서 동시에 들어온 (질문, 후보 문서 목록) 작업을 하나의 대기열에 모아
+최대 쌍(pair) 수와 최대 대기 시간 안에서 한 번의 predict 호출로 처리한 뒤,
+요청별로 sigmoid 정규화 점수를 나눠 돌려줍니다.
+
+적재 시 만든 청크 토큰 캐시를 넘기면(token_cache.TokenCacheReader) 청크는 캐시된 토큰을 쓰고 질문만 토큰화합니다.
+다시 적재해 캐시가 바뀌면 다음 배치부터 새 캐시를 사용합니다.
+
+대기열 길이와 배치 크기는 tracing 메트릭(rag_batcher_*{batcher="rerank"})으로 확인할 수 있습니다.
+"""
+from typing import Callable, List, Tuple
+
+import numpy as np
+
+from batching import MicroBatcher
+
+def sigmoid(scores: np.ndarray) -> np.ndarray:
+    return 1.0 / (1.0 + np.exp(-scores))
+
+class RerankScheduler:
+    """(query, documents) 작업을 모아 cross-encoder 배치 추론
+
+       - max_pairs: 한 번의 forward에 넣을 최대 (질문, 문서) 쌍 수
+       - max_wait_ms: 첫 작업 도착 후 다른 작업을 기다리는 최대 시간
+       - token_cache_reader: 청크 토큰 캐시 리더 (없거나 캐시가 없으면 CrossEncoder.predict로 쌍 전체를 토큰화)
+    """
+
+    def __init__(self, cross_encoder_getter: Callable, max_pairs: int = 128, max_wait_ms: float = 2.0,
+                 token_cache_reader=None):
+        self._get_cross_encoder = cross_encoder_getter
+        self.token_cache_reader = token_cache_reader
+        self._cached_scorer = None
+        self.max_pairs = max_pairs
+        self.batcher = MicroBatcher(
+            self._score_batch,
+            max_batch_size=max_pairs,
+            max_wait_ms=max_wait_ms,
+            size_fn=lambda job: len(job[1]),
+            name="rerank",
+        )
+
+    @property
+    def queue_depth(self) -> int:
+        return self.batcher.queue_depth
+
+    def _scorer(self, token_cache):
+        # 캐시가 다시 만들어졌으면 새 캐시로 scorer 교체
+        if self._cached_scorer is None or self._cached_scorer.encoder.cache is not token_cache:
+            from token_cache import CachedCrossEncoderScorer
+
+            self._cached_scorer = CachedCrossEncoderScorer(self._get_cross_encoder(), token_cache)
+        return self._cached_scorer
+
+    def _score_batch(self, jobs: List[Tuple[str, List[str]]]) -> List[List[float]]:
+        token_cache = self.token_cache_reader.cache() if self.token_cache_reader is not None else None
+        if token_cache is not None:
+            raw_scores = self._scorer(token_cache).predict(jobs)
+        else:
+            pairs = [[query, doc] for query, documents in jobs for doc in documents]
+            raw_scores = self._get_cross_encoder().predict(pairs, batch_size=max(1, len(pairs)), convert_to_numpy=True)
+        # 기존 rerank_documents와 동일하게 predict 결과에 sigmoid를 적용해 0~1 범위로 정규화
+        scores = sigmoid(np.asarray(raw_scores, dtype=np.float64)).tolist()
+
+        results, offset = [], 0
+        for _, documents in jobs:
+            results.append(scores[offset:offset + len(documents)])
+            offset += len(documents)
+        return results
+
+    def score(self, query: str, documents: List[str]) -> List[float]:
+        """질문과 각 문서의 관련도 점수(0~1) 반환 (다른 요청과 같은 배치로 처리될 수 있음)"""
+        if not documents:
+            return []
+        return self.batcher((query, list(documents)))
+
+    def score_many(self, jobs: List[Tuple[str, List[str]]]) -> List[List[float]]:
+        """이미 모아 둔 여러 작업(일괄 처리)을 한꺼번에 대기열에 넣어 처리
+
+           대화형 요청과 같은 대기열/작업 스레드를 거치므로 모델은 항상 한 스레드에서만 호출되고,
+           대기열에 작업이 쌓여 있으면 max_pairs까지 바로 채워 배치로 처리
+        """
+        futures = [self.batcher.submit((query, list(documents))) if documents else None for query, documents in jobs]
+        return [future.result() if future is not None else [] for future in futures]
@@ -0,0 +1,209 @@
+"""SQLite 기반 대화 기록 저장소 (세션별 크기 제한, 유휴 세션 정리)
+
+st.session_state.messages에 모든 메시지와 metadata_summary(set 딕셔너리)를 계속 쌓는 대신,
+메시지를 압축된 형태로 SQLite에 저장하고 페이지를 다시 그릴 때는 화면에 보이는 최근 메시지만 읽습니다.
+    - 메시지: 역할 1글자('u'/'a') + zlib 압축 JSON({"c": 내용, "m": 메타데이터 요약(set → 정렬된 리스트)})
+    - 세션별 최대 메시지 수 / 최대 바이트(메시지 + 대화 메모리)를 넘으면 오래된 메시지부터 삭제
+    - idle_seconds 동안 사용하지 않은 세션은 삭제 (append 시 주기적으로 실행)
+    - 대화 메모리(ConversationMemory.to_dict(): 최근 턴, 누적 요약, 재사용할 검색 결과)도 세션별로 함께 저장해
+      페이지를 다시 불러와도 화면의 대화 기록과 모델에 전달하는 대화 맥락이 어긋나지 않게 함
+
+설정 (환경 변수):
+    RAG_SESSION_DB              저장 경로 (기본 ./data/sessions.sqlite3)
+    RAG_SESSION_MAX_MESSAGES    세션별 최대 메시지 수 (기본 200)
+    RAG_SESSION_MAX_BYTES       세션별 최대 저장 크기 (압축 후 메시지 + 대화 메모리, 기본 512KB)
+    RAG_SESSION_IDLE_HOURS      유휴 세션 보관 시간 (기본 24시간)
+"""
+import json
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from pathlib import Path
+from typing import Dict, List, Optional
+
+SESSION_DB = "./data/sessions.sqlite3"
+EVICT_INTERVAL = 60.0  # 유휴 세션 정리 최소 간격(초)
+
+_ROLES = {"user": "u", "assistant": "a"}
+_ROLE_NAMES = {v: k for k, v in _ROLES.items()}
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS sessions (
+    session_id TEXT PRIMARY KEY,
+    last_active REAL NOT NULL,
+    message_count INTEGER NOT NULL DEFAULT 0,
+    total_bytes INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS messages (
+    session_id TEXT NOT NULL,
+    seq INTEGER NOT NULL,
+    role TEXT NOT NULL,
+    payload BLOB NOT NULL,
+    PRIMARY KEY (session_id, seq)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS session_memory (
+    session_id TEXT PRIMARY KEY,
+    payload BLOB NOT NULL
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS sessions_last_active ON sessions (last_active);
+"""
+
+def compact_metadata(metadata_summary: Optional[Dict]) -> Optional[Dict]:
+    """metadata_summary의 set을 정렬된 리스트로 바꾸고 빈 항목 제거"""
+    if not metadata_summary:
+        return None
+    compact = {key: sorted(values) if isinstance(values, (set, frozenset)) else values
+               for key, values in metadata_summary.items() if values}
+    return compact or None
+
+def encode_message(content: str, metadata_summary: Optional[Dict] = None) -> bytes:
+    payload = {"c": content}
+    metadata = compact_metadata(metadata_summary)
+    if metadata:
+        payload["m"] = metadata
+    return zlib.compress(json.dumps(payload, ensure_ascii=False, separators=(",", ":")).encode("utf-8"))
+
+def decode_message(role: str, payload: bytes) -> Dict:
+    data = json.loads(zlib.decompress(payload))
+    message = {"role": _ROLE_NAMES.get(role, role), "content": data["c"]}
+    if "m" in data:
+        message["metadata_summary"] = data["m"]
+    return message
+
+class SessionStore:
+    """세션별 대화 기록 저장소 (스레드별 SQLite 연결, WAL 모드)"""
+
+    def __init__(self, path: Optional[str] = None, max_messages: Optional[int] = None,
+                 max_bytes: Optional[int] = None, idle_seconds: Optional[float] = None):
+        self.path = path or os.getenv("RAG_SESSION_DB", SESSION_DB)
+        self.max_messages = max_messages or int(os.getenv("RAG_SESSION_MAX_MESSAGES", "200"))
+        self.max_bytes = max_bytes or int(os.getenv("RAG_SESSION_MAX_BYTES", str(512 * 1024)))
+        self.idle_seconds = idle_seconds or float(os.getenv("RAG_SESSION_IDLE_HOURS", "24")) * 3600
+        self._local = threading.local()
+        self._evicted_at = 0.0
+
+        Path(self.path).parent.mkdir(parents=True, exist_ok=True)
+        self._connection().executescript(_SCHEMA)
+
+    def _connection(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def append(self, session_id: str, role: str, content: str, metadata_summary: Optional[Dict] = None):
+        """메시지 추가 후 세션 제한(메시지 수, 바이트)을 넘으면 오래된 메시지 삭제"""
+        payload = encode_message(content, metadata_summary)
+        now = time.time()
+        conn = self._connection()
+        with conn:
+            conn.execute("BEGIN IMMEDIATE")
+            conn.execute(
+                "INSERT INTO sessions (session_id, last_active) VALUES (?, ?) "
+                "ON CONFLICT(session_id) DO UPDATE SET last_active = excluded.last_active",
+                (session_id, now),
+            )
+            seq = conn.execute("SELECT COALESCE(MAX(seq), 0) + 1 FROM messages WHERE session_id = ?",
+                               (session_id,)).fetchone()[0]
+            conn.execute("INSERT INTO messages (session_id, seq, role, payload) VALUES (?, ?, ?, ?)",
+                         (session_id, seq, _ROLES.get(role, role), payload))
+            conn.execute("UPDATE sessions SET message_count = message_count + 1, total_bytes = total_bytes + ? "
+                         "WHERE session_id = ?", (len(payload), session_id))
+            self._enforce_limits(conn, session_id)
+
+        if now - self._evicted_at > EVICT_INTERVAL:
+            self.evict_idle(now)
+
+    def _enforce_limits(self, conn: sqlite3.Connection, session_id: str):
+        count, total = conn.execute("SELECT message_count, total_bytes FROM sessions WHERE session_id = ?",
+                                    (session_id,)).fetchone()
+        # 대화 메모리는 자를 수 없으므로 크기만 더하고, 제한은 메시지를 지워서 맞춤
+        total += self._memory_bytes(conn, session_id)
+        if count <= self.max_messages and total <= self.max_bytes:
+            return
+        # 가장 최근 메시지는 남기고 오래된 순으로 제한 안에 들어올 때까지 삭제
+        removed_count, removed_bytes, last_seq = 0, 0, None
+        rows = conn.execute("SELECT seq, LENGTH(payload) FROM messages WHERE session_id = ? ORDER BY seq LIMIT ?",
+                            (session_id, count - 1))
+        for seq, size in rows:
+            if count - removed_count <= self.max_messages and total - removed_bytes <= self.max_bytes:
+                break
+            removed_count += 1
+            removed_bytes += size
+            last_seq = seq
+        if last_seq is None:
+            return
+        conn.execute("DELETE FROM messages WHERE session_id = ? AND seq <= ?", (session_id, last_seq))
+        conn.execute("UPDATE sessions SET message_count = message_count - ?, total_bytes = total_bytes - ? "
+                     "WHERE session_id = ?", (removed_count, removed_bytes, session_id))
+
+    def recent(self, session_id: str, limit: int) -> List[Dict]:
+        """최근 limit개 메시지 (오래된 것부터)"""
+        rows = self._connection().execute(
+            "SELECT role, payload FROM messages WHERE session_id = ? ORDER BY seq DESC LIMIT ?",
+            (session_id, limit),
+        ).fetchall()
+        return [decode_message(role, payload) for role, payload in reversed(rows)]
+
+    def count(self, session_id: str) -> int:
+        row = self._connection().execute("SELECT message_count FROM sessions WHERE session_id = ?",
+                                         (session_id,)).fetchone()
+        return row[0] if row else 0
+
+    def _memory_bytes(self, conn: sqlite3.Connection, session_id: str) -> int:
+        row = conn.execute("SELECT LENGTH(payload) FROM session_memory WHERE session_id = ?", (session_id,)).fetchone()
+        return row[0] if row else 0
+
+    def save_memory(self, session_id: str, state: Dict):
+        """세션의 대화 메모리 상태 저장 (JSON, zlib 압축, 세션당 한 행, 크기는 세션 바이트 제한에 포함)"""
+        payload = zlib.compress(json.dumps(state, ensure_ascii=False, separators=(",", ":")).encode("utf-8"))
+        conn = self._connection()
+        with conn:
+            conn.execute("BEGIN IMMEDIATE")
+            conn.execute(
+                "INSERT INTO sessions (session_id, last_active) VALUES (?, ?) "
+                "ON CONFLICT(session_id) DO UPDATE SET last_active = excluded.last_active",
+                (session_id, time.time()),
+            )
+            conn.execute(
+                "INSERT INTO session_memory (session_id, payload) VALUES (?, ?) "
+                "ON CONFLICT(session_id) DO UPDATE SET payload = excluded.payload",
+                (session_id, payload),
+            )
+            self._enforce_limits(conn, session_id)
+
+    def load_memory(self, session_id: str) -> Optional[Dict]:
+        row = self._connection().execute("SELECT payload FROM session_memory WHERE session_id = ?",
+                                         (session_id,)).fetchone()
+        return json.loads(zlib.decompress(row[0])) if row else None
+
+    def touch(self, session_id: str):
+        """세션 사용 시각 갱신 (유휴 정리 대상에서 제외, 챗봇 페이지를 그릴 때마다 호출)"""
+        self._connection().execute("UPDATE sessions SET last_active = ? WHERE session_id = ?", (time.time(), session_id))
+
+    def clear(self, session_id: str):
+        conn = self._connection()
+        with conn:
+            conn.execute("BEGIN IMMEDIATE")
+            conn.execute("DELETE FROM messages WHERE session_id = ?", (session_id,))
+            conn.execute("DELETE FROM session_memory WHERE session_id = ?", (session_id,))
+            conn.execute("DELETE FROM sessions WHERE session_id = ?", (session_id,))
+
+    def evict_idle(self, now: Optional[float] = None) -> int:
+        """idle_seconds 동안 사용하지 않은 세션 삭제, 삭제한 세션 수 반환"""
+        now = now or time.time()
+        self._evicted_at = now
+        cutoff = now - self.idle_seconds
+        conn = self._connection()
+        with conn:
+            conn.execute("BEGIN IMMEDIATE")
+            conn.execute("DELETE FROM messages WHERE session_id IN "
+                         "(SELECT session_id FROM sessions WHERE last_active < ?)", (cutoff,))
+            conn.execute("DELETE FROM session_memory WHERE session_id IN "
+                         "(SELECT session_id FROM sessions WHERE last_active < ?)", (cutoff,))
+            return conn.execute("DELETE FROM sessions WHERE last_active < ?", (cutoff,)).rowcount
@@ -0,0 +1,240 @@
+"""회사(source)별 샤드 인덱스와 검색 라우터
+
+모든 덱을 하나의 ppt_documents_collection에 넣으면 회사 필터가 있어도 전체 컬렉션에 where 절을 적용해야 하고,
+한 회사 보고서만 바뀌어도 전체 인덱스를 다시 만들어야 합니다. 샤드 구조에서는 회사마다 독립된 스냅샷을 둡니다.
+
+디렉터리 구조 (샤드마다 index_snapshots.SnapshotStore와 같은 형식):
+    data/index/shards/<SOURCE>/CURRENT
+    data/index/shards/<SOURCE>/versions/<버전>/chroma/
+
+검색 (ShardedCollection.query):
+    - where에 source 조건이 있으면 해당 샤드 하나만 검색 (source 조건은 샤드 안에서는 불필요하므로 제거)
+    - 없으면 모든 샤드를 스레드 풀에서 동시에 검색하고 거리 순으로 병합해 상위 n_results개 반환
+    - 쿼리 임베딩은 라우터에서 한 번만 계산해 모든 샤드에 전달
+
+사용 예시 (저장소 루트에서):
+    python code/ppt_processor.py --sharded              # 모든 덱을 회사별 샤드로 적재
+    python code/ppt_processor.py --company CJ           # CJ 샤드만 다시 만들기 (다른 회사 샤드는 그대로,
+                                                        # 아직 샤드가 없는 회사가 있으면 모든 회사 샤드를 함께 만듦)
+    python code/sharding.py list
+"""
+import argparse
+import contextvars
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple
+
+from index_snapshots import INDEX_ROOT, CURRENT_FILE, SnapshotReader, SnapshotStore
+
+SHARD_ROOT = os.path.join(INDEX_ROOT, "shards")
+SHARD_FIELD = "source"
+_RESULT_KEYS = ("ids", "documents", "metadatas", "distances", "embeddings")
+
+def shard_root(source: str, root: str = SHARD_ROOT) -> str:
+    return str(Path(root) / source)
+
+def shard_sources(root: str = SHARD_ROOT) -> List[str]:
+    """게시된 스냅샷이 있는 샤드(회사) 목록"""
+    path = Path(root)
+    if not path.exists():
+        return []
+    return sorted(p.name for p in path.iterdir() if p.is_dir() and (p / CURRENT_FILE).exists())
+
+def missing_shards(chunks: List[Dict], root: str = SHARD_ROOT) -> List[str]:
+    """청크에 있는 회사 중 아직 샤드가 없는 회사 목록"""
+    existing = set(shard_sources(root))
+    return sorted({chunk["metadata"].get(SHARD_FIELD, "") for chunk in chunks} - existing)
+
+def select_shard_chunks(chunks: List[Dict], embeddings, all_chunks: List[Dict], all_embeddings,
+                        root: str = SHARD_ROOT) -> Tuple[List[Dict], object]:
+    """한 회사만 다시 적재할 때 샤드로 게시할 (청크, 임베딩)
+
+       샤드가 하나라도 생기면 서빙(RAG_INDEX_LAYOUT=auto)은 샤드 라우터로 바뀌므로, 통합 컬렉션에서 처음 옮겨 오는 경우처럼
+       다른 회사 샤드가 없으면 다시 처리한 회사만이 아니라 전체 청크(all_chunks)로 모든 샤드를 만듦
+    """
+    reprocessed = {chunk["metadata"].get(SHARD_FIELD, "") for chunk in chunks}
+    others = [source for source in missing_shards(all_chunks, root) if source not in reprocessed]
+    if not others:
+        return chunks, embeddings
+    return all_chunks, all_embeddings
+
+def split_where(where: Optional[Dict]) -> Tuple[Optional[str], Optional[Dict]]:
+    """where 절에서 source 조건을 분리: (회사 이름 또는 None, 나머지 where 절)"""
+    if not where:
+        return None, where
+    conditions = where["$and"] if "$and" in where else [where]
+    source, rest = None, []
+    for condition in conditions:
+        value = condition.get(SHARD_FIELD) if len(condition) == 1 else None
+        if isinstance(value, dict) and set(value) == {"$eq"}:
+            value = value["$eq"]
+        if isinstance(value, str) and source is None:
+            source = value
+        else:
+            rest.append(condition)
+    if not rest:
+        return source, None
+    return source, rest[0] if len(rest) == 1 else {"$and": rest}
+
+def _empty_result(n_queries: int, include: List[str]) -> Dict:
+    result = {"ids": [[] for _ in range(n_queries)]}
+    for key in include:
+        result[key] = [[] for _ in range(n_queries)]
+    return result
+
+def merge_results(results: List[Dict], n_results: int, include: List[str]) -> Dict:
+    """샤드별 query 결과를 질문마다 거리 순으로 병합해 상위 n_results개만 남김"""
+    n_queries = len(results[0]["ids"]) if results else 0
+    merged = _empty_result(n_queries, include)
+    keys = ["ids"] + [key for key in include if key in _RESULT_KEYS]
+    for q in range(n_queries):
+        rows = []
+        for result in results:
+            distances = result["distances"][q]
+            for i, distance in enumerate(distances):
+                rows.append((distance, [result[key][q][i] for key in keys]))
+        rows.sort(key=lambda row: row[0])
+        for _, values in rows[:n_results]:
+            for key, value in zip(keys, values):
+                merged[key][q].append(value)
+    return merged
+
+class ShardedCollection:
+    """샤드 컬렉션 묶음을 하나의 (읽기 전용) 컬렉션처럼 사용하는 라우터
+
+       검색 코드(search_collection, 페이지 색인 등)는 기존 컬렉션과 같은 query/get/count로 호출
+    """
+
+    def __init__(self, shards: Dict[str, object], executor: ThreadPoolExecutor,
+                 embedding_function: Optional[Callable] = None):
+        self.shards = shards
+        self._executor = executor
+        self._embedding_function = embedding_function
+        self.version = tuple(sorted((source, getattr(c, "version", None)) for source, c in shards.items()))
+        self.name = "sharded:" + ",".join(sorted(shards))
+
+    def __repr__(self):
+        return f"ShardedCollection({sorted(self.shards)})"
+
+    def route(self, where: Optional[Dict]) -> Tuple[List[str], Optional[Dict]]:
+        """검색할 샤드 목록과 샤드에 넘길 where 절"""
+        source, rest = split_where(where)
+        if source is None:
+            return sorted(self.shards), where
+        # 없는 회사는 빈 결과 (통합 컬렉션에서 where가 아무것도 찾지 못한 것과 같음)
+        return ([source] if source in self.shards else []), rest
+
+    def _map(self, fn, sources: List[str]) -> List:
+        if len(sources) <= 1:
+            return [fn(source) for source in sources]
+        # 샤드 검색 스레드에서도 요청 추적(span)이 이어지도록 컨텍스트 복사
+        futures = [self._executor.submit(contextvars.copy_context().run, fn, source) for source in sources]
+        return [future.result() for future in futures]
+
+    def query(self, query_embeddings=None, query_texts=None, n_results: int = 10, where: Optional[Dict] = None,
+              include: Optional[List[str]] = None, **kwargs) -> Dict:
+        include = list(include or ["metadatas", "documents", "distances"])
+        if "distances" not in include:
+            include.append("distances")  # 병합 기준
+        if query_embeddings is None:
+            query_embeddings = self._embedding_function(query_texts)
+        sources, shard_where = self.route(where)
+        if not sources:
+            return _empty_result(len(query_embeddings), include)
+
+        def search(source):
+            return self.shards[source].query(query_embeddings=query_embeddings, n_results=n_results,
+                                             where=shard_where, include=include, **kwargs)
+
+        return merge_results(self._map(search, sources), n_results, include)
+
+    def get(self, ids=None, where: Optional[Dict] = None, include: Optional[List[str]] = None, **kwargs) -> Dict:
+        include = list(include or ["metadatas", "documents"])
+        sources, shard_where = self.route(where)
+        merged = {"ids": []}
+        merged.update({key: [] for key in include})
+        for result in self._map(lambda source: self.shards[source].get(ids=ids, where=shard_where,
+                                                                         include=include, **kwargs), sources):
+            for key in merged:
+                merged[key].extend(result.get(key) or [])
+        return merged
+
+    def count(self) -> int:
+        return sum(collection.count() for collection in self.shards.values())
+
+class ShardRouter:
+    """샤드별 SnapshotReader를 관리하고 현재 스냅샷들로 ShardedCollection을 구성
+
+       - check_interval 안에서는 잠금 없이 마지막으로 구성한 컬렉션 반환 (SnapshotReader와 같은 방식)
+       - check_interval마다 한 스레드만 새로 생긴 샤드 디렉터리와 샤드별 CURRENT 변경을 확인하고,
+         바뀐 샤드가 있을 때만 컬렉션을 새로 구성
+    """
+
+    def __init__(self, open_collection: Callable[[object], object], root: str = SHARD_ROOT,
+                 check_interval: float = 5.0, max_workers: Optional[int] = None,
+                 embedding_function: Optional[Callable] = None):
+        self.root = root
+        self._open_collection = open_collection
+        self.check_interval = check_interval
+        self._embedding_function = embedding_function
+        self._readers: Dict[str, SnapshotReader] = {}
+        self._executor = ThreadPoolExecutor(max_workers=max_workers or 8, thread_name_prefix="shard-search")
+        self._collection: Optional[ShardedCollection] = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+
+    def _scan(self):
+        for source in shard_sources(self.root):
+            if source not in self._readers:
+                self._readers[source] = SnapshotReader(self._open_collection, root=shard_root(source, self.root),
+                                                       check_interval=self.check_interval)
+
+    def collection(self) -> ShardedCollection:
+        """현재 샤드 스냅샷들로 구성한 컬렉션 (구성 샤드가 바뀌지 않았으면 같은 객체 재사용)"""
+        current = self._collection
+        if current is not None and (time.monotonic() - self._checked_at < self.check_interval or self._lock.locked()):
+            # 다른 스레드가 샤드를 확인하는 중이면 기다리지 않고 현재 컬렉션 사용
+            return current
+        self.refresh()
+        return self._collection
+
+    def refresh(self) -> bool:
+        """새 샤드와 샤드별 스냅샷 교체를 확인하고, 구성 샤드가 바뀌었으면 컬렉션 교체 (교체 여부 반환)"""
+        with self._lock:
+            self._checked_at = time.monotonic()
+            self._scan()
+            if not self._readers:
+                raise FileNotFoundError(f"게시된 샤드 인덱스가 없습니다: {self.root}")
+            shards = {source: reader.collection() for source, reader in self._readers.items()}
+            current = self._collection
+            if current is not None and len(current.shards) == len(shards) \
+                    and all(current.shards.get(s) is c for s, c in shards.items()):
+                return False
+            embedding_function = self._embedding_function
+            if embedding_function is None:
+                embedding_function = getattr(next(iter(shards.values())), "_embedding_function", None)
+            self._collection = ShardedCollection(shards, self._executor, embedding_function)
+            return True
+
+def main():
+    parser = argparse.ArgumentParser(description="회사별 샤드 인덱스 확인")
+    parser.add_argument("--root", default=SHARD_ROOT)
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    subparsers.add_parser("list", help="샤드별 현재 스냅샷")
+    args = parser.parse_args()
+
+    if args.command == "list":
+        sources = shard_sources(args.root)
+        if not sources:
+            print(f"샤드가 없습니다: {args.root}")
+        for source in sources:
+            store = SnapshotStore(shard_root(source, args.root))
+            version = store.current_version()
+            manifest = store.manifest(version) if version else {}
+            print(f"{source:<10} {version}  청크 {manifest.get('count', '?')}개  (보관 중인 버전 {len(store.versions())}개)")
+
+if __name__ == "__main__":
+    main()
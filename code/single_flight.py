@@ -0,0 +1,223 @@
+"""프로세스 전역 single-flight 요청 병합
+
+같은 질문(정규화된 질문 + 필터 + 모델 ID)이 동시에 여러 세션에서 들어오면
+파이프라인은 한 번만 실행하고 나머지 요청은 그 결과(또는 토큰 스트림)를 공유합니다.
+이미 끝난 요청의 결과는 캐시하지 않습니다. 실행 중인 요청에만 합류합니다.
+"""
+import json
+import re
+import threading
+import time
+import unicodedata
+from typing import Any, Callable, Dict, Iterable, Iterator, Optional, Tuple
+
+from tracing import REGISTRY
+
+FLIGHT_REQUESTS = REGISTRY.counter("rag_single_flight_requests_total",
+                                   "single-flight 요청 수 (role=leader|follower)")
+FLIGHTS_IN_PROGRESS = REGISTRY.gauge("rag_single_flight_in_progress", "실행 중인 single-flight 호출 수")
+FLIGHT_TIMEOUTS = REGISTRY.counter("rag_single_flight_timeouts_total",
+                                   "실행 중인 호출을 기다리다 timeout이 지난 follower 수")
+
+class FlightTimeout(TimeoutError):
+    """follower가 timeout 안에 실행 중인 호출의 결과(스트림이면 첫 항목)를 받지 못함"""
+
+def normalize_query(query: str) -> str:
+    """유니코드 정규화, 소문자 변환, 공백 정리 후 끝의 문장부호 제거"""
+    text = unicodedata.normalize("NFKC", query).lower()
+    text = re.sub(r"\s+", " ", text).strip()
+    return text.rstrip("?!.。 ")
+
+def make_key(query: str, metadata_filters: Optional[Dict[str, str]], model: str) -> str:
+    """정규화된 질문, 메타데이터 필터, 모델 ID로 병합 키 생성"""
+    filters = json.dumps(metadata_filters or {}, sort_keys=True, ensure_ascii=False)
+    return f"{model}\x1f{filters}\x1f{normalize_query(query)}"
+
+class _Call:
+    """실행 중인 단일 호출 (결과를 기다리는 요청들이 공유)"""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result: Any = None
+        self.error: Optional[BaseException] = None
+
+class _StreamCall:
+    """실행 중인 스트리밍 호출 (생성된 항목을 모든 구독자에게 순서대로 재생)
+
+       구독자가 모두 떠나면 cancelled가 되어 생산 스레드가 fn()의 스트림을 닫음
+    """
+
+    def __init__(self, group: str):
+        self.group = group
+        self.items = []
+        self.finished = False
+        self.cancelled = False
+        self.subscribers = 0
+        self.error: Optional[BaseException] = None
+        self.cond = threading.Condition()
+
+    def subscribe(self, timeout: Optional[float] = None) -> Optional["_Subscription"]:
+        """구독자로 등록, 이미 취소된 호출이면 None (timeout: 첫 항목을 기다릴 최대 시간)"""
+        with self.cond:
+            if self.cancelled:
+                return None
+            self.subscribers += 1
+        return _Subscription(self, None if timeout is None else time.monotonic() + timeout)
+
+    def unsubscribe(self):
+        with self.cond:
+            self.subscribers -= 1
+            if self.subscribers == 0 and not self.finished:
+                self.cancelled = True
+                self.items = []
+
+class _Subscription:
+    """_StreamCall 구독 하나 (끝까지 읽거나 close하거나 GC되면 구독 해제)
+
+       deadline(time.monotonic 기준)까지 첫 항목이 오지 않으면 구독을 해제하고 FlightTimeout
+       (첫 항목 이후에는 생산 쪽 호출의 timeout으로 스트림이 끝나므로 기다림을 제한하지 않음)
+    """
+
+    def __init__(self, call: _StreamCall, deadline: Optional[float] = None):
+        self._call = call
+        self._index = 0
+        self._closed = False
+        self._deadline = deadline
+
+    def __iter__(self) -> "_Subscription":
+        return self
+
+    def __next__(self):
+        call = self._call
+        with call.cond:
+            if self._closed:
+                raise StopIteration
+            timed_out = False
+            while self._index >= len(call.items) and not call.finished:
+                remaining = None
+                if self._deadline is not None and self._index == 0:
+                    remaining = self._deadline - time.monotonic()
+                    if remaining <= 0:
+                        timed_out = True
+                        break
+                call.cond.wait(remaining)
+            if not timed_out and self._index < len(call.items):
+                item = call.items[self._index]
+                self._index += 1
+                return item
+            error = call.error
+        self.close()
+        if timed_out:
+            FLIGHT_TIMEOUTS.inc(group=call.group, kind="stream")
+            raise FlightTimeout("실행 중인 스트림의 첫 항목을 기다리다 시간이 초과되었습니다.")
+        if error is not None:
+            raise error
+        raise StopIteration
+
+    def close(self):
+        # 조건 변수는 RLock이라 GC가 잠금을 잡은 스레드에서 __del__을 불러도 교착되지 않음
+        with self._call.cond:
+            if self._closed:
+                return
+            self._closed = True
+        self._call.unsubscribe()
+
+    __del__ = close
+
+class SingleFlight:
+    """키별로 동시에 하나의 호출만 실행하는 single-flight 그룹"""
+
+    def __init__(self, name: str = "default"):
+        self.name = name
+        self._lock = threading.Lock()
+        self._calls: Dict[str, _Call] = {}
+        self._streams: Dict[str, _StreamCall] = {}
+
+    def do(self, key: str, fn: Callable[[], Any], timeout: Optional[float] = None) -> Tuple[Any, bool]:
+        """fn()을 실행하거나, 같은 키로 실행 중인 호출이 있으면 그 결과를 기다림
+
+           timeout: follower가 결과를 기다릴 최대 시간(초), 지나면 FlightTimeout (None이면 끝까지 대기)
+           반환: (결과, 다른 요청의 결과를 공유했는지 여부)
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = _Call()
+                self._calls[key] = call
+
+        FLIGHT_REQUESTS.inc(group=self.name, kind="do", role="leader" if leader else "follower")
+        if not leader:
+            if not call.done.wait(timeout):
+                FLIGHT_TIMEOUTS.inc(group=self.name, kind="do")
+                raise FlightTimeout(f"실행 중인 호출의 결과를 {timeout:.1f}초 안에 받지 못했습니다.")
+            if call.error is not None:
+                raise call.error
+            return call.result, True
+
+        FLIGHTS_IN_PROGRESS.inc(group=self.name)
+        try:
+            call.result = fn()
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+            FLIGHTS_IN_PROGRESS.dec(group=self.name)
+        return call.result, False
+
+    def stream(self, key: str, fn: Callable[[], Iterable], timeout: Optional[float] = None) -> Tuple[Iterator, bool]:
+        """fn()이 반환하는 스트림을 같은 키의 모든 요청이 공유
+
+           생성은 백그라운드 스레드에서 진행되므로 먼저 온 요청이 중간에 연결을 끊어도
+           나머지 요청은 끝까지 스트림을 받을 수 있음. 구독자가 모두 떠나면 fn()의 스트림을 닫음.
+           timeout: follower가 첫 항목을 기다릴 최대 시간(초), 지나면 반복 중에 FlightTimeout
+           반환: (항목 이터레이터, 다른 요청의 스트림에 합류했는지 여부)
+        """
+        with self._lock:
+            call = self._streams.get(key)
+            subscription = call.subscribe(timeout) if call is not None else None
+            leader = subscription is None
+            if leader:
+                # 구독자가 모두 떠나 정리 중인 호출에는 합류하지 않고 새로 실행
+                call = _StreamCall(self.name)
+                subscription = call.subscribe()
+                self._streams[key] = call
+
+        FLIGHT_REQUESTS.inc(group=self.name, kind="stream", role="leader" if leader else "follower")
+        if leader:
+            FLIGHTS_IN_PROGRESS.inc(group=self.name)
+            threading.Thread(target=self._produce, args=(key, call, fn),
+                             name=f"single-flight-{self.name}", daemon=True).start()
+        return subscription, not leader
+
+    def _produce(self, key: str, call: _StreamCall, fn: Callable[[], Iterable]):
+        stream = None
+        try:
+            if not call.cancelled:
+                stream = iter(fn())
+                for item in stream:
+                    with call.cond:
+                        if call.cancelled:
+                            break
+                        call.items.append(item)
+                        call.cond.notify_all()
+        except BaseException as e:
+            call.error = e
+        finally:
+            # 구독자가 모두 떠났으면 생성을 멈춤 (LLM 호출, 입장 슬롯 정리는 스트림의 finally에서)
+            close = getattr(stream, "close", None)
+            if close is not None:
+                try:
+                    close()
+                except Exception as e:
+                    call.error = call.error or e
+            with self._lock:
+                if self._streams.get(key) is call:
+                    del self._streams[key]
+            with call.cond:
+                call.finished = True
+                call.cond.notify_all()
+            FLIGHTS_IN_PROGRESS.dec(group=self.name)
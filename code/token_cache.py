@@ -0,0 +1,290 @@
+"""청크 토큰화 결과 캐시 (적재 시 생성, 메모리 맵 로드)
+
+재순위화는 질문마다 후보 청크 20개를 질문과 함께 다시 토큰화하지만, 청크 텍스트는 적재할 때만 바뀝니다.
+적재 시 청크마다 토크나이저 출력(특수 토큰 없는 input_ids)을 저장해 두고, 검색 시에는 질문만 토큰화한 뒤
+캐시된 청크 토큰과 이어 붙여(prepare_for_model: [CLS] 질문 [SEP] 청크 [SEP], longest_first 자르기) 모델에 넣습니다.
+결과 입력은 tokenizer(pairs, padding=True, truncation=True)와 같습니다.
+
+디렉터리 구조 (기본 outputs/token_cache/<토크나이저 이름, '/'는 '__'>):
+    meta.json     토크나이저 이름, 어휘 크기, 청크 수, 토큰 dtype
+    keys.npy      S32 (n,)    청크 텍스트 해시 (blake2b 16바이트, 16진 문자열), 정렬됨
+    offsets.npy   int64 (n + 1,)
+    ids.bin       uint16 또는 int32 토큰 id를 이어 붙인 배열 (청크 i = ids[offsets[i]:offsets[i + 1]])
+
+cross-encoder 토크나이저가 기본이고, --tokenizer로 임베딩 모델 토크나이저 캐시도 같은 형식으로 만들 수 있습니다.
+캐시에 없는 청크(적재 이후 바뀐 컬렉션 등)는 그 자리에서 토큰화합니다.
+적재는 디렉터리를 통째로 다시 만들므로, 서빙 쪽은 TokenCacheReader로 열어 바뀌면 재시작 없이 새 캐시로 교체합니다.
+
+사용 예시 (저장소 루트에서):
+    python code/token_cache.py build
+    python code/token_cache.py build --tokenizer jhgan/ko-sroberta-multitask
+    python code/token_cache.py info
+"""
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import threading
+import time
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+TOKEN_CACHE_ROOT = "./outputs/token_cache"
+CROSS_ENCODER_MODEL = "cross-encoder/ms-marco-MiniLM-L-6-v2"
+FORMAT_VERSION = 1
+MAX_CHUNK_TOKENS = 512  # 모델 최대 길이보다 긴 청크 토큰은 어차피 잘리므로 저장하지 않음
+
+def chunk_hash(text: str) -> bytes:
+    # 16진 문자열로 저장 (numpy 고정 길이 bytes는 끝의 0 바이트를 잘라 원시 digest는 비교가 어긋날 수 있음)
+    return hashlib.blake2b(text.encode("utf-8"), digest_size=16).hexdigest().encode("ascii")
+
+def cache_path(tokenizer_name: str, root: str = TOKEN_CACHE_ROOT) -> str:
+    return str(Path(root) / tokenizer_name.replace("/", "__"))
+
+def load_tokenizer(name: str):
+    from transformers import AutoTokenizer
+
+    return AutoTokenizer.from_pretrained(name)
+
+def build_token_cache(texts: Sequence[str], tokenizer, path: str, tokenizer_name: str,
+                      max_tokens: int = MAX_CHUNK_TOKENS, batch_size: int = 256,
+                      reuse: Optional["TokenCache"] = None) -> str:
+    """청크 텍스트를 토큰화해 캐시 디렉터리에 저장 (같은 텍스트는 한 번만, 임시 디렉터리에 쓴 뒤 교체)
+
+       reuse: 같은 토크나이저의 기존 캐시에 있는 청크는 다시 토큰화하지 않고 복사 (한 회사만 다시 적재할 때)
+    """
+    unique: Dict[bytes, str] = {}
+    for text in texts:
+        unique.setdefault(chunk_hash(text), text)
+    keys = sorted(unique)
+
+    tokens: Dict[bytes, List[int]] = {}
+    if reuse is not None and reuse.tokenizer_name == tokenizer_name and reuse.meta.get("max_tokens") == max_tokens:
+        for key in keys:
+            ids = reuse.get(unique[key])
+            if ids is not None:
+                tokens[key] = ids.tolist()
+    missing = [key for key in keys if key not in tokens]
+    for start in range(0, len(missing), batch_size):
+        batch = missing[start:start + batch_size]
+        encoded = tokenizer([unique[key] for key in batch], add_special_tokens=False, truncation=True,
+                            max_length=max_tokens)["input_ids"]
+        tokens.update(zip(batch, encoded))
+    token_lists = [tokens[key] for key in keys]
+
+    dtype = np.uint16 if len(tokenizer) <= np.iinfo(np.uint16).max + 1 else np.int32
+    offsets = np.zeros(len(keys) + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum([len(ids) for ids in token_lists])
+
+    target = Path(path)
+    staging = target.with_name(f".{target.name}.{os.getpid()}.tmp")
+    shutil.rmtree(staging, ignore_errors=True)
+    staging.mkdir(parents=True)
+    np.save(staging / "keys.npy", np.array(keys, dtype="S32"))
+    np.save(staging / "offsets.npy", offsets)
+    np.concatenate([np.asarray(ids, dtype=dtype) for ids in token_lists] or [np.zeros(0, dtype=dtype)]) \
+        .tofile(staging / "ids.bin")
+    with open(staging / "meta.json", "w", encoding="utf-8") as f:
+        json.dump({"format_version": FORMAT_VERSION, "tokenizer": tokenizer_name, "vocab_size": len(tokenizer),
+                   "count": len(keys), "dtype": np.dtype(dtype).name, "max_tokens": max_tokens}, f, indent=2)
+
+    if target.exists():
+        shutil.rmtree(target)
+    os.rename(staging, target)
+    return str(target)
+
+class TokenCache:
+    """청크 해시 → 캐시된 input_ids (배열은 메모리 맵)"""
+
+    def __init__(self, path: str):
+        self.path = Path(path)
+        with open(self.path / "meta.json", encoding="utf-8") as f:
+            self.meta = json.load(f)
+        if self.meta.get("format_version") != FORMAT_VERSION:
+            raise ValueError(f"지원하지 않는 토큰 캐시 형식입니다: {self.meta.get('format_version')}")
+        self.keys = np.load(self.path / "keys.npy", mmap_mode="r")
+        self.offsets = np.load(self.path / "offsets.npy", mmap_mode="r")
+        size = os.path.getsize(self.path / "ids.bin")
+        self.ids = (np.memmap(self.path / "ids.bin", dtype=self.meta["dtype"], mode="r")
+                    if size else np.zeros(0, dtype=self.meta["dtype"]))
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def tokenizer_name(self) -> str:
+        return self.meta["tokenizer"]
+
+    def __len__(self) -> int:
+        return self.meta["count"]
+
+    def get(self, text: str) -> Optional[np.ndarray]:
+        """청크 텍스트의 input_ids (없으면 None), 키는 정렬되어 있으므로 이진 탐색"""
+        key = chunk_hash(text)
+        position = int(np.searchsorted(self.keys, key))
+        if position < len(self.keys) and self.keys[position] == key:
+            self.hits += 1
+            return self.ids[self.offsets[position]:self.offsets[position + 1]]
+        self.misses += 1
+        return None
+
+class CachedPairEncoder:
+    """(질문, 청크 목록) → 모델 입력 텐서 (질문만 토큰화하고 청크는 캐시 사용)"""
+
+    def __init__(self, tokenizer, cache: TokenCache, max_length: Optional[int] = None):
+        self.tokenizer = tokenizer
+        self.cache = cache
+        self.max_length = max_length or min(tokenizer.model_max_length, MAX_CHUNK_TOKENS)
+        self._budget = self.max_length - tokenizer.num_special_tokens_to_add(pair=True)
+        # 미리 토큰화한 입력을 pad하는 것이 의도된 사용이므로 fast 토크나이저 안내 경고 생략
+        tokenizer.deprecation_warnings["Asking-to-pad-a-fast-tokenizer"] = True
+
+    def _truncate(self, query_ids: List[int], chunk_ids: List[int]) -> Tuple[List[int], List[int]]:
+        """longest_first 자르기 (토크나이저와 같은 규칙, 쌍마다 나오는 경고 없이)
+
+           - fast 토크나이저(tokenizers): 짧은 쪽을 예산의 절반까지 남기고 나머지는 긴 쪽 (홀수 예산이면 긴 쪽이 1개 더)
+           - slow 토크나이저(transformers truncate_sequences): 긴 쪽부터 하나씩 자르고 길이가 같으면 청크 쪽부터
+        """
+        budget = self._budget
+        if len(query_ids) + len(chunk_ids) <= budget:
+            return query_ids, chunk_ids
+        if self.tokenizer.is_fast:
+            if len(query_ids) > len(chunk_ids):
+                chunk_keep = min(len(chunk_ids), budget // 2)
+                query_keep = budget - chunk_keep
+            else:
+                query_keep = min(len(query_ids), budget // 2)
+                chunk_keep = budget - query_keep
+            return query_ids[:query_keep], chunk_ids[:chunk_keep]
+        remove = len(query_ids) + len(chunk_ids) - budget
+        first = min(abs(len(chunk_ids) - len(query_ids)), remove)
+        second = remove - first
+        if len(query_ids) > len(chunk_ids):
+            query_remove, chunk_remove = first + second // 2, second - second // 2
+        else:
+            query_remove, chunk_remove = second // 2, first + second - second // 2
+        return query_ids[:len(query_ids) - query_remove], chunk_ids[:len(chunk_ids) - chunk_remove]
+
+    def _chunk_ids(self, text: str) -> List[int]:
+        ids = self.cache.get(text)
+        if ids is None:
+            return self.tokenizer(text, add_special_tokens=False)["input_ids"]
+        return ids.tolist()
+
+    def encode(self, jobs: Sequence[Tuple[str, Sequence[str]]]):
+        """여러 (질문, 청크 목록)을 하나의 패딩된 배치로 변환 (작업 순서대로 쌍이 이어짐)"""
+        features = []
+        for query, documents in jobs:
+            query_ids = self.tokenizer(query, add_special_tokens=False)["input_ids"]
+            for document in documents:
+                features.append(self.tokenizer.prepare_for_model(*self._truncate(query_ids, self._chunk_ids(document))))
+        return self.tokenizer.pad(features, padding=True, return_tensors="pt")
+
+class CachedCrossEncoderScorer:
+    """토큰 캐시를 사용하는 CrossEncoder.predict 대체 (같은 활성화 함수 적용, numpy 반환)"""
+
+    def __init__(self, cross_encoder, cache: TokenCache):
+        self.cross_encoder = cross_encoder
+        self.encoder = CachedPairEncoder(cross_encoder.tokenizer, cache, cross_encoder.max_length)
+
+    def predict(self, jobs: Sequence[Tuple[str, Sequence[str]]]) -> np.ndarray:
+        import torch
+
+        features = self.encoder.encode(jobs).to(self.cross_encoder.model.device)
+        with torch.inference_mode():
+            logits = self.cross_encoder.model(**features, return_dict=True).logits
+            scores = self.cross_encoder.activation_fn(logits)
+        if scores.ndim > 1 and scores.shape[1] == 1:
+            scores = scores[:, 0]
+        return scores.float().cpu().numpy()
+
+def open_token_cache(tokenizer_name: str, root: Optional[str] = None) -> Optional[TokenCache]:
+    """토크나이저의 캐시가 있으면 열기 (RAG_TOKEN_CACHE=0이면 사용 안 함, 경로는 RAG_TOKEN_CACHE_ROOT)"""
+    if os.getenv("RAG_TOKEN_CACHE", "1") == "0":
+        return None
+    path = cache_path(tokenizer_name, root or os.getenv("RAG_TOKEN_CACHE_ROOT", TOKEN_CACHE_ROOT))
+    if not Path(path, "meta.json").exists():
+        return None
+    cache = TokenCache(path)
+    if cache.tokenizer_name != tokenizer_name:
+        print(f"토큰 캐시의 토크나이저({cache.tokenizer_name})가 달라 사용하지 않습니다: {path}")
+        return None
+    return cache
+
+class TokenCacheReader:
+    """토크나이저의 캐시를 열어 두고, 적재로 다시 만들어지면 새 캐시로 교체 (SnapshotReader와 같은 방식)
+
+       check_interval마다 meta.json의 파일 정보(inode, 수정 시각, 크기)를 확인하고, 바뀌었으면 다시 엶
+       (서빙 시작 후에 처음 만들어진 캐시도 사용, 열지 못하면 기존 캐시를 계속 사용)
+    """
+
+    def __init__(self, tokenizer_name: str, root: Optional[str] = None, check_interval: float = 5.0):
+        self.tokenizer_name = tokenizer_name
+        self.root = root
+        self.check_interval = check_interval
+        self._cache: Optional[TokenCache] = None
+        self._signature = None
+        self._checked_at: Optional[float] = None
+        self._lock = threading.Lock()
+
+    def _meta_signature(self):
+        path = Path(cache_path(self.tokenizer_name, self.root or os.getenv("RAG_TOKEN_CACHE_ROOT", TOKEN_CACHE_ROOT)))
+        try:
+            stat = (path / "meta.json").stat()
+        except FileNotFoundError:
+            return None
+        return stat.st_ino, stat.st_mtime_ns, stat.st_size
+
+    def cache(self) -> Optional[TokenCache]:
+        """현재 캐시 (없으면 None, check_interval마다 변경 여부 확인)"""
+        checked_at = self._checked_at
+        if checked_at is not None and (time.monotonic() - checked_at < self.check_interval or self._lock.locked()):
+            # 다른 스레드가 새 캐시를 여는 중이면 기다리지 않고 현재 캐시 사용
+            return self._cache
+        self.refresh()
+        return self._cache
+
+    def refresh(self) -> bool:
+        """캐시 디렉터리가 바뀌었으면 다시 열기, 교체 여부 반환"""
+        with self._lock:
+            self._checked_at = time.monotonic()
+            signature = self._meta_signature()
+            if signature == self._signature:
+                return False
+            try:
+                cache = open_token_cache(self.tokenizer_name, self.root) if signature is not None else None
+            except Exception as e:
+                print(f"토큰 캐시를 다시 열 수 없어 기존 캐시를 계속 사용합니다: {e}")
+                return False
+            self._cache, self._signature = cache, signature
+            return True
+
+def main():
+    from chunk_store import CHUNK_STORE_PATH, ChunkStore
+
+    parser = argparse.ArgumentParser(description="청크 토큰화 결과 캐시 생성/확인")
+    parser.add_argument("--root", default=TOKEN_CACHE_ROOT)
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    build_parser = subparsers.add_parser("build", help="청크 저장소의 모든 청크를 토큰화해 저장")
+    build_parser.add_argument("--store", default=CHUNK_STORE_PATH)
+    build_parser.add_argument("--tokenizer", default=CROSS_ENCODER_MODEL, help="토크나이저 (기본: 재순위화 cross-encoder)")
+    info_parser = subparsers.add_parser("info", help="캐시 요약")
+    info_parser.add_argument("--tokenizer", default=CROSS_ENCODER_MODEL)
+    args = parser.parse_args()
+
+    path = cache_path(args.tokenizer, args.root)
+    if args.command == "build":
+        texts = ChunkStore(args.store).texts()
+        build_token_cache(texts, load_tokenizer(args.tokenizer), path, args.tokenizer)
+        print(f"청크 {len(texts)}개의 {args.tokenizer} 토큰을 {path}에 저장했습니다.")
+    elif args.command == "info":
+        cache = TokenCache(path)
+        lengths = np.diff(np.asarray(cache.offsets))
+        size = sum(p.stat().st_size for p in cache.path.iterdir())
+        print(f"{cache.tokenizer_name}: 청크 {len(cache)}개, 토큰 {lengths.sum()}개 "
+              f"(평균 {lengths.mean() if len(lengths) else 0:.0f}, 최대 {lengths.max() if len(lengths) else 0}), {size / 1024:.0f}KB")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,395 @@
+"""RAG 파이프라인 요청 단위 추적(span)과 메트릭
+
+각 단계(질문 확장, 쿼리 임베딩, 벡터 검색, 재순위화, 응답 생성)를 span으로 감싸
+소요 시간, 후보 문서 수, 토큰 수, 캐시 적중 여부를 기록합니다.
+
+- 요청 하나가 끝나면 전체 span을 JSON 한 줄로 `rag.trace` 로거에 남깁니다.
+- 단계별 지연 시간 히스토그램 등은 Prometheus 텍스트 형식으로 내보냅니다.
+
+환경 변수:
+    RAG_TRACE_LOG     JSON 로그를 기록할 파일 경로 ("-"이면 stderr)
+    RAG_METRICS_FILE  요청이 끝날 때마다 Prometheus 메트릭을 덮어쓸 파일 경로
+    RAG_METRICS_PORT  Prometheus 메트릭 HTTP 엔드포인트 포트 (/metrics)
+"""
+import json
+import logging
+import os
+import sys
+import threading
+import time
+import uuid
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from contextvars import ContextVar, Token
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Tuple
+
+logger = logging.getLogger("rag.trace")
+
+# 지연 시간 히스토그램 버킷 (초)
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+# 후보 문서 수 히스토그램 버킷
+COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100)
+
+def _label_key(labels: Dict[str, str]) -> Tuple[Tuple[str, str], ...]:
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def _format_labels(key: Tuple[Tuple[str, str], ...], extra: Optional[Tuple[str, str]] = None) -> str:
+    items = list(key) + ([extra] if extra else [])
+    if not items:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in items) + "}"
+
+class _Metric(ABC):
+    type_name = ""
+
+    def __init__(self, name: str, help_text: str):
+        self.name = name
+        self.help_text = help_text
+        self._lock = threading.Lock()
+
+    def render(self) -> List[str]:
+        return [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} {self.type_name}"] + self._render_samples()
+
+    @abstractmethod
+    def _render_samples(self) -> List[str]:
+        """메트릭 종류별 샘플 줄 (HELP/TYPE 줄 제외)"""
+
+class Counter(_Metric):
+    type_name = "counter"
+
+    def __init__(self, name: str, help_text: str):
+        super().__init__(name, help_text)
+        self._values: Dict[Tuple, float] = {}
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = _label_key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels) -> float:
+        with self._lock:
+            return self._values.get(_label_key(labels), 0.0)
+
+    def _render_samples(self) -> List[str]:
+        with self._lock:
+            return [f"{self.name}{_format_labels(k)} {v}" for k, v in sorted(self._values.items())]
+
+class Gauge(_Metric):
+    type_name = "gauge"
+
+    def __init__(self, name: str, help_text: str):
+        super().__init__(name, help_text)
+        self._values: Dict[Tuple, float] = {}
+
+    def set(self, value: float, **labels):
+        with self._lock:
+            self._values[_label_key(labels)] = value
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = _label_key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def dec(self, amount: float = 1.0, **labels):
+        self.inc(-amount, **labels)
+
+    def value(self, **labels) -> float:
+        with self._lock:
+            return self._values.get(_label_key(labels), 0.0)
+
+    def _render_samples(self) -> List[str]:
+        with self._lock:
+            return [f"{self.name}{_format_labels(k)} {v}" for k, v in sorted(self._values.items())]
+
+class Histogram(_Metric):
+    type_name = "histogram"
+
+    def __init__(self, name: str, help_text: str, buckets=LATENCY_BUCKETS):
+        super().__init__(name, help_text)
+        self.buckets = tuple(sorted(buckets))
+        # 레이블별 [버킷별 누적 개수..., +Inf 개수], 합계
+        self._counts: Dict[Tuple, List[int]] = {}
+        self._sums: Dict[Tuple, float] = {}
+
+    def observe(self, value: float, **labels):
+        key = _label_key(labels)
+        with self._lock:
+            counts = self._counts.setdefault(key, [0] * (len(self.buckets) + 1))
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+            counts[-1] += 1
+            self._sums[key] = self._sums.get(key, 0.0) + value
+
+    def count(self, **labels) -> int:
+        with self._lock:
+            counts = self._counts.get(_label_key(labels))
+            return counts[-1] if counts else 0
+
+    def _render_samples(self) -> List[str]:
+        lines = []
+        with self._lock:
+            for key in sorted(self._counts):
+                counts = self._counts[key]
+                for bound, n in zip(self.buckets, counts):
+                    lines.append(f"{self.name}_bucket{_format_labels(key, ('le', repr(float(bound))))} {n}")
+                lines.append(f"{self.name}_bucket{_format_labels(key, ('le', '+Inf'))} {counts[-1]}")
+                lines.append(f"{self.name}_sum{_format_labels(key)} {self._sums[key]}")
+                lines.append(f"{self.name}_count{_format_labels(key)} {counts[-1]}")
+        return lines
+
+class MetricsRegistry:
+    """프로세스 전역 메트릭 저장소"""
+
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+        self._lock = threading.Lock()
+
+    def _get_or_create(self, cls, name, help_text, **kwargs):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = cls(name, help_text, **kwargs)
+                self._metrics[name] = metric
+            return metric
+
+    def counter(self, name: str, help_text: str) -> Counter:
+        return self._get_or_create(Counter, name, help_text)
+
+    def gauge(self, name: str, help_text: str) -> Gauge:
+        return self._get_or_create(Gauge, name, help_text)
+
+    def histogram(self, name: str, help_text: str, buckets=LATENCY_BUCKETS) -> Histogram:
+        return self._get_or_create(Histogram, name, help_text, buckets=buckets)
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+REGISTRY = MetricsRegistry()
+
+STAGE_LATENCY = REGISTRY.histogram("rag_stage_duration_seconds", "RAG 파이프라인 단계별 소요 시간(초)")
+STAGE_ERRORS = REGISTRY.counter("rag_stage_errors_total", "RAG 파이프라인 단계별 오류 수")
+CANDIDATES = REGISTRY.histogram("rag_stage_candidates", "단계별 후보 문서 수", buckets=COUNT_BUCKETS)
+TOKENS = REGISTRY.counter("rag_tokens_total", "LLM 호출 토큰 수 (kind=prompt|completion)")
+CACHE_REQUESTS = REGISTRY.counter("rag_cache_requests_total", "캐시 조회 수 (result=hit|miss)")
+
+@dataclass
+class Span:
+    name: str
+    start: float
+    parent: Optional[str] = None
+    duration: Optional[float] = None
+    attrs: Dict = field(default_factory=dict)
+
+    def to_dict(self, trace_start: float) -> Dict:
+        return {
+            "name": self.name,
+            "parent": self.parent,
+            "start_ms": round((self.start - trace_start) * 1000, 3),
+            "duration_ms": round((self.duration or 0.0) * 1000, 3),
+            "attrs": self.attrs,
+        }
+
+@dataclass
+class Trace:
+    name: str
+    trace_id: str = field(default_factory=lambda: uuid.uuid4().hex)
+    start: float = field(default_factory=time.perf_counter)
+    wall_start: float = field(default_factory=time.time)
+    duration: Optional[float] = None
+    attrs: Dict = field(default_factory=dict)
+    spans: List[Span] = field(default_factory=list)
+
+    def stage_durations(self) -> Dict[str, float]:
+        """단계 이름별 소요 시간 합계(초)"""
+        totals: Dict[str, float] = {}
+        for s in self.spans:
+            totals[s.name] = totals.get(s.name, 0.0) + (s.duration or 0.0)
+        return totals
+
+    def to_dict(self) -> Dict:
+        return {
+            "trace_id": self.trace_id,
+            "name": self.name,
+            "timestamp": datetime.fromtimestamp(self.wall_start, tz=timezone.utc).isoformat(),
+            "duration_ms": round((self.duration or 0.0) * 1000, 3),
+            "attrs": self.attrs,
+            "spans": [s.to_dict(self.start) for s in self.spans],
+        }
+
+_current_trace: ContextVar[Optional[Trace]] = ContextVar("rag_current_trace", default=None)
+# 현재 열린 span 이름 (새 span의 parent), 스레드 풀로 복사된 컨텍스트마다 따로 이어지므로 병렬 span이 서로 섞이지 않음
+_current_span: ContextVar[Optional[str]] = ContextVar("rag_current_span", default=None)
+
+def reset_quietly(var: ContextVar, token: Token) -> None:
+    """ContextVar 복원, 다른 Context에서 닫히는 제너레이터(GC 등)에서는 reset이 실패하므로 무시"""
+    try:
+        var.reset(token)
+    except ValueError:
+        pass
+
+def current_trace() -> Optional[Trace]:
+    return _current_trace.get()
+
+@contextmanager
+def trace_request(name: str = "request", **attrs):
+    """요청 하나를 감싸는 최상위 추적 컨텍스트
+
+       이미 추적 중이면 새 요청을 만들지 않고 span으로 기록
+    """
+    if _current_trace.get() is not None:
+        with span(name, **attrs):
+            yield _current_trace.get()
+        return
+
+    _configure_exporters()
+    trace = Trace(name=name, attrs=dict(attrs))
+    token = _current_trace.set(trace)
+    span_token = _current_span.set(None)
+    try:
+        yield trace
+    except Exception as e:
+        trace.attrs["error"] = repr(e)
+        STAGE_ERRORS.inc(stage=name)
+        raise
+    finally:
+        trace.duration = time.perf_counter() - trace.start
+        reset_quietly(_current_span, span_token)
+        reset_quietly(_current_trace, token)
+        STAGE_LATENCY.observe(trace.duration, stage=name)
+        _export_trace(trace)
+
+@contextmanager
+def span(name: str, **attrs):
+    """파이프라인 단계 하나를 감싸는 span
+
+       with 블록 안에서 반환된 dict에 속성(후보 수, 토큰 수 등)을 추가할 수 있음
+    """
+    trace = _current_trace.get()
+    s = Span(name=name, start=time.perf_counter(), attrs=dict(attrs))
+    if trace is not None:
+        s.parent = _current_span.get()
+    token = _current_span.set(name)
+    try:
+        yield s.attrs
+    except Exception as e:
+        s.attrs["error"] = repr(e)
+        STAGE_ERRORS.inc(stage=name)
+        raise
+    finally:
+        s.duration = time.perf_counter() - s.start
+        STAGE_LATENCY.observe(s.duration, stage=name)
+        if "candidates" in s.attrs:
+            CANDIDATES.observe(s.attrs["candidates"], stage=name)
+        reset_quietly(_current_span, token)
+        if trace is not None:
+            trace.spans.append(s)
+
+def record_tokens(attrs: Dict, stage: str, usage) -> None:
+    """OpenAI 응답의 usage 정보를 span 속성과 메트릭에 기록"""
+    if usage is None:
+        return
+    prompt_tokens = getattr(usage, "prompt_tokens", None) or 0
+    completion_tokens = getattr(usage, "completion_tokens", None) or 0
+    attrs["prompt_tokens"] = prompt_tokens
+    attrs["completion_tokens"] = completion_tokens
+    TOKENS.inc(prompt_tokens, stage=stage, kind="prompt")
+    TOKENS.inc(completion_tokens, stage=stage, kind="completion")
+
+def record_cache(cache: str, hit: bool) -> None:
+    """캐시 적중 여부를 현재 span(또는 요청)과 메트릭에 기록"""
+    CACHE_REQUESTS.inc(cache=cache, result="hit" if hit else "miss")
+    trace = _current_trace.get()
+    if trace is not None:
+        hits = trace.attrs.setdefault("cache", {})
+        hits[cache] = "hit" if hit else "miss"
+
+def render_prometheus() -> str:
+    """Prometheus 텍스트 형식의 메트릭 문자열 반환"""
+    return REGISTRY.render()
+
+def write_prometheus(path: str) -> None:
+    """메트릭을 파일로 기록 (node_exporter textfile collector 등에서 읽을 수 있도록 원자적으로 교체)"""
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(render_prometheus())
+    os.replace(tmp_path, path)
+
+_metrics_server = None
+_exporters_configured = False
+_exporters_lock = threading.Lock()
+
+def start_metrics_server(port: int, host: str = "0.0.0.0"):
+    """`/metrics` 엔드포인트를 제공하는 HTTP 서버를 백그라운드 스레드로 시작 (프로세스당 한 번)"""
+    # http.server는 메트릭 서버를 쓸 때만 임포트 (rag_chatbot 임포트 시간 절약)
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.rstrip("/") != "/metrics":
+                self.send_error(404)
+                return
+            body = render_prometheus().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    global _metrics_server
+    with _exporters_lock:
+        if _metrics_server is None:
+            server = ThreadingHTTPServer((host, port), MetricsHandler)
+            server.daemon_threads = True
+            threading.Thread(target=server.serve_forever, name="rag-metrics-server", daemon=True).start()
+            _metrics_server = server
+        return _metrics_server
+
+def _configure_exporters() -> None:
+    """환경 변수에 따라 JSON 로그 핸들러와 메트릭 서버를 한 번만 설정"""
+    global _exporters_configured
+    if _exporters_configured:
+        return
+    with _exporters_lock:
+        if _exporters_configured:
+            return
+        log_path = os.getenv("RAG_TRACE_LOG")
+        if log_path:
+            handler = logging.StreamHandler(sys.stderr) if log_path == "-" else logging.FileHandler(log_path, encoding="utf-8")
+            handler.setFormatter(logging.Formatter("%(message)s"))
+            logger.addHandler(handler)
+            logger.setLevel(logging.INFO)
+            logger.propagate = False
+        _exporters_configured = True
+
+    port = os.getenv("RAG_METRICS_PORT")
+    if port:
+        try:
+            start_metrics_server(int(port))
+        except OSError as e:
+            # 여러 Streamlit 프로세스가 같은 포트를 쓰려는 경우 등
+            print(f"메트릭 서버 시작 실패 (포트 {port}): {e}")
+
+def _export_trace(trace: Trace) -> None:
+    if logger.isEnabledFor(logging.INFO):
+        logger.info(json.dumps(trace.to_dict(), ensure_ascii=False, default=str))
+
+    metrics_file = os.getenv("RAG_METRICS_FILE")
+    if metrics_file:
+        try:
+            write_prometheus(metrics_file)
+        except OSError as e:
+            print(f"메트릭 파일 기록 실패: {e}")
@@ -0,0 +1,101 @@
+"""Streamlit 앱 기동 시 백그라운드 워밍업과 준비(readiness) 상태
+
+ESG.py(또는 챗봇 페이지)가 처음 실행될 때 백그라운드 스레드에서
+프롬프트 자산, 벡터 인덱스, 임베딩 모델, 재순위화 모델을 로드하고 더미 질의를 한 번 실행합니다.
+페이지는 get_warmup_state()로 진행 상황만 확인하고, 로딩이 끝날 때까지 막히지 않습니다.
+
+이 모듈은 torch 등 무거운 모듈을 임포트하지 않습니다 (워밍업 스레드 안에서만 임포트).
+"""
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+
+PENDING = "pending"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+@dataclass
+class WarmupStep:
+    name: str
+    status: str = PENDING
+    seconds: Optional[float] = None
+    error: Optional[str] = None
+
+@dataclass
+class WarmupState:
+    """워밍업 진행 상황 (페이지에서 읽기 전용으로 사용)"""
+    steps: List[WarmupStep] = field(default_factory=list)
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+
+    @property
+    def started(self) -> bool:
+        return self.started_at is not None
+
+    @property
+    def finished(self) -> bool:
+        return self.finished_at is not None
+
+    @property
+    def ready(self) -> bool:
+        """모든 단계가 성공적으로 끝났는지 여부"""
+        return self.finished and all(step.status == DONE for step in self.steps)
+
+    @property
+    def failed_steps(self) -> List[WarmupStep]:
+        return [step for step in self.steps if step.status == FAILED]
+
+    @property
+    def progress(self) -> float:
+        if not self.steps:
+            return 0.0
+        return sum(step.status in (DONE, FAILED) for step in self.steps) / len(self.steps)
+
+    def summary(self) -> Dict:
+        return {step.name: {"status": step.status, "seconds": step.seconds, "error": step.error} for step in self.steps}
+
+_state = WarmupState()
+_lock = threading.Lock()
+_thread: Optional[threading.Thread] = None
+
+def get_warmup_state() -> WarmupState:
+    return _state
+
+def is_ready() -> bool:
+    return _state.ready
+
+def start_background_warmup() -> WarmupState:
+    """백그라운드 워밍업 시작 (프로세스당 한 번만 실행, 이후 호출은 현재 상태만 반환)"""
+    global _thread
+    with _lock:
+        if _thread is None:
+            _state.started_at = time.time()
+            _thread = threading.Thread(target=_run_warmup, name="rag-warmup", daemon=True)
+            _thread.start()
+    return _state
+
+def _run_warmup():
+    try:
+        import rag_chatbot
+        steps = rag_chatbot.warmup_steps()
+    except Exception as e:
+        _state.steps = [WarmupStep("import", status=FAILED, error=repr(e))]
+        _state.finished_at = time.time()
+        return
+
+    _state.steps = [WarmupStep(name) for name, _ in steps]
+    for step, (_, fn) in zip(_state.steps, steps):
+        step.status = RUNNING
+        start = time.perf_counter()
+        try:
+            fn()
+            step.status = DONE
+        except Exception as e:
+            print(f"워밍업 단계 '{step.name}' 실패: {e}")
+            step.status = FAILED
+            step.error = str(e)
+        step.seconds = time.perf_counter() - start
+    _state.finished_at = time.time()
+    print(f"워밍업 완료: {_state.summary()}")
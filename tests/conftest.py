@@ -0,0 +1,5 @@
+import sys
+from pathlib import Path
+
+# code/ 모듈은 패키지가 아니라 code/를 경로에 두고 실행되므로 테스트도 같은 방식으로 불러옴
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "code"))
@@ -0,0 +1,57 @@
+import json
+
+import pytest
+from fastapi.testclient import TestClient
+
+import api_server
+import rag_chatbot
+from load_shedding import LoadShedder
+
+HISTORY = [{"role": "user", "content": "이전 질문"}, {"role": "assistant", "content": "이전 답변"}]
+
+
+@pytest.fixture
+def generated(monkeypatch):
+    """검색·생성을 가짜로 바꾸고 응답 생성에 전달된 인자 기록"""
+    calls = []
+
+    def generate_response_stream(query, context, metadata_summary, history=None, model=None):
+        calls.append({"query": query, "context": context, "metadata_summary": metadata_summary, "history": history})
+        yield "답변"
+
+    monkeypatch.setattr(rag_chatbot, "_load_shedder", LoadShedder(max_inflight=2, max_queue=10))
+    monkeypatch.setattr(rag_chatbot, "generate_response_stream", generate_response_stream)
+    monkeypatch.setattr(rag_chatbot, "get_collection", lambda: None)
+    monkeypatch.setattr(rag_chatbot, "extract_metadata_filters", lambda query: {})
+    monkeypatch.setattr(rag_chatbot, "expand_query", lambda query: f"{query} 확장")
+    monkeypatch.setattr(rag_chatbot, "get_relevant_context", lambda query, collection, **kwargs: ("검색 문서", {"sources": {"CJ"}}))
+    return calls
+
+
+def stream(payload):
+    response = TestClient(api_server.app).post("/answer/stream", json=payload)
+    assert response.status_code == 200
+    return [json.loads(line[len("data: "):]) for line in response.text.splitlines() if line.startswith("data: ")]
+
+
+def test_stream_passes_history_to_generation(generated):
+    events = stream({"query": "후속 질문", "history": HISTORY})
+    assert [event["type"] for event in events] == ["context", "token", "done"]
+    assert events[0]["context"] == "검색 문서" and events[0]["expanded_query"] == "후속 질문 확장"
+    assert generated == [{"query": "후속 질문", "context": "검색 문서", "metadata_summary": {"sources": {"CJ"}},
+                          "history": HISTORY}]
+
+
+def test_stream_reuses_given_context(generated, monkeypatch):
+    def fail(*args, **kwargs):
+        raise AssertionError("전달받은 검색 결과가 있으면 다시 검색하지 않음")
+
+    monkeypatch.setattr(rag_chatbot, "get_relevant_context", fail)
+    events = stream({"query": "후속 질문", "history": HISTORY, "context": "이전 문서",
+                     "metadata_summary": {"sources": ["SK"]}})
+    assert events[0] == {"type": "context", "expanded_query": "후속 질문", "metadata_filters": {},
+                         "context": "이전 문서", "metadata_summary": {"sources": ["SK"]},
+                         "degradation": events[0]["degradation"]}
+    assert [event["content"] for event in events if event["type"] == "token"] == ["답변"]
+    assert generated == [{"query": "후속 질문", "context": "이전 문서", "metadata_summary": {"sources": ["SK"]},
+                          "history": HISTORY}]
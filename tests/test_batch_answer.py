@@ -0,0 +1,75 @@
+import json
+import threading
+
+import pytest
+
+from batch_answer import completed_ids, run_batch
+
+
+class FakeRag:
+    """rag_chatbot 대신 쓰는 가짜 파이프라인 (interrupt_after번째 이후 검색에서 Ctrl+C로 중단)"""
+
+    FINETUNED_MODEL_ID = "model"
+
+    def __init__(self, interrupt_after=None, fail=()):
+        self.interrupt_after = interrupt_after
+        self.fail = set(fail)
+        self.retrieve_calls = 0
+        self.answered = []
+        self._lock = threading.Lock()
+
+    def extract_metadata_filters(self, question):
+        return {}
+
+    def expand_query(self, question):
+        return question
+
+    def get_collection(self):
+        return None
+
+    def retrieve_documents_batch(self, queries, collection, filters, initial_k, final_k):
+        self.retrieve_calls += 1
+        if self.interrupt_after is not None and self.retrieve_calls > self.interrupt_after:
+            raise KeyboardInterrupt
+        return [([f"{query} 문서"], [{"source": "CJ", "page_range": "1-1"}], [0.9]) for query in queries]
+
+    def build_context(self, documents, metadatas, scores):
+        return "\n".join(documents), {"sources": {"CJ"}}
+
+    def generate_response(self, question, context, metadata_summary, model, raise_errors):
+        if question in self.fail:
+            raise RuntimeError("LLM 오류")
+        with self._lock:
+            self.answered.append(question)
+        return f"{question} 답변", None
+
+
+def read_records(path):
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip() and line.strip().endswith("}")]
+
+
+def test_interrupted_run_resumes_without_duplicates_or_gaps(tmp_path):
+    questions = tmp_path / "questions.jsonl"
+    questions.write_text("\n".join(json.dumps({"id": i, "question": f"질문 {i}"}, ensure_ascii=False)
+                                   for i in range(10)) + "\n", encoding="utf-8")
+    output = tmp_path / "answers.jsonl"
+
+    # 첫 실행: 질문 3은 생성 실패, 두 번째 묶음 검색 중 중단, 마지막 줄은 쓰다가 잘림
+    first = FakeRag(interrupt_after=1, fail={"질문 3"})
+    with pytest.raises(KeyboardInterrupt):
+        run_batch(first, str(questions), str(output), concurrency=2, batch_size=4)
+    with open(output, "a", encoding="utf-8") as f:
+        f.write('{"id": "9", "question": "질')
+    done = completed_ids(str(output))
+    assert done == {"0", "1", "2"}
+
+    second = FakeRag()
+    summary = run_batch(second, str(questions), str(output), concurrency=2, batch_size=4)
+    assert summary["skipped"] == 3 and summary["written"] == 7 and summary["failed"] == 0
+    # 다시 실행하면 실패했거나 처리하지 못한 질문만 답변
+    assert sorted(second.answered) == sorted(f"질문 {i}" for i in range(3, 10))
+
+    answered = [record["id"] for record in read_records(output) if "error" not in record]
+    assert sorted(answered, key=int) == [str(i) for i in range(10)]
+    assert completed_ids(str(output)) == {str(i) for i in range(10)}
@@ -0,0 +1,94 @@
+import threading
+import time
+
+import pytest
+
+from batching import MicroBatcher
+
+
+class RecordingHandler:
+    """작업을 그대로 돌려주고 배치별 작업 목록 기록 (gate가 있으면 첫 배치를 gate가 열릴 때까지 붙잡음)"""
+
+    def __init__(self, gate=None):
+        self.batches = []
+        self.gate = gate
+        self.started = threading.Event()
+
+    def __call__(self, items):
+        self.batches.append(list(items))
+        self.started.set()
+        if self.gate is not None:
+            self.gate.wait(5)
+            self.gate = None
+        return [f"{item}!" for item in items]
+
+
+def test_jobs_within_max_wait_share_a_batch():
+    handler = RecordingHandler()
+    batcher = MicroBatcher(handler, max_batch_size=8, max_wait_ms=200)
+    first = batcher.submit("a")
+    time.sleep(0.02)
+    second = batcher.submit("b")
+    assert first.result(5) == "a!" and second.result(5) == "b!"
+    assert handler.batches == [["a", "b"]]
+
+
+def test_single_job_waits_at_most_max_wait():
+    handler = RecordingHandler()
+    batcher = MicroBatcher(handler, max_batch_size=8, max_wait_ms=50)
+    start = time.perf_counter()
+    assert batcher("a", timeout=5) == "a!"
+    elapsed = time.perf_counter() - start
+    # 다른 작업이 없어도 창이 끝날 때까지는 기다리지만 그 이상 지연되지 않음
+    assert 0.04 <= elapsed < 1.0
+    assert handler.batches == [["a"]]
+
+
+def test_full_batch_is_dispatched_without_waiting():
+    handler = RecordingHandler()
+    batcher = MicroBatcher(handler, max_batch_size=2, max_wait_ms=5000)
+    futures = [batcher.submit(item) for item in ("a", "b")]
+    # 최대 크기에 도달하면 max_wait_ms(5초)를 기다리지 않음
+    assert [future.result(2) for future in futures] == ["a!", "b!"]
+
+
+def test_job_exceeding_max_batch_is_carried_to_next_batch():
+    gate = threading.Event()
+    handler = RecordingHandler(gate)
+    batcher = MicroBatcher(handler, max_batch_size=4, max_wait_ms=50, size_fn=len)
+    futures = [batcher.submit("x")]
+    assert handler.started.wait(5)
+    # 첫 배치를 처리하는 동안 크기 3, 2, 1 작업이 대기열에 쌓임
+    futures += [batcher.submit(item) for item in ("ccc", "bb", "a")]
+    assert batcher.queue_depth == 3
+    gate.set()
+    assert [future.result(5) for future in futures] == ["x!", "ccc!", "bb!", "a!"]
+    # "bb"는 "ccc"와 합치면 4를 넘으므로 다음 배치의 첫 작업이 되고, 순서는 유지됨
+    assert handler.batches == [["x"], ["ccc"], ["bb", "a"]]
+    assert batcher.queue_depth == 0
+
+
+def test_handler_error_reaches_every_waiting_future():
+    calls = []
+
+    def handler(items):
+        calls.append(list(items))
+        if len(calls) == 1:
+            raise RuntimeError("모델 오류")
+        return items[:1] if len(calls) == 2 else items
+
+    batcher = MicroBatcher(handler, max_batch_size=8, max_wait_ms=100)
+    futures = [batcher.submit(item) for item in ("a", "b", "c")]
+    for future in futures:
+        with pytest.raises(RuntimeError, match="모델 오류"):
+            future.result(5)
+
+    # 결과 수가 작업 수와 다르면 모든 작업이 실패
+    futures = [batcher.submit(item) for item in ("d", "e")]
+    for future in futures:
+        with pytest.raises(RuntimeError, match="결과 수"):
+            future.result(5)
+
+    # 오류 후에도 작업 스레드는 계속 동작
+    assert batcher("f", timeout=5) == "f"
+    assert calls == [["a", "b", "c"], ["d", "e"], ["f"]]
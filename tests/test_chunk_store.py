@@ -0,0 +1,101 @@
+import numpy as np
+import pytest
+
+from chunk_store import ChunkStore, replace_sources, resolve_store_path, store_exists, write_chunk_store
+from index_snapshots import SnapshotStore
+
+
+def make_chunks(prefix, n=3):
+    return [{"text": f"{prefix} 청크 {i}",
+             "metadata": {"section": "Social", "sub_section": "인권", "source": prefix,
+                          "page_range": f"{i + 1}-{i + 2}", "chunk_index": i, "total_chunks_in_section": n}}
+            for i in range(n)]
+
+
+def test_round_trip_keeps_text_metadata_and_embeddings(tmp_path):
+    chunks = make_chunks("CJ")
+    chunks[1]["metadata"].update({"duplicate_count": 2, "duplicate_pages": "CJ:5-6"})
+    embeddings = np.arange(6, dtype=np.float32).reshape(3, 2)
+    write_chunk_store(chunks, str(tmp_path), embeddings, "model")
+
+    store = ChunkStore(str(tmp_path))
+    assert list(store) == [{**c, "metadata": {**c["metadata"], "page_start": i + 1, "page_end": i + 2}}
+                           for i, c in enumerate(chunks)]
+    assert np.array_equal(store.embeddings, embeddings)
+    assert store.where(source="CJ").tolist() == [0, 1, 2]
+    assert store.where(source="KTNG").size == 0
+
+
+def test_publish_swaps_pointer_and_old_readers_keep_their_version(tmp_path):
+    assert not store_exists(str(tmp_path))
+    first_path = write_chunk_store(make_chunks("CJ"), str(tmp_path))
+    old = ChunkStore(str(tmp_path))
+
+    second_path = write_chunk_store(make_chunks("KTNG", 2), str(tmp_path))
+    assert first_path != second_path
+    assert str(old.path) == first_path and str(resolve_store_path(str(tmp_path))) == second_path
+    # 이미 연 저장소는 이전 버전 그대로, 새로 열면 새 버전
+    assert old.text(2) == "CJ 청크 2"
+    assert len(ChunkStore(str(tmp_path))) == 2
+
+
+def test_old_versions_are_pruned(tmp_path):
+    for i in range(5):
+        write_chunk_store(make_chunks(f"S{i}", 1), str(tmp_path))
+    snapshots = SnapshotStore(str(tmp_path))
+    assert len(snapshots.versions()) == 3
+    assert ChunkStore(str(tmp_path)).text(0) == "S4 청크 0"
+
+
+def test_rejected_write_leaves_current_version(tmp_path):
+    write_chunk_store(make_chunks("CJ"), str(tmp_path))
+    with pytest.raises(ValueError):
+        write_chunk_store(make_chunks("KTNG"), str(tmp_path), np.zeros((1, 2), dtype=np.float32))
+    assert ChunkStore(str(tmp_path)).text(0) == "CJ 청크 0"
+
+
+def test_legacy_flat_directory_is_still_readable(tmp_path):
+    version_dir = write_chunk_store(make_chunks("CJ"), str(tmp_path / "versioned"))
+    # CURRENT가 없는 디렉터리(버전 디렉터리를 직접 지정한 경우 포함)는 그대로 읽음
+    assert resolve_store_path(version_dir) == ChunkStore(version_dir).path
+    assert len(ChunkStore(version_dir)) == 3
+
+
+def test_replace_sources_reuses_other_companies(tmp_path):
+    assert replace_sources(str(tmp_path), make_chunks("CJ"), np.zeros((3, 2), dtype=np.float32), "model") is None
+    chunks = make_chunks("CJ") + make_chunks("KTNG", 2)
+    embeddings = np.arange(10, dtype=np.float32).reshape(5, 2)
+    write_chunk_store(chunks, str(tmp_path), embeddings, "model")
+
+    new_chunks = make_chunks("CJ", 1)
+    merged, merged_embeddings = replace_sources(str(tmp_path), new_chunks, np.full((1, 2), -1, dtype=np.float32), "model")
+    assert [c["metadata"]["source"] for c in merged] == ["KTNG", "KTNG", "CJ"]
+    assert merged[0]["text"] == "KTNG 청크 0"
+    assert merged_embeddings.tolist() == [[6, 7], [8, 9], [-1, -1]]
+    # 임베딩 모델이 다르면 재사용하지 않음
+    assert replace_sources(str(tmp_path), new_chunks, np.zeros((1, 2), dtype=np.float32), "other") is None
+
+
+def test_report_column_is_optional(tmp_path):
+    chunks = make_chunks("CJ", 2)
+    chunks[0]["metadata"]["report"] = "cj_2024"
+    path = write_chunk_store(chunks, str(tmp_path))
+    assert ChunkStore(str(tmp_path)).metadata(0)["report"] == "cj_2024"
+    assert "report" not in ChunkStore(str(tmp_path)).metadata(1)
+    # report 열이 없는 이전 저장소도 읽힘
+    (tmp_path / path / "report.npy").unlink()
+    assert "report" not in ChunkStore(str(tmp_path)).metadata(0)
+
+
+def test_large_dictionary_uses_wider_codes(tmp_path):
+    n = 70_000
+    chunks = [{"text": "t", "metadata": {"source": "CJ", "duplicates": f"CJ#{i}"}} for i in range(n)]
+    write_chunk_store(chunks, str(tmp_path))
+
+    store = ChunkStore(str(tmp_path))
+    assert store.codes("duplicates").dtype == np.uint32
+    assert store.codes("source").dtype == np.uint16
+    assert (store.code_dtypes["duplicates"], store.code_dtypes["source"]) == ("uint32", "uint16")
+    # 65,536번째 이후 값도 원래 문자열로 디코딩
+    for i in (0, 65_535, 65_536, n - 1):
+        assert store.metadata(i)["duplicates"] == f"CJ#{i}"
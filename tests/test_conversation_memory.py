@@ -0,0 +1,93 @@
+import pytest
+
+from conversation_memory import ConversationMemory, Turn
+
+
+def summarize(summary, turns):
+    return " / ".join([summary] + [turn.user for turn in turns]).strip(" /")
+
+
+@pytest.fixture
+def memory():
+    memory = ConversationMemory()
+    memory.add_turn("CJ 탄소 배출 목표는?", "2030년까지 감축", summarize,
+                    context="문맥", metadata_summary={"sources": {"CJ"}}, metadata_filters={"source": "CJ"})
+    return memory
+
+
+@pytest.mark.parametrize("query", [
+    "그럼 신한은?", "그 회사의 목표는?", "그것은 왜?", "위 내용 요약해줘", "위내용 더", "그중에서 가장 큰 것은?", "이것도 설명해줘",
+])
+def test_follow_up_markers_at_start(memory, query):
+    assert memory.is_follow_up(query)
+
+
+@pytest.mark.parametrize("query", [
+    "그룹 ESG 전략", "그린본드 발행 현황", "그래프로 보여줘", "그로 인해 달라진 점",
+    "탄소 배출을 자세히 알려줘", "예시를 들어줘", "CJ 추가로 인권 정책", "그러면 " + "가" * 50,
+])
+def test_generic_or_long_queries_are_not_follow_ups(memory, query):
+    assert not memory.is_follow_up(query)
+
+
+def test_follow_up_needs_previous_context_and_same_filters(memory):
+    assert not ConversationMemory().is_follow_up("그럼 신한은?")
+    assert not memory.is_follow_up("그럼 신한은?", {"source": "SHINHAN"})
+    assert memory.is_follow_up("그럼 목표는?", {"source": "CJ"})
+
+
+def test_old_turns_are_summarized_within_budget():
+    memory = ConversationMemory(max_recent_turns=2)
+    for i in range(4):
+        memory.add_turn(f"질문 {i}", f"답변 {i}", summarize)
+    assert [turn.user for turn in memory.recent] == ["질문 2", "질문 3"]
+    assert memory.summary == "질문 0 / 질문 1"
+
+
+def test_round_trip_through_dict(memory):
+    restored = ConversationMemory.from_dict(memory.to_dict())
+    assert list(restored.recent) == [Turn("CJ 탄소 배출 목표는?", "2030년까지 감축")]
+    assert restored.last_metadata_summary == {"sources": ["CJ"]}
+    assert restored.last_filters == {"source": "CJ"}
+    assert restored.is_follow_up("그럼 목표는?")
+
+
+def test_summary_can_be_deferred_until_after_the_answer():
+    memory = ConversationMemory(max_recent_turns=2)
+    for i in range(3):
+        memory.add_turn(f"질문 {i}", f"답변 {i}")
+    # 요약 전에는 밀려난 턴도 원문으로 대화 기록에 남음
+    assert memory.pending == [Turn("질문 0", "답변 0")] and memory.summary == ""
+    assert [m["content"] for m in memory.build_messages() if m["role"] == "user"] == ["질문 0", "질문 1", "질문 2"]
+    assert ConversationMemory.from_dict(memory.to_dict()).pending == memory.pending
+
+    assert memory.summarize_pending(summarize) is True
+    assert memory.pending == [] and memory.summary == "질문 0"
+    assert memory.summarize_pending(summarize) is False
+
+
+def test_turns_added_while_summarizing_wait_for_the_next_summary():
+    memory = ConversationMemory(max_recent_turns=1)
+    memory.add_turn("질문 0", "답변 0")
+    memory.add_turn("질문 1", "답변 1")
+
+    def slow_summarize(summary, turns):
+        # 요약하는 동안 다음 턴이 추가됨
+        memory.add_turn("질문 2", "답변 2")
+        return summarize(summary, turns)
+
+    memory.summarize_pending(slow_summarize)
+    assert memory.summary == "질문 0" and memory.pending == [Turn("질문 1", "답변 1")]
+
+
+def test_clear_discards_a_summary_in_progress():
+    memory = ConversationMemory(max_recent_turns=1)
+    memory.add_turn("질문 0", "답변 0")
+    memory.add_turn("질문 1", "답변 1")
+
+    def summarize_then_clear(summary, turns):
+        memory.clear()
+        return "버려질 요약"
+
+    assert memory.summarize_pending(summarize_then_clear) is False
+    assert memory.is_empty()
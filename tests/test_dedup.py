@@ -0,0 +1,95 @@
+import json
+
+import numpy as np
+import pytest
+
+from dedup import (MinHasher, deduplicate_by_source, deduplicate_chunks, duplicate_metadatas, format_report, jaccard,
+                   lsh_params, same_figures, shingles)
+
+PARAGRAPH = ("KTG는 차세대 제품 사업 확대를 위한 전략과 실행 과제를 다음과 같이 추진하고 있습니다. "
+             "첫째, 혁신 플랫폼 기반의 포트폴리오 경쟁력 강화를 위해 디바이스 개발 역량을 고도화하고 있습니다. "
+             "또한 기술 경쟁력 강화를 위해 3년간 국내외 총 4,374건의 특허를 출원하고 683건을 등록했습니다.")
+OTHER = ("임직원의 안전과 보건을 최우선 가치로 삼아 사업장별 위험성 평가를 실시하고, 협력회사와 함께 "
+         "안전 문화를 확산하기 위한 교육과 점검 활동을 정기적으로 운영하고 있습니다.")
+
+
+def chunk(text, page, section="Social", source="KTNG", report="ktng", **extra):
+    return {"text": text, "metadata": {"section": section, "sub_section": "전략", "source": source, "report": report,
+                                       "page_range": f"{page}-{page}", "page_start": page, "page_end": page,
+                                       "chunk_index": 0, **extra}}
+
+
+def test_shingles_ignore_spacing_and_punctuation_but_keep_digits():
+    assert shingles("가나 다라, 마바!") == shingles("가나다라마바")
+    assert shingles("2023년 보고서") != shingles("2024년 보고서")
+    assert shingles("") == set() and shingles("가나") == {"가나"}
+
+
+def test_minhash_estimates_jaccard():
+    a, b = shingles(PARAGRAPH), shingles(PARAGRAPH[:150] + OTHER)
+    hasher = MinHasher(256)
+    estimate = float(np.mean(hasher.signature(a) == hasher.signature(b)))
+    assert estimate == pytest.approx(jaccard(a, b), abs=0.1)
+    assert np.array_equal(hasher.signature(a), MinHasher(256).signature(a))
+
+
+def test_lsh_params_put_the_threshold_near_the_s_curve():
+    bands, rows = lsh_params(0.8, 128)
+    assert bands * rows <= 128
+    assert (1 / bands) ** (1 / rows) == pytest.approx(0.8, abs=0.05)
+
+
+def test_near_duplicates_merge_with_back_references():
+    chunks = [chunk(PARAGRAPH, 18), chunk(OTHER, 19), chunk("NGP 전략 과제 " + PARAGRAPH, 21)]
+    kept, report = deduplicate_chunks(chunks, 0.8)
+    assert [c["text"] for c in kept] == [PARAGRAPH, OTHER]
+    assert report["before"] == 3 and report["after"] == 2 and report["removed"] == 1
+    metadata = kept[0]["metadata"]
+    assert metadata["duplicate_count"] == 1 and metadata["duplicate_pages"] == "전략 p.21-21"
+    assert [m["page_range"] for m in duplicate_metadatas(metadata)] == ["21-21"]
+    # 원본 청크는 수정하지 않음
+    assert "duplicates" not in chunks[0]["metadata"]
+
+
+def test_different_sections_are_not_merged():
+    kept, _ = deduplicate_chunks([chunk(PARAGRAPH, 1), chunk(PARAGRAPH, 2, section="Governance")], 0.8)
+    assert len(kept) == 2
+
+
+def test_changed_figures_are_not_merged():
+    # 긴 청크는 수치가 모두 달라도 n-gram 유사도가 높지만 다른 내용
+    text = PARAGRAPH + " " + OTHER
+    changed = text.replace("3년간", "5년간").replace("4,374", "5,120").replace("683", "702")
+    assert jaccard(shingles(text), shingles(changed)) >= 0.8
+    assert not same_figures(text, changed)
+    kept, _ = deduplicate_chunks([chunk(text, 1), chunk(changed, 2)], 0.8)
+    assert len(kept) == 2
+
+
+def test_short_boilerplate_merges_despite_page_numbers():
+    footers = [chunk(f". {page} SHINHAN LIFE 2023 ESG REPORT", page, source="SHINHAN", report="shinhan")
+               for page in (26, 57)]
+    assert same_figures(footers[0]["text"], footers[1]["text"])
+    kept, _ = deduplicate_chunks(footers, 0.8)
+    assert len(kept) == 1
+
+
+def test_short_chunks_are_always_kept():
+    kept, _ = deduplicate_chunks([chunk("환경 경영", 1), chunk("환경 경영", 2)], 0.8)
+    assert len(kept) == 2
+
+
+def test_decks_of_the_same_company_are_deduplicated_together():
+    chunks = [chunk(PARAGRAPH, 18, report="ktng_2024"), chunk(OTHER, 3, source="CJ", report="cj"),
+              chunk(PARAGRAPH, 20, report="ktng_2023"), chunk(PARAGRAPH, 7, source="CJ", report="cj")]
+    kept, reports = deduplicate_by_source(chunks, 0.8)
+    assert [(c["metadata"]["source"], c["metadata"]["report"]) for c in kept] == \
+        [("KTNG", "ktng_2024"), ("CJ", "cj"), ("CJ", "cj")]
+    metadata = kept[0]["metadata"]
+    # 다른 덱의 중복은 덱 이름까지 역참조에 기록
+    assert metadata["duplicate_pages"] == "ktng_2023 전략 p.20-20"
+    assert json.loads(metadata["duplicates"])[0]["report"] == "ktng_2023"
+    assert duplicate_metadatas(metadata)[0]["report"] == "ktng_2023"
+    assert reports["KTNG"]["decks"] == {"ktng_2024": [1, 1], "ktng_2023": [1, 0]}
+    assert "ktng_2023 1 → 0" in format_report("KTNG", reports["KTNG"])
+    assert reports["CJ"]["removed"] == 0 and "decks" not in reports["CJ"]
@@ -0,0 +1,101 @@
+import json
+import threading
+
+import numpy as np
+import pytest
+import sentence_transformers
+
+from embedding_service import (EmbeddingHTTPServer, EmbeddingService, EmbeddingServiceClient,
+                               UnixEmbeddingHTTPServer, decode_array, encode_array)
+
+
+class FakeSentenceTransformer:
+    """임베딩 = [글자 수, 텍스트 번호], encode 호출별 텍스트 수 기록"""
+
+    def __init__(self, model_name, device=None):
+        self.batches = []
+
+    def get_sentence_embedding_dimension(self):
+        return 2
+
+    def encode(self, texts, convert_to_numpy=True):
+        if "실패" in texts:
+            raise RuntimeError("모델 오류")
+        self.batches.append(len(texts))
+        return np.array([[len(text), i] for i, text in enumerate(texts)], dtype=np.float32)
+
+
+@pytest.fixture
+def service(monkeypatch):
+    monkeypatch.setattr(sentence_transformers, "SentenceTransformer", FakeSentenceTransformer)
+    return EmbeddingService("fake-model", max_batch_size=8, max_wait_ms=20)
+
+
+def serve(server):
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server
+
+
+def test_array_encoding_round_trip():
+    array = np.arange(6, dtype=np.float64).reshape(2, 3)
+    payload = json.loads(json.dumps(encode_array(array)))
+    decoded = decode_array(payload)
+    assert decoded.dtype == np.float32 and decoded.tolist() == array.tolist()
+
+
+def test_concurrent_requests_are_batched(service):
+    results = {}
+
+    def embed(key, texts):
+        results[key] = service.embed(texts)
+
+    threads = [threading.Thread(target=embed, args=(i, ["가" * (i + 1)] * 2)) for i in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(5)
+
+    # 요청별로 자기 텍스트의 임베딩만 받음
+    for i in range(4):
+        assert results[i][:, 0].tolist() == [i + 1, i + 1]
+    assert sum(service.model.batches) == 8 and len(service.model.batches) < 4
+    assert service.embed([]).shape == (0, 2)
+
+
+def check_round_trip(client, service):
+    embeddings = client.embed(["하나", "둘셋"])
+    assert embeddings.tolist() == [[2, 0], [2, 1]]
+    # keep-alive 연결을 재사용해도 다음 요청이 정상 처리됨
+    assert client.embed(["넷다섯여섯"]).tolist() == [[5, 0]]
+    with pytest.raises(RuntimeError, match="500"):
+        client.embed(["실패"])
+    assert client.embed(["다시"]).tolist() == [[2, 0]]
+
+
+def test_http_round_trip(service):
+    server = serve(EmbeddingHTTPServer(("127.0.0.1", 0), service))
+    try:
+        client = EmbeddingServiceClient(f"http://127.0.0.1:{server.server_address[1]}", timeout=5)
+        check_round_trip(client, service)
+
+        conn = client._connection()
+        conn.request("GET", "/health")
+        health = json.loads(conn.getresponse().read())
+        assert health == {"status": "ok", "model": "fake-model", "queue_depth": 0}
+        conn.request("POST", "/embed", body=b"{}", headers={"Content-Type": "application/json"})
+        response = conn.getresponse()
+        assert response.status == 400 and "잘못된 요청" in json.loads(response.read())["error"]
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def test_unix_socket_round_trip(service, tmp_path):
+    socket_path = str(tmp_path / "embed.sock")
+    server = serve(UnixEmbeddingHTTPServer(socket_path, service))
+    try:
+        check_round_trip(EmbeddingServiceClient(f"unix://{socket_path}", timeout=5), service)
+    finally:
+        server.shutdown()
+        server.server_close()
@@ -0,0 +1,79 @@
+import pytest
+
+from index_snapshots import SnapshotReader, SnapshotStore, _OpenSnapshot
+
+
+def publish(store, name, activate=True):
+    def build(path):
+        return {"name": name}
+    return store.publish(build, activate=activate)
+
+
+def test_publish_switches_current_only_after_build(tmp_path):
+    store = SnapshotStore(str(tmp_path))
+    first = publish(store, "a")
+    assert store.current_version() == first
+
+    seen = []
+
+    def build(path):
+        # 빌드 중에는 이전 버전이 계속 현재 버전
+        seen.append(store.current_version())
+        return {}
+
+    second = store.publish(build)
+    assert seen == [first] and store.current_version() == second
+    assert store.versions() == [first, second]
+
+    def fail(path):
+        raise RuntimeError("build failed")
+
+    with pytest.raises(RuntimeError):
+        store.publish(fail)
+    # 실패한 빌드는 게시되지 않고 임시 디렉터리도 남지 않음
+    assert store.current_version() == second and store.versions() == [first, second]
+    assert sorted(p.name for p in store.versions_dir.iterdir()) == sorted([first, second])
+
+
+def test_activate_rolls_back_to_previous_version(tmp_path):
+    store = SnapshotStore(str(tmp_path))
+    first = publish(store, "a")
+    second = publish(store, "b")
+    store.activate(first)
+    assert store.current_version() == first
+    assert store.manifest(second)["name"] == "b"
+    with pytest.raises(ValueError):
+        store.activate("missing")
+    assert store.current_version() == first
+
+
+def test_prune_keeps_recent_and_active_versions(tmp_path):
+    store = SnapshotStore(str(tmp_path))
+    versions = [publish(store, str(i)) for i in range(4)]
+    store.activate(versions[0])
+    assert store.prune(keep=2) == [versions[1]]
+    assert store.versions() == [versions[0], versions[2], versions[3]]
+    assert store.current_version() == versions[0]
+
+
+class FakeReader(SnapshotReader):
+    """ChromaDB를 열지 않고 버전만 기록하는 리더"""
+
+    def _open(self, version):
+        return _OpenSnapshot(version, self.store.chroma_path(version), None, object())
+
+
+def test_reader_picks_up_new_version(tmp_path):
+    store = SnapshotStore(str(tmp_path))
+    first = publish(store, "a")
+    reader = FakeReader(lambda client: None, root=str(tmp_path), check_interval=60)
+    assert reader.collection().version == first
+
+    second = publish(store, "b")
+    # check_interval 안에서는 CURRENT를 다시 읽지 않음
+    assert reader.collection().version == first
+    assert reader.refresh() is True
+    assert reader.version == second and reader.collection().version == second
+    # 진행 중인 요청을 위해 직전 스냅샷은 열어 둠
+    assert reader._previous.version == first
+    assert reader.refresh() is False
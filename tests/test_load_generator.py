@@ -0,0 +1,45 @@
+import types
+
+import pytest
+
+import load_generator
+import rag_chatbot
+from mock_llm_server import MockConfig, start_mock_server
+
+
+@pytest.fixture
+def llm(monkeypatch):
+    """모의 LLM 서버에 연결한 rag_chatbot 클라이언트 (서버 설정은 테스트에서 변경)"""
+    server = start_mock_server(MockConfig())
+    monkeypatch.setenv("OPENAI_BASE_URL", server.base_url)
+    monkeypatch.setenv("OPENAI_API_KEY", "mock")
+    monkeypatch.setattr(rag_chatbot._client, "_value", None)
+    yield server
+    server.shutdown()
+    rag_chatbot._client._value = None
+
+
+def fake_rag():
+    """검색 단계만 대신하고 LLM 호출(확장, 생성)은 rag_chatbot 그대로 사용"""
+    return types.SimpleNamespace(
+        get_collection=lambda: None,
+        expand_query=rag_chatbot.expand_query,
+        extract_metadata_filters=rag_chatbot.extract_metadata_filters,
+        get_relevant_context=lambda query, collection, metadata_filters=None: ("문맥", {}),
+        generate_response=rag_chatbot.generate_response,
+    )
+
+
+def test_successful_requests_are_samples(llm):
+    result = load_generator.run_load(fake_rag(), ["탄소?"], concurrency=2, mode="full", requests=4)
+    assert (result["requests"], result["errors"]) == (4, 0)
+
+
+def test_llm_errors_are_counted_as_errors(llm):
+    # 재시도 없이 바로 실패하도록 4xx 오류 주입
+    llm.mock_config.error_rate = 1.0
+    llm.mock_config.error_statuses = (400,)
+    result = load_generator.run_load(fake_rag(), ["탄소?", "ESG 경영 전략은 무엇인가요?"], concurrency=2, mode="full",
+                                requests=4)
+    assert (result["requests"], result["errors"]) == (0, 4)
+    assert result["throughput_rps"] == 0.0
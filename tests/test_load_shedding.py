@@ -0,0 +1,173 @@
+import asyncio
+import contextvars
+import gc
+import json
+import threading
+import time
+from types import SimpleNamespace
+
+import pytest
+
+import rag_chatbot
+from conversation_memory import Turn
+from load_shedding import BUSY_MESSAGE, Deadline, LoadShedder, Overloaded, current_budget
+
+
+@pytest.fixture
+def shedder(monkeypatch):
+    shedder = LoadShedder(max_inflight=2, max_queue=10)
+    monkeypatch.setattr(rag_chatbot, "_load_shedder", shedder)
+    return shedder
+
+
+def test_admit_sets_budget_and_releases_slot():
+    shedder = LoadShedder(max_inflight=2, max_queue=10)
+    with shedder.admit() as budget:
+        assert current_budget() is budget and shedder.in_flight == 1
+    assert current_budget() is None and shedder.in_flight == 0
+
+
+def test_rejects_over_limit_and_expired_deadline():
+    shedder = LoadShedder(max_inflight=1, max_queue=10)
+    with shedder.admit():
+        with pytest.raises(Overloaded):
+            with shedder.admit():
+                pass
+    with pytest.raises(Overloaded):
+        with shedder.admit(Deadline(0)):
+            pass
+    assert shedder.in_flight == 0
+
+
+def test_rejects_when_rerank_queue_is_full():
+    shedder = LoadShedder(max_inflight=5, max_queue=3, queue_depth_fns={"rerank": lambda: 3})
+    with pytest.raises(Overloaded):
+        with shedder.admit():
+            pass
+    assert shedder.in_flight == 0
+
+
+class FakeCompletions:
+    def __init__(self):
+        self.calls = []
+
+    def create(self, **kwargs):
+        self.calls.append(kwargs)
+        message = SimpleNamespace(content=" 요약 ")
+        return SimpleNamespace(choices=[SimpleNamespace(message=message)], usage=None)
+
+
+@pytest.fixture
+def completions(monkeypatch):
+    completions = FakeCompletions()
+    client = SimpleNamespace(chat=SimpleNamespace(completions=completions))
+    monkeypatch.setattr(rag_chatbot, "get_client", lambda: client)
+    return completions
+
+
+def test_summarize_uses_request_deadline(shedder, completions):
+    turns = [Turn("질문", "답변")]
+    assert rag_chatbot.summarize_conversation("", turns, deadline=Deadline(20)) == "요약"
+    assert 19 < completions.calls[0]["timeout"] <= 20
+    assert shedder.in_flight == 0
+
+    # 이미 입장한 요청 안에서는 그 예산을 사용하고, 남은 시간이 부족하면 호출하지 않음
+    with shedder.admit(Deadline(10, start=time.monotonic() - 8)):
+        with pytest.raises(Overloaded):
+            rag_chatbot.summarize_conversation("", turns)
+    assert len(completions.calls) == 1
+
+
+def endless_stream(query, collection, model, history, budget):
+    yield {"type": "context", "degradation": budget.metadata()}
+    while True:
+        yield {"type": "token", "content": "조각"}
+
+
+def test_abandoned_stream_in_another_context_releases_slot(shedder, monkeypatch):
+    monkeypatch.setattr(rag_chatbot, "_answer_query_stream", endless_stream)
+    events = rag_chatbot.answer_query_stream("질문", None)
+    # 서버처럼 다른 Context에서 진행하다가 버리면 GC가 현재 Context에서 close (ContextVar reset 실패)
+    assert contextvars.copy_context().run(next, events)["type"] == "context"
+    assert shedder.in_flight == 1
+    del events
+    gc.collect()
+    assert shedder.in_flight == 0
+
+
+async def stream_then_disconnect(app, payload):
+    """ASGI 앱을 직접 호출해 첫 이벤트를 받은 뒤 클라이언트 연결을 끊음"""
+    first_event = asyncio.Event()
+    requests = [{"type": "http.request", "body": json.dumps(payload).encode(), "more_body": False}]
+
+    async def receive():
+        if requests:
+            return requests.pop(0)
+        await first_event.wait()
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        if message["type"] == "http.response.body" and message.get("body", b"").startswith(b"data: "):
+            first_event.set()
+
+    scope = {"type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "POST",
+             "scheme": "http", "path": "/answer/stream", "raw_path": b"/answer/stream", "root_path": "",
+             "query_string": b"", "headers": [(b"content-type", b"application/json")],
+             "client": ("testclient", 50000), "server": ("testserver", 80)}
+    await asyncio.wait_for(app(scope, receive, send), timeout=5)
+    assert first_event.is_set()
+
+
+@pytest.mark.parametrize("coalesce", [False, True])
+def test_abandoned_http_stream_releases_slot(shedder, monkeypatch, coalesce):
+    import api_server
+
+    monkeypatch.setattr(rag_chatbot, "_answer_query_stream", endless_stream)
+    monkeypatch.setattr(rag_chatbot, "get_collection", lambda: None)
+    for _ in range(3):
+        asyncio.run(stream_then_disconnect(api_server.app, {"query": "질문", "coalesce": coalesce}))
+        deadline = time.monotonic() + 5
+        while shedder.in_flight and time.monotonic() < deadline:
+            time.sleep(0.05)
+        assert shedder.in_flight == 0
+
+
+def test_coalesced_follower_gives_up_at_its_deadline(shedder, monkeypatch):
+    started, release = threading.Event(), threading.Event()
+
+    def slow_answer(query, collection, model, history):
+        started.set()
+        release.wait(5)
+        return {"response": "답변"}
+
+    def slow_stream(query, collection, model, history, budget):
+        started.set()
+        release.wait(5)
+        yield {"type": "context", "degradation": budget.metadata()}
+
+    monkeypatch.setattr(rag_chatbot, "extract_metadata_filters", lambda query: {})
+    monkeypatch.setattr(rag_chatbot, "_answer_query", slow_answer)
+    monkeypatch.setattr(rag_chatbot, "_answer_query_stream", slow_stream)
+
+    leader = threading.Thread(target=rag_chatbot.coalesced_answer, args=("질문", None))
+    leader.start()
+    assert started.wait(5)
+    # 실행 중인 요청보다 마감 시간이 먼저 오면 기다리지 않고 거절 결과 반환
+    result, shared = rag_chatbot.coalesced_answer("질문", None, deadline=Deadline(0.05))
+    assert shared and result["response"] == BUSY_MESSAGE and result["degradation"]["reasons"] == ["deadline"]
+
+    started.clear()
+    events, _ = rag_chatbot.coalesced_answer_stream("질문 스트림", None)
+    follower, shared = rag_chatbot.coalesced_answer_stream("질문 스트림", None, deadline=Deadline(0.05))
+    assert started.wait(5) and shared
+    follower_events = list(follower)
+    assert [event["type"] for event in follower_events] == ["context", "token", "done"]
+    assert follower_events[1]["content"] == BUSY_MESSAGE
+    release.set()
+    assert next(events)["type"] == "context"
+    events.close()
+    leader.join(5)
+    deadline = time.monotonic() + 5
+    while shedder.in_flight and time.monotonic() < deadline:
+        time.sleep(0.05)
+    assert shedder.in_flight == 0
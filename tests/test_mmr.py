@@ -0,0 +1,61 @@
+import numpy as np
+
+import rag_chatbot
+from mmr import mmr_select
+
+# 0, 1번은 거의 같은 내용, 2번은 다른 방향, 3번은 관련도가 가장 낮음
+EMBEDDINGS = np.array([[1.0, 0.0], [0.99, 0.01], [0.0, 1.0], [0.7, 0.7]], dtype=np.float32)
+RELEVANCE = [0.9, 0.85, 0.6, 0.1]
+
+
+def test_lambda_one_is_score_order():
+    assert mmr_select(EMBEDDINGS, RELEVANCE, 4, lambda_=1.0) == [0, 1, 2, 3]
+    assert mmr_select(EMBEDDINGS, [0.2, 0.8, 0.5, 0.9], 2, lambda_=1.0) == [3, 1]
+
+
+def test_near_duplicates_are_skipped():
+    # 1번은 관련도가 높지만 0번과 거의 같으므로 다른 방향의 2번이 먼저
+    assert mmr_select(EMBEDDINGS, RELEVANCE, 2, lambda_=0.5) == [0, 2]
+
+
+def test_max_similarity_excludes_candidates():
+    # 0번과 유사도 0.99 이상인 1번은 고르지 않고, 후보가 남지 않으면 k개보다 적게 반환
+    selected = mmr_select(EMBEDDINGS, RELEVANCE, 4, lambda_=0.9, max_similarity=0.95)
+    assert 1 not in selected and selected[0] == 0
+    assert mmr_select(EMBEDDINGS[:2], RELEVANCE[:2], 2, max_similarity=0.95) == [0]
+
+
+def test_pool_size_limits_candidates():
+    # 점수 상위 2개 안에서만 고르므로 다양성이 높아도 2, 3번은 뽑히지 않음
+    assert mmr_select(EMBEDDINGS, RELEVANCE, 3, lambda_=0.1, pool_size=2) == [0, 1]
+
+
+def test_empty_and_single_candidate():
+    assert mmr_select(np.zeros((0, 2)), [], 3) == []
+    assert mmr_select(EMBEDDINGS, RELEVANCE, 0) == []
+    assert mmr_select(EMBEDDINGS[:1], [0.4], 3) == [0]
+
+
+class FakeCollection:
+    def __init__(self):
+        self.includes = []
+
+    def query(self, query_texts=None, n_results=10, where=None, include=None, **kwargs):
+        self.includes.append(include)
+        result = {"documents": [["a", "a'", "b"]], "metadatas": [[{}, {}, {}]], "distances": [[0.1, 0.2, 0.3]]}
+        if "embeddings" in include:
+            result["embeddings"] = [EMBEDDINGS[:3]]
+        return result
+
+
+def test_retrieve_documents_requests_candidate_embeddings(monkeypatch):
+    monkeypatch.setattr(rag_chatbot, "score_documents", lambda query, documents: [0.9, 0.85, 0.6])
+    collection = FakeCollection()
+    documents, _, _ = rag_chatbot.retrieve_documents("질문", collection, final_k=2, mmr_lambda=0.5)
+    assert "embeddings" in collection.includes[0]
+    assert documents == ["a", "b"]
+
+    documents, _, _ = rag_chatbot.retrieve_documents("질문", collection, final_k=2, mmr_lambda=1.0)
+    # MMR을 쓰지 않으면 후보 임베딩을 받지 않고 점수 순
+    assert "embeddings" not in collection.includes[1]
+    assert documents == ["a", "a'"]
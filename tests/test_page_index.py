@@ -0,0 +1,72 @@
+import json
+
+import pytest
+
+from page_index import PageIndex, parse_page_reference
+
+
+@pytest.mark.parametrize("query, pages", [
+    ("신한 보고서 4~5페이지 내용", (4, 5)),
+    ("5-4 페이지", (4, 5)),
+    ("12쪽 요약", (12, 12)),
+    ("p4~5 내용", (4, 5)),
+    ("보고서p.4", (4, 4)),
+    ("4p에서 말한 목표", (4, 4)),
+    ("page 7", (7, 7)),
+    ("2030페이지", (2030, 2030)),
+])
+def test_page_references(query, pages):
+    assert parse_page_reference(query) == pages
+
+
+@pytest.mark.parametrize("query", ["10%p 증가한 이유", "3.5페이지", "1 page 요약", "CJ 2030 page 목표", "2030년 목표"])
+def test_not_page_references(query):
+    assert parse_page_reference(query) is None
+
+
+def chunk_metadata(source, pages, chunk_index=0, **extra):
+    return {"source": source, "section": "Social", "page_range": pages, "chunk_index": chunk_index, **extra}
+
+
+@pytest.fixture
+def index():
+    duplicates = json.dumps([{"section": "Social", "page_range": "9-9", "page_start": 9, "page_end": 9},
+                             {"section": "Social", "page_range": "10-10", "page_start": 10, "page_end": 10}])
+    documents = ["표지", "4쪽 1", "4쪽 2", "5-6쪽", "꼬리말", "CJ 4쪽"]
+    metadatas = [chunk_metadata("신한", "1-1"), chunk_metadata("신한", "4-4", 1), chunk_metadata("신한", "4-4", 0),
+                 chunk_metadata("신한", "5-6"), chunk_metadata("신한", "8-8", duplicates=duplicates),
+                 chunk_metadata("CJ", "4-4")]
+    return PageIndex(documents, metadatas)
+
+
+def test_lookup_orders_by_page_then_chunk(index):
+    assert [index.documents[p] for p in index.lookup(4, 5, "신한")] == ["4쪽 2", "4쪽 1", "5-6쪽"]
+    assert [index.documents[p] for p in index.lookup(4, 4)] == ["CJ 4쪽", "4쪽 2", "4쪽 1"]
+
+
+def test_lookup_finds_merged_duplicates_once(index):
+    # 중복으로 합쳐진 9, 10쪽 위치로도 대표 청크를 찾고, 여러 위치가 겹쳐도 한 번만 반환
+    positions = index.lookup(9, 10, "신한")
+    assert [index.documents[p] for p in positions] == ["꼬리말"]
+    assert index.metadatas[positions[0]]["page_range"] == "9-9"
+    assert len(index.lookup(8, 10, "신한")) == 1
+
+
+def test_page_count(index):
+    assert index.page_count("신한") == 10
+    assert index.page_count("CJ") == 4
+    assert index.page_count("없는 출처") == 0
+    assert index.page_count() == 10
+
+
+def test_lookup_pages_rejects_pages_beyond_the_deck(index):
+    import rag_chatbot
+
+    class Collection:
+        def get(self, include):
+            return {"documents": index.documents[:6], "metadatas": index.metadatas[:6]}
+
+    collection = Collection()
+    assert rag_chatbot.lookup_pages(collection, {"pages": "2030-2030", "source": "신한"}) == ([], [], [])
+    documents, _, scores = rag_chatbot.lookup_pages(collection, {"pages": "4-40", "source": "CJ"})
+    assert documents == ["CJ 4쪽"] and scores == [1.0]
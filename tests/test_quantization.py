@@ -0,0 +1,96 @@
+import numpy as np
+import pytest
+
+from chunk_store import ChunkStore, write_chunk_store
+from quantization import (QuantizedCollection, QuantizedReader, available_method, build_index, exact_search,
+                          search, where_filters)
+
+
+@pytest.fixture(scope="module")
+def data():
+    # 군집이 있는 임베딩 (실제 문장 임베딩처럼 비슷한 청크끼리 모여 있음)
+    rng = np.random.default_rng(0)
+    centers = rng.normal(size=(40, 64))
+    embeddings = (centers[rng.integers(0, 40, 2000)] + 0.5 * rng.normal(size=(2000, 64))).astype(np.float32)
+    queries = (centers[rng.integers(0, 40, 50)] + 0.5 * rng.normal(size=(50, 64))).astype(np.float32)
+    return embeddings, queries
+
+
+def recall(index, embeddings, queries, k=10, rescore_k=0):
+    hits = []
+    for query in queries:
+        exact, _ = exact_search(embeddings, query, k)
+        found, _ = search(index, query, k, None, embeddings, rescore_k)
+        hits.append(len(set(exact.tolist()) & set(found.tolist())) / k)
+    return float(np.mean(hits))
+
+
+def test_int8_recall_matches_exact_search(data):
+    embeddings, queries = data
+    index = build_index(embeddings, "int8")
+    assert index.nbytes < embeddings.nbytes / 3
+    assert recall(index, embeddings, queries) >= 0.95
+
+
+def test_pq_recall_and_rescoring(data):
+    embeddings, queries = data
+    index = build_index(embeddings, "pq", subspaces=16)
+    assert index.nbytes < embeddings.nbytes / 5
+    # 코드 점수만으로는 근사, 상위 후보를 float 임베딩으로 다시 계산하면 정확 검색과 거의 같음
+    assert recall(index, embeddings, queries) >= 0.4
+    assert recall(index, embeddings, queries, rescore_k=100) >= 0.95
+
+
+def test_search_within_rows(data):
+    embeddings, queries = data
+    index = build_index(embeddings, "int8")
+    rows = np.arange(0, 2000, 7)
+    positions, _ = search(index, queries[0], 5, rows)
+    assert set(positions.tolist()) <= set(rows.tolist())
+    assert set(positions.tolist()) == set(exact_search(embeddings, queries[0], 5, rows)[0].tolist())
+
+
+def test_where_filters():
+    assert where_filters(None) == {}
+    assert where_filters({"source": "CJ"}) == {"source": "CJ"}
+    assert where_filters({"$and": [{"source": {"$eq": "CJ"}}, {"section": {"$eq": "Social"}}]}) == \
+        {"source": "CJ", "section": "Social"}
+    with pytest.raises(ValueError):
+        where_filters({"page_start": {"$gte": 3}})
+    with pytest.raises(ValueError):
+        where_filters({"source": {"$ne": "CJ"}})
+
+
+def make_chunks(n):
+    return [{"text": f"청크 {i}", "metadata": {"section": "Social", "sub_section": "인권",
+                                              "source": "CJ" if i % 2 else "KTNG", "page_range": f"{i}-{i}"}}
+            for i in range(n)]
+
+
+def test_codes_are_published_with_the_store(tmp_path, data):
+    embeddings = data[0][:300]
+    index = build_index(embeddings, "int8")
+    path = write_chunk_store(make_chunks(300), str(tmp_path), embeddings, "model", add_files=index.save)
+    assert available_method(path) == "int8"
+
+    store = ChunkStore(str(tmp_path))
+    collection = QuantizedCollection(store, index, lambda texts: [embeddings[0]] * len(texts), rescore_k=20)
+    result = collection.query(query_texts=["질문"], n_results=3, where={"source": {"$eq": "KTNG"}})
+    assert result["ids"][0][0] == "0"
+    assert all(m["source"] == "KTNG" for m in result["metadatas"][0])
+    assert result["distances"][0][0] == pytest.approx(0.0, abs=1e-5)
+    assert collection.get(ids=["1", "2"], include=["documents"])["documents"] == ["청크 1", "청크 2"]
+
+
+def test_reader_switches_to_new_version(tmp_path, data):
+    embeddings = data[0][:300]
+    write_chunk_store(make_chunks(300), str(tmp_path), embeddings, "model",
+                      add_files=build_index(embeddings, "int8").save)
+    reader = QuantizedReader(lambda texts: [embeddings[0]], path=str(tmp_path), check_interval=0)
+    first = reader.collection()
+    assert reader.refresh() is False
+
+    write_chunk_store(make_chunks(200), str(tmp_path), embeddings[:200], "model",
+                      add_files=build_index(embeddings[:200], "int8").save)
+    second = reader.collection()
+    assert second is not first and second.count() == 200 and first.count() == 300
@@ -0,0 +1,54 @@
+import threading
+import time
+
+import numpy as np
+
+from rerank_scheduler import RerankScheduler, sigmoid
+
+
+class CountingCrossEncoder:
+    """점수 = 문서 길이, 동시에 실행된 predict 수와 호출별 쌍 수 기록"""
+
+    def __init__(self):
+        self.active = 0
+        self.max_active = 0
+        self.batches = []
+        self._lock = threading.Lock()
+
+    def predict(self, pairs, batch_size=32, convert_to_numpy=True):
+        with self._lock:
+            self.active += 1
+            self.max_active = max(self.max_active, self.active)
+        time.sleep(0.01)
+        with self._lock:
+            self.active -= 1
+            self.batches.append(len(pairs))
+        return np.array([len(doc) for _, doc in pairs], dtype=np.float32)
+
+
+def test_scores_are_sigmoid_of_predictions_per_job():
+    model = CountingCrossEncoder()
+    scheduler = RerankScheduler(lambda: model, max_pairs=8, max_wait_ms=1)
+    scores = scheduler.score_many([("q1", ["a", "bb"]), ("q2", []), ("q3", ["ccc"])])
+    assert np.allclose(scores[0], sigmoid(np.array([1.0, 2.0])))
+    assert scores[1] == []
+    assert np.allclose(scores[2], sigmoid(np.array([3.0])))
+
+
+def test_score_many_shares_the_batcher_with_interactive_requests():
+    model = CountingCrossEncoder()
+    scheduler = RerankScheduler(lambda: model, max_pairs=8, max_wait_ms=5)
+    jobs = [(f"q{i}", ["doc"] * 4) for i in range(6)]
+
+    interactive = [threading.Thread(target=scheduler.score, args=("live", ["doc"] * 2)) for _ in range(4)]
+    for thread in interactive:
+        thread.start()
+    results = scheduler.score_many(jobs)
+    for thread in interactive:
+        thread.join(5)
+
+    assert len(results) == 6 and all(len(r) == 4 for r in results)
+    # 모델은 배치 작업 스레드 하나에서만 호출되고 배치는 max_pairs를 넘지 않음
+    assert model.max_active == 1
+    assert max(model.batches) <= 8
+    assert sum(model.batches) == 6 * 4 + 4 * 2
@@ -0,0 +1,88 @@
+import time
+
+import pytest
+
+from session_store import SessionStore, decode_message, encode_message
+
+
+@pytest.fixture
+def store(tmp_path):
+    return SessionStore(str(tmp_path / "sessions.sqlite3"), max_messages=5, max_bytes=10_000, idle_seconds=60)
+
+
+def test_message_round_trip_compacts_metadata_sets():
+    payload = encode_message("답변", {"sources": {"KTNG", "CJ"}, "sections": set()})
+    assert decode_message("a", payload) == {"role": "assistant", "content": "답변",
+                                            "metadata_summary": {"sources": ["CJ", "KTNG"]}}
+
+
+def test_recent_returns_latest_messages_in_order(store):
+    for i in range(4):
+        store.append("s", "user" if i % 2 == 0 else "assistant", f"메시지 {i}")
+    assert [m["content"] for m in store.recent("s", 2)] == ["메시지 2", "메시지 3"]
+    assert store.recent("s", 10)[0]["role"] == "user"
+
+
+def test_message_cap_drops_oldest(store):
+    for i in range(8):
+        store.append("s", "user", f"메시지 {i}")
+    assert store.count("s") == 5
+    assert [m["content"] for m in store.recent("s", 10)] == [f"메시지 {i}" for i in range(3, 8)]
+
+
+def test_byte_cap_keeps_latest_message(tmp_path):
+    store = SessionStore(str(tmp_path / "s.sqlite3"), max_messages=100, max_bytes=200)
+    for i in range(20):
+        store.append("s", "user", f"{i} " + "긴 메시지 " * i)
+    messages = store.recent("s", 100)
+    assert messages[-1]["content"].startswith("19 ")
+    assert len(messages) < 20
+
+
+def test_sessions_are_isolated_and_cleared(store):
+    store.append("a", "user", "A")
+    store.append("b", "user", "B")
+    store.save_memory("a", {"summary": "요약"})
+    store.clear("a")
+    assert store.count("a") == 0 and store.load_memory("a") is None
+    assert [m["content"] for m in store.recent("b", 10)] == ["B"]
+
+
+def test_idle_sessions_are_evicted_with_their_memory(store):
+    store.append("old", "user", "오래된 세션")
+    store.save_memory("old", {"summary": "요약"})
+    store.append("new", "user", "새 세션")
+    assert store.evict_idle(time.time() + 30) == 0
+    store.touch("new")
+    assert store.evict_idle(time.time() + 61) == 2
+    assert store.count("old") == 0 and store.load_memory("old") is None
+
+
+def test_memory_state_round_trip(store):
+    assert store.load_memory("s") is None
+    store.save_memory("s", {"summary": "요약", "recent": [["질문", "답변"]]})
+    store.save_memory("s", {"summary": "새 요약", "recent": []})
+    assert store.load_memory("s") == {"summary": "새 요약", "recent": []}
+
+
+def test_memory_counts_toward_byte_cap(tmp_path):
+    store = SessionStore(str(tmp_path / "s.sqlite3"), max_messages=100, max_bytes=300)
+    for i in range(5):
+        store.append("s", "user", f"메시지 {i}")
+    assert store.count("s") == 5
+    # 압축해도 큰 대화 메모리를 저장하면 메시지를 지워서 제한 안으로 맞춤 (최근 메시지는 남김)
+    store.save_memory("s", {"summary": "".join(chr(0xAC00 + i) for i in range(200))})
+    assert store.count("s") == 1
+    assert store.recent("s", 1)[0]["content"] == "메시지 4"
+    assert store.load_memory("s")["summary"].startswith("가")
+
+
+def test_touch_keeps_session_from_idle_eviction(store):
+    store.append("s", "user", "질문")
+    store.save_memory("s", {"summary": "요약"})
+    # 마지막 사용이 오래전인 세션도 페이지를 다시 보면(touch) 정리하지 않음
+    store._connection().execute("UPDATE sessions SET last_active = ?", (time.time() - 120,))
+    store.touch("s")
+    assert store.evict_idle() == 0
+    assert store.evict_idle(time.time() + 61) == 1
+    assert store.load_memory("s") is None
@@ -0,0 +1,85 @@
+import threading
+
+from index_snapshots import CURRENT_FILE
+from sharding import ShardRouter, merge_results, select_shard_chunks, split_where
+
+
+def test_split_where_extracts_source():
+    assert split_where(None) == (None, None)
+    assert split_where({"source": "CJ"}) == ("CJ", None)
+    assert split_where({"$and": [{"source": {"$eq": "CJ"}}, {"section": "Social"}]}) == ("CJ", {"section": "Social"})
+    assert split_where({"section": "Social"}) == (None, {"section": "Social"})
+
+
+def test_merge_results_orders_by_distance():
+    a = {"ids": [["a1", "a2"]], "documents": [["A1", "A2"]], "distances": [[0.1, 0.5]]}
+    b = {"ids": [["b1"]], "documents": [["B1"]], "distances": [[0.3]]}
+    merged = merge_results([a, b], 2, ["documents", "distances"])
+    assert merged == {"ids": [["a1", "b1"]], "documents": [["A1", "B1"]], "distances": [[0.1, 0.3]]}
+
+
+class FakeReader:
+    def __init__(self, name):
+        self.current = object()
+        self.calls = 0
+
+    def collection(self):
+        self.calls += 1
+        return self.current
+
+
+def make_router(tmp_path, sources=("CJ", "KTNG")):
+    router = ShardRouter(lambda client: None, root=str(tmp_path), check_interval=60, embedding_function=lambda t: t)
+    router._readers = {source: FakeReader(source) for source in sources}
+    return router
+
+
+def test_router_reuses_collection_without_touching_readers(tmp_path):
+    router = make_router(tmp_path)
+    first = router.collection()
+    assert all(reader.calls == 1 for reader in router._readers.values())
+    # check_interval 안에서는 샤드 리더를 확인하지 않고 같은 컬렉션
+    for _ in range(10):
+        assert router.collection() is first
+    assert all(reader.calls == 1 for reader in router._readers.values())
+    assert router.refresh() is False and router.collection() is first
+
+
+def test_router_rebuilds_only_when_a_shard_changes(tmp_path):
+    router = make_router(tmp_path)
+    first = router.collection()
+    router._readers["CJ"].current = object()
+    assert router.refresh() is True
+    second = router.collection()
+    assert second is not first
+    assert second.shards["KTNG"] is first.shards["KTNG"]
+
+
+def test_router_does_not_wait_while_another_thread_refreshes(tmp_path):
+    router = make_router(tmp_path)
+    first = router.collection()
+    router._checked_at = 0.0
+    with router._lock:
+        result = []
+        thread = threading.Thread(target=lambda: result.append(router.collection()))
+        thread.start()
+        thread.join(timeout=5)
+    assert result == [first]
+
+
+def chunk(source, text):
+    return {"text": text, "metadata": {"source": source}}
+
+
+def test_company_reload_bootstraps_missing_shards(tmp_path):
+    cj = [chunk("CJ", "새 CJ")]
+    everything = [chunk("KTNG", "KTNG"), chunk("SK", "SK")] + cj
+    # 통합 컬렉션에서 처음 --company로 적재하면 다른 회사 샤드도 함께 만들어야 CJ만 검색되지 않음
+    assert select_shard_chunks(cj, "cj", everything, "all", root=str(tmp_path)) == (everything, "all")
+
+    for source in ("KTNG", "SK"):
+        path = tmp_path / source
+        path.mkdir()
+        (path / CURRENT_FILE).write_text("v1\n")
+    # 다른 회사 샤드가 모두 있으면 다시 처리한 회사만 게시
+    assert select_shard_chunks(cj, "cj", everything, "all", root=str(tmp_path)) == (cj, "cj")
@@ -0,0 +1,183 @@
+import gc
+import threading
+import time
+
+import pytest
+
+from single_flight import FlightTimeout, SingleFlight, make_key, normalize_query
+
+
+def test_key_normalizes_query_but_keeps_filters_and_model():
+    assert normalize_query("  CJ의   탄소 목표는？ ") == "cj의 탄소 목표는"
+    assert make_key("CJ 목표?", {"source": "CJ"}, "m") == make_key("cj  목표", {"source": "CJ"}, "m")
+    assert make_key("CJ 목표", {"source": "CJ"}, "m") != make_key("CJ 목표", {}, "m")
+    assert make_key("CJ 목표", {}, "a") != make_key("CJ 목표", {}, "b")
+
+
+def test_concurrent_calls_share_one_execution():
+    flight = SingleFlight("test")
+    started, release = threading.Event(), threading.Event()
+    calls = []
+
+    def fn():
+        calls.append(1)
+        started.set()
+        release.wait(5)
+        return "answer"
+
+    results = []
+    leader = threading.Thread(target=lambda: results.append(flight.do("k", fn)))
+    leader.start()
+    started.wait(5)
+    followers = [threading.Thread(target=lambda: results.append(flight.do("k", fn))) for _ in range(3)]
+    for thread in followers:
+        thread.start()
+    time.sleep(0.05)
+    release.set()
+    for thread in [leader] + followers:
+        thread.join(5)
+
+    assert len(calls) == 1
+    assert sorted(results, key=lambda r: r[1]) == [("answer", False)] + [("answer", True)] * 3
+
+
+def test_error_reaches_followers_and_result_is_not_cached():
+    flight = SingleFlight("test")
+    started, release = threading.Event(), threading.Event()
+
+    def fail():
+        started.set()
+        release.wait(5)
+        raise RuntimeError("boom")
+
+    errors = []
+
+    def run():
+        try:
+            flight.do("k", fail)
+        except RuntimeError as e:
+            errors.append(str(e))
+
+    threads = [threading.Thread(target=run)]
+    threads[0].start()
+    started.wait(5)
+    threads.append(threading.Thread(target=run))
+    threads[1].start()
+    time.sleep(0.05)
+    release.set()
+    for thread in threads:
+        thread.join(5)
+    assert errors == ["boom", "boom"]
+    # 끝난 호출은 캐시하지 않음
+    assert flight.do("k", lambda: "again") == ("again", False)
+
+
+def test_stream_replays_items_to_late_subscribers():
+    flight = SingleFlight("test")
+    release = threading.Event()
+
+    def produce():
+        yield "a"
+        release.wait(5)
+        yield "b"
+
+    first, shared_first = flight.stream("k", produce)
+    assert next(first) == "a"
+    second, shared_second = flight.stream("k", produce)
+    release.set()
+    assert (shared_first, shared_second) == (False, True)
+    assert list(first) == ["b"]
+    assert list(second) == ["a", "b"]
+
+
+def test_stream_error_is_raised_after_items():
+    flight = SingleFlight("test")
+
+    def produce():
+        yield "a"
+        raise ValueError("stream failed")
+
+    items, _ = flight.stream("k", produce)
+    assert next(items) == "a"
+    with pytest.raises(ValueError):
+        next(items)
+
+
+def endless(closed):
+    try:
+        while True:
+            yield "a"
+            time.sleep(0.01)
+    finally:
+        closed.set()
+
+
+def test_stream_closes_producer_when_last_subscriber_leaves():
+    flight = SingleFlight("test")
+    closed = threading.Event()
+    items, _ = flight.stream("k", lambda: endless(closed))
+    assert next(items) == "a"
+    items.close()
+    assert closed.wait(5)
+    # 정리 중이거나 끝난 호출에는 합류하지 않음
+    assert flight.stream("k", lambda: iter(["b"]))[1] is False
+
+
+def test_stream_keeps_producing_while_a_subscriber_remains():
+    flight = SingleFlight("test")
+    closed = threading.Event()
+    first, _ = flight.stream("k", lambda: endless(closed))
+    second, shared = flight.stream("k", lambda: endless(closed))
+    assert shared and next(first) == "a"
+    first.close()
+    assert [next(second) for _ in range(3)] == ["a"] * 3
+    assert not closed.is_set()
+    del second
+    gc.collect()
+    assert closed.wait(5)
+
+
+def test_follower_stops_waiting_after_timeout():
+    flight = SingleFlight("test")
+    started, release = threading.Event(), threading.Event()
+
+    def slow():
+        started.set()
+        release.wait(5)
+        return "answer"
+
+    results = []
+    leader = threading.Thread(target=lambda: results.append(flight.do("k", slow)))
+    leader.start()
+    started.wait(5)
+    start = time.monotonic()
+    with pytest.raises(FlightTimeout):
+        flight.do("k", slow, timeout=0.05)
+    assert time.monotonic() - start < 1
+    # 기다림을 포기한 follower와 관계없이 leader는 끝까지 실행
+    release.set()
+    leader.join(5)
+    assert results == [("answer", False)]
+
+
+def test_stream_follower_times_out_only_before_first_item():
+    flight = SingleFlight("test")
+    release = threading.Event()
+
+    def produce():
+        release.wait(5)
+        yield "a"
+        time.sleep(0.1)
+        yield "b"
+
+    leader, _ = flight.stream("k", produce)
+    follower, shared = flight.stream("k", produce, timeout=0.05)
+    assert shared
+    with pytest.raises(FlightTimeout):
+        next(follower)
+    release.set()
+    # 첫 항목이 나온 뒤 합류하면 이후 항목은 timeout과 관계없이 기다림
+    assert next(leader) == "a"
+    late, shared = flight.stream("k", produce, timeout=0.05)
+    assert shared and list(late) == ["a", "b"]
+    assert list(leader) == ["b"]
@@ -0,0 +1,116 @@
+import numpy as np
+import pytest
+import torch
+from sentence_transformers import CrossEncoder
+from transformers import BertConfig, BertForSequenceClassification, BertTokenizer, BertTokenizerFast
+
+from token_cache import (CachedCrossEncoderScorer, CachedPairEncoder, TokenCache, TokenCacheReader,
+                         build_token_cache, cache_path)
+
+WORDS = [f"w{i}" for i in range(20)]
+
+
+class FakeTokenizer:
+    def __init__(self):
+        self.tokenized = []
+
+    def __len__(self):
+        return 1000
+
+    def __call__(self, texts, add_special_tokens, truncation, max_length):
+        self.tokenized.extend(texts)
+        return {"input_ids": [[len(word) for word in text.split()][:max_length] for text in texts]}
+
+
+def test_build_and_lookup(tmp_path):
+    tokenizer = FakeTokenizer()
+    path = build_token_cache(["가 나다", "라마바사", "가 나다"], tokenizer, str(tmp_path / "cache"), "fake")
+    cache = TokenCache(path)
+    assert len(cache) == 2 and tokenizer.tokenized.count("가 나다") == 1
+    assert cache.get("가 나다").tolist() == [1, 2]
+    assert cache.get("없는 청크") is None
+
+
+def test_reuse_tokenizes_only_new_chunks(tmp_path):
+    path = str(tmp_path / "cache")
+    build_token_cache(["가 나다", "라마바사"], FakeTokenizer(), path, "fake")
+    tokenizer = FakeTokenizer()
+    build_token_cache(["가 나다", "라마바사", "새 청크"], tokenizer, path, "fake", reuse=TokenCache(path))
+    assert tokenizer.tokenized == ["새 청크"]
+    cache = TokenCache(path)
+    assert cache.get("라마바사").tolist() == [4] and cache.get("새 청크").tolist() == [1, 2]
+    # 다른 토크나이저의 캐시는 재사용하지 않음
+    tokenizer = FakeTokenizer()
+    build_token_cache(["가 나다"], tokenizer, path, "other", reuse=TokenCache(path))
+    assert tokenizer.tokenized == ["가 나다"]
+
+
+def test_reader_follows_rebuilt_cache(tmp_path):
+    reader = TokenCacheReader("fake", root=str(tmp_path), check_interval=0)
+    # 서빙 시작 때 캐시가 없어도 나중에 만들어지면 사용
+    assert reader.cache() is None
+    path = cache_path("fake", str(tmp_path))
+    build_token_cache(["가 나다"], FakeTokenizer(), path, "fake")
+    first = reader.cache()
+    assert first is not None and first.get("가 나다").tolist() == [1, 2]
+    assert reader.refresh() is False and reader.cache() is first
+
+    # 다시 적재하면 디렉터리가 교체되고, 리더는 새 캐시를 엶
+    build_token_cache(["가 나다", "새 청크"], FakeTokenizer(), path, "fake")
+    second = reader.cache()
+    assert second is not first and second.get("새 청크").tolist() == [1, 2]
+
+
+def test_reader_waits_for_check_interval(tmp_path):
+    path = cache_path("fake", str(tmp_path))
+    build_token_cache(["가 나다"], FakeTokenizer(), path, "fake")
+    reader = TokenCacheReader("fake", root=str(tmp_path), check_interval=60)
+    first = reader.cache()
+    build_token_cache(["새 청크"], FakeTokenizer(), path, "fake")
+    assert reader.cache() is first
+    assert reader.refresh() is True and reader.cache().get("새 청크") is not None
+
+
+@pytest.fixture
+def vocab_file(tmp_path):
+    path = tmp_path / "vocab.txt"
+    path.write_text("\n".join(["[PAD]", "[UNK]", "[CLS]", "[SEP]", "[MASK]"] + WORDS) + "\n", encoding="utf-8")
+    return str(path)
+
+
+def text(start, length):
+    return " ".join(WORDS[start:start + length])
+
+
+@pytest.mark.parametrize("tokenizer_class", [BertTokenizerFast, BertTokenizer])
+def test_pair_encoder_matches_tokenizer_truncation(tmp_path, vocab_file, tokenizer_class):
+    tokenizer = tokenizer_class(vocab_file)
+    documents = [text(5, length) for length in range(1, 10)]
+    cache = TokenCache(build_token_cache(documents, tokenizer, str(tmp_path / "cache"), "tiny"))
+    # 홀수/짝수 예산, 질문이 더 긴 경우, 길이가 같은 경우 모두 확인
+    for max_length in (7, 8, 9, 10):
+        encoder = CachedPairEncoder(tokenizer, cache, max_length)
+        for query in [text(0, length) for length in range(1, 10)]:
+            expected = tokenizer([query] * len(documents), documents, padding=True, truncation=True,
+                                 max_length=max_length, return_tensors="pt")
+            features = encoder.encode([(query, documents)])
+            for key in ("input_ids", "token_type_ids", "attention_mask"):
+                assert features[key].tolist() == expected[key].tolist(), (max_length, query, key)
+
+
+def test_cached_scorer_matches_cross_encoder_predict(tmp_path, vocab_file):
+    torch.manual_seed(0)
+    model_dir = tmp_path / "model"
+    config = BertConfig(vocab_size=len(WORDS) + 5, hidden_size=16, num_hidden_layers=1, num_attention_heads=2,
+                        intermediate_size=32, max_position_embeddings=32, num_labels=1)
+    BertForSequenceClassification(config).save_pretrained(model_dir)
+    BertTokenizerFast(vocab_file).save_pretrained(model_dir)
+    cross_encoder = CrossEncoder(str(model_dir), max_length=9, device="cpu")
+
+    documents = [text(5, length) for length in range(1, 10)]
+    cache = TokenCache(build_token_cache(documents[:5], cross_encoder.tokenizer, str(tmp_path / "cache"), "tiny"))
+    jobs = [(text(0, 3), documents), (text(0, 6), documents[::2])]
+    # 캐시에 없는 청크(뒤쪽 4개)는 그 자리에서 토큰화
+    scores = CachedCrossEncoderScorer(cross_encoder, cache).predict(jobs)
+    expected = cross_encoder.predict([(query, document) for query, chunk_list in jobs for document in chunk_list])
+    np.testing.assert_allclose(scores, expected, rtol=1e-5, atol=1e-6)
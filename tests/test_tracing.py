@@ -0,0 +1,171 @@
+import contextvars
+import json
+import threading
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+import tracing
+from tracing import Counter, Gauge, Histogram, MetricsRegistry, span, trace_request
+
+
+def test_counter_and_gauge_rendering():
+    counter = Counter("requests_total", "요청 수")
+    counter.inc(stage="b")
+    counter.inc(2, stage="a")
+    counter.inc(stage="a")
+    assert counter.value(stage="a") == 3 and counter.value(stage="없음") == 0
+    # 레이블 순서대로 정렬해 출력
+    assert counter.render() == ["# HELP requests_total 요청 수", "# TYPE requests_total counter",
+                                'requests_total{stage="a"} 3.0', 'requests_total{stage="b"} 1.0']
+
+    gauge = Gauge("in_flight", "처리 중인 요청 수")
+    gauge.inc()
+    gauge.inc()
+    gauge.dec()
+    gauge.set(7, pool="x")
+    assert gauge.value() == 1 and gauge.value(pool="x") == 7
+    assert gauge.render()[1:] == ["# TYPE in_flight gauge", "in_flight 1.0", 'in_flight{pool="x"} 7']
+
+
+def test_histogram_buckets_are_cumulative():
+    histogram = Histogram("latency", "지연", buckets=(1, 0.1, 0.5))
+    for value in (0.05, 0.3, 0.3, 2.0):
+        histogram.observe(value, stage="s")
+    assert histogram.count(stage="s") == 4 and histogram.count() == 0
+    assert histogram.render()[2:] == [
+        'latency_bucket{stage="s",le="0.1"} 1',
+        'latency_bucket{stage="s",le="0.5"} 3',
+        'latency_bucket{stage="s",le="1.0"} 3',
+        'latency_bucket{stage="s",le="+Inf"} 4',
+        'latency_sum{stage="s"} 2.65',
+        'latency_count{stage="s"} 4',
+    ]
+
+
+def test_label_values_are_escaped():
+    counter = Counter("errors_total", "오류 수")
+    counter.inc(error='a "b"\\c\nd')
+    assert counter.render()[-1] == 'errors_total{error="a \\"b\\"\\\\c\\nd"} 1.0'
+
+
+def test_registry_reuses_metrics_by_name():
+    registry = MetricsRegistry()
+    assert registry.counter("c", "도움말") is registry.counter("c", "도움말")
+    registry.counter("c", "도움말").inc()
+    registry.histogram("h", "히스토그램", buckets=(1,)).observe(0.5)
+    text = registry.render()
+    assert text.endswith("\n")
+    assert "# TYPE c counter\nc 1.0\n" in text and 'h_bucket{le="1.0"} 1' in text
+
+
+def spans_by_name(trace):
+    return {s.name: s for s in trace.spans}
+
+
+def test_span_parents_follow_context_across_threads():
+    barrier = threading.Barrier(2)
+
+    def stage(name):
+        with span(name):
+            # 두 스레드의 span이 동시에 열려 있어도 서로의 parent가 되지 않음
+            barrier.wait(timeout=5)
+            with span(f"{name}.inner"):
+                pass
+
+    with trace_request("request") as trace:
+        with span("retrieve"):
+            with ThreadPoolExecutor(max_workers=2) as executor:
+                futures = [executor.submit(contextvars.copy_context().run, stage, name) for name in ("a", "b")]
+                for future in futures:
+                    future.result()
+        with span("generate"):
+            pass
+
+    spans = spans_by_name(trace)
+    assert spans["retrieve"].parent is None and spans["generate"].parent is None
+    assert spans["a"].parent == "retrieve" and spans["b"].parent == "retrieve"
+    assert spans["a.inner"].parent == "a" and spans["b.inner"].parent == "b"
+    # 요청이 끝나면 현재 추적과 span이 복원됨
+    assert tracing.current_trace() is None and tracing._current_span.get() is None
+
+
+def test_nested_trace_request_becomes_span():
+    with trace_request("outer") as outer:
+        with trace_request("inner") as inner:
+            with span("stage"):
+                pass
+    assert inner is outer
+    spans = spans_by_name(outer)
+    assert spans["inner"].parent is None and spans["stage"].parent == "inner"
+
+
+def test_span_error_is_recorded():
+    before = tracing.STAGE_ERRORS.value(stage="failing")
+    with pytest.raises(RuntimeError):
+        with trace_request("request") as trace:
+            with span("failing"):
+                raise RuntimeError("실패")
+    assert tracing.STAGE_ERRORS.value(stage="failing") == before + 1
+    assert "RuntimeError" in spans_by_name(trace)["failing"].attrs["error"]
+    assert "RuntimeError" in trace.attrs["error"]
+
+
+@pytest.fixture
+def trace_logger():
+    # 다른 테스트의 설정과 섞이지 않도록 전역 로거 상태를 복원
+    handlers, level, propagate = list(tracing.logger.handlers), tracing.logger.level, tracing.logger.propagate
+    configured = tracing._exporters_configured
+    yield tracing.logger
+    for handler in tracing.logger.handlers:
+        if handler not in handlers:
+            handler.close()
+    tracing.logger.handlers[:] = handlers
+    tracing.logger.setLevel(level)
+    tracing.logger.propagate = propagate
+    tracing._exporters_configured = configured
+
+
+def test_file_exporters(tmp_path, monkeypatch, trace_logger):
+    log_path = tmp_path / "trace.log"
+    metrics_path = tmp_path / "metrics.prom"
+    monkeypatch.setenv("RAG_TRACE_LOG", str(log_path))
+    monkeypatch.setenv("RAG_METRICS_FILE", str(metrics_path))
+    monkeypatch.delenv("RAG_METRICS_PORT", raising=False)
+    tracing._exporters_configured = False
+
+    with trace_request("exported", question="질문"):
+        with span("search", candidates=3):
+            tracing.record_cache("answer", hit=False)
+
+    records = [json.loads(line) for line in log_path.read_text(encoding="utf-8").splitlines()]
+    assert len(records) == 1
+    record = records[0]
+    assert record["name"] == "exported" and record["attrs"] == {"question": "질문", "cache": {"answer": "miss"}}
+    assert [s["name"] for s in record["spans"]] == ["search"] and record["spans"][0]["attrs"] == {"candidates": 3}
+    metrics = metrics_path.read_text(encoding="utf-8")
+    assert 'rag_stage_duration_seconds_count{stage="exported"}' in metrics
+    assert 'rag_cache_requests_total{cache="answer",result="miss"}' in metrics
+    # 원자적으로 교체하므로 임시 파일이 남지 않음
+    assert sorted(p.name for p in tmp_path.iterdir()) == ["metrics.prom", "trace.log"]
+
+
+def test_metrics_http_endpoint(monkeypatch):
+    monkeypatch.setattr(tracing, "_metrics_server", None)
+    server = tracing.start_metrics_server(0, host="127.0.0.1")
+    try:
+        assert tracing.start_metrics_server(0, host="127.0.0.1") is server
+        tracing.TOKENS.inc(5, stage="http", kind="prompt")
+        url = f"http://127.0.0.1:{server.server_address[1]}"
+        with urllib.request.urlopen(f"{url}/metrics", timeout=5) as response:
+            assert response.headers["Content-Type"].startswith("text/plain; version=0.0.4")
+            body = response.read().decode("utf-8")
+        assert 'rag_tokens_total{kind="prompt",stage="http"}' in body
+        with pytest.raises(urllib.error.HTTPError) as excinfo:
+            urllib.request.urlopen(f"{url}/other", timeout=5)
+        assert excinfo.value.code == 404
+    finally:
+        server.shutdown()
+        server.server_close()